@@ -33,7 +33,21 @@ def setup_argparse():
 
     # أمر إضافة عدة منتجات من ملف
     bulk_parser = subparsers.add_parser('add-bulk', help='إضافة عدة منتجات من ملف')
-    bulk_parser.add_argument('file', help='مسار ملف المنتجات')
+    bulk_parser.add_argument('file', help='مسار ملف المنتجات (CSV أو TSV أو JSONL أو نص حر)')
+    bulk_parser.add_argument('--format', choices=['csv', 'tsv', 'jsonl', 'text'], help='صيغة الملف (افتراضي: حسب الامتداد)')
+    bulk_parser.add_argument('--chat-id', help='معرف المحادثة المالكة للمنتجات')
+    bulk_parser.add_argument('--chunk-size', type=int, help='عدد الصفوف في كل دفعة')
+    bulk_parser.add_argument('--restart', action='store_true', help='تجاهل نقطة الاستئناف والبدء من أول الملف')
+
+    # أمر تصدير المشتريات إلى ملف
+    export_parser = subparsers.add_parser('export', help='تصدير المشتريات إلى ملف CSV أو Parquet')
+    export_parser.add_argument('output', help='مسار الملف الناتج')
+    export_parser.add_argument('--format', choices=['csv', 'parquet'], help='صيغة الملف (افتراضي: حسب الامتداد)')
+    export_parser.add_argument('--from', dest='start', help='تاريخ البداية (YYYY-MM-DD)')
+    export_parser.add_argument('--to', dest='end', help='تاريخ النهاية (YYYY-MM-DD)')
+    export_parser.add_argument('--product', help='تصدير المنتجات التي يحتوي اسمها على هذا النص فقط')
+    export_parser.add_argument('--chat-id', help='تصدير مشتريات هذه المحادثة فقط')
+    export_parser.add_argument('--page-size', type=int, help='عدد المنتجات في كل صفحة')
 
     # أمر عرض المنتجات
     list_parser = subparsers.add_parser('list', help='عرض المنتجات')
@@ -60,36 +74,69 @@ async def add_product(product: str, price: float, notes: str = '') -> bool:
         logger.error(f"خطأ في إضافة المنتج: {str(e)}")
         return False
 
-async def add_bulk_products(file_path: str) -> bool:
-    """إضافة عدة منتجات من ملف"""
-    from database.sheets import add_multiple_to_sheets
+async def add_bulk_products(file_path: str, file_format: str = None, chat_id: str = None,
+                            chunk_size: int = None, restart: bool = False) -> bool:
+    """إضافة عدة منتجات من ملف (قراءة متدفقة على دفعات مع إمكانية الاستئناف)"""
+    from database.bulk_import import import_file, IMPORT_CHUNK_ROWS
+    from database.sheets import init_storage, shutdown_storage
+    from utils.parsers.file_parser import FileFormat
     try:
-        with open(file_path, 'r', encoding='utf-8') as f:
-            products = []
-            for line in f:
-                line = line.strip()
-                if line:
-                    parts = line.split()
-                    if len(parts) >= 2:
-                        product = parts[0]
-                        price = float(parts[1])
-                        notes = ' '.join(parts[2:]) if len(parts) > 2 else ''
-                        products.append((product, price, notes))
-
-        if products:
-            success_count, errors = await add_multiple_to_sheets(products)
-            if errors:
-                for error in errors:
-                    logger.error(error)
-            if success_count > 0:
-                logger.info(f"تم إضافة {success_count} منتج")
-                return True
+        await init_storage(build_aggregates=False)
+        try:
+            result = await import_file(
+                file_path,
+                chat_id=chat_id,
+                file_format=FileFormat(file_format) if file_format else None,
+                chunk_rows=chunk_size or IMPORT_CHUNK_ROWS,
+                restart=restart
+            )
+        finally:
+            # إرسال الصفوف المتبقية في مخزن الكتابة قبل الخروج
+            await shutdown_storage()
+        
+        if result.already_done:
+            logger.info("تم استيراد هذا الملف من قبل، استخدم --restart لاستيراده مرة أخرى")
+            return False
+        for error in result.errors:
+            logger.error(error)
+        if result.invalid > len(result.errors):
+            logger.error(f"و{result.invalid - len(result.errors)} سجل مرفوض آخر")
+        if result.added > 0:
+            logger.info(f"تم إضافة {result.added} منتج ({result.rate:.0f} صف/ثانية)")
+            return True
         
         logger.error("لم يتم إضافة أي منتجات")
         return False
         
     except Exception as e:
         logger.error(f"خطأ في إضافة المنتجات: {str(e)}")
+        logger.error("أعد تشغيل الأمر نفسه لاستئناف الاستيراد من آخر دفعة محفوظة")
+        return False
+
+async def export_products(output: str, file_format: str = None, start: str = None, end: str = None,
+                          product: str = None, chat_id: str = None, page_size: int = None) -> bool:
+    """تصدير المشتريات إلى ملف (قراءة السجل صفحة بعد صفحة)"""
+    from database.export import export_products as export_to_file, parse_export_date, EXPORT_PAGE_ROWS
+    from database.sheets import init_storage, shutdown_storage
+    try:
+        if file_format is None:
+            file_format = 'parquet' if output.lower().endswith('.parquet') else 'csv'
+        start_date = parse_export_date(start) if start else None
+        end_date = parse_export_date(end) if end else None
+        
+        await init_storage(build_aggregates=False)
+        try:
+            result = await export_to_file(
+                output, file_format, start_date, end_date, product, chat_id, page_size or EXPORT_PAGE_ROWS
+            )
+        finally:
+            await shutdown_storage()
+        
+        logger.info(f"تم تصدير {result.rows} منتج إلى {output}")
+        return True
+    
+    except Exception as e:
+        logger.error(f"خطأ في تصدير المشتريات: {str(e)}")
         return False
 
 async def list_products(limit: int = 10) -> None:
@@ -129,7 +176,10 @@ async def main() -> None:
         if args.command == 'add':
             await add_product(args.product, args.price, args.notes)
         elif args.command == 'add-bulk':
-            await add_bulk_products(args.file)
+            await add_bulk_products(args.file, args.format, args.chat_id, args.chunk_size, args.restart)
+        elif args.command == 'export':
+            await export_products(args.output, args.format, args.start, args.end, args.product,
+                                  args.chat_id, args.page_size)
         elif args.command == 'list':
             await list_products(args.limit)
         else:
@@ -0,0 +1,631 @@
+"""
+مجاميع المشتريات المحدثة تدريجياً
+
+بدلاً من جلب المنتجات وجمع أسعارها مع كل طلب مجموع، نحتفظ في الذاكرة بعدد المشتريات
+ومجموعها لكل (محادثة، يوم) و(محادثة، شهر) و(محادثة، منتج). كل إضافة أو حذف عبر طبقة
+التخزين يعدّل المجاميع المعنية فقط (O(1) لكل صف)، فيُجاب عن المجاميع دون الرجوع إلى محرك
+التخزين.
+
+تُبنى المجاميع من السجل الكامل عند أول تشغيل. مصدر البناء يعيد صفوف كل قسم (ورقة شهر في Google Sheets، أو None للمحركات غير المقسمة)،
+فيمكن أيضاً إعادة حساب أقسام معينة فقط. ما يُضاف أو يُحذف أثناء القراءة يُسجل ثم يُطبق على
+النتيجة، فلا يُحسب صف مرتين ولا يضيع حذف. إلى أن يكتمل البناء تعيد الاستعلامات None ويجمع
+المستدعي الأسعار بنفسه كما كان.
+
+التعديلات اليدوية على جدول البيانات لا تمر بطبقة التخزين، فيُبلغ محرك Google Sheets المجاميع
+بالصفوف التي تغيرت عند مطابقة مراياه مع الورقة (apply_rows)، وبمحتوى القسم كاملاً عند أول
+تحميل لمرآته (replace_partition). الأقسام التي لم تُحمّل مراياها لا تُقرأ عند التعديل اليدوي،
+فتظهر تعديلاتها في المجاميع عند تحميل مرآتها أو عند استدعاء rebuild_aggregates.
+
+عند الإغلاق تُحفظ المجاميع في ملف مع إصدار جدول البيانات الذي تطابقه، وعند التشغيل التالي
+تُحمّل منه دون قراءة السجل إذا لم يتغير الإصدار. إذا تغير الإصدار أو توقف البوت دون إغلاق
+سليم (أو لم يُعرف الإصدار، كما في المحركات المحلية) تُبنى من جديد.
+
+مساهمة كل منتج محفوظة بمعرفه. الصفوف المضافة يدوياً في الورقة ليس لها معرف حتى يكتبه البوت،
+فتُحفظ مساهمتها بموقعها (القسم#رقم الصف) ثم تنتقل إلى المعرف عند كتابته (assign_ids). إذا طُلب
+حذف معرف غير معروف يُعاد حساب الأقسام التي فيها مساهمات بدون معرف، بدلاً من ترك المجموع أكبر
+من الحقيقي.
+
+المجاميع تُحفظ كأعداد عشرية دقيقة (Decimal) حتى لا يتراكم خطأ التقريب مع الإضافة والحذف.
+
+الإعدادات (عبر المتغيرات البيئية):
+    AGGREGATES_ENABLED: تفعيل المجاميع (افتراضي: 1)
+    AGGREGATES_RETRY_DELAY: الانتظار قبل إعادة محاولة بناء فاشل بالثواني (افتراضي: 60)
+    AGGREGATES_PERSIST: حفظ المجاميع عند الإغلاق لتحميلها في التشغيل التالي (افتراضي: 1)
+"""
+import os
+import time
+import asyncio
+import logging
+import itertools
+from dataclasses import dataclass
+from datetime import date
+from decimal import Decimal
+from typing import Any, AsyncIterator, Callable, Dict, Iterable, List, Optional, Set, Tuple
+
+from database.backend import (
+    ChatId, GROUP_BY_PRODUCT, GROUP_BY_DAY, ID_INDEX, chat_key, date_key, row_chat
+)
+from database.executor import storage_executor
+from database.journal import RecordJournal
+
+# إعداد التسجيل
+logger = logging.getLogger(__name__)
+
+# تفعيل المجاميع
+AGGREGATES_ENABLED = os.getenv("AGGREGATES_ENABLED", "1") not in ("0", "false", "False", "")
+# الانتظار قبل إعادة محاولة بناء فاشل (بالثواني)
+AGGREGATES_RETRY_DELAY = float(os.getenv("AGGREGATES_RETRY_DELAY", "60"))
+# حفظ المجاميع عند الإغلاق
+AGGREGATES_PERSIST = os.getenv("AGGREGATES_PERSIST", "1") not in ("0", "false", "False", "")
+
+# أبعاد التجميع
+GROUP_BY_MONTH = "month"
+DIMENSIONS = (GROUP_BY_DAY, GROUP_BY_MONTH, GROUP_BY_PRODUCT)
+
+# مفتاح مجاميع جميع المحادثات (chat_id=None)
+ALL_CHATS = None
+
+# مساهمة منتج في المجاميع: (المحادثة، اليوم YYYY/MM/DD، اسم المنتج، السعر)
+Entry = Tuple[str, str, str, Decimal]
+
+# مصدر البناء: دالة تستقبل الأقسام المطلوبة (None = الكل) وتعيد صفحات (القسم، المنتجات)
+Source = Callable[[Optional[Set[Optional[str]]]], AsyncIterator[Tuple[Optional[str], List[Dict]]]]
+
+@dataclass
+class Total:
+    """عدد المشتريات ومجموعها"""
+    count: int = 0
+    total: float = 0.0
+
+def _entry(day, name, price, chat) -> Optional[Entry]:
+    """مساهمة منتج في المجاميع (None إذا كان السعر غير صالح)"""
+    try:
+        amount = Decimal(repr(float(price)))
+    except (TypeError, ValueError):
+        return None
+    return chat, str(day)[:10], str(name), amount
+
+def location_key(partition: Optional[str], row_number: int) -> str:
+    """مفتاح مساهمة صف ليس له معرف: موقعه في قسمه"""
+    return f"{partition or ''}#{row_number}"
+
+def _product_key(partition: Optional[str], product_id: Optional[str], row_number: Optional[int]) -> Optional[str]:
+    """مفتاح مساهمة منتج: معرفه، أو موقعه إذا لم يكن له معرف (None إذا لم يُعرف أي منهما)"""
+    if product_id:
+        return product_id
+    if row_number is not None:
+        return location_key(partition, row_number)
+    return None
+
+def _row_item(partition: Optional[str], row_number: Optional[int], row: list) -> Tuple[Optional[str], Optional[Entry]]:
+    """مفتاح صف ومساهمته (None إذا كان الصف فارغاً أو سعره غير صالح)"""
+    if not any(row[:ID_INDEX]):
+        return None, None
+    product_id = row[ID_INDEX] if len(row) > ID_INDEX and row[ID_INDEX] else None
+    return _product_key(partition, product_id, row_number), _entry(row[0], row[1], row[2], row_chat(row))
+
+def _keys(entry: Entry):
+    """مفاتيح المجاميع التي يدخل فيها المنتج: (البعد، المفتاح)"""
+    _, day, name, _ = entry
+    return ((GROUP_BY_DAY, day), (GROUP_BY_MONTH, day[:7]), (GROUP_BY_PRODUCT, name))
+
+class _Groups:
+    """
+    المجاميع نفسها: البعد -> المحادثة -> المفتاح -> [العدد، المجموع]
+
+    كل منتج يُحسب في مجاميع محادثته ومجاميع ALL_CHATS. المجموعات التي يصبح عددها صفراً
+    تُحذف، فيبقى حجم الذاكرة بحجم الأيام والأشهر والمنتجات الموجودة فعلاً.
+    """
+
+    def __init__(self):
+        self.groups: Dict[str, Dict[Optional[str], Dict[str, list]]] = {dimension: {} for dimension in DIMENSIONS}
+        # مفتاح المساهمة (معرف المنتج أو موقعه) -> (قسمه، مساهمته) لطرحها عند الحذف
+        self.entries: Dict[str, Tuple[Optional[str], Entry]] = {}
+        # القسم -> مفاتيح مساهماته
+        self.partitions: Dict[Optional[str], Set[str]] = {}
+        # مفاتيح المساهمات التي ليس لها معرف ولا موقع
+        self._anonymous = itertools.count()
+
+    def add(self, key: Optional[str], partition: Optional[str], entry: Entry) -> bool:
+        if not key:
+            key = f"~{next(self._anonymous)}"
+        if key in self.entries:
+            return False
+        self.entries[key] = (partition, entry)
+        self.partitions.setdefault(partition, set()).add(key)
+        self._apply(entry, 1)
+        return True
+
+    def remove(self, key: str) -> bool:
+        item = self.entries.pop(key, None)
+        if item is None:
+            return False
+        partition, entry = item
+        keys = self.partitions.get(partition)
+        if keys is not None:
+            keys.discard(key)
+            if not keys:
+                del self.partitions[partition]
+        self._apply(entry, -1)
+        return True
+
+    def rekey(self, old: str, new: str) -> None:
+        """نقل مساهمة من موقع الصف إلى المعرف الذي كُتب له"""
+        item = self.entries.get(old)
+        if item is None:
+            return
+        if new in self.entries:
+            # الصف محسوب بمعرفه من قبل
+            self.remove(old)
+            return
+        del self.entries[old]
+        self.entries[new] = item
+        keys = self.partitions[item[0]]
+        keys.discard(old)
+        keys.add(new)
+
+    def clear_partition(self, partition: Optional[str]) -> None:
+        for key in list(self.partitions.get(partition, ())):
+            self.remove(key)
+
+    def dump(self) -> List[list]:
+        """المساهمات بشكل قابل للحفظ في JSON"""
+        return [
+            [None if key.startswith('~') else key, partition, chat, day, name, str(amount)]
+            for key, (partition, (chat, day, name, amount)) in self.entries.items()
+        ]
+
+    @classmethod
+    def restore(cls, items: List[list]) -> '_Groups':
+        """بناء المجاميع من مساهمات محفوظة بـ dump"""
+        groups = cls()
+        for key, partition, chat, day, name, amount in items:
+            groups.add(key, partition, (chat, day, name, Decimal(amount)))
+        return groups
+
+    def located_partitions(self) -> Set[Optional[str]]:
+        """الأقسام التي فيها مساهمات محفوظة بالموقع (صفوف لم يُعرف معرفها بعد)"""
+        return {partition for partition, keys in self.partitions.items() if any('#' in key for key in keys)}
+
+    def _apply(self, entry: Entry, sign: int) -> None:
+        amount = entry[3] if sign > 0 else -entry[3]
+        for chat in (entry[0], ALL_CHATS):
+            for dimension, key in _keys(entry):
+                chats = self.groups[dimension]
+                keys = chats.get(chat)
+                if keys is None:
+                    keys = chats[chat] = {}
+                group = keys.get(key)
+                if group is None:
+                    group = keys[key] = [0, Decimal(0)]
+                group[0] += sign
+                group[1] += amount
+                if group[0] <= 0:
+                    del keys[key]
+                    if not keys:
+                        del chats[chat]
+
+    def lookup(self, chat_id: ChatId, dimension: str, key: str) -> Total:
+        """مجموع مفتاح واحد كما تراه المحادثة (مشترياتها والمشتريات بدون مالك)"""
+        count, total = 0, Decimal(0)
+        for chat in self._visible_chats(chat_id):
+            group = self.groups[dimension].get(chat, {}).get(key)
+            if group is not None:
+                count += group[0]
+                total += group[1]
+        return Total(count, float(total))
+
+    def items(self, chat_id: ChatId, dimension: str) -> Dict[str, list]:
+        """جميع مجاميع البعد كما تراها المحادثة"""
+        merged: Dict[str, list] = {}
+        for chat in self._visible_chats(chat_id):
+            for key, (count, total) in self.groups[dimension].get(chat, {}).items():
+                group = merged.get(key)
+                if group is None:
+                    merged[key] = [count, total]
+                else:
+                    group[0] += count
+                    group[1] += total
+        return merged
+
+    @staticmethod
+    def _visible_chats(chat_id: ChatId) -> Tuple[Optional[str], ...]:
+        if chat_id is None:
+            return (ALL_CHATS,)
+        chat = chat_key(chat_id)
+        return (chat, '') if chat else ('',)
+
+class AggregateStore:
+    """
+    مجاميع المشتريات لكل محادثة حسب اليوم والشهر والمنتج
+
+    Args:
+        source: مصدر البناء؛ يستقبل الأقسام المطلوبة (None = الكل) ويعيد صفحات (القسم، المنتجات)
+        retry_delay: الانتظار قبل إعادة محاولة بناء فاشل بالثواني
+        partition_of: القسم الذي يُكتب فيه صف جديد (None = محرك غير مقسم)
+        journal: ملف حفظ المجاميع بين التشغيلات (None = بدون حفظ)
+    """
+
+    def __init__(
+        self,
+        source: Source,
+        retry_delay: float = AGGREGATES_RETRY_DELAY,
+        partition_of: Optional[Callable[[list], Optional[str]]] = None,
+        journal: Optional[RecordJournal] = None,
+    ):
+        self.source = source
+        self.retry_delay = retry_delay
+        self.partition_of = partition_of or (lambda row: None)
+        self.journal = journal
+        # مصدر المجاميع المحفوظة (None إذا لم تُفتح بـ open)
+        self._source_id: Optional[str] = None
+        self._groups: Optional[_Groups] = None
+        # العمليات التي تمت أثناء القراءة، لتطبيقها على النتيجة
+        self._changes: Optional[List[Callable[[_Groups], Any]]] = None
+        self._task: Optional[asyncio.Task] = None
+        # طلبات البناء المنتظرة: بناء كامل، أو إعادة حساب أقسام معينة
+        self._full = False
+        self._dirty: Set[Optional[str]] = set()
+
+        # الإحصاءات
+        self._rebuilds = 0
+        self._refreshes = 0
+        self._last_rebuild: Optional[float] = None
+        self._rebuild_time = 0.0
+        self._failures = 0
+        self._restored = False
+
+    @property
+    def ready(self) -> bool:
+        """هل المجاميع مبنية وصالحة للاستعلام؟"""
+        return self._groups is not None
+
+    def _mutate(self, operation: Callable[[_Groups], Any]) -> Any:
+        """تطبيق عملية على المجاميع الحالية، وتسجيلها إذا كانت هناك قراءة جارية"""
+        result = None
+        if self._groups is not None:
+            result = operation(self._groups)
+        if self._changes is not None:
+            self._changes.append(operation)
+        return result
+
+    def add_rows(self, rows: List[list]) -> None:
+        """
+        تسجيل صفوف أضيفت إلى محرك التخزين
+
+        Args:
+            rows: الصفوف بالشكل [التاريخ، المنتج، السعر، الملاحظات، المعرف، المحادثة]
+        """
+        for row in rows:
+            entry = _entry(row[0], row[1], row[2], row_chat(row))
+            if entry is None:
+                continue
+            product_id = row[ID_INDEX] if len(row) > ID_INDEX and row[ID_INDEX] else None
+            partition = self.partition_of(row)
+            self._mutate(lambda groups, product_id=product_id, partition=partition, entry=entry:
+                         groups.add(product_id, partition, entry))
+
+    def apply_rows(self, partition: Optional[str], changes: List[Tuple[int, Optional[list], Optional[list]]]) -> None:
+        """
+        تسجيل صفوف قسم تغيرت في الورقة من خارج طبقة التخزين (تعديل يدوي أو صفوف جديدة)
+
+        تُطرح جميع المحتويات السابقة قبل إضافة الجديدة، فلا يضيع صف نُقل معرفه إلى صف آخر.
+
+        Args:
+            partition: القسم
+            changes: (رقم الصف، محتواه السابق أو None، محتواه الحالي أو None)؛ الصف الذي ليس له
+                معرف يُحسب بموقعه
+        """
+        def apply(groups: _Groups) -> None:
+            for row_number, old, _ in changes:
+                if old is None:
+                    continue
+                key, _ = _row_item(partition, row_number, old)
+                if key is not None and not groups.remove(location_key(partition, row_number)):
+                    groups.remove(key)
+            for row_number, _, new in changes:
+                if new is None:
+                    continue
+                key, entry = _row_item(partition, row_number, new)
+                if entry is not None:
+                    groups.add(key, partition, entry)
+
+        if changes:
+            self._mutate(apply)
+
+    def replace_partition(self, partition: Optional[str], rows: List[Tuple[Optional[int], list]]) -> None:
+        """
+        استبدال مساهمات قسم بمحتواه الحالي كاملاً (بعد تحميل مرآته أو حذف ورقته)
+
+        Args:
+            partition: القسم
+            rows: (رقم الصف أو None للصفوف المعلقة، محتواه) لكل صفوف القسم
+        """
+        def replace(groups: _Groups) -> None:
+            groups.clear_partition(partition)
+            for row_number, row in rows:
+                key, entry = _row_item(partition, row_number, row)
+                if entry is not None:
+                    groups.add(key, partition, entry)
+
+        self._mutate(replace)
+
+    def assign_ids(self, partition: Optional[str], ids: Dict[int, str]) -> None:
+        """
+        تسجيل معرفات كُتبت لصفوف لم يكن لها معرف
+
+        Args:
+            partition: القسم
+            ids: رقم الصف -> المعرف الجديد
+        """
+        for row_number, product_id in ids.items():
+            old = location_key(partition, row_number)
+            self._mutate(lambda groups, old=old, new=product_id: groups.rekey(old, new))
+
+    def remove_ids(self, ids: List[str]) -> None:
+        """
+        تسجيل منتجات حُذفت من محرك التخزين
+
+        إذا لم يُعرف أحد المعرفات فربما حُسب صفه بموقعه قبل كتابة معرفه؛ يُعاد حساب الأقسام
+        التي فيها مساهمات بدون معرف في الخلفية.
+
+        Args:
+            ids: معرفات المنتجات المحذوفة فعلاً
+        """
+        missed = [
+            product_id for product_id in ids
+            if self._mutate(lambda groups, key=product_id: groups.remove(key)) is False
+        ]
+        if missed:
+            located = self._groups.located_partitions()
+            if located:
+                logger.info(f"{len(missed)} منتج محذوف غير معروف في المجاميع، إعادة حساب {len(located)} قسم")
+                self.schedule_refresh(located)
+
+    async def rebuild(self) -> None:
+        """
+        بناء المجاميع من السجل الكامل
+
+        المجاميع الحالية تبقى صالحة حتى يكتمل البناء ثم تُستبدل. إذا فشل البناء تبقى كما هي.
+        """
+        await self._read(None)
+
+    async def refresh(self, partitions: Iterable[Optional[str]]) -> None:
+        """
+        إعادة حساب مساهمات أقسام معينة من مصدرها، وبقية الأقسام كما هي
+
+        Args:
+            partitions: الأقسام (يُبنى كل شيء إذا لم تكن المجاميع مبنية بعد)
+        """
+        await self._read(set(partitions) if self._groups is not None else None)
+
+    async def _read(self, partitions: Optional[Set[Optional[str]]]) -> None:
+        """قراءة الأقسام (None = الكل) من المصدر واستبدال مساهماتها"""
+        started = time.monotonic()
+        fresh = _Groups()
+        read: Set[Optional[str]] = set()
+        self._changes = []
+        try:
+            async for partition, products in self.source(partitions):
+                read.add(partition)
+                for product in products:
+                    entry = _entry(product.get('date', ''), product.get('name', ''), product.get('price'),
+                                   chat_key(product.get('chat_id')))
+                    if entry is not None:
+                        key = _product_key(partition, product.get('id'), product.get('sheet_row'))
+                        fresh.add(key, partition, entry)
+            # ما أضيف أو حُذف أثناء القراءة (الإضافة المقروءة مسبقاً لا تُحسب مرتين)
+            for operation in self._changes:
+                operation(fresh)
+        finally:
+            self._changes = None
+
+        elapsed = time.monotonic() - started
+        if partitions is None or self._groups is None:
+            self._groups = fresh
+            self._rebuilds += 1
+            self._last_rebuild = time.monotonic()
+            self._rebuild_time = elapsed
+            logger.info(f"تم بناء مجاميع المشتريات من {len(fresh.entries)} منتج في {elapsed:.1f} ثانية")
+            return
+
+        # الأقسام الأخرى في fresh فيها فقط ما أضيف أثناء القراءة، وهو موجود في المجاميع الحالية
+        replaced = partitions | read
+        for partition in replaced:
+            self._groups.clear_partition(partition)
+        for key, (partition, entry) in fresh.entries.items():
+            if partition in replaced:
+                self._groups.add(key, partition, entry)
+        self._refreshes += 1
+        logger.info(f"تمت إعادة حساب مجاميع {len(replaced)} قسم في {elapsed:.1f} ثانية")
+
+    async def _rebuild_loop(self) -> None:
+        """مهمة الخلفية: تنفيذ طلبات البناء المنتظرة مع إعادة المحاولة حتى تنجح"""
+        while self._full or self._dirty:
+            full, partitions = self._full, self._dirty
+            self._full, self._dirty = False, set()
+            try:
+                if full:
+                    await self.rebuild()
+                else:
+                    await self.refresh(partitions)
+                continue
+            except asyncio.CancelledError:
+                # يبقى الطلب منتظراً (المجاميع المحفوظة عند الإيقاف تُعد قديمة)
+                self._full = self._full or full
+                self._dirty |= partitions
+                raise
+            except Exception as e:
+                self._full = self._full or full
+                self._dirty |= partitions
+                self._failures += 1
+                logger.warning(f"تعذر بناء مجاميع المشتريات: {str(e)}، إعادة المحاولة بعد {self.retry_delay:.0f} ثانية")
+            await asyncio.sleep(self.retry_delay)
+
+    def _start(self) -> None:
+        """بدء مهمة البناء في الخلفية (إن لم تكن جارية)"""
+        if self._task is None or self._task.done():
+            self._task = asyncio.get_running_loop().create_task(self._rebuild_loop())
+
+    def schedule_rebuild(self, invalidate: bool = False) -> None:
+        """
+        بدء إعادة البناء في الخلفية (إن لم يكن جارياً)
+
+        Args:
+            invalidate: التوقف عن استخدام المجاميع الحالية حتى يكتمل البناء (بعد تعديل يدوي
+                جعلها غير صحيحة)
+        """
+        if invalidate:
+            self._groups = None
+        self._full = True
+        self._start()
+
+    def schedule_refresh(self, partitions: Iterable[Optional[str]]) -> None:
+        """
+        إعادة حساب أقسام معينة في الخلفية
+
+        Args:
+            partitions: الأقسام (لا شيء إذا لم تكن المجاميع مبنية بعد؛ البناء الأول يشملها)
+        """
+        partitions = set(partitions)
+        if not partitions or self._groups is None:
+            return
+        self._dirty |= partitions
+        self._start()
+
+    async def stop(self) -> None:
+        """إيقاف البناء الجاري (إن وجد)"""
+        if self._task is not None and not self._task.done():
+            self._task.cancel()
+            try:
+                await self._task
+            except asyncio.CancelledError:
+                pass
+        self._task = None
+
+    async def open(self, source_id: str, version: Optional[str]) -> bool:
+        """
+        تحميل المجاميع المحفوظة عند الإغلاق السابق، أو بدء البناء في الخلفية
+
+        المجاميع المحفوظة تُستخدم فقط إذا كانت من المصدر نفسه وبالإصدار نفسه، وأغلق البوت بعد
+        حفظها دون أن يفتحها تشغيل آخر (يُسجل الفتح في الملف ولا يُمسح إلا عند الحفظ التالي).
+
+        Args:
+            source_id: معرف المصدر (جدول البيانات أو المحرك المحلي)
+            version: إصدار المصدر الحالي (None إذا لم يُعرف، فتُبنى المجاميع دائماً)
+
+        Returns:
+            bool: True إذا حُمّلت المجاميع المحفوظة
+        """
+        self._source_id = source_id
+        if self.journal is not None and AGGREGATES_PERSIST:
+            try:
+                snapshot, records = await storage_executor.run(self.journal.load)
+                await storage_executor.run(self.journal.append, [{'op': 'open', 'source': source_id}])
+            except (OSError, ValueError) as e:
+                logger.warning(f"تعذرت قراءة المجاميع المحفوظة: {str(e)}")
+                snapshot, records = None, []
+            if (version is not None and not records and isinstance(snapshot, dict)
+                    and snapshot.get('source') == source_id and snapshot.get('version') == version):
+                try:
+                    self._groups = _Groups.restore(snapshot.get('entries', []))
+                except (TypeError, ValueError, ArithmeticError) as e:
+                    logger.warning(f"تجاهل المجاميع المحفوظة التالفة: {str(e)}")
+                else:
+                    self._restored = True
+                    logger.info(f"تم تحميل مجاميع {len(self._groups.entries)} منتج من الإغلاق السابق")
+                    return True
+        self.schedule_rebuild()
+        return False
+
+    async def close(self, version: Optional[str]) -> None:
+        """
+        إيقاف البناء وحفظ المجاميع للتشغيل التالي
+
+        لا تُحفظ إذا لم يُعرف الإصدار أو كان هناك بناء لم يكتمل، فتُبنى من جديد في التشغيل التالي.
+
+        Args:
+            version: إصدار المصدر الذي تطابقه المجاميع الآن
+        """
+        await self.stop()
+        if self.journal is None or self._source_id is None or not AGGREGATES_PERSIST:
+            return
+        try:
+            if version is not None and self._groups is not None and not (self._full or self._dirty):
+                state = {'source': self._source_id, 'version': version, 'entries': self._groups.dump()}
+                await storage_executor.run(self.journal.compact, state)
+                logger.info(f"تم حفظ مجاميع {len(self._groups.entries)} منتج")
+            await storage_executor.run(self.journal.close)
+        except (OSError, ValueError) as e:
+            logger.warning(f"تعذر حفظ المجاميع: {str(e)}")
+
+    def day_total(self, chat_id: ChatId, day: date) -> Optional[Total]:
+        """مشتريات يوم معين (None إذا لم تُبن المجاميع بعد)"""
+        if self._groups is None:
+            return None
+        return self._groups.lookup(chat_id, GROUP_BY_DAY, date_key(day))
+
+    def month_total(self, chat_id: ChatId, year: int, month: int) -> Optional[Total]:
+        """مشتريات شهر معين (None إذا لم تُبن المجاميع بعد)"""
+        if self._groups is None:
+            return None
+        return self._groups.lookup(chat_id, GROUP_BY_MONTH, f"{year:04d}/{month:02d}")
+
+    def product_total(self, chat_id: ChatId, name: str) -> Optional[Total]:
+        """مشتريات منتج معين في كل السجل (None إذا لم تُبن المجاميع بعد)"""
+        if self._groups is None:
+            return None
+        return self._groups.lookup(chat_id, GROUP_BY_PRODUCT, name)
+
+    def summary(
+        self, chat_id: ChatId, group_by: str = GROUP_BY_PRODUCT,
+        start: Optional[date] = None, end: Optional[date] = None
+    ) -> Optional[List[Dict]]:
+        """
+        ملخص المشتريات مجمعاً حسب اليوم أو الشهر أو المنتج
+
+        Args:
+            chat_id: المحادثة (None = جميع المحادثات)
+            group_by: day أو month أو product
+            start: أول يوم (للتجميع باليوم أو الشهر فقط؛ None = من أول السجل)
+            end: آخر يوم (None = حتى آخره)
+
+        Returns:
+            Optional[List[Dict]]: عناصر بالمفاتيح key, count, total بنفس ترتيب
+            aggregate_products، أو None إذا لم تُبن المجاميع بعد
+        """
+        if group_by not in DIMENSIONS:
+            raise ValueError(f"نوع تجميع غير مدعوم: {group_by}")
+        if self._groups is None:
+            return None
+
+        result = [
+            {'key': key, 'count': count, 'total': float(total)}
+            for key, (count, total) in self._groups.items(chat_id, group_by).items()
+        ]
+        if group_by == GROUP_BY_PRODUCT:
+            return sorted(result, key=lambda g: g['total'], reverse=True)
+        if start is not None or end is not None:
+            width = 10 if group_by == GROUP_BY_DAY else 7
+            first = date_key(start)[:width] if start else ''
+            last = date_key(end)[:width] if end else '~'
+            result = [group for group in result if first <= group['key'] <= last]
+        return sorted(result, key=lambda g: g['key'])
+
+    def get_stats(self) -> Dict[str, Any]:
+        """إحصاءات المجاميع للمراقبة"""
+        groups = self._groups
+        return {
+            'ready': groups is not None,
+            'rebuilding': self._task is not None and not self._task.done(),
+            'products': len(groups.entries) if groups is not None else 0,
+            'groups': sum(
+                len(keys) for chats in groups.groups.values() for keys in chats.values()
+            ) if groups is not None else 0,
+            'rebuilds': self._rebuilds,
+            'refreshes': self._refreshes,
+            'restored': self._restored,
+            'rebuild_time': round(self._rebuild_time, 3),
+            'last_rebuild_age': round(time.monotonic() - self._last_rebuild, 1) if self._last_rebuild is not None else None,
+            'failures': self._failures,
+        }
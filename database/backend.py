@@ -0,0 +1,257 @@
+"""
+واجهة محركات التخزين
+
+جميع عمليات التخزين التي يحتاجها البوت معرفة هنا كواجهة واحدة، ولكل محرك تنفيذه الخاص:
+
+    sheets: Google Sheets (database/sheets.py)
+    memory: قائمة في الذاكرة مع حفظ محلي، تُستخدم أيضاً في الوضع التجريبي (database/memory_backend.py)
+    sqlite: قاعدة بيانات SQLite محلية (database/sqlite_backend.py)
+
+يُختار المحرك عبر المتغير البيئي STORAGE_BACKEND (افتراضي: sheets).
+
+كل منتج يُعاد كقاموس بالمفاتيح: date, name, price, notes, sheet_row, id, chat_id. المعرف id نص
+ثابت يُنشأ مع المنتج ويُحفظ معه، ولا يتغير إذا تحرك الصف أو عُدلت الورقة يدوياً؛ هو ما يُمرر إلى
+delete_many. أما sheet_row فهو موقع الصف داخل المحرك (رقم الصف في Google Sheets، أو رقم
+السجل في المحركات المحلية) ويُستخدم للعرض فقط.
+
+كل صف يحمل معرف المحادثة التي أضافته (chat_id كنص)، وعمليات القراءة والحذف تقبل chat_id
+فلا ترى المحادثة إلا مشترياتها. الصفوف المحفوظة قبل إضافة عمود المحادثة ليس لها مالك
+(chat_id فارغ) وتظهر لجميع المحادثات كما كانت. chat_id=None يعني جميع المحادثات.
+"""
+import os
+import secrets
+from abc import ABC, abstractmethod
+from datetime import date
+from typing import Any, AsyncIterator, Dict, List, Optional, Tuple, Union
+
+# المحرك المستخدم: sheets أو memory أو sqlite
+STORAGE_BACKEND = os.getenv("STORAGE_BACKEND", "sheets").strip().lower()
+
+# أنواع التجميع المدعومة في aggregate
+GROUP_BY_PRODUCT = "product"
+GROUP_BY_DAY = "day"
+
+# عدد المنتجات الافتراضي في كل صفحة عند المرور على السجل كاملاً (انظر iter_pages)
+PAGE_ROWS = 1000
+# حدود النطاق عند عدم تحديد التاريخ (date.min لا يُنسق بأربع خانات فلا يصلح لمقارنة النصوص)
+FIRST_DAY = date(1000, 1, 1)
+LAST_DAY = date(9999, 12, 31)
+
+# موقع المعرف في الصف [التاريخ، المنتج، السعر، الملاحظات، المعرف، المحادثة]
+ID_INDEX = 4
+# موقع معرف المحادثة المالكة في الصف
+CHAT_INDEX = 5
+
+# معرف المحادثة كما يمرره تيليجرام (رقم) أو كما يُخزن (نص)
+ChatId = Optional[Union[int, str]]
+
+def chat_key(chat_id: ChatId) -> str:
+    """
+    معرف المحادثة بالشكل المخزن في الصفوف
+
+    Returns:
+        str: المعرف كنص، أو نص فارغ إذا لم تُحدد محادثة
+    """
+    return '' if chat_id is None else str(chat_id).strip()
+
+def is_visible(owner: str, chat_id: ChatId) -> bool:
+    """
+    هل يظهر صف تملكه المحادثة owner للمحادثة chat_id؟
+
+    الصفوف بدون مالك (قبل إضافة عمود المحادثة) تظهر للجميع، وchat_id=None يرى كل الصفوف.
+    """
+    return chat_id is None or not owner or owner == chat_key(chat_id)
+
+def row_chat(row: list) -> str:
+    """معرف المحادثة المالكة لصف (نص فارغ للصفوف القديمة)"""
+    return str(row[CHAT_INDEX]) if len(row) > CHAT_INDEX and row[CHAT_INDEX] is not None else ''
+
+def new_product_id() -> str:
+    """
+    إنشاء معرف جديد للمنتج
+
+    Returns:
+        str: 12 خانة ست عشرية عشوائية (48 بت)
+    """
+    return secrets.token_hex(6)
+
+def ensure_row_ids(rows: List[list]) -> List[list]:
+    """
+    التأكد من أن لكل صف معرفاً (الصفوف القديمة المحفوظة قبل إضافة المعرفات تُعطى معرفاً جديداً)
+
+    Args:
+        rows: الصفوف بالشكل [التاريخ، المنتج، السعر، الملاحظات، المعرف، المحادثة]
+
+    Returns:
+        List[list]: الصفوف نفسها إذا كانت كاملة، أو نسخ منها مع المعرف
+    """
+    result = []
+    for row in rows:
+        if len(row) <= ID_INDEX or not row[ID_INDEX]:
+            row = list(row[:ID_INDEX]) + [''] * (ID_INDEX - len(row)) + [new_product_id()] + list(row[CHAT_INDEX:])
+        result.append(row)
+    return result
+
+def date_key(day: date) -> str:
+    """
+    تحويل التاريخ إلى الشكل المخزن YYYY/MM/DD (يسمح بمقارنة التواريخ كنصوص)
+
+    Args:
+        day: التاريخ
+
+    Returns:
+        str: التاريخ بالتنسيق المخزن
+    """
+    return day.strftime("%Y/%m/%d")
+
+def in_date_range(product: Dict, start_key: str, end_key: str) -> bool:
+    """هل يقع تاريخ المنتج بين التاريخين (شاملاً الطرفين)؟"""
+    return start_key <= str(product.get('date', ''))[:10] <= end_key
+
+def aggregate_products(products: List[Dict], group_by: str = GROUP_BY_PRODUCT) -> List[Dict]:
+    """
+    تجميع المنتجات حسب اسم المنتج أو اليوم
+
+    Args:
+        products: قائمة المنتجات
+        group_by: product أو day
+
+    Returns:
+        List[Dict]: عناصر بالمفاتيح key, count, total؛ مرتبة حسب المجموع تنازلياً عند
+        التجميع بالمنتج، وحسب اليوم تصاعدياً عند التجميع باليوم
+    """
+    if group_by not in (GROUP_BY_PRODUCT, GROUP_BY_DAY):
+        raise ValueError(f"نوع تجميع غير مدعوم: {group_by}")
+
+    groups: Dict[str, Dict[str, Any]] = {}
+    for product in products:
+        key = product['name'] if group_by == GROUP_BY_PRODUCT else str(product['date'])[:10]
+        group = groups.get(key)
+        if group is None:
+            group = groups[key] = {'key': key, 'count': 0, 'total': 0.0}
+        group['count'] += 1
+        group['total'] += product['price']
+
+    if group_by == GROUP_BY_PRODUCT:
+        return sorted(groups.values(), key=lambda g: g['total'], reverse=True)
+    return sorted(groups.values(), key=lambda g: g['key'])
+
+class StorageBackend(ABC):
+    """
+    الواجهة المشتركة لمحركات التخزين
+
+    الصفوف تُمرر بالشكل [التاريخ، المنتج، السعر، الملاحظات، المعرف، المحادثة] بعد التحقق من
+    صحتها (عمود المحادثة اختياري؛ الصف بدونه ليس له مالك).
+    """
+
+    # اسم المحرك (للسجلات والإحصاءات)
+    name = "backend"
+
+    async def start(self) -> None:
+        """تهيئة المحرك عند بدء البوت"""
+
+    async def close(self) -> None:
+        """إغلاق المحرك بشكل آمن عند إيقاف البوت"""
+
+    async def add(self, row: list) -> None:
+        """
+        إضافة صف واحد
+
+        Args:
+            row: الصف بالشكل [التاريخ، المنتج، السعر، الملاحظات، المعرف، المحادثة]
+        """
+        await self.add_many([row])
+
+    @abstractmethod
+    async def add_many(self, rows: List[list]) -> None:
+        """
+        إضافة عدة صفوف دفعة واحدة
+
+        Args:
+            rows: الصفوف بالشكل [التاريخ، المنتج، السعر، الملاحظات، المعرف، المحادثة]
+        """
+
+    @abstractmethod
+    async def list_recent(self, limit: int, chat_id: ChatId = None) -> List[Dict]:
+        """
+        آخر المنتجات المضافة
+
+        Args:
+            limit: أقصى عدد من المنتجات
+            chat_id: المحادثة المالكة (None = جميع المحادثات)
+
+        Returns:
+            List[Dict]: المنتجات من الأحدث إلى الأقدم
+        """
+
+    @abstractmethod
+    async def query_by_date_range(self, start: date, end: date, chat_id: ChatId = None) -> List[Dict]:
+        """
+        المنتجات المضافة بين تاريخين (شاملاً الطرفين)
+
+        Args:
+            start: تاريخ البداية
+            end: تاريخ النهاية
+            chat_id: المحادثة المالكة (None = جميع المحادثات)
+
+        Returns:
+            List[Dict]: المنتجات من الأحدث إلى الأقدم
+        """
+
+    @abstractmethod
+    async def delete_many(self, ids: List[str], chat_id: ChatId = None) -> Tuple[int, list]:
+        """
+        حذف عدة منتجات
+
+        Args:
+            ids: معرفات المنتجات (id) كما أعادتها list_recent
+            chat_id: المحادثة المالكة؛ منتجات المحادثات الأخرى لا تُحذف (None = أي محادثة)
+
+        Returns:
+            Tuple[int, list]: (عدد المنتجات المحذوفة، المعرفات التي فشل حذفها)
+        """
+
+    async def aggregate(
+        self, start: date, end: date, group_by: str = GROUP_BY_PRODUCT, chat_id: ChatId = None
+    ) -> List[Dict]:
+        """
+        مجموع المشتريات وعددها بين تاريخين، مجمعة حسب المنتج أو اليوم
+
+        Args:
+            start: تاريخ البداية
+            end: تاريخ النهاية
+            group_by: product أو day
+            chat_id: المحادثة المالكة (None = جميع المحادثات)
+
+        Returns:
+            List[Dict]: عناصر بالمفاتيح key, count, total
+        """
+        return aggregate_products(await self.query_by_date_range(start, end, chat_id), group_by)
+
+    async def iter_pages(
+        self, start: Optional[date] = None, end: Optional[date] = None, chat_id: ChatId = None,
+        page_size: int = PAGE_ROWS
+    ) -> AsyncIterator[List[Dict]]:
+        """
+        المرور على المنتجات صفحة بعد صفحة من الأقدم إلى الأحدث
+
+        التنفيذ الافتراضي يقرأ النطاق كاملاً ثم يقسمه؛ المحركات تعيد تعريفه لقراءة صفحة واحدة
+        في كل مرة، فيبقى استهلاك الذاكرة ثابتاً مهما طال السجل.
+
+        Args:
+            start: تاريخ البداية (None = من أول السجل)
+            end: تاريخ النهاية (None = حتى آخره)
+            chat_id: المحادثة المالكة (None = جميع المحادثات)
+            page_size: أقصى عدد من المنتجات في كل صفحة
+
+        Yields:
+            List[Dict]: صفحة من المنتجات
+        """
+        products = await self.query_by_date_range(start or FIRST_DAY, end or LAST_DAY, chat_id)
+        products.reverse()
+        for offset in range(0, len(products), max(1, page_size)):
+            yield products[offset:offset + page_size]
+
+    def get_stats(self) -> Dict[str, Any]:
+        """إحصاءات المحرك للمراقبة"""
+        return {'backend': self.name}
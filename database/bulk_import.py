@@ -0,0 +1,241 @@
+"""
+استيراد المنتجات من الملفات بشكل متدفق
+
+الأمر `python cli.py add-bulk FILE` يقرأ الملف سجلاً بعد سجل (utils/parsers/file_parser.py)
+ويرسل الصفوف إلى محرك التخزين الحالي على دفعات بحجم IMPORT_CHUNK_ROWS، فلا يُحمّل الملف
+في الذاكرة مهما كبر. مع Google Sheets تمر الدفعات بمخزن الكتابة المؤجلة ومحدد المعدل، فيبقى
+الاستيراد ضمن حصة الطلبات ويتباطأ تلقائياً عند امتلاء المخزن.
+
+بعد كل دفعة يُحفظ عدد السجلات المعالجة في ملف نقطة استئناف خاص بالملف، فإذا توقف استيراد
+ملف كبير يكمل تشغيل الأمر نفسه من حيث توقف. تُربط نقطة الاستئناف ببصمة الملف (الحجم ووقت
+التعديل وأول 64KB)؛ إذا تغير الملف يبدأ الاستيراد من أوله. معرفات المنتجات مشتقة من البصمة
+وترتيب السجل، فالسجل نفسه يحمل المعرف نفسه في كل محاولة.
+
+الإعدادات (عبر المتغيرات البيئية):
+    IMPORT_CHUNK_ROWS: عدد الصفوف في كل دفعة (افتراضي: 500)
+    IMPORT_CHECKPOINT_DIR: مجلد نقاط الاستئناف (افتراضي: data/imports)
+"""
+import os
+import json
+import time
+import hashlib
+import logging
+from dataclasses import dataclass, field
+from datetime import datetime
+from typing import Callable, List, Optional
+
+from database.backend import ChatId, chat_key
+from utils.parsers.file_parser import FileFormat, FileRecord, ProductFileReader
+
+# إعداد التسجيل
+logger = logging.getLogger(__name__)
+
+# عدد الصفوف في كل دفعة
+IMPORT_CHUNK_ROWS = int(os.getenv("IMPORT_CHUNK_ROWS", "500"))
+# مجلد نقاط الاستئناف
+IMPORT_CHECKPOINT_DIR = os.getenv(
+    "IMPORT_CHECKPOINT_DIR",
+    os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), "data", "imports")
+)
+# عدد السجلات المرفوضة التي تُسجل تفاصيلها (البقية تُعد فقط)
+IMPORT_MAX_LOGGED_ERRORS = 20
+# حجم الجزء الأول من الملف الداخل في البصمة
+FINGERPRINT_BYTES = 64 * 1024
+
+@dataclass
+class ImportResult:
+    """نتيجة الاستيراد"""
+    records: int = 0  # السجلات المعالجة في هذا التشغيل
+    added: int = 0  # الصفوف المرسلة إلى محرك التخزين
+    invalid: int = 0  # السجلات المرفوضة
+    resumed_from: int = 0  # السجلات التي تخطيناها لأنها استوردت في تشغيل سابق
+    elapsed: float = 0.0
+    errors: List[str] = field(default_factory=list)
+    already_done: bool = False  # اكتمل استيراد هذا الملف من قبل
+
+    @property
+    def rate(self) -> float:
+        """عدد الصفوف المضافة في الثانية"""
+        return self.added / self.elapsed if self.elapsed > 0 else 0.0
+
+def file_fingerprint(path: str) -> str:
+    """بصمة الملف: الحجم ووقت التعديل وتجزئة أول FINGERPRINT_BYTES"""
+    stat = os.stat(path)
+    digest = hashlib.blake2b(digest_size=8)
+    digest.update(f"{stat.st_size}:{stat.st_mtime_ns}:".encode())
+    with open(path, 'rb') as f:
+        digest.update(f.read(FINGERPRINT_BYTES))
+    return digest.hexdigest()
+
+def import_product_id(fingerprint: str, index: int) -> str:
+    """معرف ثابت للسجل رقم index في الملف (12 خانة ست عشرية مثل new_product_id)"""
+    return hashlib.blake2b(f"{fingerprint}:{index}".encode(), digest_size=6).hexdigest()
+
+class ImportCheckpoint:
+    """
+    نقطة استئناف استيراد ملف معين
+
+    تُكتب في ملف JSON باسم مشتق من المسار المطلق للملف المستورد، عبر ملف مؤقت ثم
+    os.replace حتى لا تتلف إذا توقف البرنامج أثناء الكتابة.
+    """
+
+    def __init__(self, path: str, fingerprint: str, directory: str = IMPORT_CHECKPOINT_DIR):
+        self.source = os.path.abspath(path)
+        self.fingerprint = fingerprint
+        name = hashlib.blake2b(self.source.encode(), digest_size=8).hexdigest()
+        self.path = os.path.join(directory, f"{name}.json")
+        self.records = 0
+        self.added = 0
+        self.invalid = 0
+        self.completed = False
+
+    def load(self) -> None:
+        """قراءة آخر نقطة محفوظة (تُتجاهل إذا تغير الملف منذ حفظها)"""
+        if not os.path.exists(self.path):
+            return
+        try:
+            with open(self.path, 'r', encoding='utf-8') as f:
+                data = json.load(f)
+        except (OSError, json.JSONDecodeError) as e:
+            logger.warning(f"تعذرت قراءة نقطة الاستئناف {self.path}: {str(e)}")
+            return
+        if data.get('fingerprint') != self.fingerprint:
+            logger.warning(f"تغير الملف {self.source} منذ آخر استيراد، سيبدأ الاستيراد من أوله")
+            return
+        self.records = data.get('records', 0)
+        self.added = data.get('added', 0)
+        self.invalid = data.get('invalid', 0)
+        self.completed = data.get('completed', False)
+
+    def save(self) -> None:
+        """حفظ النقطة الحالية"""
+        os.makedirs(os.path.dirname(self.path), exist_ok=True)
+        tmp_path = self.path + ".tmp"
+        with open(tmp_path, 'w', encoding='utf-8') as f:
+            json.dump({
+                'source': self.source,
+                'fingerprint': self.fingerprint,
+                'records': self.records,
+                'added': self.added,
+                'invalid': self.invalid,
+                'completed': self.completed,
+                'updated': datetime.now().isoformat(timespec='seconds'),
+            }, f, ensure_ascii=False)
+            f.flush()
+            os.fsync(f.fileno())
+        os.replace(tmp_path, self.path)
+
+    def reset(self) -> None:
+        """البدء من أول الملف"""
+        self.records = self.added = self.invalid = 0
+        self.completed = False
+
+def _log_progress(result: ImportResult, done: int, reader: ProductFileReader) -> None:
+    """عرض التقدم بعد كل دفعة"""
+    percent = 100.0 * reader.bytes_read / reader.size if reader.size else 100.0
+    logger.info(
+        f"تم استيراد {done} سجل ({min(percent, 100.0):.1f}%)، "
+        f"أضيف {result.added} ورُفض {result.invalid}، {result.rate:.0f} صف/ثانية"
+    )
+
+async def import_file(
+    path: str,
+    chat_id: ChatId = None,
+    file_format: Optional[FileFormat] = None,
+    chunk_rows: int = IMPORT_CHUNK_ROWS,
+    restart: bool = False,
+    on_progress: Optional[Callable[[ImportResult, int, ProductFileReader], None]] = _log_progress,
+) -> ImportResult:
+    """
+    استيراد المنتجات من ملف إلى محرك التخزين الحالي
+
+    Args:
+        path: مسار الملف
+        chat_id: المحادثة المالكة للمنتجات (None = بدون مالك)
+        file_format: صيغة الملف (None = حسب الامتداد)
+        chunk_rows: عدد الصفوف في كل دفعة
+        restart: تجاهل نقطة الاستئناف والبدء من أول الملف
+        on_progress: دالة تُستدعى بعد كل دفعة بـ (النتيجة، عدد السجلات المعالجة، القارئ)
+
+    Returns:
+        ImportResult: نتيجة الاستيراد
+
+    Raises:
+        أي استثناء يرفعه محرك التخزين؛ الدفعات السابقة محفوظة في نقطة الاستئناف
+    """
+    from database.sheets import get_backend, validate_product_data, format_date, aggregate_store
+
+    chunk_rows = max(1, chunk_rows)
+    fingerprint = file_fingerprint(path)
+    checkpoint = ImportCheckpoint(path, fingerprint)
+    if restart:
+        checkpoint.reset()
+    else:
+        checkpoint.load()
+
+    result = ImportResult(resumed_from=checkpoint.records)
+    if checkpoint.completed:
+        result.already_done = True
+        return result
+    if checkpoint.records:
+        logger.info(f"استئناف استيراد {path} من السجل {checkpoint.records + 1}")
+
+    backend = get_backend()
+    chat = chat_key(chat_id)
+    started = time.monotonic()
+    rows: List[list] = []
+
+    def reject(record: FileRecord, reason: str) -> None:
+        result.invalid += 1
+        checkpoint.invalid += 1
+        if len(result.errors) < IMPORT_MAX_LOGGED_ERRORS:
+            result.errors.append(f"السطر {record.line}: {reason}")
+
+    async def flush(consumed: int, completed: bool = False) -> None:
+        """إرسال الدفعة الحالية ثم حفظ نقطة الاستئناف"""
+        if rows:
+            await backend.add_many(rows)
+            aggregate_store.add_rows(rows)
+            result.added += len(rows)
+            checkpoint.added += len(rows)
+            rows.clear()
+        checkpoint.records = consumed
+        checkpoint.completed = completed
+        checkpoint.save()
+        result.elapsed = time.monotonic() - started
+        if on_progress is not None:
+            on_progress(result, consumed, reader)
+
+    with ProductFileReader(path, file_format) as reader:
+        consumed = checkpoint.records
+        for record in reader:
+            if record.index < checkpoint.records:
+                continue
+            result.records += 1
+            consumed = record.index + 1
+            if not record.is_valid:
+                reject(record, record.error)
+                continue
+            product = record.product
+            try:
+                validate_product_data(product.product, product.price)
+            except ValueError as e:
+                reject(record, str(e))
+                continue
+            rows.append([
+                record.date or format_date(datetime.now()),
+                product.product.strip(),
+                product.price,
+                product.notes.strip(),
+                import_product_id(fingerprint, record.index),
+                chat,
+            ])
+            if len(rows) >= chunk_rows:
+                await flush(consumed)
+        await flush(consumed, completed=True)
+
+    logger.info(
+        f"اكتمل استيراد {path}: أضيف {result.added} منتج ورُفض {result.invalid} سجل "
+        f"في {result.elapsed:.1f} ثانية"
+    )
+    return result
@@ -0,0 +1,166 @@
+"""
+كشف التعديلات اليدوية على جدول البيانات
+
+مرايا الصفوف تُحدّث بما يضيفه البوت أو يحذفه، لكن المستخدمين يعدلون جدول "المشتريات" مباشرة
+أيضاً (تصحيح سعر، حذف صف، إضافة صفوف). بدلاً من إعادة مزامنة المرايا كل بضع ثوانٍ تحسباً
+لذلك، يُسأل Google Drive على فترات عن رقم إصدار الملف (version) ومن أجرى آخر تعديل؛ الطلب لا
+ينقل أي خلايا. إذا تغير الإصدار بتعديل من خارج البوت تُستدعى دالة المزامنة الموجهة، وإلا تبقى
+المرايا كما هي مهما طال الوقت.
+
+يُعد التغيير من البوت نفسه إذا كان آخر من عدّل الملف هو حساب الخدمة (lastModifyingUser.me)
+وأرسل البوت طلبات كتابة منذ الفحص السابق. تعديل يدوي يتبعه في الفترة نفسها تعديل من البوت
+لا يظهر في الإصدار، فيُكتشف مع التعديل اليدوي التالي.
+
+الإعدادات (عبر المتغيرات البيئية):
+    SHEETS_CHANGE_PROBE_ENABLED: تفعيل الفحص الدوري (افتراضي: 1)
+    SHEETS_CHANGE_PROBE_INTERVAL: الفترة بين فحصين بالثواني (افتراضي: 60)
+"""
+import os
+import asyncio
+import logging
+import time
+from typing import Any, Awaitable, Callable, Dict, Optional
+
+# إعداد التسجيل
+logger = logging.getLogger(__name__)
+
+# تفعيل الفحص الدوري
+SHEETS_CHANGE_PROBE_ENABLED = os.getenv("SHEETS_CHANGE_PROBE_ENABLED", "1") not in ("0", "false", "False", "")
+# الفترة بين فحصين (بالثواني)
+SHEETS_CHANGE_PROBE_INTERVAL = float(os.getenv("SHEETS_CHANGE_PROBE_INTERVAL", "60"))
+
+class ChangeProbe:
+    """
+    فحص دوري لإصدار جدول البيانات
+
+    Args:
+        fetch_func: دالة async تعيد بيانات الملف (version و lastModifyingUser)، أو قاموساً
+            فارغاً إذا لم يكن الجدول مفتوحاً
+        on_change: دالة async تُستدعى عند تعديل الجدول من خارج البوت
+        local_writes: دالة تعيد عدد طلبات الكتابة التي أرسلها البوت حتى الآن
+        interval: الفترة بين فحصين بالثواني
+    """
+
+    def __init__(
+        self,
+        fetch_func: Callable[[], Awaitable[Dict[str, Any]]],
+        on_change: Callable[[], Awaitable[None]],
+        local_writes: Callable[[], int],
+        interval: float = SHEETS_CHANGE_PROBE_INTERVAL,
+    ):
+        self.fetch_func = fetch_func
+        self.on_change = on_change
+        self.local_writes = local_writes
+        self.interval = max(1.0, interval)
+
+        # آخر إصدار تمت مطابقة المرايا معه، وعدد طلبات الكتابة عند فحصه
+        self._version: Optional[str] = None
+        self._writes_seen = 0
+        self._last_success: Optional[float] = None
+        self._task: Optional[asyncio.Task] = None
+
+        # الإحصاءات
+        self._probes = 0
+        self._own_changes = 0
+        self._external_changes = 0
+        self._failures = 0
+
+    @property
+    def active(self) -> bool:
+        """
+        هل يعمل الفحص بنجاح؟
+
+        ما دام الفحص يعمل لا تحتاج المرايا إلى مزامنة دورية؛ إذا توقف (Drive API غير مفعّل
+        أو انقطاع) تعود المرايا إلى المزامنة حسب ROW_CACHE_SYNC_INTERVAL.
+        """
+        return (
+            self._task is not None and not self._task.done() and self._last_success is not None
+            and time.monotonic() - self._last_success < 2 * self.interval
+        )
+
+    @property
+    def version(self) -> Optional[str]:
+        """آخر إصدار تمت مطابقة المرايا معه (None قبل أول فحص)"""
+        return self._version
+
+    def baseline(self, version: str) -> None:
+        """
+        تحديد الإصدار الذي تطابقه البيانات في الذاكرة قبل أول فحص
+
+        التعديلات اليدوية بين قراءة هذا الإصدار وأول فحص تُكتشف في ذلك الفحص بدلاً من أن يصبح
+        إصدارها هو الأساس.
+        """
+        if version and self._version is None:
+            self._version = version
+            self._writes_seen = self.local_writes()
+
+    async def check(self) -> bool:
+        """
+        فحص واحد لإصدار الجدول
+
+        Returns:
+            bool: True إذا عُدّل الجدول من خارج البوت واستُدعيت دالة المزامنة
+        """
+        writes = self.local_writes()
+        info = await self.fetch_func()
+        version = str(info.get('version') or '')
+        if not version:
+            return False
+        self._probes += 1
+        self._last_success = time.monotonic()
+
+        if self._version is None or version == self._version:
+            # أول فحص يحدد الإصدار الذي تطابقه المرايا
+            self._version = version
+            self._writes_seen = writes
+            return False
+
+        own = info.get('lastModifyingUser', {}).get('me', False) and writes != self._writes_seen
+        if own:
+            self._own_changes += 1
+        else:
+            logger.info(f"تم تعديل جدول البيانات من خارج البوت (الإصدار {version}، {info.get('modifiedTime', '')})")
+            await self.on_change()
+            self._external_changes += 1
+        # لا نسجل الإصدار إلا بعد نجاح المزامنة، فتُعاد في الفحص التالي إذا فشلت
+        self._version = version
+        self._writes_seen = writes
+        return not own
+
+    async def _probe_loop(self) -> None:
+        """مهمة الخلفية: فحص الإصدار كل interval ثانية"""
+        while True:
+            try:
+                await self.check()
+            except asyncio.CancelledError:
+                raise
+            except Exception as e:
+                self._failures += 1
+                logger.warning(f"تعذر فحص إصدار جدول البيانات: {str(e)}")
+            await asyncio.sleep(self.interval)
+
+    def start(self) -> None:
+        """بدء الفحص الدوري داخل حلقة الأحداث الحالية"""
+        if self._task is None or self._task.done():
+            self._task = asyncio.get_running_loop().create_task(self._probe_loop())
+
+    async def stop(self) -> None:
+        """إيقاف الفحص الدوري"""
+        if self._task is not None and not self._task.done():
+            self._task.cancel()
+            try:
+                await self._task
+            except asyncio.CancelledError:
+                pass
+        self._task = None
+
+    def get_stats(self) -> dict:
+        """إحصاءات الفحص للمراقبة"""
+        return {
+            'active': self.active,
+            'version': self._version,
+            'probes': self._probes,
+            'own_changes': self._own_changes,
+            'external_changes': self._external_changes,
+            'failures': self._failures,
+        }
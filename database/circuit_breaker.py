@@ -0,0 +1,175 @@
+"""
+قاطع الدائرة لطلبات التخزين
+
+عندما تتكرر أخطاء الاتصال بـ Google Sheets، لا فائدة من إرسال كل طلب جديد لينتظر المهلة
+ثم يفشل. القاطع يراقب الأخطاء المتتالية ويمر بثلاث حالات:
+
+    closed (مغلق): الطلبات تمر بشكل عادي، وتُحسب الأخطاء المتتالية.
+    open (مفتوح): بعد عدد معين من الأخطاء تُرفض الطلبات فوراً لفترة الاستعادة.
+    half_open (نصف مفتوح): بعد فترة الاستعادة يُسمح بطلب تجريبي؛ نجاحه يعيد القاطع
+        إلى الحالة المغلقة، وفشله يعيده إلى الحالة المفتوحة.
+
+بهذا يعود البوت إلى Google Sheets تلقائياً بعد انقطاع مؤقت دون الحاجة لإعادة التشغيل.
+
+الإعدادات (عبر المتغيرات البيئية):
+    CIRCUIT_FAILURE_THRESHOLD: عدد الأخطاء المتتالية قبل فتح القاطع (افتراضي: 5)
+    CIRCUIT_RECOVERY_TIMEOUT: مدة بقاء القاطع مفتوحاً قبل الطلب التجريبي بالثواني (افتراضي: 30)
+    CIRCUIT_HALF_OPEN_PROBES: عدد الطلبات التجريبية المسموح بها معاً (افتراضي: 1)
+"""
+import os
+import logging
+import threading
+import time
+from typing import Any, Dict, Optional
+
+# إعداد التسجيل
+logger = logging.getLogger(__name__)
+
+# عدد الأخطاء المتتالية قبل فتح القاطع
+CIRCUIT_FAILURE_THRESHOLD = int(os.getenv("CIRCUIT_FAILURE_THRESHOLD", "5"))
+# مدة بقاء القاطع مفتوحاً قبل الطلب التجريبي (بالثواني)
+CIRCUIT_RECOVERY_TIMEOUT = float(os.getenv("CIRCUIT_RECOVERY_TIMEOUT", "30"))
+# عدد الطلبات التجريبية المسموح بها معاً في الحالة نصف المفتوحة
+CIRCUIT_HALF_OPEN_PROBES = int(os.getenv("CIRCUIT_HALF_OPEN_PROBES", "1"))
+
+# حالات القاطع
+CLOSED = "closed"
+OPEN = "open"
+HALF_OPEN = "half_open"
+
+class CircuitOpenError(Exception):
+    """يُرفع عند رفض طلب لأن القاطع مفتوح"""
+    pass
+
+class CircuitBreaker:
+    """
+    قاطع دائرة لخدمة تخزين واحدة
+
+    يُستدعى allow_request() قبل كل طلب، ثم record_success() أو record_failure() بعده.
+    آمن للاستخدام من حلقة الأحداث ومن خيوط منفذ التخزين معاً.
+    """
+
+    def __init__(
+        self,
+        name: str,
+        failure_threshold: int = CIRCUIT_FAILURE_THRESHOLD,
+        recovery_timeout: float = CIRCUIT_RECOVERY_TIMEOUT,
+        half_open_probes: int = CIRCUIT_HALF_OPEN_PROBES
+    ):
+        self.name = name
+        self.failure_threshold = max(1, failure_threshold)
+        self.recovery_timeout = recovery_timeout
+        self.half_open_probes = max(1, half_open_probes)
+        self._lock = threading.Lock()
+
+        self._state = CLOSED
+        self._failures = 0
+        self._opened_at = 0.0
+        self._probes = 0
+        self._last_error: Optional[str] = None
+
+        # عدادات الانتقال بين الحالات والطلبات المرفوضة
+        self._transitions = {CLOSED: 0, OPEN: 0, HALF_OPEN: 0}
+        self._rejected = 0
+
+    def _set_state(self, state: str) -> None:
+        """الانتقال إلى حالة جديدة (يجب حجز القفل)"""
+        if state == self._state:
+            return
+        logger.warning(f"قاطع {self.name}: {self._state} -> {state}")
+        self._state = state
+        self._transitions[state] += 1
+        self._probes = 0
+        if state == OPEN:
+            self._opened_at = time.monotonic()
+
+    def _refresh(self) -> None:
+        """الانتقال إلى نصف مفتوح بعد انتهاء فترة الاستعادة (يجب حجز القفل)"""
+        if self._state == OPEN and time.monotonic() - self._opened_at >= self.recovery_timeout:
+            self._set_state(HALF_OPEN)
+
+    @property
+    def state(self) -> str:
+        """الحالة الحالية للقاطع"""
+        with self._lock:
+            self._refresh()
+            return self._state
+
+    def allow_request(self) -> bool:
+        """
+        هل يُسمح بإرسال طلب الآن؟
+
+        في الحالة نصف المفتوحة يُسمح فقط بعدد محدود من الطلبات التجريبية.
+
+        Returns:
+            bool: True إذا كان يمكن إرسال الطلب
+        """
+        with self._lock:
+            self._refresh()
+            if self._state == CLOSED:
+                return True
+            if self._state == HALF_OPEN and self._probes < self.half_open_probes:
+                self._probes += 1
+                return True
+            self._rejected += 1
+            return False
+
+    def check(self) -> None:
+        """
+        التحقق من السماح بالطلب
+
+        Raises:
+            CircuitOpenError: إذا كان القاطع مفتوحاً
+        """
+        if not self.allow_request():
+            raise CircuitOpenError(f"خدمة {self.name} غير متاحة مؤقتاً")
+
+    def record_success(self) -> None:
+        """تسجيل نجاح طلب (يغلق القاطع إذا كان الطلب تجريبياً)"""
+        with self._lock:
+            self._failures = 0
+            if self._state != CLOSED:
+                logger.info(f"قاطع {self.name}: نجح الطلب التجريبي، استعادة الاتصال")
+                self._set_state(CLOSED)
+
+    def record_failure(self, error: Optional[BaseException] = None) -> None:
+        """
+        تسجيل فشل طلب
+
+        Args:
+            error: الخطأ الذي حدث (للمراقبة)
+        """
+        with self._lock:
+            self._failures += 1
+            if error is not None:
+                self._last_error = str(error)
+            if self._state == HALF_OPEN:
+                # فشل الطلب التجريبي: نبدأ فترة استعادة جديدة
+                self._set_state(OPEN)
+            elif self._state == CLOSED and self._failures >= self.failure_threshold:
+                self._set_state(OPEN)
+
+    def release_probe(self) -> None:
+        """إعادة خانة طلب تجريبي لم يصل إلى الخدمة (مثل خطأ في البيانات)"""
+        with self._lock:
+            if self._state == HALF_OPEN and self._probes > 0:
+                self._probes -= 1
+
+    def get_stats(self) -> Dict[str, Any]:
+        """
+        حالة القاطع وعداداته للمراقبة
+
+        Returns:
+            Dict[str, Any]: الحالة، الأخطاء المتتالية، عدد الانتقالات لكل حالة، والطلبات المرفوضة
+        """
+        with self._lock:
+            self._refresh()
+            return {
+                'state': self._state,
+                'consecutive_failures': self._failures,
+                'opened': self._transitions[OPEN],
+                'half_opened': self._transitions[HALF_OPEN],
+                'closed': self._transitions[CLOSED],
+                'rejected': self._rejected,
+                'last_error': self._last_error,
+            }
@@ -0,0 +1,149 @@
+"""
+منفذ عمليات التخزين
+
+عمليات التخزين المتزامنة (SQLite والكتابة في ملفات السجل المحلي وتجديد رمز الوصول لـ
+Google) توقف حلقة الأحداث إذا استُدعيت مباشرة من داخل معالج async. هذا الملف يوفر مجموعة
+خيوط محدودة الحجم تُنفَّذ فيها هذه العمليات، مع مهلة لكل استدعاء وإحصاءات عن طول طابور
+الانتظار.
+
+الإعدادات (عبر المتغيرات البيئية):
+    STORAGE_WORKERS: عدد الخيوط (افتراضي: 4)
+    STORAGE_CALL_TIMEOUT: المهلة الافتراضية لكل استدعاء بالثواني (افتراضي: 30)
+"""
+import os
+import asyncio
+import logging
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor, Future
+from typing import Any, Callable, Dict, Optional
+
+# إعداد التسجيل
+logger = logging.getLogger(__name__)
+
+# عدد الخيوط المخصصة لعمليات التخزين
+STORAGE_WORKERS = int(os.getenv("STORAGE_WORKERS", "4"))
+# المهلة الافتراضية لكل استدعاء (بالثواني)
+STORAGE_CALL_TIMEOUT = float(os.getenv("STORAGE_CALL_TIMEOUT", "30"))
+
+class StorageExecutor:
+    """
+    مجموعة خيوط محدودة لتنفيذ استدعاءات التخزين المتزامنة بعيداً عن حلقة الأحداث
+
+    كل استدعاء له مهلة؛ إذا انتهت المهلة يُرفع TimeoutError للمستدعي. الاستدعاء الذي
+    لم يبدأ بعد يُلغى، أما الذي بدأ فعلاً فلا يمكن إيقافه ويكمل في الخلفية.
+    """
+
+    def __init__(self, max_workers: int = STORAGE_WORKERS, default_timeout: float = STORAGE_CALL_TIMEOUT):
+        self.max_workers = max(1, max_workers)
+        self.default_timeout = default_timeout
+        self._executor: Optional[ThreadPoolExecutor] = None
+        self._lock = threading.Lock()
+
+        # الإحصاءات
+        self._queued = 0
+        self._running = 0
+        self._max_queued = 0
+        self._completed = 0
+        self._failed = 0
+        self._timed_out = 0
+
+    def _get_executor(self) -> ThreadPoolExecutor:
+        """إنشاء مجموعة الخيوط عند أول استخدام"""
+        if self._executor is None:
+            self._executor = ThreadPoolExecutor(
+                max_workers=self.max_workers,
+                thread_name_prefix="storage"
+            )
+            logger.info(f"تم إنشاء منفذ التخزين بعدد {self.max_workers} خيوط")
+        return self._executor
+
+    def _on_done(self, future: Future) -> None:
+        """تحديث العدادات عند إلغاء استدعاء قبل أن يبدأ"""
+        if future.cancelled():
+            with self._lock:
+                self._queued -= 1
+
+    async def run(self, func: Callable, *args, timeout: Optional[float] = None, **kwargs) -> Any:
+        """
+        تنفيذ دالة متزامنة في مجموعة الخيوط وانتظار نتيجتها
+
+        Args:
+            func: الدالة المتزامنة المراد تنفيذها
+            *args: معطيات الدالة
+            timeout: مهلة هذا الاستدعاء بالثواني (None = المهلة الافتراضية)
+            **kwargs: معطيات الدالة المسماة
+
+        Returns:
+            نتيجة الدالة
+
+        Raises:
+            TimeoutError: إذا لم يكتمل الاستدعاء خلال المهلة
+        """
+        deadline = self.default_timeout if timeout is None else timeout
+        submitted_at = time.monotonic()
+
+        def task():
+            with self._lock:
+                self._queued -= 1
+                self._running += 1
+            try:
+                # لا فائدة من بدء استدعاء انتهت مهلته وهو في الطابور
+                if deadline and time.monotonic() - submitted_at > deadline:
+                    raise TimeoutError(f"انتهت مهلة {getattr(func, '__name__', func)} قبل بدء التنفيذ")
+                result = func(*args, **kwargs)
+                with self._lock:
+                    self._completed += 1
+                return result
+            except BaseException:
+                with self._lock:
+                    self._failed += 1
+                raise
+            finally:
+                with self._lock:
+                    self._running -= 1
+
+        with self._lock:
+            self._queued += 1
+            self._max_queued = max(self._max_queued, self._queued)
+            if self._queued > self.max_workers:
+                logger.debug(f"طابور التخزين: {self._queued} استدعاء في الانتظار")
+
+        future = self._get_executor().submit(task)
+        future.add_done_callback(self._on_done)
+
+        try:
+            return await asyncio.wait_for(asyncio.wrap_future(future), deadline or None)
+        except asyncio.TimeoutError:
+            with self._lock:
+                self._timed_out += 1
+            logger.warning(f"انتهت مهلة عملية التخزين {getattr(func, '__name__', func)} ({deadline} ثانية)")
+            raise TimeoutError(f"انتهت مهلة عملية التخزين بعد {deadline} ثانية")
+
+    def get_stats(self) -> Dict[str, Any]:
+        """
+        إحصاءات المنفذ للمراقبة
+
+        Returns:
+            Dict[str, Any]: عدد الخيوط، طول الطابور الحالي والأقصى، وعدادات النتائج
+        """
+        with self._lock:
+            return {
+                'workers': self.max_workers,
+                'queued': self._queued,
+                'running': self._running,
+                'max_queued': self._max_queued,
+                'completed': self._completed,
+                'failed': self._failed,
+                'timed_out': self._timed_out,
+            }
+
+    def shutdown(self, wait: bool = True) -> None:
+        """إيقاف مجموعة الخيوط (مع انتظار الاستدعاءات الجارية افتراضياً)"""
+        if self._executor is not None:
+            self._executor.shutdown(wait=wait)
+            self._executor = None
+            logger.info("تم إيقاف منفذ التخزين")
+
+# المنفذ المشترك لجميع عمليات التخزين
+storage_executor = StorageExecutor()
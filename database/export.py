@@ -0,0 +1,177 @@
+"""
+تصدير المشتريات إلى ملف CSV أو Parquet
+
+يُقرأ السجل من محرك التخزين الحالي صفحة بعد صفحة (StorageBackend.iter_pages) وتُكتب كل صفحة
+في الملف فور وصولها، فلا يبقى في الذاكرة أكثر من صفحة واحدة مهما طال تاريخ المشتريات. مع
+Google Sheets تُقرأ الأوراق على نطاقات ثابتة الحجم بدلاً من get_all_values.
+
+ملفات CSV تُكتب بترميز UTF-8 مع BOM حتى يعرض Excel النصوص العربية بشكل صحيح. صيغة Parquet
+تحتاج إلى مكتبة pyarrow (اختيارية، غير موجودة في requirements.txt)؛ كل صفحة تُكتب كمجموعة
+صفوف (row group) مستقلة.
+
+الإعدادات (عبر المتغيرات البيئية):
+    EXPORT_PAGE_ROWS: عدد المنتجات في كل صفحة (افتراضي: 1000)
+"""
+import os
+import csv
+import time
+import logging
+from dataclasses import dataclass
+from datetime import date, datetime
+from typing import Dict, List, Optional
+
+from database.backend import ChatId
+
+try:
+    import pyarrow
+    import pyarrow.parquet
+except ImportError:
+    pyarrow = None
+
+# إعداد التسجيل
+logger = logging.getLogger(__name__)
+
+# عدد المنتجات في كل صفحة
+EXPORT_PAGE_ROWS = int(os.getenv("EXPORT_PAGE_ROWS", "1000"))
+
+# صيغ التصدير المدعومة
+FORMAT_CSV = "csv"
+FORMAT_PARQUET = "parquet"
+EXPORT_FORMATS = (FORMAT_CSV, FORMAT_PARQUET)
+
+# حقول المنتج المصدرة وعناوين أعمدتها (بنفس ترتيب أعمدة الورقة)
+EXPORT_FIELDS = ['date', 'name', 'price', 'notes', 'id', 'chat_id']
+EXPORT_HEADERS = ["التاريخ", "المنتج", "السعر", "ملاحظات", "المعرف", "المحادثة"]
+
+class ExportError(Exception):
+    """خطأ في التصدير (صيغة غير مدعومة أو مكتبة غير مثبتة)"""
+    pass
+
+@dataclass
+class ExportResult:
+    """نتيجة التصدير"""
+    path: str
+    file_format: str
+    rows: int = 0
+    pages: int = 0
+    elapsed: float = 0.0
+
+def parse_export_date(text: str) -> date:
+    """
+    تحليل تاريخ من مدخلات المستخدم (YYYY-MM-DD أو YYYY/MM/DD)
+
+    Raises:
+        ValueError: إذا لم يكن النص تاريخاً صالحاً
+    """
+    return datetime.strptime(text.strip().replace('-', '/'), "%Y/%m/%d").date()
+
+def _matches(product: Dict, name_filter: Optional[str]) -> bool:
+    """هل يحتوي اسم المنتج على نص التصفية (بدون مراعاة حالة الأحرف)؟"""
+    return not name_filter or name_filter in str(product.get('name', '')).casefold()
+
+class _CsvWriter:
+    """كتابة الصفحات في ملف CSV"""
+
+    def __init__(self, path: str):
+        self._file = open(path, 'w', encoding='utf-8-sig', newline='')
+        self._writer = csv.writer(self._file)
+        self._writer.writerow(EXPORT_HEADERS)
+
+    def write(self, products: List[Dict]) -> None:
+        self._writer.writerows(
+            [product.get(field) if product.get(field) is not None else '' for field in EXPORT_FIELDS]
+            for product in products
+        )
+
+    def close(self) -> None:
+        self._file.close()
+
+class _ParquetWriter:
+    """كتابة الصفحات في ملف Parquet (مجموعة صفوف لكل صفحة)"""
+
+    def __init__(self, path: str):
+        self._schema = pyarrow.schema([
+            (field, pyarrow.float64() if field == 'price' else pyarrow.string()) for field in EXPORT_FIELDS
+        ])
+        self._writer = pyarrow.parquet.ParquetWriter(path, self._schema)
+
+    def write(self, products: List[Dict]) -> None:
+        columns = {
+            field: [
+                float(product[field]) if field == 'price'
+                else (str(product[field]) if product.get(field) is not None else None)
+                for product in products
+            ]
+            for field in EXPORT_FIELDS
+        }
+        self._writer.write_table(pyarrow.Table.from_pydict(columns, schema=self._schema))
+
+    def close(self) -> None:
+        self._writer.close()
+
+def _open_writer(path: str, file_format: str):
+    """إنشاء كاتب الملف حسب الصيغة"""
+    if file_format == FORMAT_CSV:
+        return _CsvWriter(path)
+    if file_format == FORMAT_PARQUET:
+        if pyarrow is None:
+            raise ExportError("التصدير بصيغة Parquet يحتاج إلى مكتبة pyarrow (pip install pyarrow)")
+        return _ParquetWriter(path)
+    raise ExportError(f"صيغة تصدير غير مدعومة: {file_format}")
+
+async def export_products(
+    path: str,
+    file_format: str = FORMAT_CSV,
+    start: Optional[date] = None,
+    end: Optional[date] = None,
+    product: Optional[str] = None,
+    chat_id: ChatId = None,
+    page_size: int = EXPORT_PAGE_ROWS,
+) -> ExportResult:
+    """
+    تصدير المشتريات من محرك التخزين الحالي إلى ملف
+
+    تُكتب المنتجات من الأقدم إلى الأحدث. إذا فشلت القراءة في منتصف التصدير يُحذف الملف
+    الناقص ويُرفع الخطأ.
+
+    Args:
+        path: مسار الملف الناتج
+        file_format: csv أو parquet
+        start: تاريخ البداية (None = من أول السجل)
+        end: تاريخ النهاية (None = حتى آخره)
+        product: لا تُصدر إلا المنتجات التي يحتوي اسمها على هذا النص (None = الجميع)
+        chat_id: المحادثة المالكة؛ تُصدر منتجاتها والمنتجات بدون مالك فقط (None = الجميع)
+        page_size: عدد المنتجات في كل صفحة
+
+    Returns:
+        ExportResult: نتيجة التصدير
+
+    Raises:
+        ExportError: إذا كانت الصيغة غير مدعومة أو pyarrow غير مثبتة
+    """
+    from database.sheets import get_backend
+
+    file_format = file_format.lower()
+    name_filter = product.strip().casefold() if product and product.strip() else None
+    result = ExportResult(path, file_format)
+    started = time.monotonic()
+
+    writer = _open_writer(path, file_format)
+    try:
+        async for page in get_backend().iter_pages(start, end, chat_id, page_size):
+            if name_filter:
+                page = [item for item in page if _matches(item, name_filter)]
+            if not page:
+                continue
+            writer.write(page)
+            result.rows += len(page)
+            result.pages += 1
+    except BaseException:
+        writer.close()
+        os.remove(path)
+        raise
+    writer.close()
+
+    result.elapsed = time.monotonic() - started
+    logger.info(f"تم تصدير {result.rows} منتج إلى {path} في {result.elapsed:.1f} ثانية")
+    return result
@@ -0,0 +1,162 @@
+"""
+كتابة مرة واحدة لكل تحديث من تيليجرام
+
+كل عملية إضافة يطلبها البوت تحمل مفتاحاً مشتقاً من التحديث الذي سببها: رقم الرسالة في
+المحادثة، أو الرسالة التي يحمل زرها الاستعلام مع بيانات الزر. الضغط مرتين على "تأكيد الكل"
+أو إعادة تيليجرام إرسال التحديث نفسه ينتج المفتاح نفسه، فتُتخطى الكتابة الثانية وتُعاد نتيجة
+الأولى. معرفات المنتجات تُشتق من المفتاح أيضاً، فإذا أعادت with_retry المحاولة بعد مهلة
+وصلت فيها الصفوف فعلاً إلى الورقة يُعرف ذلك من عمود المعرف ولا تُكتب مرة أخرى.
+
+الفهرس في الذاكرة ومحدود: يُنسى المفتاح بعد IDEMPOTENCY_TTL ثانية، وتُحذف أقدم المفاتيح إذا
+تجاوز عددها IDEMPOTENCY_MAX_KEYS.
+
+الإعدادات (عبر المتغيرات البيئية):
+    IDEMPOTENCY_TTL: مدة تذكر المفتاح بالثواني (افتراضي: 86400)
+    IDEMPOTENCY_MAX_KEYS: أقصى عدد من المفاتيح في الفهرس (افتراضي: 10000)
+"""
+import os
+import time
+import asyncio
+import hashlib
+import logging
+from collections import OrderedDict
+from typing import Any, Awaitable, Callable, Dict, Optional, Tuple
+
+# إعداد التسجيل
+logger = logging.getLogger(__name__)
+
+# مدة تذكر المفتاح (بالثواني)
+IDEMPOTENCY_TTL = float(os.getenv("IDEMPOTENCY_TTL", "86400"))
+# أقصى عدد من المفاتيح في الفهرس
+IDEMPOTENCY_MAX_KEYS = int(os.getenv("IDEMPOTENCY_MAX_KEYS", "10000"))
+
+def update_write_key(update) -> Optional[str]:
+    """
+    مفتاح الكتابة لتحديث من تيليجرام
+
+    الاستعلام من زر يُعرف بالرسالة التي تحمل الزر وبيانات الزر (لا بمعرف الاستعلام الذي يتغير
+    مع كل ضغطة)، والرسالة برقمها في المحادثة.
+
+    Returns:
+        Optional[str]: المفتاح، أو None إذا لم يحمل التحديث رسالة
+    """
+    query = getattr(update, 'callback_query', None)
+    if query is not None and query.message is not None:
+        return f"cb:{query.message.chat.id}:{query.message.message_id}:{query.data}"
+    message = getattr(update, 'message', None)
+    if message is not None:
+        return f"msg:{message.chat.id}:{message.message_id}"
+    return None
+
+def idempotent_product_id(key: str, index: int) -> str:
+    """معرف ثابت للمنتج رقم index في الكتابة ذات المفتاح key (12 خانة ست عشرية مثل new_product_id)"""
+    return hashlib.blake2b(f"{key}:{index}".encode(), digest_size=6).hexdigest()
+
+class IdempotencyIndex:
+    """
+    فهرس مفاتيح الكتابة المنفذة ونتائجها
+
+    المفتاح الذي فشلت كتابته يبقى في الفهرس كـ "غير مؤكد": ربما وصلت الصفوف قبل الخطأ، فتُبلغ
+    المحاولة التالية بذلك لتتحقق من الورقة قبل الكتابة.
+
+    Args:
+        ttl: مدة تذكر المفتاح بالثواني
+        max_keys: أقصى عدد من المفاتيح
+    """
+
+    def __init__(self, ttl: float = IDEMPOTENCY_TTL, max_keys: int = IDEMPOTENCY_MAX_KEYS):
+        self.ttl = ttl
+        self.max_keys = max(1, max_keys)
+        # المفتاح -> (وقت الانتهاء، هل اكتملت الكتابة، النتيجة)
+        self._keys: 'OrderedDict[str, Tuple[float, bool, Any]]' = OrderedDict()
+        # الكتابات الجارية حسب المفتاح (طلب مكرر يصل أثناء التنفيذ ينتظر نتيجتها)
+        self._inflight: Dict[str, asyncio.Future] = {}
+
+        # الإحصاءات
+        self._writes = 0
+        self._duplicates = 0
+        self._uncertain_retries = 0
+        self._evictions = 0
+
+    def _lookup(self, key: str) -> Optional[Tuple[bool, Any]]:
+        """حالة المفتاح إن كان محفوظاً ولم تنته مدته: (هل اكتملت الكتابة، النتيجة)"""
+        entry = self._keys.get(key)
+        if entry is None:
+            return None
+        if entry[0] <= time.monotonic():
+            del self._keys[key]
+            return None
+        return entry[1], entry[2]
+
+    def _remember(self, key: str, done: bool, result: Any = None) -> None:
+        """حفظ حالة المفتاح مع حذف المنتهية والأقدم إذا امتلأ الفهرس"""
+        now = time.monotonic()
+        self._keys.pop(key, None)
+        self._keys[key] = (now + self.ttl, done, result)
+        while self._keys:
+            oldest_key, (expires, _, _) = next(iter(self._keys.items()))
+            if expires > now and len(self._keys) <= self.max_keys:
+                break
+            del self._keys[oldest_key]
+            if expires > now:
+                self._evictions += 1
+
+    async def run(self, key: Optional[str], write: Callable[[bool], Awaitable[Any]]) -> Any:
+        """
+        تنفيذ كتابة مرة واحدة لكل مفتاح
+
+        Args:
+            key: مفتاح الكتابة (None = بدون حماية من التكرار)
+            write: دالة async تنفذ الكتابة وتعيد نتيجتها؛ تستقبل True إذا فشلت محاولة سابقة
+                بالمفتاح نفسه فربما وصل جزء من الصفوف بالفعل
+
+        Returns:
+            نتيجة الكتابة، أو نتيجة الكتابة الأولى إذا كان المفتاح منفذاً من قبل
+        """
+        if key is None:
+            return await write(False)
+
+        state = self._lookup(key)
+        if state is not None and state[0]:
+            self._duplicates += 1
+            logger.info(f"تجاهل كتابة مكررة للمفتاح {key}")
+            return state[1]
+        inflight = self._inflight.get(key)
+        if inflight is not None:
+            self._duplicates += 1
+            logger.info(f"كتابة المفتاح {key} جارية، انتظار نتيجتها بدلاً من تكرارها")
+            return await asyncio.shield(inflight)
+
+        uncertain = state is not None
+        if uncertain:
+            self._uncertain_retries += 1
+        future = asyncio.get_running_loop().create_future()
+        self._inflight[key] = future
+        try:
+            result = await write(uncertain)
+        except BaseException as e:
+            self._remember(key, False)
+            if isinstance(e, Exception):
+                future.set_exception(e)
+                # لا يُنتظر المستقبل دائماً؛ نعلّم الاستثناء كمقروء حتى لا يُسجل تحذير
+                future.exception()
+            else:
+                future.cancel()
+            raise
+        finally:
+            del self._inflight[key]
+        self._writes += 1
+        self._remember(key, True, result)
+        future.set_result(result)
+        return result
+
+    def get_stats(self) -> dict:
+        """إحصاءات الفهرس للمراقبة"""
+        return {
+            'keys': len(self._keys),
+            'inflight': len(self._inflight),
+            'writes': self._writes,
+            'duplicates': self._duplicates,
+            'uncertain_retries': self._uncertain_retries,
+            'evictions': self._evictions,
+        }
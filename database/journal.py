@@ -0,0 +1,208 @@
+"""
+سجل تعديلات دائم (append-only) مع لقطات دورية
+
+بدلاً من إعادة كتابة الملف كاملاً بعد كل تعديل، يُضاف سطر JSON واحد لكل تعديل في نهاية
+السجل، فتبقى تكلفة الكتابة ثابتة مهما كبرت البيانات. عند التشغيل تُقرأ آخر لقطة ثم تُعاد
+التعديلات المسجلة بعدها. عندما يكبر السجل تُكتب لقطة جديدة من الحالة الحالية ويُفرّغ السجل.
+
+التوقف المفاجئ أثناء الكتابة قد يقطع السطر الأخير فقط؛ يُتجاهل هذا السطر عند التحميل
+ويُقص من الملف، وبقية التاريخ تبقى سليمة. اللقطة تُكتب في ملف مؤقت ثم تستبدل القديمة دفعة
+واحدة، لذلك لا توجد لحظة تكون فيها اللقطة نصف مكتوبة.
+
+الإعدادات (عبر المتغيرات البيئية):
+    JOURNAL_FSYNC_INTERVAL: أقل فترة بين عمليتي fsync بالثواني (افتراضي: 1)
+    JOURNAL_COMPACT_RECORDS: عدد السجلات الذي تُكتب بعده لقطة جديدة (افتراضي: 1000)
+"""
+import os
+import json
+import logging
+import threading
+import time
+from typing import Any, Dict, List, Optional, Tuple
+
+# إعداد التسجيل
+logger = logging.getLogger(__name__)
+
+# أقل فترة بين عمليتي fsync (بالثواني)؛ 0 يعني fsync بعد كل كتابة
+JOURNAL_FSYNC_INTERVAL = float(os.getenv("JOURNAL_FSYNC_INTERVAL", "1"))
+# عدد السجلات الذي تُكتب بعده لقطة جديدة ويُفرّغ السجل
+JOURNAL_COMPACT_RECORDS = int(os.getenv("JOURNAL_COMPACT_RECORDS", "1000"))
+
+class RecordJournal:
+    """
+    سجل تعديلات في ملف JSONL مع ملف لقطة
+
+    عمليات الكتابة متزامنة وآمنة للاستدعاء من خيوط منفذ التخزين. الكتابة تصل إلى نظام
+    التشغيل فوراً (لا تضيع إذا توقفت العملية)، أما fsync فيُجمع بحيث لا يتكرر أكثر من مرة
+    كل fsync_interval ثانية، ويُنفذ دائماً عند الإغلاق وعند كتابة لقطة.
+
+    Args:
+        path: مسار ملف السجل
+        snapshot_path: مسار ملف اللقطة
+    """
+
+    def __init__(
+        self,
+        path: str,
+        snapshot_path: str,
+        fsync_interval: float = JOURNAL_FSYNC_INTERVAL,
+        compact_records: int = JOURNAL_COMPACT_RECORDS
+    ):
+        self.path = path
+        self.snapshot_path = snapshot_path
+        self.fsync_interval = fsync_interval
+        self.compact_records = max(1, compact_records)
+        self._lock = threading.Lock()
+        self._file = None
+        self._last_fsync = 0.0
+        self._unsynced = 0
+        # عدد السجلات في الملف منذ آخر لقطة
+        self._records = 0
+
+        # الإحصاءات
+        self._appended = 0
+        self._fsyncs = 0
+        self._compactions = 0
+
+    @property
+    def exists(self) -> bool:
+        """هل يوجد سجل أو لقطة سابقة؟"""
+        return os.path.exists(self.path) or os.path.exists(self.snapshot_path)
+
+    def load(self) -> Tuple[Optional[Any], List[Dict]]:
+        """
+        قراءة آخر لقطة والسجلات المضافة بعدها
+
+        السطر الأخير المقطوع (إن وجد) يُقص من الملف حتى لا تلتصق به الكتابات التالية.
+
+        Returns:
+            Tuple[Optional[Any], List[Dict]]: (محتوى اللقطة أو None، السجلات بترتيب كتابتها)
+        """
+        snapshot = None
+        if os.path.exists(self.snapshot_path):
+            with open(self.snapshot_path, 'r', encoding='utf-8') as f:
+                snapshot = json.load(f)
+
+        records: List[Dict] = []
+        if not os.path.exists(self.path):
+            return snapshot, records
+
+        good_offset = 0
+        with open(self.path, 'rb') as f:
+            for line in f:
+                # سطر بدون نهاية يعني كتابة لم تكتمل
+                try:
+                    if not line.endswith(b"\n"):
+                        raise ValueError("سطر غير مكتمل")
+                    if line.strip():
+                        records.append(json.loads(line))
+                except ValueError:
+                    logger.warning(f"تجاهل سجل تالف في {self.path} عند الموضع {good_offset}")
+                    break
+                good_offset += len(line)
+
+        if good_offset < os.path.getsize(self.path):
+            with open(self.path, 'r+b') as f:
+                f.truncate(good_offset)
+                f.flush()
+                os.fsync(f.fileno())
+
+        self._records = len(records)
+        return snapshot, records
+
+    def _open(self):
+        """فتح ملف السجل للإضافة (يجب حجز القفل)"""
+        if self._file is None:
+            directory = os.path.dirname(self.path)
+            if directory:
+                os.makedirs(directory, exist_ok=True)
+            self._file = open(self.path, 'a', encoding='utf-8')
+        return self._file
+
+    def _fsync(self) -> None:
+        """تنفيذ fsync للكتابات المعلقة (يجب حجز القفل)"""
+        if self._file is not None and self._unsynced:
+            os.fsync(self._file.fileno())
+            self._fsyncs += 1
+            self._unsynced = 0
+        self._last_fsync = time.monotonic()
+
+    def append(self, records: List[Dict]) -> None:
+        """
+        إضافة سجلات في نهاية الملف
+
+        Args:
+            records: السجلات (قواميس قابلة للتحويل إلى JSON)
+        """
+        if not records:
+            return
+        with self._lock:
+            f = self._open()
+            f.write("".join(json.dumps(r, ensure_ascii=False) + "\n" for r in records))
+            f.flush()
+            self._unsynced += len(records)
+            self._records += len(records)
+            self._appended += len(records)
+            if time.monotonic() - self._last_fsync >= self.fsync_interval:
+                self._fsync()
+
+    def sync(self) -> None:
+        """fsync فوري لأي كتابات معلقة"""
+        with self._lock:
+            self._fsync()
+
+    def needs_compaction(self) -> bool:
+        """هل تجاوز السجل الحد الذي تُكتب بعده لقطة جديدة؟"""
+        return self._records >= self.compact_records
+
+    def compact(self, state: Any) -> None:
+        """
+        كتابة لقطة من الحالة الحالية ثم تفريغ السجل
+
+        يجب أن تشمل الحالة كل السجلات المكتوبة حتى الآن. إذا توقف البوت بين استبدال اللقطة
+        وتفريغ السجل تُعاد السجلات فوق اللقطة الجديدة، لذلك يجب أن يكون تطبيقها مرة ثانية
+        بلا أثر.
+
+        Args:
+            state: الحالة الكاملة (قابلة للتحويل إلى JSON)
+        """
+        with self._lock:
+            tmp_path = self.snapshot_path + ".tmp"
+            with open(tmp_path, 'w', encoding='utf-8') as f:
+                json.dump(state, f, ensure_ascii=False)
+                f.flush()
+                os.fsync(f.fileno())
+            os.replace(tmp_path, self.snapshot_path)
+
+            if self._file is not None:
+                self._file.close()
+                self._file = None
+            with open(self.path, 'w', encoding='utf-8') as f:
+                f.flush()
+                os.fsync(f.fileno())
+            self._records = 0
+            self._unsynced = 0
+            self._compactions += 1
+        logger.info(f"تم ضغط السجل {os.path.basename(self.path)} في لقطة جديدة")
+
+    def close(self) -> None:
+        """fsync وإغلاق الملف"""
+        with self._lock:
+            self._fsync()
+            if self._file is not None:
+                self._file.close()
+                self._file = None
+
+    def get_stats(self) -> Dict[str, Any]:
+        """
+        إحصاءات السجل للمراقبة
+
+        Returns:
+            Dict[str, Any]: عدد السجلات منذ آخر لقطة، والسجلات المكتوبة، وعمليات fsync والضغط
+        """
+        return {
+            'records': self._records,
+            'appended': self._appended,
+            'fsyncs': self._fsyncs,
+            'compactions': self._compactions,
+        }
@@ -0,0 +1,379 @@
+"""
+سجل مشتريات مضغوط في الذاكرة
+
+بدلاً من قائمة قواميس (مئات البايتات لكل منتج)، تُخزن الأعمدة في مصفوفات array متجاورة:
+المفتاح، رقم اليوم (ordinal)، السعر، ورقم اسم المنتج والملاحظات في جدول نصوص مشترك
+(كل اسم يُخزن مرة واحدة مهما تكرر). تكلفة المنتج الواحد في الأعمدة حوالي 40 بايت، لذلك يبقى سجل
+سنوات من المشتريات في بضعة ميغابايت ويمكن المرور عليه بسرعة.
+
+معرف كل منتج (12 خانة ست عشرية) يُخزن كعدد صحيح في عمود خاص، مع فهرس من المعرف إلى
+المفتاح للوصول المباشر عند الحذف.
+
+المحادثة المالكة تُخزن كرقم في جدول النصوص، ولكل محادثة قائمة مفاتيح صفوفها بالترتيب،
+فقراءة مشتريات محادثة لا تمر على صفوف المحادثات الأخرى.
+
+المعالجات تتعامل مع المنتجات عبر RowView: كائن خفيف يتصرف كقاموس للقراءة فقط
+(date, name, price, notes, sheet_row, id, chat_id) دون نسخ البيانات.
+"""
+import heapq
+import logging
+from array import array
+from bisect import bisect_left, bisect_right
+from collections.abc import Mapping
+from datetime import date, datetime
+from itertools import islice
+from typing import Any, Dict, Iterable, Iterator, List, Optional
+
+# إعداد التسجيل
+logger = logging.getLogger(__name__)
+
+# تنسيق التاريخ المخزن
+DATE_FORMAT = "%Y/%m/%d"
+# رقم اليوم للتواريخ التي لا يمكن تحليلها (يُحفظ نصها الأصلي بشكل منفصل)
+UNKNOWN_DAY = 0
+# لا نضغط المصفوفات قبل أن يبلغ عدد الصفوف المحذوفة هذا الحد
+COMPACT_MIN_DEAD = 1024
+# طول معرف المنتج بالخانات الست عشرية
+ID_LENGTH = 12
+
+def parse_day(value: str) -> int:
+    """
+    تحويل تاريخ بالشكل YYYY/MM/DD إلى رقم اليوم
+
+    Returns:
+        int: رقم اليوم (date.toordinal) أو UNKNOWN_DAY إذا تعذر التحليل
+    """
+    try:
+        return datetime.strptime(str(value)[:10], DATE_FORMAT).toordinal()
+    except ValueError:
+        return UNKNOWN_DAY
+
+def parse_id(product_id: str) -> int:
+    """
+    تحويل معرف المنتج إلى عدد صحيح للتخزين
+
+    Raises:
+        ValueError: إذا لم يكن المعرف 12 خانة ست عشرية
+    """
+    if not isinstance(product_id, str) or len(product_id) != ID_LENGTH:
+        raise ValueError(f"معرف غير صالح: {product_id!r}")
+    return int(product_id, 16)
+
+def format_id(value: int) -> str:
+    """تحويل المعرف المخزن إلى نصه الأصلي"""
+    return f"{value:0{ID_LENGTH}x}"
+
+class _Columns:
+    """أعمدة الصفوف؛ تُستبدل بنسخة جديدة عند الضغط ولا تُعدل الصفوف الموجودة فيها أبداً"""
+
+    __slots__ = ('keys', 'ids', 'days', 'prices', 'names', 'notes', 'chats', 'alive')
+
+    def __init__(self):
+        self.keys = array('q')
+        self.ids = array('q')
+        self.days = array('i')
+        self.prices = array('d')
+        self.names = array('i')
+        self.notes = array('i')
+        self.chats = array('i')
+        self.alive = bytearray()
+
+class RowView(Mapping):
+    """
+    عرض للقراءة فقط لصف واحد في السجل
+
+    يبقى صالحاً حتى بعد حذف الصف أو ضغط السجل (يشير إلى نسخة الأعمدة التي أُنشئ منها)،
+    لذلك يمكن حفظه في بيانات المحادثة واستخدامه لاحقاً.
+    """
+
+    __slots__ = ('_ledger', '_columns', '_slot')
+
+    FIELDS = ('date', 'name', 'price', 'notes', 'sheet_row', 'id', 'chat_id')
+
+    def __init__(self, ledger: 'Ledger', columns: _Columns, slot: int):
+        self._ledger = ledger
+        self._columns = columns
+        self._slot = slot
+
+    def __getitem__(self, field: str) -> Any:
+        columns, slot = self._columns, self._slot
+        if field == 'date':
+            return self._ledger.format_day(columns.days[slot], columns.keys[slot])
+        if field == 'name':
+            return self._ledger.strings[columns.names[slot]]
+        if field == 'price':
+            return columns.prices[slot]
+        if field == 'notes':
+            return self._ledger.strings[columns.notes[slot]]
+        if field == 'sheet_row':
+            return columns.keys[slot]
+        if field == 'id':
+            return format_id(columns.ids[slot])
+        if field == 'chat_id':
+            return self._ledger.strings[columns.chats[slot]]
+        raise KeyError(field)
+
+    def __iter__(self) -> Iterator[str]:
+        return iter(self.FIELDS)
+
+    def __len__(self) -> int:
+        return len(self.FIELDS)
+
+    def __repr__(self) -> str:
+        return repr(dict(self))
+
+class Ledger:
+    """
+    سجل المنتجات بتخزين عمودي
+
+    المفاتيح يجب أن تُضاف بترتيب تصاعدي (كما يعطيها المحرك)، فيُبحث عن المفتاح بالبحث
+    الثنائي دون فهرس إضافي. الحذف يضع علامة على الصف فقط، وتُضغط المصفوفات عندما تصبح
+    الصفوف المحذوفة أكثر من الموجودة.
+    """
+
+    def __init__(self):
+        self._columns = _Columns()
+        self._alive_count = 0
+        # جدول النصوص المشترك (أسماء المنتجات والملاحظات)
+        self.strings: List[str] = ['']
+        self._string_ids: Dict[str, int] = {'': 0}
+        # فهرس المعرف -> المفتاح
+        self._keys_by_id: Dict[int, int] = {}
+        # مفاتيح صفوف كل محادثة بترتيب تصاعدي (حسب رقم المحادثة في جدول النصوص)
+        self._keys_by_chat: Dict[int, array] = {}
+        # نصوص الأيام المحسوبة مسبقاً، والتواريخ التي تعذر تحليلها حسب المفتاح
+        self._day_strings: Dict[int, str] = {}
+        self._raw_dates: Dict[int, str] = {}
+
+    def __len__(self) -> int:
+        return self._alive_count
+
+    def __contains__(self, key: int) -> bool:
+        return self._find(key) is not None
+
+    @property
+    def last_key(self) -> Optional[int]:
+        """آخر مفتاح أُضيف (None إذا كان السجل فارغاً)"""
+        keys = self._columns.keys
+        return keys[-1] if keys else None
+
+    def _intern(self, value: str) -> int:
+        """رقم النص في الجدول المشترك (يُضاف إذا لم يكن موجوداً)"""
+        value = value or ''
+        index = self._string_ids.get(value)
+        if index is None:
+            index = len(self.strings)
+            self.strings.append(value)
+            self._string_ids[value] = index
+        return index
+
+    def _find(self, key: int) -> Optional[int]:
+        """موضع الصف الموجود بهذا المفتاح أو None"""
+        columns = self._columns
+        slot = bisect_left(columns.keys, key)
+        if slot < len(columns.keys) and columns.keys[slot] == key and columns.alive[slot]:
+            return slot
+        return None
+
+    def find_id(self, product_id: str) -> Optional[int]:
+        """مفتاح المنتج بهذا المعرف أو None"""
+        try:
+            return self._keys_by_id.get(parse_id(product_id))
+        except ValueError:
+            return None
+
+    def _chat_groups(self, chat: str) -> List[array]:
+        """قوائم مفاتيح صفوف المحادثة والصفوف التي ليس لها مالك"""
+        groups = []
+        index = self._string_ids.get(chat) if chat else None
+        for chat_index in (index, 0):
+            keys = self._keys_by_chat.get(chat_index) if chat_index is not None else None
+            if keys:
+                groups.append(keys)
+        return groups
+
+    def _iter_chat_latest(self, chat: str) -> Iterator[int]:
+        """مواضع صفوف المحادثة (والصفوف بدون مالك) الموجودة من الأحدث إلى الأقدم"""
+        for key in heapq.merge(*(reversed(keys) for keys in self._chat_groups(chat)), reverse=True):
+            slot = self._find(key)
+            if slot is not None:
+                yield slot
+
+    def format_day(self, day: int, key: int) -> str:
+        """نص التاريخ لرقم اليوم (أو النص الأصلي إذا تعذر تحليله عند الإضافة)"""
+        if day == UNKNOWN_DAY:
+            return self._raw_dates.get(key, '')
+        text = self._day_strings.get(day)
+        if text is None:
+            text = self._day_strings[day] = date.fromordinal(day).strftime(DATE_FORMAT)
+        return text
+
+    def append(
+        self, key: int, product_id: str, row_date: str, name: str, price: float, notes: str, chat: str = ''
+    ) -> None:
+        """
+        إضافة صف في نهاية السجل
+
+        Args:
+            chat: معرف المحادثة المالكة (نص فارغ = بدون مالك)
+
+        Raises:
+            ValueError: إذا لم يكن المفتاح أكبر من آخر مفتاح، أو كان المعرف غير صالح أو مكرراً
+        """
+        last = self.last_key
+        if last is not None and key <= last:
+            raise ValueError(f"المفتاح {key} ليس أكبر من آخر مفتاح {last}")
+        uid = parse_id(product_id)
+        if uid in self._keys_by_id:
+            raise ValueError(f"المعرف {product_id} مستخدم بالفعل")
+
+        day = parse_day(row_date)
+        if day == UNKNOWN_DAY and row_date:
+            self._raw_dates[key] = str(row_date)
+
+        columns = self._columns
+        columns.keys.append(key)
+        columns.ids.append(uid)
+        columns.days.append(day)
+        columns.prices.append(float(price))
+        columns.names.append(self._intern(name))
+        columns.notes.append(self._intern(notes))
+        chat_index = self._intern(chat)
+        columns.chats.append(chat_index)
+        columns.alive.append(1)
+        self._keys_by_chat.setdefault(chat_index, array('q')).append(key)
+        self._keys_by_id[uid] = key
+        self._alive_count += 1
+
+    def delete(self, key: int) -> bool:
+        """
+        حذف صف حسب مفتاحه
+
+        Returns:
+            bool: True إذا كان الصف موجوداً
+        """
+        slot = self._find(key)
+        if slot is None:
+            return False
+        self._columns.alive[slot] = 0
+        self._keys_by_id.pop(self._columns.ids[slot], None)
+        self._alive_count -= 1
+        self._raw_dates.pop(key, None)
+        self._maybe_compact()
+        return True
+
+    def get(self, key: int) -> Optional[RowView]:
+        """عرض الصف بهذا المفتاح أو None"""
+        slot = self._find(key)
+        return RowView(self, self._columns, slot) if slot is not None else None
+
+    def _maybe_compact(self) -> None:
+        """نسخ الصفوف الموجودة إلى أعمدة جديدة إذا أصبحت الصفوف المحذوفة هي الأغلب"""
+        old = self._columns
+        dead = len(old.keys) - self._alive_count
+        if dead < COMPACT_MIN_DEAD or dead < self._alive_count:
+            return
+        new = _Columns()
+        for slot in range(len(old.keys)):
+            if old.alive[slot]:
+                new.keys.append(old.keys[slot])
+                new.ids.append(old.ids[slot])
+                new.days.append(old.days[slot])
+                new.prices.append(old.prices[slot])
+                new.names.append(old.names[slot])
+                new.notes.append(old.notes[slot])
+                new.chats.append(old.chats[slot])
+                new.alive.append(1)
+        # العروض القديمة تبقى مرتبطة بالأعمدة القديمة ولا تتأثر
+        self._columns = new
+        # قوائم المحادثات تحتفظ بمفاتيح الصفوف المحذوفة حتى الضغط
+        by_chat: Dict[int, array] = {}
+        for key, chat_index in zip(new.keys, new.chats):
+            by_chat.setdefault(chat_index, array('q')).append(key)
+        self._keys_by_chat = by_chat
+        logger.debug(f"تم ضغط السجل: حذف {dead} صف من الذاكرة")
+
+    def iter_rows(self) -> Iterator[RowView]:
+        """المرور على الصفوف من الأقدم إلى الأحدث"""
+        columns = self._columns
+        alive = columns.alive
+        for slot in range(len(columns.keys)):
+            if alive[slot]:
+                yield RowView(self, columns, slot)
+
+    def _latest_slots(self, chat: Optional[str]) -> Iterable[int]:
+        """مواضع الصفوف من الأحدث إلى الأقدم، لمحادثة واحدة أو للجميع (None)"""
+        if chat is not None:
+            return self._iter_chat_latest(chat)
+        alive = self._columns.alive
+        return (slot for slot in range(len(alive) - 1, -1, -1) if alive[slot])
+
+    def iter_latest(self, chat: Optional[str] = None) -> Iterator[RowView]:
+        """
+        المرور على الصفوف من الأحدث إلى الأقدم
+
+        Args:
+            chat: معرف المحادثة؛ تُعاد صفوفها والصفوف بدون مالك فقط (None = جميع الصفوف)
+        """
+        columns = self._columns
+        for slot in self._latest_slots(chat):
+            yield RowView(self, columns, slot)
+
+    def iter_day_range(self, start: date, end: date, chat: Optional[str] = None) -> Iterator[RowView]:
+        """
+        الصفوف بين تاريخين (شاملاً الطرفين) من الأحدث إلى الأقدم
+
+        Args:
+            start: تاريخ البداية
+            end: تاريخ النهاية
+            chat: معرف المحادثة (None = جميع الصفوف)
+        """
+        first, last = start.toordinal(), end.toordinal()
+        columns = self._columns
+        days = columns.days
+        for slot in self._latest_slots(chat):
+            if first <= days[slot] <= last:
+                yield RowView(self, columns, slot)
+
+    def iter_after(
+        self, after_key: int, start: Optional[date] = None, end: Optional[date] = None, chat: Optional[str] = None
+    ) -> Iterator[RowView]:
+        """
+        الصفوف التي مفاتيحها أكبر من after_key من الأقدم إلى الأحدث
+
+        يُستخدم للمرور على السجل صفحة بعد صفحة: تبدأ كل صفحة بعد آخر مفتاح في سابقتها، فلا
+        تتأثر الصفحات التالية بالإضافة أو الحذف أو الضغط بينها.
+
+        Args:
+            after_key: آخر مفتاح في الصفحة السابقة (0 = من أول السجل)
+            start: تاريخ البداية (None = بدون حد)
+            end: تاريخ النهاية (None = بدون حد)
+            chat: معرف المحادثة (None = جميع الصفوف)
+        """
+        first = start.toordinal() if start is not None else None
+        last = end.toordinal() if end is not None else None
+        columns = self._columns
+        days = columns.days
+        if chat is None:
+            slots = (slot for slot in range(bisect_right(columns.keys, after_key), len(columns.keys))
+                     if columns.alive[slot])
+        else:
+            keys = heapq.merge(*(
+                islice(group, bisect_right(group, after_key), None) for group in self._chat_groups(chat)
+            ))
+            slots = (slot for slot in map(self._find, keys) if slot is not None)
+        for slot in slots:
+            day = days[slot]
+            if (first is None or first <= day) and (last is None or day <= last):
+                yield RowView(self, columns, slot)
+
+    def memory_usage(self) -> int:
+        """تقدير حجم الأعمدة في الذاكرة بالبايت (بدون جدول النصوص وفهرس المعرفات)"""
+        columns = self._columns
+        return sum(
+            len(col) * col.itemsize
+            for col in (
+                columns.keys, columns.ids, columns.days, columns.prices, columns.names, columns.notes, columns.chats,
+                *self._keys_by_chat.values()
+            )
+        ) + len(columns.alive)
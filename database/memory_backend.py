@@ -0,0 +1,240 @@
+"""
+محرك التخزين في الذاكرة
+
+يحفظ المنتجات في الذاكرة مع سجل تعديلات محلي (append-only)، ولا يحتاج إلى أي خدمة خارجية.
+يُستخدم عند اختيار STORAGE_BACKEND=memory، وفي الوضع التجريبي عند غياب اعتمادات Google Sheets.
+
+كل إضافة أو حذف يُكتب كسطر واحد في السجل (تكلفة ثابتة)، وعند التشغيل تُقرأ آخر لقطة ثم
+تُعاد التعديلات المسجلة بعدها (انظر database/journal.py). المنتجات نفسها تُحفظ في سجل
+عمودي مضغوط (انظر database/ledger.py) وتُرجع للمعالجات كعروض للقراءة فقط.
+"""
+import os
+import asyncio
+import logging
+import pickle
+from datetime import date
+from itertools import islice
+from typing import Any, AsyncIterator, Dict, List, Optional, Tuple
+
+from database.backend import StorageBackend, ChatId, ID_INDEX, PAGE_ROWS, chat_key, ensure_row_ids, is_visible, new_product_id, row_chat
+from database.executor import storage_executor
+from database.journal import RecordJournal
+from database.ledger import Ledger
+
+# إعداد التسجيل
+logger = logging.getLogger(__name__)
+
+class MemoryBackend(StorageBackend):
+    """
+    محرك تخزين في الذاكرة
+
+    لكل منتج مفتاح ثابت (sheet_row) يُعطى عند الإضافة ولا يتغير بعد حذف منتجات أخرى، ومعرف
+    (id) يأتي مع الصف. تطبيق سجل الإضافة أو الحذف مرة ثانية بلا أثر، لذلك إعادة التعديلات
+    فوق لقطة تشملها آمنة، والصف الذي يصل مرة ثانية بنفس المعرف لا يُضاف مرتين.
+
+    Args:
+        journal: سجل التعديلات الدائم (None = في الذاكرة فقط)
+        legacy_file: ملف pickle القديم؛ يُنقل محتواه إلى السجل مرة واحدة إذا لم يوجد سجل
+    """
+
+    name = "memory"
+
+    def __init__(self, journal: Optional[RecordJournal] = None, legacy_file: Optional[str] = None):
+        self.journal = journal
+        # المنتجات بترتيب الإضافة (المفاتيح تصاعدية)
+        self._ledger = Ledger()
+        # المفتاح التالي (يبدأ من 2 مثل أول صف بيانات في الورقة)
+        self._next_key = 2
+        self._lock: Optional[asyncio.Lock] = None
+        # هل أُعطيت معرفات جديدة لمنتجات محفوظة قبل إضافة المعرفات؟ (تُحفظ في لقطة بعد التحميل)
+        self._ids_assigned = False
+
+        if self.journal is not None:
+            if not self.journal.exists and legacy_file and os.path.exists(legacy_file):
+                self._migrate_legacy(legacy_file)
+            else:
+                self._load()
+
+    @property
+    def lock(self) -> asyncio.Lock:
+        """قفل ترتيب التعديلات وكتابتها في السجل (يُنشأ داخل حلقة الأحداث عند أول استخدام)"""
+        if self._lock is None:
+            self._lock = asyncio.Lock()
+        return self._lock
+
+    # ------------------------------------------------------------------
+    # السجل واللقطات
+    # ------------------------------------------------------------------
+    def _apply(self, record: Dict) -> None:
+        """تطبيق سجل تعديل واحد على الحالة في الذاكرة"""
+        op = record.get('op')
+        if op == 'add':
+            key = record['key']
+            # عند إعادة السجلات فوق لقطة تشملها يكون المفتاح موجوداً أو أقدم من آخر مفتاح
+            last_key = self._ledger.last_key
+            if last_key is None or key > last_key:
+                args = (record['date'], record['name'], record['price'], record['notes'], record.get('chat', ''))
+                try:
+                    self._ledger.append(key, record.get('id'), *args)
+                except ValueError:
+                    # سجل قديم بدون معرف
+                    self._ledger.append(key, new_product_id(), *args)
+                    self._ids_assigned = True
+            self._next_key = max(self._next_key, key + 1)
+        elif op == 'del':
+            for key in record['keys']:
+                self._ledger.delete(key)
+
+    def _snapshot_state(self) -> Dict[str, Any]:
+        """الحالة الكاملة بصيغة اللقطة"""
+        return {
+            'next_key': self._next_key,
+            'products': [
+                [p['sheet_row'], p['date'], p['name'], p['price'], p['notes'], p['id'], p['chat_id']]
+                for p in self._ledger.iter_rows()
+            ]
+        }
+
+    def _load(self) -> None:
+        """تحميل آخر لقطة ثم إعادة التعديلات المسجلة بعدها"""
+        try:
+            snapshot, records = self.journal.load()
+            if snapshot:
+                for key, row_date, name, price, notes, *rest in snapshot.get('products', []):
+                    self._apply({
+                        'op': 'add', 'key': key, 'date': row_date, 'name': name, 'price': price, 'notes': notes,
+                        'id': rest[0] if rest else None, 'chat': rest[1] if len(rest) > 1 else ''
+                    })
+                self._next_key = max(self._next_key, snapshot.get('next_key', 2))
+            for record in records:
+                self._apply(record)
+            if self._ids_assigned:
+                # حفظ المعرفات الجديدة حتى لا تتغير في التشغيل التالي
+                self.journal.compact(self._snapshot_state())
+                self._ids_assigned = False
+            if self._ledger or records:
+                logger.info(f"تم تحميل {len(self._ledger)} منتج من السجل المحلي ({len(records)} تعديل بعد آخر لقطة)")
+        except Exception as e:
+            logger.error(f"فشل في تحميل المنتجات من السجل المحلي: {str(e)}")
+
+    def _migrate_legacy(self, legacy_file: str) -> None:
+        """نقل المنتجات من ملف pickle القديم إلى لقطة جديدة"""
+        try:
+            with open(legacy_file, 'rb') as f:
+                products = pickle.load(f)
+            for product in products:
+                self._apply({
+                    'op': 'add',
+                    'key': self._next_key,
+                    'date': product.get('date', ''),
+                    'name': product.get('name', ''),
+                    'price': product.get('price', 0.0),
+                    'notes': product.get('notes', '')
+                })
+            self.journal.compact(self._snapshot_state())
+            os.replace(legacy_file, legacy_file + ".migrated")
+            logger.info(f"تم نقل {len(self._ledger)} منتج من الملف القديم إلى السجل المحلي")
+        except Exception as e:
+            logger.error(f"فشل في نقل المنتجات من الملف القديم: {str(e)}")
+
+    async def _commit(self, records: List[Dict]) -> None:
+        """
+        كتابة التعديلات في السجل ثم تطبيقها في الذاكرة (يجب حجز القفل)
+
+        Args:
+            records: سجلات التعديل
+        """
+        if self.journal is not None:
+            await storage_executor.run(self.journal.append, records)
+        for record in records:
+            self._apply(record)
+        if self.journal is not None and self.journal.needs_compaction():
+            await storage_executor.run(self.journal.compact, self._snapshot_state())
+
+    # ------------------------------------------------------------------
+    # واجهة المحرك
+    # ------------------------------------------------------------------
+    async def close(self) -> None:
+        if self.journal is not None:
+            await storage_executor.run(self.journal.close)
+
+    async def add_many(self, rows: List[list]) -> None:
+        async with self.lock:
+            records = []
+            seen = set()
+            for row in ensure_row_ids(rows):
+                row_date, product, price, notes, product_id = row[:ID_INDEX + 1]
+                # صف أُرسل من قبل (مثلاً إعادة إرسال من مخزن الكتابة بعد توقف مفاجئ)
+                if product_id in seen or self._ledger.find_id(product_id) is not None:
+                    logger.debug(f"[{self.name}] تجاهل منتج مكرر بالمعرف {product_id}")
+                    continue
+                seen.add(product_id)
+                records.append({
+                    'op': 'add',
+                    'key': self._next_key + len(records),
+                    'id': product_id,
+                    'date': row_date,
+                    'name': product,
+                    'price': price,
+                    'notes': notes,
+                    'chat': row_chat(row)
+                })
+            await self._commit(records)
+        logger.info(f"[{self.name}] تمت إضافة {len(records)} منتج، عدد المنتجات: {len(self._ledger)}")
+
+    @staticmethod
+    def _chat(chat_id: ChatId) -> Optional[str]:
+        """معرف المحادثة بالشكل المخزن في السجل (None = جميع المحادثات)"""
+        return None if chat_id is None else chat_key(chat_id)
+
+    async def list_recent(self, limit: int, chat_id: ChatId = None) -> List[Dict]:
+        if limit <= 0:
+            return []
+        return list(islice(self._ledger.iter_latest(self._chat(chat_id)), limit))
+
+    async def query_by_date_range(self, start: date, end: date, chat_id: ChatId = None) -> List[Dict]:
+        return list(self._ledger.iter_day_range(start, end, self._chat(chat_id)))
+
+    async def iter_pages(
+        self, start: Optional[date] = None, end: Optional[date] = None, chat_id: ChatId = None,
+        page_size: int = PAGE_ROWS
+    ) -> AsyncIterator[List[Dict]]:
+        last_key = 0
+        while True:
+            page = list(islice(self._ledger.iter_after(last_key, start, end, self._chat(chat_id)), max(1, page_size)))
+            if not page:
+                return
+            last_key = page[-1]['sheet_row']
+            yield page
+
+    def _find_owned(self, product_id: str, chat_id: ChatId) -> Optional[int]:
+        """مفتاح المنتج إذا كان موجوداً ويظهر لهذه المحادثة"""
+        key = self._ledger.find_id(product_id)
+        if key is None or is_visible(self._ledger.get(key)['chat_id'], chat_id):
+            return key
+        return None
+
+    async def delete_many(self, ids: List[str], chat_id: ChatId = None) -> Tuple[int, list]:
+        async with self.lock:
+            # المعرف -> المفتاح عبر فهرس السجل (منتجات المحادثات الأخرى تُعامل كغير موجودة)
+            keys = {product_id: self._find_owned(product_id, chat_id) for product_id in dict.fromkeys(ids)}
+            found = [key for key in keys.values() if key is not None]
+            deleted = [self._ledger.get(key)['name'] for key in found]
+            if found:
+                await self._commit([{'op': 'del', 'keys': found}])
+
+        failed = [product_id for product_id in ids if keys[product_id] is None]
+        if found:
+            logger.info(f"[{self.name}] تم حذف {len(found)} منتج: {deleted}")
+        return len(found), failed
+
+    def get_stats(self) -> Dict[str, Any]:
+        stats = {
+            'backend': self.name,
+            'products': len(self._ledger),
+            'ledger_bytes': self._ledger.memory_usage(),
+            'distinct_strings': len(self._ledger.strings)
+        }
+        if self.journal is not None:
+            stats['journal'] = self.journal.get_stats()
+        return stats
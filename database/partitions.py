@@ -0,0 +1,226 @@
+"""
+تقسيم المشتريات على أوراق عمل شهرية
+
+بدلاً من كتابة كل المشتريات في الورقة الأولى (فتصبح كل قراءة مروراً على التاريخ كاملاً)، تُكتب
+مشتريات كل شهر في ورقة عمل باسم الشهر (مثل 2026-10) تُنشأ عند أول إضافة فيه. الورقة الأولى
+تبقى كأقدم قسم وتحمل كل ما سُجل قبل تفعيل التقسيم.
+
+مع التقسيم حسب المحادثة يكون لكل محادثة أوراقها الشهرية الخاصة باسم "المحادثة_الشهر" (مثل
+123456789_2026-10)، فلا تمر قراءات مستخدم على بيانات غيره ولا تكبر تكلفتها بعدد المستخدمين.
+أوراق الأشهر بدون محادثة (المنشأة قبل التقسيم حسب المحادثة، أو للصفوف التي ليس لها مالك)
+والورقة الأولى أقسام مشتركة تُقرأ لكل محادثة مع تصفية صفوفها حسب عمود المحادثة.
+
+عدد أوراق المحادثات محدود بـ SHEETS_MAX_CHAT_PARTITIONS: كل ورقة تضيف إلى بيانات جدول
+البيانات التي تُقرأ عند فتحه وعند كل مزامنة بعد تعديل خارجي، وGoogle تحد جدول البيانات
+الواحد بعشرة ملايين خلية (ورقة الشهر تبدأ بـ 200 صف × 6 أعمدة = 1200 خلية وتكبر مع الإضافة).
+بعد بلوغ الحد لا تُنشأ أوراق محادثات جديدة، وتُكتب صفوف المحادثة في ورقة الشهر المشتركة مع
+عمود المحادثة، فتبقى ظاهرة لصاحبها فقط. أوراق المحادثة الموجودة (أو التي لها صفوف معلقة) تبقى
+تستقبل صفوفها حتى لا يتوزع شهر المحادثة بين ورقتين دون حاجة. لتحرير أماكن يمكن نقل أوراق
+الأشهر القديمة يدوياً إلى جدول بيانات للأرشيف؛ يلاحظ البوت حذفها مع المزامنة التالية.
+
+فهرس الأقسام (أسماء الأوراق الموجودة وآخر تاريخ في الورقة القديمة) صغير ويُبنى من بيانات
+جدول البيانات عند فتحه، فتعرف القراءات أي الأوراق تحتاجها دون تنزيل الأوراق القديمة:
+أوامر اليوم والشهر تقرأ ورقة الشهر فقط، و"آخر N" تبدأ بأحدث شهر ولا تنتقل للأقدم إلا إذا
+لم يكفِ.
+
+الإعدادات (عبر المتغيرات البيئية):
+    SHEETS_PARTITION_BY_MONTH: تفعيل التقسيم الشهري (افتراضي: 1)
+    SHEETS_PARTITION_BY_CHAT: أوراق شهرية منفصلة لكل محادثة (افتراضي: 1، يتطلب التقسيم الشهري)
+    SHEETS_MAX_CHAT_PARTITIONS: أقصى عدد لأوراق المحادثات في جدول البيانات (افتراضي: 200)
+"""
+import os
+import re
+from datetime import date
+from typing import Dict, Iterable, List, Optional, Set, Tuple
+
+# تفعيل التقسيم الشهري
+SHEETS_PARTITION_BY_MONTH = os.getenv("SHEETS_PARTITION_BY_MONTH", "1") not in ("0", "false", "False", "")
+
+# أوراق منفصلة لكل محادثة
+SHEETS_PARTITION_BY_CHAT = os.getenv("SHEETS_PARTITION_BY_CHAT", "1") not in ("0", "false", "False", "")
+
+# أقصى عدد لأوراق المحادثات؛ بعده تُكتب صفوف المحادثات في أوراق الأشهر المشتركة
+SHEETS_MAX_CHAT_PARTITIONS = int(os.getenv("SHEETS_MAX_CHAT_PARTITIONS", "200"))
+
+# مفتاح الورقة الأولى (القسم القديم)
+LEGACY_PARTITION = ""
+
+# اسم ورقة الشهر: YYYY-MM، أو المحادثة_YYYY-MM
+_MONTH = r'\d{4}-(?:0[1-9]|1[0-2])'
+_MONTH_TITLE = re.compile(rf'^{_MONTH}$')
+_CHAT_MONTH_TITLE = re.compile(rf'^(-?\d+)_({_MONTH})$')
+# معرفات محادثات تيليجرام أرقام (سالبة للمجموعات)
+_CHAT_ID = re.compile(r'^-?\d+$')
+
+def month_of(day: date) -> str:
+    """مفتاح الشهر (واسم ورقته) لتاريخ معين"""
+    return f"{day.year:04d}-{day.month:02d}"
+
+def partition_of(row_date: str, chat: str = '') -> str:
+    """
+    القسم الذي يُكتب فيه صف حسب تاريخه والمحادثة المالكة
+
+    Args:
+        row_date: التاريخ بالشكل YYYY/MM/DD
+        chat: معرف المحادثة المالكة (نص فارغ = بدون مالك)
+
+    Returns:
+        str: مفتاح ورقة المحادثة في ذلك الشهر، أو مفتاح الشهر المشترك إذا لم يكن للصف مالك
+        (أو كان التقسيم حسب المحادثة معطلاً)، أو LEGACY_PARTITION إذا كان التقسيم معطلاً أو
+        تعذر تحليل التاريخ
+    """
+    if not SHEETS_PARTITION_BY_MONTH:
+        return LEGACY_PARTITION
+    text = str(row_date)
+    key = text[:7].replace('/', '-')
+    if not _MONTH_TITLE.match(key):
+        return LEGACY_PARTITION
+    if SHEETS_PARTITION_BY_CHAT and chat and _CHAT_ID.match(chat):
+        return f"{chat}_{key}"
+    return key
+
+def split_partition(key: str) -> Tuple[str, str]:
+    """
+    تحليل مفتاح القسم إلى (المحادثة، الشهر)
+
+    Returns:
+        Tuple[str, str]: المحادثة نص فارغ للأقسام المشتركة، والشهر نص فارغ للورقة القديمة
+    """
+    match = _CHAT_MONTH_TITLE.match(key)
+    if match:
+        return match.group(1), match.group(2)
+    return '', key
+
+def is_partition_title(title: str) -> bool:
+    """هل هذا اسم ورقة شهرية (مشتركة أو لمحادثة)؟"""
+    return bool(_MONTH_TITLE.match(title) or _CHAT_MONTH_TITLE.match(title))
+
+class PartitionCatalog:
+    """
+    فهرس الأوراق الشهرية الموجودة في جدول البيانات
+
+    legacy_last_key هو آخر تاريخ (YYYY/MM/DD) في الورقة القديمة؛ الورقة القديمة لا تستقبل
+    صفوفاً جديدة بعد تفعيل التقسيم، لذلك لا تُقرأ لاستعلام يبدأ بعد هذا التاريخ.
+
+    الاستعلامات تمرر المحادثة (chat)، فتُعاد أقسامها والأقسام المشتركة فقط؛ chat=None
+    يعيد أقسام جميع المحادثات.
+
+    route يطبق حد أوراق المحادثات على الكتابة؛ قراره لمفتاح معين لا يتغير أثناء التشغيل، لأن
+    ورقة المحادثة التي اختيرت تُحجز حتى تُنشأ.
+    """
+
+    def __init__(self, max_chat_partitions: int = SHEETS_MAX_CHAT_PARTITIONS):
+        self.max_chat_partitions = max_chat_partitions
+        self.partitions: Set[str] = set()
+        # الأقسام حسب المحادثة المالكة ('' للأقسام المشتركة)
+        self._by_chat: Dict[str, Set[str]] = {}
+        # أوراق محادثات اختيرت للكتابة ولم تُنشأ بعد
+        self._reserved: Set[str] = set()
+        # أوراق محادثات لم تُنشأ لبلوغ الحد، فكُتبت صفوفها في ورقة الشهر المشتركة
+        self._overflow: Set[str] = set()
+        # None = غير معروف بعد
+        self.legacy_last_key: Optional[str] = None
+
+    def __contains__(self, key: str) -> bool:
+        return key in self.partitions
+
+    def load(self, titles: Iterable[str]) -> None:
+        """بناء الفهرس من أسماء أوراق العمل في جدول البيانات"""
+        self.partitions = set()
+        self._by_chat = {}
+        for title in titles:
+            if is_partition_title(title):
+                self.add(title)
+
+    def add(self, key: str) -> None:
+        """تسجيل ورقة شهر أُنشئت للتو"""
+        self.partitions.add(key)
+        self._reserved.discard(key)
+        self._by_chat.setdefault(split_partition(key)[0], set()).add(key)
+
+    def reserve(self, keys: Iterable[str]) -> None:
+        """حجز أوراق محادثات لها صفوف معلقة ولم تعد موجودة (حُذفت من خارج البوت)"""
+        for key in keys:
+            if split_partition(key)[0] and key not in self.partitions:
+                self._reserved.add(key)
+
+    @property
+    def chat_partition_count(self) -> int:
+        """عدد أوراق المحادثات الموجودة والمحجوزة"""
+        return len(self.partitions) - len(self._by_chat.get('', ())) + len(self._reserved)
+
+    def route(self, key: str) -> str:
+        """
+        القسم الذي تُكتب فيه صفوف مفتاح حسبه partition_of
+
+        Args:
+            key: مفتاح القسم حسب تاريخ الصف ومحادثته
+
+        Returns:
+            str: المفتاح نفسه، أو ورقة الشهر المشتركة إذا كان ورقة محادثة جديدة وبلغ عدد أوراق
+            المحادثات الحد
+        """
+        owner, month = split_partition(key)
+        if not owner or key in self.partitions or key in self._reserved:
+            return key
+        if self.chat_partition_count < self.max_chat_partitions:
+            self._reserved.add(key)
+            return key
+        self._overflow.add(key)
+        return month
+
+    def newest_first(self, chat: Optional[str] = None, extra: Iterable[str] = ()) -> List[str]:
+        """
+        مفاتيح الأقسام من الأحدث إلى الأقدم، والورقة القديمة في النهاية
+
+        في الشهر نفسه تسبق ورقة المحادثة الورقة المشتركة.
+
+        Args:
+            chat: معرف المحادثة (None = جميع المحادثات)
+            extra: أقسام إضافية لم تُنشأ أوراقها بعد (لها صفوف معلقة)
+        """
+        if chat is None:
+            candidates = self.partitions.union(extra)
+        else:
+            candidates = self._by_chat.get('', set()).union(self._by_chat.get(chat, ()), extra)
+        keys = []
+        for key in candidates:
+            if key == LEGACY_PARTITION:
+                continue
+            owner, month = split_partition(key)
+            if chat is None or not owner or owner == chat:
+                keys.append((month, owner, key))
+        keys.sort(reverse=True)
+        return [key for _, _, key in keys] + [LEGACY_PARTITION]
+
+    def for_range(self, start: date, end: date, chat: Optional[str] = None, extra: Iterable[str] = ()) -> List[str]:
+        """
+        الأقسام التي قد تحتوي على مشتريات بين تاريخين، من الأحدث إلى الأقدم
+
+        الورقة القديمة تُضاف إذا كان آخر تاريخ فيها غير معروف أو لا يسبق بداية النطاق.
+        """
+        first, last = month_of(start), month_of(end)
+        keys = [key for key in self.newest_first(chat, extra) if key and first <= split_partition(key)[1] <= last]
+        if self.legacy_overlaps(start):
+            keys.append(LEGACY_PARTITION)
+        return keys
+
+    def legacy_overlaps(self, start: date) -> bool:
+        """هل قد تحتوي الورقة القديمة على مشتريات من هذا التاريخ أو بعده؟"""
+        if not SHEETS_PARTITION_BY_MONTH or self.legacy_last_key is None:
+            return True
+        return start.strftime("%Y/%m/%d") <= self.legacy_last_key
+
+    def get_stats(self) -> dict:
+        """إحصاءات الفهرس للمراقبة"""
+        shared = sorted(self._by_chat.get('', ()))
+        return {
+            'enabled': SHEETS_PARTITION_BY_MONTH,
+            'by_chat': SHEETS_PARTITION_BY_CHAT,
+            'months': shared,
+            'chat_partitions': len(self.partitions) - len(shared),
+            'chats': len(self._by_chat.keys() - {''}),
+            'max_chat_partitions': self.max_chat_partitions,
+            'overflow_partitions': len(self._overflow),
+            'legacy_last_date': self.legacy_last_key,
+        }
@@ -0,0 +1,173 @@
+"""
+محدد معدل الطلبات وسياسة إعادة المحاولة لـ Google Sheets
+
+حصة Google Sheets API محسوبة بالدقيقة، وتجاوزها يعيد الخطأ 429 لجميع الطلبات التالية.
+بدلاً من إرسال الطلبات دفعة واحدة ثم الفشل، يمر كل طلب عبر دلو رموز (token bucket)
+مشترك يوزع الطلبات بانتظام على الدقيقة؛ الطلبات الزائدة تنتظر دورها بدلاً من أن تفشل.
+
+الإعدادات (عبر المتغيرات البيئية):
+    SHEETS_REQUESTS_PER_MINUTE: عدد الطلبات المسموح بها في الدقيقة (افتراضي: 60)
+    SHEETS_BURST: أقصى عدد طلبات متتالية بدون انتظار (افتراضي: 10)
+    SHEETS_RETRY_BASE_DELAY: أول فترة انتظار قبل إعادة المحاولة بالثواني (افتراضي: 1)
+    SHEETS_RETRY_MAX_DELAY: أقصى فترة انتظار بين محاولتين بالثواني (افتراضي: 32)
+"""
+import os
+import asyncio
+import logging
+import random
+import time
+from typing import Any, Dict, Optional
+
+# إعداد التسجيل
+logger = logging.getLogger(__name__)
+
+# عدد الطلبات المسموح بها في الدقيقة
+SHEETS_REQUESTS_PER_MINUTE = float(os.getenv("SHEETS_REQUESTS_PER_MINUTE", "60"))
+# أقصى عدد طلبات متتالية بدون انتظار
+SHEETS_BURST = int(os.getenv("SHEETS_BURST", "10"))
+# أول فترة انتظار قبل إعادة المحاولة (بالثواني)
+SHEETS_RETRY_BASE_DELAY = float(os.getenv("SHEETS_RETRY_BASE_DELAY", "1"))
+# أقصى فترة انتظار بين محاولتين (بالثواني)
+SHEETS_RETRY_MAX_DELAY = float(os.getenv("SHEETS_RETRY_MAX_DELAY", "32"))
+
+# رموز HTTP التي تستحق إعادة المحاولة (تجاوز الحصة وأخطاء الخادم المؤقتة)
+RETRYABLE_STATUS_CODES = {408, 429, 500, 502, 503, 504}
+
+class TokenBucket:
+    """
+    دلو رموز لتحديد معدل الطلبات
+
+    يمتلئ الدلو بمعدل rate_per_minute رمزاً في الدقيقة حتى سعة burst. كل طلب يستهلك رمزاً،
+    وإذا كان الدلو فارغاً ينتظر الطلب (بدون إيقاف حلقة الأحداث) حتى يتوفر رمز.
+    الطلبات تُخدم بترتيب وصولها.
+    """
+
+    def __init__(self, rate_per_minute: float = SHEETS_REQUESTS_PER_MINUTE, burst: int = SHEETS_BURST):
+        self.rate = max(rate_per_minute, 0.001) / 60.0
+        self.capacity = max(1, burst)
+        self._tokens = float(self.capacity)
+        self._updated = time.monotonic()
+        # لا تُمنح رموز قبل هذا الوقت (بعد رد 429 مع Retry-After)
+        self._paused_until = 0.0
+        self._lock: Optional[asyncio.Lock] = None
+
+        # الإحصاءات
+        self._acquired = 0
+        self._waited = 0
+        self._total_wait = 0.0
+        self._pauses = 0
+
+    @property
+    def lock(self) -> asyncio.Lock:
+        """قفل ترتيب الانتظار (يُنشأ داخل حلقة الأحداث عند أول استخدام)"""
+        if self._lock is None:
+            self._lock = asyncio.Lock()
+        return self._lock
+
+    def _refill(self) -> None:
+        """إضافة الرموز المستحقة منذ آخر تحديث"""
+        now = time.monotonic()
+        if now <= self._updated:
+            return
+        self._tokens = min(self.capacity, self._tokens + (now - self._updated) * self.rate)
+        self._updated = now
+
+    async def acquire(self) -> None:
+        """انتظار رمز واحد قبل إرسال طلب"""
+        started = time.monotonic()
+        async with self.lock:
+            while True:
+                now = time.monotonic()
+                if now < self._paused_until:
+                    await asyncio.sleep(self._paused_until - now)
+                    continue
+                self._refill()
+                if self._tokens >= 1:
+                    self._tokens -= 1
+                    break
+                await asyncio.sleep((1 - self._tokens) / self.rate)
+
+        waited = time.monotonic() - started
+        self._acquired += 1
+        if waited > 0.001:
+            self._waited += 1
+            self._total_wait += waited
+
+    def pause(self, seconds: float) -> None:
+        """
+        إيقاف منح الرموز لفترة (عند تجاوز الحصة)
+
+        Args:
+            seconds: مدة الإيقاف بالثواني
+        """
+        until = time.monotonic() + seconds
+        if until > self._paused_until:
+            self._paused_until = until
+            # الدلو يبدأ فارغاً بعد الإيقاف حتى لا تُرسل دفعة كاملة فوراً
+            self._tokens = 0.0
+            self._updated = until
+            self._pauses += 1
+            logger.warning(f"تم تجاوز حصة Google Sheets، إيقاف الطلبات لمدة {seconds:.1f} ثانية")
+
+    def get_stats(self) -> Dict[str, Any]:
+        """
+        إحصاءات المحدد للمراقبة
+
+        Returns:
+            Dict[str, Any]: المعدل، الرموز المتاحة، وعدد الطلبات التي انتظرت ومجموع الانتظار
+        """
+        self._refill()
+        return {
+            'rate_per_minute': self.rate * 60,
+            'burst': self.capacity,
+            'tokens': round(max(self._tokens, 0.0), 2),
+            'acquired': self._acquired,
+            'waited': self._waited,
+            'total_wait': round(self._total_wait, 2),
+            'pauses': self._pauses,
+        }
+
+def get_status_code(error: Exception) -> Optional[int]:
+    """رمز HTTP لخطأ APIError (أو None إذا لم يكن متاحاً)"""
+    response = getattr(error, 'response', None)
+    return getattr(response, 'status_code', None)
+
+def get_retry_after(error: Exception) -> Optional[float]:
+    """
+    قيمة ترويسة Retry-After بالثواني من رد الخطأ
+
+    Returns:
+        Optional[float]: عدد الثواني أو None إذا لم تكن الترويسة موجودة
+    """
+    response = getattr(error, 'response', None)
+    headers = getattr(response, 'headers', None) or {}
+    value = headers.get('Retry-After')
+    if value is None:
+        return None
+    try:
+        return max(0.0, float(value))
+    except (TypeError, ValueError):
+        return None
+
+def is_retryable(error: Exception) -> bool:
+    """هل يستحق الخطأ إعادة المحاولة؟ (أخطاء الشبكة والمهلة وأخطاء الحصة والخادم)"""
+    if isinstance(error, (ConnectionError, TimeoutError)):
+        return True
+    status = get_status_code(error)
+    # رد بدون رمز معروف يُعامل كخطأ مؤقت
+    return status is None or status in RETRYABLE_STATUS_CODES
+
+def backoff_delay(attempt: int, base: float = SHEETS_RETRY_BASE_DELAY, cap: float = SHEETS_RETRY_MAX_DELAY) -> float:
+    """
+    فترة الانتظار قبل المحاولة التالية (تضاعف أسي مع عشوائية كاملة)
+
+    Args:
+        attempt: رقم المحاولة الفاشلة بدءاً من 0
+
+    Returns:
+        float: عدد الثواني
+    """
+    return random.uniform(0, min(cap, base * (2 ** attempt)))
+
+# المحدد المشترك لجميع طلبات Google Sheets
+sheets_limiter = TokenBucket()
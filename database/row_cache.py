@@ -0,0 +1,257 @@
+"""
+مرآة صفوف ورقة العمل في الذاكرة
+
+بدلاً من تنزيل الورقة كاملة (get_all_values) مع كل قراءة، نحتفظ بنسخة من الصفوف في الذاكرة
+ونجلب فقط الصفوف التي أضيفت بعد آخر مزامنة عبر نطاق A1 محدود يبدأ بعد آخر صف معروف.
+الإضافات التي تتم عبر البوت تظهر في المرآة فوراً (كصفوف معلقة) حتى يرى المستخدم ما أضافه
+قبل أن تصل الصفوف فعلياً إلى Google Sheets.
+
+تحتفظ المرآة أيضاً بفهرس من معرف المنتج (العمود E) إلى رقم صفه، فيُعرف موقع أي منتج
+مباشرة عند الحذف. الصفوف التي لا تحمل معرفاً (أضيفت يدوياً أو قبل إضافة العمود) أو تحمل
+معرفاً مكرراً (نُسخت يدوياً) تُسجل حتى تُعطى معرفاً جديداً.
+
+ما دام فحص إصدار الجدول (database/change_probe.py) يعمل لا تُزامن المرآة دورياً؛ التعديلات
+اليدوية تُطابق عبر reconcile عند اكتشافها، وROW_CACHE_SYNC_INTERVAL يُستخدم إذا توقف الفحص.
+
+الإعدادات (عبر المتغيرات البيئية):
+    ROW_CACHE_ENABLED: تفعيل المرآة (افتراضي: 1)
+    ROW_CACHE_SYNC_INTERVAL: أقل فترة بين مزامنتين بالثواني (افتراضي: 30)
+    ROW_CACHE_SYNC_WINDOW: عدد الصفوف في كل طلب مزامنة (افتراضي: 500)
+"""
+import os
+import re
+import asyncio
+import logging
+import time
+from typing import Dict, List, Optional, Set, Tuple
+
+from database.backend import ID_INDEX
+
+# إعداد التسجيل
+logger = logging.getLogger(__name__)
+
+# تفعيل المرآة
+ROW_CACHE_ENABLED = os.getenv("ROW_CACHE_ENABLED", "1") not in ("0", "false", "False", "")
+# أقل فترة بين مزامنتين (بالثواني)
+ROW_CACHE_SYNC_INTERVAL = float(os.getenv("ROW_CACHE_SYNC_INTERVAL", "30"))
+# عدد الصفوف في كل طلب مزامنة
+ROW_CACHE_SYNC_WINDOW = int(os.getenv("ROW_CACHE_SYNC_WINDOW", "500"))
+
+# عدد أعمدة البيانات (التاريخ، المنتج، السعر، الملاحظات، المعرف، المحادثة)
+ROW_WIDTH = 6
+# أول صف بيانات (الصف 1 للعناوين)
+FIRST_DATA_ROW = 2
+
+def parse_updated_range(updated_range: str) -> Optional[Tuple[int, int]]:
+    """
+    استخراج أرقام الصفوف من نطاق A1 كما يعيده Sheets API
+
+    مثال: "'المشتريات'!A12:D14" -> (12, 14)
+
+    Returns:
+        Optional[Tuple[int, int]]: (أول صف، آخر صف) أو None إذا تعذر التحليل
+    """
+    if not updated_range:
+        return None
+    match = re.search(r'![A-Z]+(\d+)(?::[A-Z]+(\d+))?$', updated_range)
+    if not match:
+        return None
+    start = int(match.group(1))
+    end = int(match.group(2)) if match.group(2) else start
+    return start, end
+
+def _normalize(row: list) -> list:
+    """توحيد طول الصف ليطابق أعمدة البيانات"""
+    row = list(row[:ROW_WIDTH])
+    if len(row) < ROW_WIDTH:
+        row.extend([''] * (ROW_WIDTH - len(row)))
+    return row
+
+class RowCache:
+    """
+    نسخة في الذاكرة من صفوف البيانات
+
+    الصف رقم n في الورقة مخزن في rows[n - FIRST_DATA_ROW]. الصفوف المضافة عبر البوت ولم
+    تُؤكد بعد من Google Sheets تبقى في pending بدون رقم صف.
+
+    يجب على المستدعي حجز lock أثناء المزامنة وأثناء إرسال صفوف جديدة ثم تأكيدها، حتى لا
+    تجلب المزامنة صفاً ما زال معلقاً فيظهر مرتين.
+    """
+
+    def __init__(self, sync_interval: float = ROW_CACHE_SYNC_INTERVAL, sync_window: int = ROW_CACHE_SYNC_WINDOW):
+        self.sync_interval = sync_interval
+        self.sync_window = max(1, sync_window)
+        self.rows: List[list] = []
+        self.pending: List[list] = []
+        # فهرس المعرف -> رقم الصف، والصفوف التي تحتاج إلى معرف
+        self._row_by_id: Dict[str, int] = {}
+        self.missing_ids: Set[int] = set()
+        self.last_sync: Optional[float] = None
+        # هل تمت تعبئة المرآة من الورقة مرة واحدة على الأقل؟
+        self.loaded = False
+        self._lock: Optional[asyncio.Lock] = None
+
+    @property
+    def lock(self) -> asyncio.Lock:
+        """قفل المزامنة (يُنشأ داخل حلقة الأحداث عند أول استخدام)"""
+        if self._lock is None:
+            self._lock = asyncio.Lock()
+        return self._lock
+
+    @property
+    def last_row(self) -> int:
+        """رقم آخر صف معروف في الورقة (1 إذا لم يوجد سوى صف العناوين)"""
+        return FIRST_DATA_ROW - 1 + len(self.rows)
+
+    def needs_sync(self) -> bool:
+        """هل مرت فترة المزامنة منذ آخر مزامنة (أو لم تتم مزامنة بعد)؟"""
+        return self.last_sync is None or time.monotonic() - self.last_sync >= self.sync_interval
+
+    def next_window(self) -> Tuple[int, int]:
+        """نطاق الصفوف التالي الذي يجب جلبه: (أول صف، آخر صف)"""
+        start = self.last_row + 1
+        return start, start + self.sync_window - 1
+
+    def extend(self, start_row: int, values: List[list]) -> None:
+        """
+        إضافة صفوف مجلوبة من الورقة تبدأ من start_row
+
+        الصفوف التي سبق جلبها تُستبدل، والفجوة (إن وجدت) تُملأ بصفوف فارغة.
+        """
+        for offset, row in enumerate(values):
+            self.set_row(start_row + offset, row)
+
+    def set_row(self, row_number: int, row: list) -> None:
+        """تعيين محتوى صف معين في المرآة"""
+        if row_number < FIRST_DATA_ROW:
+            return
+        index = row_number - FIRST_DATA_ROW
+        while len(self.rows) <= index:
+            self.rows.append([''] * ROW_WIDTH)
+        self._unindex(row_number)
+        row = self.rows[index] = _normalize(row)
+
+        if not any(row[:ID_INDEX]):
+            return
+        product_id = row[ID_INDEX]
+        if product_id and self._row_by_id.get(product_id, row_number) == row_number:
+            self._row_by_id[product_id] = row_number
+        else:
+            self.missing_ids.add(row_number)
+
+    def _unindex(self, row_number: int) -> None:
+        """إزالة الصف الحالي في هذا الموقع من الفهرس"""
+        self.missing_ids.discard(row_number)
+        old = self.get_row(row_number)
+        if old is not None and self._row_by_id.get(old[ID_INDEX]) == row_number:
+            del self._row_by_id[old[ID_INDEX]]
+
+    def find(self, product_id: str) -> Optional[int]:
+        """رقم صف المنتج بهذا المعرف حسب آخر نسخة معروفة (None إذا لم يوجد)"""
+        return self._row_by_id.get(product_id)
+
+    def is_pending(self, product_id: str) -> bool:
+        """هل المنتج بهذا المعرف ما زال معلقاً (لم يصل إلى الورقة بعد)؟"""
+        return any(row[ID_INDEX] == product_id for row in self.pending)
+
+    def assign_id(self, row_number: int, product_id: str) -> None:
+        """تسجيل معرف جديد كُتب في الورقة لصف لم يكن له معرف"""
+        row = self.get_row(row_number)
+        if row is not None:
+            row = list(row)
+            row[ID_INDEX] = product_id
+            self.set_row(row_number, row)
+
+    def expire(self) -> None:
+        """فرض مزامنة الصفوف الجديدة في الطلب التالي"""
+        self.last_sync = None
+
+    def mark_synced(self) -> None:
+        """تسجيل وقت آخر مزامنة ناجحة"""
+        self.last_sync = time.monotonic()
+        self.loaded = True
+
+    def add_pending(self, rows: List[list]) -> None:
+        """إضافة صفوف أرسلها المستخدم عبر البوت ولم تصل بعد إلى الورقة"""
+        self.pending.extend(_normalize(row) for row in rows)
+
+    def discard_pending(self, rows: List[list]) -> None:
+        """إزالة صفوف من قائمة المعلقة (إذا فشل حفظها أو بعد تأكيدها)"""
+        for row in rows:
+            row = _normalize(row)
+            try:
+                self.pending.remove(row)
+            except ValueError:
+                pass
+
+    def confirm_pending(self, rows: List[list], start_row: Optional[int] = None) -> None:
+        """
+        نقل صفوف معلقة إلى مواقعها الفعلية بعد نجاح إرسالها
+
+        Args:
+            rows: الصفوف المرسلة بنفس ترتيب كتابتها
+            start_row: رقم أول صف كتبته Google Sheets (None إذا كان غير معروف)
+        """
+        self.discard_pending(rows)
+        if start_row is None or not self.loaded:
+            # لا نعرف المواقع؛ المزامنة التالية ستجلب الصفوف من الورقة
+            self.last_sync = None
+            return
+        for offset, row in enumerate(rows):
+            self.set_row(start_row + offset, row)
+
+    def reconcile(self, values: List[list], snapshot: List[list]) -> List[Tuple[int, list, list]]:
+        """
+        مطابقة الصفوف المعروفة مع محتواها الحالي في الورقة بعد تعديل يدوي
+
+        تُحدّث الصفوف المختلفة فقط. الصفوف التي غيرها البوت بعد أخذ snapshot (حذف أو تأكيد
+        إضافة أثناء القراءة) تُترك كما هي لأن المحتوى المقروء أقدم منها.
+
+        Args:
+            values: الصفوف من FIRST_DATA_ROW حتى آخر صف في snapshot (الفارغة في النهاية لا تُعاد)
+            snapshot: نسخة من rows قبل القراءة (list(cache.rows))
+
+        Returns:
+            List[Tuple[int, list, list]]: (رقم الصف، محتواه السابق، محتواه الحالي) لكل صف تغير
+        """
+        changed = []
+        for index, old in enumerate(snapshot):
+            if index >= len(self.rows) or self.rows[index] is not old:
+                continue
+            row = _normalize(values[index]) if index < len(values) else [''] * ROW_WIDTH
+            if row != old:
+                self.set_row(index + FIRST_DATA_ROW, row)
+                changed.append((index + FIRST_DATA_ROW, old, self.rows[index]))
+        return changed
+
+    def clear_row(self, row_number: int) -> None:
+        """تفريغ صف في المرآة بعد حذفه من الورقة"""
+        if FIRST_DATA_ROW <= row_number <= self.last_row:
+            self._unindex(row_number)
+            self.rows[row_number - FIRST_DATA_ROW] = [''] * ROW_WIDTH
+
+    def get_row(self, row_number: int) -> Optional[list]:
+        """محتوى صف معين أو None إذا كان خارج المرآة"""
+        if FIRST_DATA_ROW <= row_number <= self.last_row:
+            return self.rows[row_number - FIRST_DATA_ROW]
+        return None
+
+    def iter_latest(self):
+        """
+        المرور على الصفوف من الأحدث إلى الأقدم
+
+        Yields:
+            Tuple[list, Optional[int]]: (الصف، رقم الصف في الورقة أو None للصفوف المعلقة)
+        """
+        for row in reversed(self.pending):
+            yield row, None
+        for index in range(len(self.rows) - 1, -1, -1):
+            yield self.rows[index], index + FIRST_DATA_ROW
+
+    def invalidate(self) -> None:
+        """مسح المرآة بالكامل (تُعاد تعبئتها في المزامنة التالية)"""
+        self.rows = []
+        self._row_by_id = {}
+        self.missing_ids = set()
+        self.last_sync = None
+        self.loaded = False
@@ -2,25 +2,47 @@
 التعامل مع قاعدة البيانات (Google Sheets)
 
 هذا الملف يحتوي على الدوال المسؤولة عن التعامل مع Google Sheets.
-يستخدم مكتبة gspread للاتصال بـ Google Sheets API.
+يتصل بـ Google Sheets API عبر العميل غير المتزامن في database/sheets_client.py.
 
 المتطلبات:
     - ملف client_secret_*.json يحتوي على بيانات اعتماد Google Sheets API
     - ورقة عمل باسم "المشتريات" في Google Sheets
 """
 import os
+import re
 import json
 import logging
-import pickle
-from typing import Optional, Tuple, List, Dict, Any
-import gspread
-from oauth2client.service_account import ServiceAccountCredentials
-from gspread.exceptions import SpreadsheetNotFound, WorksheetNotFound, APIError
+import contextlib
+from typing import Optional, Tuple, List, Dict, Any, Set, AsyncIterator, NamedTuple, Iterable, Callable
 import traceback
-from functools import lru_cache
-from datetime import datetime, timedelta
+from collections import OrderedDict
+from datetime import date, datetime
 from dotenv import load_dotenv
-import time
+import asyncio
+from functools import wraps
+from database.backend import (
+    StorageBackend, STORAGE_BACKEND, ID_INDEX, PAGE_ROWS, FIRST_DAY, LAST_DAY, ChatId, chat_key, date_key, in_date_range, ensure_row_ids, is_visible,
+    new_product_id, row_chat
+)
+from database.executor import storage_executor
+from database.journal import RecordJournal
+from database.memory_backend import MemoryBackend
+from database.sqlite_backend import SQLiteBackend
+from database.rate_limit import (
+    sheets_limiter, backoff_delay, get_retry_after, get_status_code, is_retryable, SHEETS_RETRY_BASE_DELAY
+)
+from database.circuit_breaker import CircuitBreaker, CircuitOpenError
+from database.write_buffer import AppendBuffer, BufferFullError, WRITE_BUFFER_ENABLED
+from database.row_cache import RowCache, ROW_CACHE_ENABLED, FIRST_DATA_ROW, parse_updated_range
+from database.partitions import PartitionCatalog, LEGACY_PARTITION, SHEETS_PARTITION_BY_MONTH, partition_of
+from database.change_probe import ChangeProbe, SHEETS_CHANGE_PROBE_ENABLED
+from database.aggregates import AggregateStore, Total, AGGREGATES_ENABLED
+from database.idempotency import IdempotencyIndex, idempotent_product_id
+from database.unit_of_work import UnitOfWorkStats, unit_of_work
+from database.sheets_client import (
+    AsyncSheetsClient, AsyncSpreadsheet, AsyncWorksheet, ServiceAccountToken, APIError, SpreadsheetNotFound,
+    WorksheetNotFound, quote_title
+)
 
 # إعداد التسجيل
 logger = logging.getLogger(__name__)
@@ -34,18 +56,67 @@ MAX_PRICE = 1000000
 
 # عدد محاولات إعادة الاتصال
 MAX_RETRIES = 3
-# فترة الانتظار بين المحاولات (بالثواني)
-RETRY_DELAY = 2
 
-# سنستخدم وضع تجريبي في حالة كان هناك مشكلة في الاتصال
+# عدد الصفوف الإضافية التي نطلبها بعد آخر صف معروف عند قراءة نهاية الورقة
+# (الصفوف الفارغة في نهاية النطاق لا تُعاد، لذلك لا تكلف شيئاً)
+TAIL_READ_SLACK = 100
+
+# آخر صف مستخدم معروف في كل ورقة حسب مفتاح القسم (يُحدّث من ردود الإضافة والقراءة)
+_known_used_rows: Dict[str, int] = {}
+
+# عدد الصفوف عند إنشاء ورقة شهر جديدة (تتوسع الورقة تلقائياً عند الإضافة)
+PARTITION_INITIAL_ROWS = 200
+
+# معرفات آخر الصفوف التي وصلت إلى الأوراق؛ إذا فشل إرسال دفعة في أحد الأشهر بعد نجاحها في
+# غيره تُعاد الدفعة كاملة، فتُتخطى الصفوف التي وصلت بالفعل
+APPENDED_IDS_LIMIT = 1000
+_appended_ids: "OrderedDict[str, None]" = OrderedDict()
+
+# رؤوس الأعمدة
+SHEET_HEADERS = ["التاريخ", "المنتج", "السعر", "ملاحظات", "المعرف", "المحادثة"]
+# عمود معرف المنتج
+ID_COLUMN = "E"
+# عمود المحادثة المالكة، وهو آخر أعمدة البيانات
+CHAT_COLUMN = "F"
+
+# عميل Google Sheets المشترك (جلسة HTTP واحدة طوال التشغيل)
+_client: Optional[AsyncSheetsClient] = None
+# ورقة العمل المفتوحة (تُفتح مرة واحدة في كل تشغيل)
+_worksheet: Optional[AsyncWorksheet] = None
+_worksheet_lock: Optional[asyncio.Lock] = None
+# هل تم التحقق من رؤوس الأعمدة في هذا التشغيل؟
+_schema_checked = False
+# جدول البيانات المفتوح وأوراق الأشهر فيه حسب مفتاح الشهر
+_spreadsheet: Optional[AsyncSpreadsheet] = None
+_partition_worksheets: Dict[str, AsyncWorksheet] = {}
+# أوراق الأشهر الموجودة مسبقاً التي تم التحقق من رؤوس أعمدتها قبل الكتابة فيها
+_headers_checked: Set[str] = set()
+# أوراق أشهر أُرسل طلب إنشائها ولم يصل تأكيده (ربما أُنشئت الورقة رغم فشل الطلب)
+_unconfirmed_partitions: Set[str] = set()
+# فهرس الأوراق الشهرية
+partition_catalog = PartitionCatalog()
+
+load_dotenv()
+# مفتاح جدول البيانات (يسمح بفتحه مباشرة دون البحث بالاسم في Drive)
+GOOGLE_SHEETS_KEY = os.getenv("GOOGLE_SHEETS_KEY")
+
+# سنستخدم وضع تجريبي في حالة عدم وجود اعتمادات Google Sheets
 DEMO_MODE = False
 
-# مخزن مؤقت للمنتجات في الوضع التجريبي
-DEMO_PRODUCTS: List[Dict] = []
+# قاطع الدائرة لطلبات Google Sheets (يرفض الطلبات مؤقتاً أثناء الانقطاع ثم يعيد المحاولة)
+sheets_breaker = CircuitBreaker("Google Sheets")
 
-# ملف لتخزين المنتجات المضافة
+# ملفات تخزين المنتجات المضافة محلياً (سجل التعديلات وآخر لقطة)
 DEMO_DATA_DIR = os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), "data")
+DEMO_JOURNAL_FILE = os.path.join(DEMO_DATA_DIR, "demo_products.jsonl")
+DEMO_SNAPSHOT_FILE = os.path.join(DEMO_DATA_DIR, "demo_products.snapshot.json")
+# ملف pickle القديم (يُنقل إلى السجل مرة واحدة)
 DEMO_DATA_FILE = os.path.join(DEMO_DATA_DIR, "demo_products.pkl")
+# سجل الصفوف المؤجلة التي لم تُرسل بعد إلى Google Sheets
+PENDING_ROWS_FILE = os.path.join(DEMO_DATA_DIR, "pending_rows.jsonl")
+# المجاميع المحفوظة عند الإغلاق
+AGGREGATES_JOURNAL_FILE = os.path.join(DEMO_DATA_DIR, "aggregates.jsonl")
+AGGREGATES_SNAPSHOT_FILE = os.path.join(DEMO_DATA_DIR, "aggregates.snapshot.json")
 
 # تأكد من وجود مجلد البيانات
 if not os.path.exists(DEMO_DATA_DIR):
@@ -55,25 +126,6 @@ if not os.path.exists(DEMO_DATA_DIR):
     except Exception as e:
         logger.error(f"فشل في إنشاء مجلد البيانات: {str(e)}")
 
-# تحميل المنتجات السابقة من الملف إذا كان موجوداً
-try:
-    if os.path.exists(DEMO_DATA_FILE):
-        with open(DEMO_DATA_FILE, 'rb') as f:
-            DEMO_PRODUCTS = pickle.load(f)
-            logger.info(f"تم تحميل {len(DEMO_PRODUCTS)} منتج من الملف المؤقت")
-except Exception as e:
-    logger.error(f"فشل في تحميل المنتجات من الملف: {str(e)}")
-    DEMO_PRODUCTS = []
-
-# دالة لحفظ المنتجات إلى ملف
-def save_demo_products():
-    try:
-        with open(DEMO_DATA_FILE, 'wb') as f:
-            pickle.dump(DEMO_PRODUCTS, f)
-        logger.info(f"تم حفظ {len(DEMO_PRODUCTS)} منتج إلى الملف المؤقت")
-    except Exception as e:
-        logger.error(f"فشل في حفظ المنتجات إلى الملف: {str(e)}")
-
 class SheetsError(Exception):
     """فئة مخصصة للأخطاء المتعلقة بـ Google Sheets"""
     pass
@@ -85,208 +137,1778 @@ def find_client_secret_file():
             return file
     return None
 
-# التخزين المؤقت للعميل مع التحقق من انتهاء صلاحية الجلسة
-@lru_cache(maxsize=1)
-def get_google_sheets_client() -> Tuple[Optional[gspread.Client], datetime]:
+# ملف مفتاح حساب الخدمة
+CREDENTIALS_FILE = "sheet-bot-444713-d558e2ce2ee8.json"
+
+def get_sheets_client() -> Optional[AsyncSheetsClient]:
     """
-    الحصول على عميل Google Sheets مع تخزين مؤقت
+    الحصول على عميل Google Sheets المشترك
+    
+    يُنشأ العميل مرة واحدة ويبقى طوال التشغيل؛ رمز الوصول يتجدد في الخلفية فلا حاجة
+    لإعادة إنشائه دورياً.
     
     Returns:
-        Tuple[Optional[gspread.Client], datetime]: (عميل جوجل شيتس، وقت الإنشاء)
+        Optional[AsyncSheetsClient]: العميل، أو None في الوضع التجريبي (لا توجد اعتمادات)
     """
-    global DEMO_MODE
+    global DEMO_MODE, _client
     
     if DEMO_MODE:
         logger.info("تشغيل في الوضع التجريبي - لن يتم الاتصال بـ Google Sheets")
-        return None, datetime.now()
+        return None
+    if _client is not None:
+        return _client
     
-    try:
-        # صلاحيات Google Sheets و Google Drive
-        scope = ['https://spreadsheets.google.com/feeds',
-                'https://www.googleapis.com/auth/drive']
-        
-        # استخدام ملف الاعتماد مباشرة
-        credentials_file = "sheet-bot-444713-d558e2ce2ee8.json"
-        
-        # تحقق من وجود الملف
-        if not os.path.exists(credentials_file):
-            logger.error(f"ملف الاعتماد غير موجود: {credentials_file}")
-            DEMO_MODE = True
-            return None, datetime.now()
-            
-        # تهيئة الاعتمادات باستخدام ملف client_secret
-        try:
-            # استخدام ServiceAccountCredentials مباشرة
-            credentials = ServiceAccountCredentials.from_json_keyfile_name(
-                credentials_file, scope
-            )
-            
-            # إنشاء عميل gspread
-            client = gspread.authorize(credentials)
-            logger.info("تم الاتصال بنجاح بـ Google Sheets API")
-            return client, datetime.now()
-            
-        except Exception as e:
-            logger.error(f"فشل في إنشاء اعتمادات: {str(e)}")
-            DEMO_MODE = True
-            return None, datetime.now()
+    # تحقق من وجود الملف
+    if not os.path.exists(CREDENTIALS_FILE):
+        logger.error(f"ملف الاعتماد غير موجود: {CREDENTIALS_FILE}")
+        DEMO_MODE = True
+        return None
     
+    try:
+        _client = AsyncSheetsClient(ServiceAccountToken.from_file(CREDENTIALS_FILE))
     except Exception as e:
-        logger.error(f"خطأ في إنشاء عميل Google Sheets: {str(e)}")
+        logger.error(f"فشل في إنشاء اعتمادات: {str(e)}")
         logger.error(traceback.format_exc())
         logger.info("تغيير إلى الوضع التجريبي")
         DEMO_MODE = True
-        return None, datetime.now()
+        return None
+    
+    logger.info("تم إنشاء عميل Google Sheets API")
+    return _client
 
 def with_retry(func):
     """
     مزخرف لإضافة إعادة المحاولة للدوال التي تتعامل مع Google Sheets API
     
-    Args:
-        func: الدالة التي ستتم إعادة محاولة تنفيذها
+    الانتظار بين المحاولات غير متزامن (لا يوقف حلقة الأحداث) ويتضاعف مع كل محاولة مع
+    قيمة عشوائية. عند تجاوز الحصة (429) نحترم Retry-After ونوقف محدد المعدل المشترك
+    (عبر _sheets_call) حتى لا تصطدم بقية الطلبات بالحد نفسه. الأخطاء الدائمة (مثل 400 و 403) لا يُعاد تنفيذها.
+    
+    Args:
+        func: الدالة التي ستتم إعادة محاولة تنفيذها
+        
+    Returns:
+        نتيجة تنفيذ الدالة في حال النجاح
+        
+    Raises:
+        SheetsError: في حال فشل جميع المحاولات
+    """
+    @wraps(func)
+    async def wrapper(*args, **kwargs):
+        last_error = None
+        for attempt in range(MAX_RETRIES):
+            try:
+                return await func(*args, **kwargs)
+            except (APIError, ConnectionError, TimeoutError) as e:
+                if not is_retryable(e):
+                    logger.error(f"خطأ دائم من Google Sheets (رمز {get_status_code(e)}): {str(e)}")
+                    raise
+                logger.warning(f"فشل الاتصال (محاولة {attempt+1}/{MAX_RETRIES}): {str(e)}")
+                last_error = e
+                if attempt + 1 >= MAX_RETRIES:
+                    break
+                
+                delay = backoff_delay(attempt)
+                if get_status_code(e) == 429:
+                    # محدد المعدل أُوقف بالفعل في _sheets_call
+                    retry_after = get_retry_after(e)
+                    if retry_after is not None:
+                        delay = retry_after
+                # انتظار قبل إعادة المحاولة
+                await asyncio.sleep(delay)
+            except Exception as e:
+                # الأخطاء الأخرى تُرفع مباشرة
+                logger.error(f"خطأ غير متوقع: {str(e)}")
+                raise
+        
+        # بعد فشل جميع المحاولات
+        error_msg = f"فشلت جميع محاولات الاتصال بـ Google Sheets ({MAX_RETRIES} محاولات)"
+        if last_error:
+            error_msg += f": {str(last_error)}"
+        logger.error(error_msg)
+        raise SheetsError(error_msg)
+        
+    return wrapper
+
+async def _sheets_call(func, *args, **kwargs):
+    """
+    تنفيذ طلب إلى Google Sheets بعد الحصول على إذن من قاطع الدائرة ومحدد المعدل
+    
+    Args:
+        func: دالة العميل غير المتزامنة (مثل worksheet.get)
+        *args: معطيات الدالة
+        **kwargs: معطيات الدالة المسماة
+        
+    Returns:
+        نتيجة الدالة
+        
+    Raises:
+        CircuitOpenError: إذا كان قاطع الدائرة مفتوحاً
+    """
+    sheets_breaker.check()
+    await sheets_limiter.acquire()
+    try:
+        result = await func(*args, **kwargs)
+    except APIError as e:
+        if get_status_code(e) == 429:
+            # إيقاف جميع الطلبات حتى تتجدد الحصة بدلاً من إرسال طلبات ستفشل بدورها
+            retry_after = get_retry_after(e)
+            sheets_limiter.pause(retry_after if retry_after is not None else SHEETS_RETRY_BASE_DELAY)
+            sheets_breaker.release_probe()
+        elif is_retryable(e):
+            sheets_breaker.record_failure(e)
+        else:
+            # الخدمة ردت (الخطأ في الطلب نفسه)
+            sheets_breaker.record_success()
+        raise
+    except OSError as e:
+        # أخطاء الشبكة والمهلة
+        sheets_breaker.record_failure(e)
+        raise
+    except Exception:
+        sheets_breaker.release_probe()
+        raise
+    sheets_breaker.record_success()
+    return result
+
+async def _open_spreadsheet(client: AsyncSheetsClient) -> AsyncSpreadsheet:
+    """
+    فتح جدول البيانات
+    
+    إذا كان GOOGLE_SHEETS_KEY موجوداً نفتح الجدول بالمفتاح مباشرة، وإلا نبحث عنه بالاسم.
+    
+    Args:
+        client: عميل Google Sheets
+        
+    Returns:
+        AsyncSpreadsheet: جدول البيانات
+    """
+    if GOOGLE_SHEETS_KEY:
+        return await client.open_by_key(GOOGLE_SHEETS_KEY)
+    
+    try:
+        return await client.open(SPREADSHEET_NAME)
+    except SpreadsheetNotFound:
+        # إذا لم يتم العثور على الجدول، محاولة البحث عن أي جدول
+        all_spreadsheets = await client.openall()
+        if not all_spreadsheets:
+            raise SheetsError("لا توجد جداول بيانات متاحة")
+        spreadsheet = all_spreadsheets[0]
+        logger.info(f"استخدام جدول بديل: {spreadsheet.title}")
+        return spreadsheet
+
+async def _migrate_sheet_schema(worksheet: AsyncWorksheet) -> None:
+    """
+    التحقق من رؤوس الأعمدة وإنشاؤها إذا لزم الأمر
+    
+    تعمل مرة واحدة في كل تشغيل عند أول فتح لورقة العمل.
+    
+    Args:
+        worksheet: ورقة العمل
+    """
+    global _schema_checked
+    
+    async with _unit_of_work(worksheet.spreadsheet, join=False):
+        await _ensure_headers(worksheet)
+    _schema_checked = True
+
+async def _ensure_headers(worksheet: AsyncWorksheet, key: Optional[str] = None) -> None:
+    """
+    كتابة رؤوس الأعمدة إذا كانت ناقصة
+    
+    إضافة الأعمدة الناقصة وكتابة الرؤوس وتنسيقها تُرسل في طلب batchUpdate واحد، مع بقية
+    تعديلات العملية إذا كانت هناك وحدة عمل مفتوحة.
+    
+    Args:
+        worksheet: ورقة العمل
+        key: مفتاح القسم؛ يُسجل كمفحوص بعد وصول الرؤوس (None = بدون تسجيل)
+    """
+    headers = await _sheets_call(worksheet.row_values, 1)
+    if headers and len(headers) >= len(SHEET_HEADERS):
+        if key is not None:
+            _headers_checked.add(key)
+        return
+    
+    # إذا كان الصف الأول فارغًا، سنضيف العناوين
+    requests = []
+    # أوراق الأشهر القديمة أُنشئت بعدد الأعمدة السابق
+    added_cols = len(SHEET_HEADERS) - worksheet.col_count if 0 < worksheet.col_count < len(SHEET_HEADERS) else 0
+    if added_cols:
+        requests.append(worksheet.add_cols_request(added_cols))
+    requests.extend(_header_requests(worksheet))
+    
+    async def written(replies: List[Dict[str, Any]]) -> None:
+        worksheet.col_count += added_cols
+        if key is not None:
+            _headers_checked.add(key)
+        logger.info(f"تم إنشاء رؤوس الأعمدة في {worksheet.title}")
+    
+    async with _unit_of_work(worksheet.spreadsheet) as unit:
+        unit.add(requests, written)
+
+def _header_requests(worksheet: AsyncWorksheet) -> List[Dict[str, Any]]:
+    """طلبا كتابة رؤوس الأعمدة وتنسيقها"""
+    return [
+        worksheet.update_cells_request(f'A1:{CHAT_COLUMN}1', [SHEET_HEADERS]),
+        worksheet.format_request(f'A1:{CHAT_COLUMN}1', {
+            "backgroundColor": {"red": 0.9, "green": 0.9, "blue": 0.9},
+            "horizontalAlignment": "CENTER",
+            "textFormat": {"bold": True}
+        })
+    ]
+
+def _unit_of_work(spreadsheet: Optional[AsyncSpreadsheet] = None, join: bool = True):
+    """
+    وحدة عمل تجمع تعديلات العملية الحالية في طلب batchUpdate واحد (database/unit_of_work.py)
+    
+    Args:
+        spreadsheet: جدول البيانات (None = الجدول المفتوح)
+        join: الانضمام إلى الوحدة المفتوحة إن وجدت
+    """
+    async def send(requests: List[Dict[str, Any]]) -> Dict[str, Any]:
+        return await _sheets_call((spreadsheet or _spreadsheet).batch_update, requests)
+    return unit_of_work(send, unit_stats, join)
+
+def _get_worksheet_lock() -> asyncio.Lock:
+    """قفل فتح الأوراق (يُنشأ داخل حلقة الأحداث عند أول استخدام)"""
+    global _worksheet_lock
+    if _worksheet_lock is None:
+        _worksheet_lock = asyncio.Lock()
+    return _worksheet_lock
+
+async def get_worksheet() -> Optional[AsyncWorksheet]:
+    """
+    الحصول على ورقة العمل مع التعامل مع الأخطاء
+    
+    يُفتح جدول البيانات مرة واحدة ثم يُعاد استخدام ورقة العمل نفسها طوال التشغيل.
+    
+    الوضع التجريبي يُفعّل فقط عند غياب الاعتمادات؛ أخطاء الاتصال تُسجل في قاطع الدائرة
+    وتُرفع للمستدعي حتى يعود البوت إلى Google Sheets تلقائياً بعد زوال الانقطاع.
+    
+    Returns:
+        Optional[AsyncWorksheet]: ورقة العمل أو None في حالة الوضع التجريبي
+    
+    Raises:
+        CircuitOpenError: إذا كان قاطع الدائرة مفتوحاً
+        SheetsError: إذا تعذر فتح ورقة العمل
+    """
+    global _worksheet, _spreadsheet, _partition_worksheets
+    
+    if _worksheet is not None and not DEMO_MODE:
+        return _worksheet
+    
+    # get_sheets_client يفعّل الوضع التجريبي إذا لم توجد اعتمادات
+    client = get_sheets_client()
+    if client is None:
+        return None
+    
+    async with _get_worksheet_lock():
+        # ربما فتحها طلب آخر أثناء انتظار القفل
+        if _worksheet is not None:
+            return _worksheet
+        
+        sheets_breaker.check()
+        try:
+            spreadsheet = await _open_spreadsheet(client)
+            # طلب واحد يعيد جميع الأوراق: الأولى هي القسم القديم والبقية تبني فهرس الأشهر
+            worksheets = await spreadsheet.worksheets()
+            worksheet = worksheets[0]
+            
+            if not _schema_checked:
+                await _migrate_sheet_schema(worksheet)
+        except Exception as e:
+            logger.error(f"خطأ في فتح ورقة العمل: {str(e)}")
+            sheets_breaker.record_failure(e)
+            raise SheetsError(f"تعذر فتح ورقة العمل: {str(e)}")
+        
+        sheets_breaker.record_success()
+        _worksheet = worksheet
+        _spreadsheet = spreadsheet
+        _partition_worksheets = {ws.title: ws for ws in worksheets[1:]}
+        partition_catalog.load(_partition_worksheets)
+        logger.info(f"تم فتح ورقة العمل: {spreadsheet.title} ({len(partition_catalog.partitions)} ورقة شهرية)")
+        return worksheet
+
+async def _find_unconfirmed_partition(key: str) -> Optional[AsyncWorksheet]:
+    """
+    البحث عن ورقة شهر فشل إرسال طلب إنشائها
+    
+    ربما وصل الطلب وضاع رده، أو أُنشئت الورقة من خارج البوت فرُفض الطلب. إذا وُجدت تُسجل في
+    الفهرس حتى لا يُطلب إنشاؤها مرة أخرى.
+    
+    Returns:
+        Optional[AsyncWorksheet]: الورقة، أو None إذا لم تُنشأ
+    """
+    async with _get_worksheet_lock():
+        if key not in _unconfirmed_partitions or key in _partition_worksheets:
+            return _partition_worksheets.get(key)
+        try:
+            worksheet = await _sheets_call(_spreadsheet.worksheet, key)
+        except WorksheetNotFound:
+            return None
+        _unconfirmed_partitions.discard(key)
+        _partition_worksheets[key] = worksheet
+        partition_catalog.add(key)
+        logger.info(f"ورقة الشهر {key} موجودة رغم فشل طلب إنشائها")
+        return worksheet
+
+async def get_partition_worksheet(key: str, create: bool = False) -> Optional[AsyncWorksheet]:
+    """
+    ورقة العمل لقسم معين
+    
+    Args:
+        key: مفتاح الشهر (مثل 2026-10)، أو LEGACY_PARTITION للورقة الأولى
+        create: إنشاء ورقة الشهر إذا لم تكن موجودة (عند الإضافة فقط)؛ طلب الإنشاء ينضم إلى وحدة
+            العمل المفتوحة، ولا تُسجل الورقة في الفهرس إلا بعد إرسال الوحدة
+    
+    Returns:
+        Optional[AsyncWorksheet]: ورقة العمل، أو None في الوضع التجريبي أو إذا لم تُنشأ بعد
+    
+    Raises:
+        CircuitOpenError: إذا كان قاطع الدائرة مفتوحاً
+        SheetsError: إذا تعذر إنشاء الورقة
+    """
+    legacy = await get_worksheet()
+    if legacy is None or key == LEGACY_PARTITION:
+        return legacy
+    if create:
+        await _find_unconfirmed_partition(key)
+    
+    async with _get_worksheet_lock():
+        worksheet = _partition_worksheets.get(key)
+        if worksheet is not None and create and key not in _headers_checked:
+            # ورقة أُنشئت قبل إضافة عمود المحادثة؛ نحدّث رؤوسها قبل أول كتابة فيها
+            await _ensure_headers(worksheet, key)
+        if worksheet is not None or not create:
+            return worksheet
+        
+        try:
+            # الورقة الجديدة فارغة، فلا حاجة لقراءة رؤوسها: إنشاؤها وكتابة رؤوسها وتنسيقها تُرسل
+            # مع بقية تعديلات العملية (مثل إضافة الصفوف إليها) في طلب batchUpdate واحد
+            worksheet, request = _spreadsheet.add_worksheet_request(key, PARTITION_INITIAL_ROWS, len(SHEET_HEADERS))
+            _unconfirmed_partitions.add(key)
+            
+            async def created(replies: List[Dict[str, Any]]) -> None:
+                _spreadsheet.register_worksheet(worksheet)
+                _unconfirmed_partitions.discard(key)
+                _headers_checked.add(key)
+                _partition_worksheets[key] = worksheet
+                partition_catalog.add(key)
+                logger.info(f"تم إنشاء ورقة الشهر: {key}")
+            
+            async with _unit_of_work() as unit:
+                unit.add([request] + _header_requests(worksheet), created)
+        except (CircuitOpenError, SheetsError):
+            raise
+        except Exception as e:
+            logger.error(f"خطأ في إنشاء ورقة الشهر {key}: {str(e)}")
+            raise SheetsError(f"تعذر إنشاء ورقة الشهر {key}: {str(e)}")
+        return worksheet
+
+def validate_product_data(product: str, price: float) -> None:
+    """
+    التحقق من صحة بيانات المنتج
+    
+    Args:
+        product (str): اسم المنتج
+        price (float): سعر المنتج
+        
+    Raises:
+        ValueError: إذا كانت البيانات غير صالحة
+    """
+    if not product or not product.strip():
+        raise ValueError("اسم المنتج لا يمكن أن يكون فارغاً")
+        
+    if not isinstance(price, (int, float)):
+        raise ValueError("السعر يجب أن يكون رقماً")
+        
+    if price < MIN_PRICE or price > MAX_PRICE:
+        raise ValueError(f"السعر يجب أن يكون بين {MIN_PRICE} و {MAX_PRICE}")
+
+def format_date(dt: datetime) -> str:
+    """
+    تنسيق التاريخ بالشكل المطلوب YYYY/MM/DD
+    
+    Args:
+        dt (datetime): كائن تاريخ
+    
+    Returns:
+        str: التاريخ بالتنسيق المطلوب
+    """
+    return dt.strftime("%Y/%m/%d")
+
+def _row_to_product(row: list, sheet_row: Optional[int]) -> Optional[Dict]:
+    """
+    تحويل صف من الورقة إلى قاموس منتج
+    
+    Args:
+        row: قيم الصف [التاريخ، المنتج، السعر، الملاحظات، المعرف، المحادثة]
+        sheet_row: رقم الصف الفعلي في الورقة (None للصفوف التي لم تُرسل بعد)
+        
+    Returns:
+        Optional[Dict]: بيانات المنتج أو None إذا كان الصف فارغاً أو غير صالح
+    """
+    try:
+        if len(row) >= 3 and any(row):
+            return {
+                'date': row[0],
+                'name': row[1],
+                'price': float(row[2]),
+                'notes': row[3] if len(row) > 3 else '',
+                'sheet_row': sheet_row,
+                'id': row[ID_INDEX] if len(row) > ID_INDEX and row[ID_INDEX] else None,
+                'chat_id': row_chat(row)
+            }
+    except (IndexError, ValueError, TypeError) as e:
+        logger.warning(f"خطأ في تحويل الصف {row}: {str(e)}")
+    return None
+
+def _mirror(key: str) -> RowCache:
+    """
+    مرآة صفوف قسم معين (تُنشأ عند أول استخدام)
+    
+    Args:
+        key: مفتاح الشهر، أو LEGACY_PARTITION للورقة الأولى
+    """
+    cache = row_caches.get(key)
+    if cache is None:
+        cache = row_caches[key] = RowCache()
+    return cache
+
+def _group_by_partition(rows: List[list]) -> Dict[str, List[list]]:
+    """
+    توزيع الصفوف على أقسامها حسب التاريخ والمحادثة المالكة مع الحفاظ على ترتيبها
+    
+    بعد بلوغ حد أوراق المحادثات تُوزع صفوف المحادثات الجديدة على أوراق الأشهر المشتركة.
+    """
+    groups: Dict[str, List[list]] = {}
+    for row in rows:
+        groups.setdefault(partition_catalog.route(partition_of(row[0], row_chat(row))), []).append(row)
+    return groups
+
+def _pending_partitions() -> List[str]:
+    """الأقسام التي لها صفوف معلقة (ربما لم تُنشأ أوراقها بعد)"""
+    return [key for key, cache in row_caches.items() if cache.pending]
+
+def _row_runs(rows: List[int]) -> List[Tuple[int, int]]:
+    """دمج أرقام الصفوف المتتالية في نطاقات (أول صف، آخر صف)"""
+    runs: List[Tuple[int, int]] = []
+    for row_number in sorted(rows):
+        if runs and row_number == runs[-1][1] + 1:
+            runs[-1] = (runs[-1][0], row_number)
+        else:
+            runs.append((row_number, row_number))
+    return runs
+
+def _column_number(letters: str) -> int:
+    """رقم العمود من حروفه (A = 1)"""
+    number = 0
+    for letter in letters:
+        number = number * 26 + ord(letter) - ord('A') + 1
+    return number
+
+def _range_shape(a1_range: str) -> Tuple[int, int]:
+    """
+    رقم أول صف وعدد الأعمدة في نطاق A1 بدون اسم الورقة
+    
+    مثال: "A2:F10" -> (2, 6)، "E2:E" -> (2, 1)
+    """
+    match = re.fullmatch(r'([A-Z]+)(\d*)(?::([A-Z]+)\d*)?', a1_range)
+    if not match:
+        raise ValueError(f"نطاق غير مدعوم: {a1_range}")
+    first_column = _column_number(match.group(1))
+    last_column = _column_number(match.group(3)) if match.group(3) else first_column
+    return int(match.group(2) or 1), last_column - first_column + 1
+
+class RangeRows(NamedTuple):
+    """
+    نتيجة قراءة نطاق: رقم أول صف فيه وصفوفه
+    
+    كل صف بعدد أعمدة النطاق (الخانات الفارغة نصوص فارغة). الصفوف الفارغة في نهاية النطاق
+    لا يعيدها Google Sheets، فعدد الصفوف قد يكون أقل من حجم النطاق.
+    """
+    title: str
+    first_row: int
+    rows: List[list]
+    
+    def products(self, chat_id: ChatId = None) -> List[Dict]:
+        """منتجات النطاق (لنطاقات الأعمدة A:F) من الأقدم إلى الأحدث"""
+        products = []
+        for offset, row in enumerate(self.rows):
+            product = _row_to_product(row, self.first_row + offset)
+            if product is not None and is_visible(product['chat_id'], chat_id):
+                products.append(product)
+        return products
+
+async def _batch_read(requests: List[Tuple[AsyncWorksheet, str]]) -> List[RangeRows]:
+    """
+    قراءة عدة نطاقات من أوراق مختلفة في طلب values_batch_get واحد
+    
+    Args:
+        requests: (ورقة العمل، نطاق A1 بدون اسم الورقة) لكل نطاق
+    
+    Returns:
+        List[RangeRows]: نتيجة كل نطاق بنفس الترتيب (بدون طلب إذا كانت القائمة فارغة)
+    """
+    if not requests:
+        return []
+    
+    value_ranges = await _sheets_call(_spreadsheet.values_batch_get, [
+        f"{quote_title(worksheet.title)}!{a1_range}" for worksheet, a1_range in requests
+    ])
+    results = []
+    for (worksheet, a1_range), value_range in zip(requests, value_ranges):
+        first_row, width = _range_shape(a1_range)
+        rows = [
+            [cell if cell is not None else '' for cell in row[:width]] + [''] * (width - len(row))
+            for row in value_range.get('values', [])
+        ]
+        results.append(RangeRows(worksheet.title, first_row, rows))
+    return results
+
+async def _sync_row_caches(targets: List[Tuple[AsyncWorksheet, RowCache]]) -> None:
+    """
+    مزامنة عدة مرايا بجلب الصفوف المضافة بعد آخر صف معروف في كل منها فقط
+    
+    نوافذ جميع الأوراق تُقرأ في طلب values_batch_get واحد، ولا يُطلب نطاق تالٍ إلا للمرايا
+    التي امتلأت نافذتها. الأقفال تُحجز بترتيب أسماء الأوراق حتى لا تنتظر مزامنتان بعضهما.
+    
+    Args:
+        targets: (ورقة العمل، مرآتها) لكل قسم
+    """
+    targets = sorted({worksheet.title: (worksheet, cache) for worksheet, cache in targets}.items())
+    async with contextlib.AsyncExitStack() as stack:
+        for _, (_, cache) in targets:
+            await stack.enter_async_context(cache.lock)
+        
+        # ربما أنهى طلب آخر مزامنة بعضها أثناء انتظار الأقفال
+        due = [(worksheet, cache) for _, (worksheet, cache) in targets if cache.needs_sync()]
+        first_load = {worksheet.title for worksheet, cache in due if not cache.loaded}
+        fetched: Dict[str, int] = {}
+        new_rows: Dict[str, List[int]] = {}
+        active = due
+        while active:
+            windows = [cache.next_window() for _, cache in active]
+            results = await _batch_read([
+                (worksheet, f"A{start}:{CHAT_COLUMN}{end}") for (worksheet, _), (start, end) in zip(active, windows)
+            ])
+            remaining = []
+            for (worksheet, cache), result in zip(active, results):
+                if result.rows:
+                    cache.extend(result.first_row, result.rows)
+                    fetched[worksheet.title] = fetched.get(worksheet.title, 0) + len(result.rows)
+                    new_rows.setdefault(worksheet.title, []).extend(
+                        range(result.first_row, result.first_row + len(result.rows))
+                    )
+                # الصفوف الفارغة في نهاية النطاق لا تُعاد، لذلك نطاق غير مكتمل يعني نهاية البيانات
+                if len(result.rows) >= cache.sync_window:
+                    remaining.append((worksheet, cache))
+            active = remaining
+        
+        for worksheet, cache in due:
+            cache.mark_synced()
+            if fetched.get(worksheet.title):
+                logger.info(
+                    f"تمت مزامنة {fetched[worksheet.title]} صف جديد من {worksheet.title}، آخر صف معروف: {cache.last_row}"
+                )
+            
+            # الصفوف المضافة من خارج البوت لم تمر بالمجاميع (صفوف البوت محسوبة بمعرفاتها)
+            if worksheet.title in first_load:
+                aggregate_store.replace_partition(_partition_key(worksheet), _counted_rows(cache))
+            else:
+                _count_new_rows(worksheet, cache, new_rows.get(worksheet.title, []))
+            
+            # الصفوف التي أضيفت يدوياً أو قبل إضافة عمود المعرف (أو فشلت كتابة معرفها سابقاً)
+            if cache.missing_ids:
+                ids = {row_number: new_product_id() for row_number in cache.missing_ids}
+                if await _write_ids(worksheet, ids):
+                    for row_number, product_id in ids.items():
+                        cache.assign_id(row_number, product_id)
+
+async def _write_ids(worksheet: AsyncWorksheet, ids: Dict[int, str]) -> bool:
+    """
+    كتابة معرفات جديدة لصفوف ليس لها معرف في طلب batch_update واحد
+    
+    Args:
+        worksheet: ورقة العمل
+        ids: رقم الصف -> المعرف الجديد
+    
+    Returns:
+        bool: True إذا كُتبت المعرفات (إذا فشلت الكتابة تُعاد المحاولة في المزامنة التالية)
+    """
+    if not ids:
+        return True
+    
+    # دمج الصفوف المتتالية في نطاق واحد
+    data = [
+        {
+            'range': f"{ID_COLUMN}{first}:{ID_COLUMN}{last}",
+            'values': [[ids[row_number]] for row_number in range(first, last + 1)]
+        }
+        for first, last in _row_runs(list(ids))
+    ]
+    
+    try:
+        await _sheets_call(worksheet.batch_update, data)
+    except (SheetsError, CircuitOpenError, APIError, OSError) as e:
+        logger.warning(f"تعذرت كتابة معرفات {len(ids)} صف: {str(e)}")
+        return False
+    logger.info(f"تم إنشاء معرفات لـ {len(ids)} صف في {worksheet.title}")
+    # مساهمات هذه الصفوف في المجاميع محفوظة بمواقعها حتى الآن
+    aggregate_store.assign_ids(_partition_key(worksheet), ids)
+    return True
+
+def _partition_key(worksheet: AsyncWorksheet) -> str:
+    """مفتاح القسم الذي تحمله ورقة العمل"""
+    if _worksheet is not None and worksheet.id == _worksheet.id:
+        return LEGACY_PARTITION
+    return worksheet.title
+
+def _counted_row(cache: RowCache, row_number: int) -> list:
+    """
+    صف المرآة كما تحسبه المجاميع
+    
+    الصف الذي ينتظر معرفاً جديداً (بدون معرف، أو بمعرف مكرر من صف آخر) يُحسب بموقعه حتى يُكتب معرفه.
+    """
+    row = cache.get_row(row_number)
+    if row_number in cache.missing_ids:
+        return row[:ID_INDEX] + [''] + row[ID_INDEX + 1:]
+    return row
+
+def _counted_rows(cache: RowCache) -> List[Tuple[Optional[int], list]]:
+    """جميع صفوف المرآة والصفوف المعلقة كما تحسبها المجاميع"""
+    rows: List[Tuple[Optional[int], list]] = [
+        (row_number, _counted_row(cache, row_number)) for row_number in range(FIRST_DATA_ROW, cache.last_row + 1)
+    ]
+    rows.extend((None, row) for row in cache.pending)
+    return rows
+
+def _count_new_rows(worksheet: AsyncWorksheet, cache: RowCache, row_numbers: List[int]) -> None:
+    """إبلاغ المجاميع بصفوف جلبتها المرآة بعد آخر صف معروف"""
+    if row_numbers:
+        aggregate_store.apply_rows(
+            _partition_key(worksheet), [(row_number, None, _counted_row(cache, row_number)) for row_number in row_numbers]
+        )
+
+async def _fill_missing_ids(worksheet: AsyncWorksheet, products: List[Dict]) -> None:
+    """
+    إعطاء معرفات للمنتجات المقروءة مباشرة من الورقة والتي ليس لها معرف (بدون المرآة)
+    
+    Args:
+        worksheet: ورقة العمل
+        products: المنتجات كما أعادتها _row_to_product (تُحدث في مكانها)
+    """
+    missing = [p for p in products if p['id'] is None and p['sheet_row'] is not None]
+    ids = {p['sheet_row']: new_product_id() for p in missing}
+    if missing and await _write_ids(worksheet, ids):
+        for product in missing:
+            product['id'] = ids[product['sheet_row']]
+
+async def _probe_visible_rows(
+    worksheet: AsyncWorksheet, chat_id: ChatId, last_row: Optional[int] = None
+) -> Tuple[int, List[int]]:
+    """
+    أرقام الصفوف المرئية للمحادثة من عمودي التاريخ والمحادثة وحدهما في طلب واحد
+    
+    Args:
+        worksheet: ورقة العمل
+        chat_id: المحادثة (None = الجميع)
+        last_row: آخر صف يُفحص (None = حتى آخر صف مستخدم)
+    
+    Returns:
+        Tuple[int, List[int]]: (آخر صف مستخدم، أرقام الصفوف المرئية تصاعدياً)
+    """
+    bound = last_row if last_row is not None else ''
+    dates, owners = await _sheets_call(worksheet.batch_get, [
+        f"A{FIRST_DATA_ROW}:A{bound}", f"{CHAT_COLUMN}{FIRST_DATA_ROW}:{CHAT_COLUMN}{bound}"
+    ])
+    owners += [[]] * (len(dates) - len(owners))
+    visible = [
+        FIRST_DATA_ROW + offset for offset, (cells, owner) in enumerate(zip(dates, owners))
+        if cells and cells[0] and is_visible(owner[0] if owner else '', chat_id)
+    ]
+    return FIRST_DATA_ROW - 1 + len(dates), visible
+
+async def _read_tail_products(
+    worksheet: AsyncWorksheet, key: str, limit: int, chat_id: ChatId = None
+) -> List[Dict]:
+    """
+    قراءة آخر المنتجات من نافذة محدودة في نهاية الورقة
+    
+    إذا كان آخر صف مستخدم معروفاً (من رد آخر إضافة أو قراءة سابقة) نبدأ بنافذة بحجم limit
+    تنتهي عنده. وإلا (أول قراءة، أو بعد تعديل يدوي) نقرأ أولاً عمودي التاريخ والمحادثة وحدهما
+    في طلب واحد، فنعرف آخر صف مستخدم وأين يقع آخر limit منتج لهذه المحادثة، ثم نقرأ النافذة
+    مرة واحدة بدلاً من البدء من row_count (الصفوف الفارغة في الشبكة) والرجوع منه خطوة بخطوة.
+    إذا لم تكفِ النافذة (صفوف محذوفة أو لمحادثات أخرى) نفحص العمودين فوقها مرة واحدة ونقرأ ما
+    ينقص فقط. بذلك تكلف القراءة طلبين على الأكثر ويبقى حجم البيانات المنقولة صغيراً مهما كبرت الورقة.
+    
+    Args:
+        worksheet: ورقة العمل
+        key: مفتاح القسم الذي تحمله الورقة
+        limit: عدد المنتجات المطلوبة
+        chat_id: لا تُحسب إلا منتجات هذه المحادثة والمنتجات بدون مالك (None = الجميع)
+    
+    Returns:
+        List[Dict]: المنتجات من الأحدث إلى الأقدم
+    """
+    limit = max(1, limit)
+    end = _known_used_rows.get(key)
+    probed = end is None
+    if end is not None:
+        start = max(2, end - limit + 1)
+    else:
+        end, visible = await _probe_visible_rows(worksheet, chat_id)
+        if not visible:
+            _known_used_rows[key] = end
+            return []
+        start = visible[-limit] if len(visible) >= limit else visible[0]
+    
+    # التأكد من عدم وجود صفوف أضيفت من خارج البوت بعد آخر صف معروف
+    last_data_row = None
+    while True:
+        values = await _sheets_call(worksheet.get, f"A{start}:{CHAT_COLUMN}{end + TAIL_READ_SLACK}")
+        if len(values) < end + TAIL_READ_SLACK - start + 1:
+            break
+        # النافذة ممتلئة حتى نهايتها، ربما توجد صفوف أخرى بعدها
+        end += TAIL_READ_SLACK
+    
+    products: List[Dict] = []
+    while True:
+        if values:
+            if last_data_row is None:
+                last_data_row = start + len(values) - 1
+            for offset in range(len(values) - 1, -1, -1):
+                if start + offset > last_data_row:
+                    continue
+                product = _row_to_product(values[offset], start + offset)
+                if product is not None and is_visible(product['chat_id'], chat_id):
+                    products.append(product)
+                    if len(products) >= limit:
+                        break
+        
+        if len(products) >= limit or start <= 2 or probed:
+            break
+        
+        # النافذة احتوت صفوفاً فارغة أو لمحادثات أخرى؛ نحدد ما ينقص من الصفوف فوقها بطلب واحد
+        probed = True
+        _, visible = await _probe_visible_rows(worksheet, chat_id, start - 1)
+        if not visible:
+            break
+        missing = limit - len(products)
+        end = start - 1
+        start = visible[-missing] if len(visible) >= missing else visible[0]
+        values = await _sheets_call(worksheet.get, f"A{start}:{CHAT_COLUMN}{end}")
+    
+    _known_used_rows[key] = last_data_row if last_data_row is not None else 1
+    await _fill_missing_ids(worksheet, products)
+    return products
+
+async def _read_date_ranges(
+    worksheets: List[AsyncWorksheet], start_key: str, end_key: str, chat_id: ChatId = None
+) -> List[Dict]:
+    """
+    قراءة المنتجات بين تاريخين من عدة أوراق دون تنزيلها كاملة
+    
+    يُقرأ عمود التاريخ وحده لجميع الأوراق في طلب values_batch_get واحد، ثم تُجلب الصفوف
+    المطابقة فقط (بعد دمج المتتالية منها في نطاقات) من جميع الأوراق في طلب ثانٍ.
+    
+    Args:
+        worksheets: أوراق الأقسام من الأحدث إلى الأقدم
+        start_key: تاريخ البداية بالشكل YYYY/MM/DD
+        end_key: تاريخ النهاية بالشكل YYYY/MM/DD
+        chat_id: المحادثة المالكة (None = الجميع)
+    
+    Returns:
+        List[Dict]: المنتجات من الأحدث إلى الأقدم
+    """
+    columns = await _batch_read([(worksheet, f"A{FIRST_DATA_ROW}:A") for worksheet in worksheets])
+    requests = []
+    for worksheet, column in zip(worksheets, columns):
+        rows = [
+            column.first_row + offset for offset, (cell,) in enumerate(column.rows)
+            if cell and start_key <= str(cell)[:10] <= end_key
+        ]
+        requests.extend((worksheet, f"A{first}:{CHAT_COLUMN}{last}") for first, last in _row_runs(rows))
+    
+    found: Dict[str, List[Dict]] = {worksheet.title: [] for worksheet in worksheets}
+    for result in await _batch_read(requests):
+        found[result.title].extend(result.products(chat_id))
+    
+    products = []
+    for worksheet in worksheets:
+        sheet_products = found[worksheet.title][::-1]
+        await _fill_missing_ids(worksheet, sheet_products)
+        products.extend(sheet_products)
+    return products
+
+async def _iter_sheet_pages(
+    worksheet: AsyncWorksheet, key: str, page_size: int
+) -> AsyncIterator[Tuple[int, List[list]]]:
+    """
+    قراءة صفوف الورقة من أولها على نطاقات ثابتة الحجم
+    
+    لا يُحمّل في الذاكرة أكثر من نطاق واحد مهما كبرت الورقة. النطاق الذي يعود أقصر من حجمه
+    لا يعني نهاية البيانات إذا كانت فيه صفوف محذوفة (فارغة)، لذلك نكمل حتى آخر صف في الورقة
+    (row_count) أو آخر صف مستخدم معروف أيهما أكبر.
+    
+    Args:
+        worksheet: ورقة العمل
+        key: مفتاح القسم الذي تحمله الورقة
+        page_size: عدد الصفوف في كل نطاق
+    
+    Yields:
+        Tuple[int, List[list]]: (رقم أول صف في النطاق، صفوفه)
+    """
+    last_row = max(worksheet.row_count, _known_used_rows.get(key) or 0)
+    start = FIRST_DATA_ROW
+    while True:
+        end = start + page_size - 1
+        values = await _sheets_call(worksheet.get, f"A{start}:{CHAT_COLUMN}{end}")
+        if values:
+            yield start, values
+        if len(values) < page_size and end >= last_row:
+            return
+        start = end + 1
+
+async def _load_legacy_last_date() -> None:
+    """
+    تحديد آخر تاريخ في الورقة القديمة إذا لم يكن معروفاً
+    
+    الورقة القديمة لا تستقبل صفوفاً جديدة بعد تفعيل التقسيم، فيكفي آخر صف فيها (من مرآتها
+    إذا كانت محملة، أو بقراءة نهايتها فقط) لمعرفة هل تحتاجها الاستعلامات الحديثة.
+    """
+    if not SHEETS_PARTITION_BY_MONTH or partition_catalog.legacy_last_key is not None:
+        return
+    
+    cache = row_caches.get(LEGACY_PARTITION)
+    if cache is not None and cache.loaded:
+        products = []
+        for row, sheet_row in cache.iter_latest():
+            product = _row_to_product(row, sheet_row)
+            if product is not None:
+                products.append(product)
+                break
+    else:
+        worksheet = await get_worksheet()
+        if worksheet is None:
+            return
+        products = await _read_tail_products(worksheet, LEGACY_PARTITION, 1)
+    
+    partition_catalog.legacy_last_key = str(products[0]['date'])[:10] if products else ""
+    logger.info(f"آخر تاريخ في الورقة القديمة: {partition_catalog.legacy_last_key or 'فارغة'}")
+
+async def _append_rows_to_sheet(worksheet: AsyncWorksheet, key: str, rows: List[list]) -> None:
+    """
+    إضافة صفوف إلى الورقة وتحديث المرآة بمواقعها الفعلية
+    
+    الإضافة تُرسل مع بقية تعديلات العملية في طلب batchUpdate واحد (appendCells). إذا كانت الإضافة
+    التعديل الوحيد تُرسل عبر values.append الذي يعيد أرقام الصفوف المكتوبة؛ مع الدمج لا تُعرف
+    المواقع، فتجلب المزامنة التالية الصفوف إلى المرآة.
+    
+    Args:
+        worksheet: ورقة العمل
+        key: مفتاح القسم الذي تحمله الورقة
+        rows: الصفوف بالشكل [التاريخ، المنتج، السعر، الملاحظات، المعرف، المحادثة]
+    """
+    cache = _mirror(key)
+    
+    async def appended(replies: List[Dict[str, Any]]) -> None:
+        _remember_appended(rows)
+        updated_range = None
+        if replies and isinstance(replies[0], dict):
+            updated_range = replies[0].get('updates', {}).get('updatedRange')
+        written = parse_updated_range(updated_range)
+        
+        if written is None:
+            cache.confirm_pending(rows, None)
+            return
+        
+        _known_used_rows[key] = max(_known_used_rows.get(key) or 0, written[1])
+        
+        start_row = written[0]
+        # أضيفت صفوف من خارج البوت بعد آخر مزامنة؛ نجلبها حتى لا تبقى فجوة في المرآة
+        if cache.loaded and start_row > cache.last_row + 1:
+            gap_start = cache.last_row + 1
+            gap = await _sheets_call(worksheet.get, f"A{gap_start}:{CHAT_COLUMN}{start_row - 1}")
+            cache.extend(gap_start, gap)
+            _count_new_rows(worksheet, cache, list(range(gap_start, gap_start + len(gap))))
+        cache.confirm_pending(rows, start_row)
+    
+    async with _unit_of_work() as unit:
+        # نحجز قفل المرآة أثناء الإرسال حتى لا تجلب مزامنة متزامنة هذه الصفوف وهي ما زالت معلقة
+        unit.hold(worksheet.title, cache.lock)
+        unit.add(
+            [worksheet.append_cells_request(rows)], appended,
+            direct=lambda: _sheets_call(worksheet.append_rows, rows)
+        )
+
+async def _buffer_rows(rows: List[list], unverified: bool = False) -> None:
+    """
+    حفظ صفوف في مخزن الكتابة المؤجلة وإظهارها في مرايا أقسامها فوراً
+    
+    Args:
+        rows: الصفوف بالشكل [التاريخ، المنتج، السعر، الملاحظات، المعرف، المحادثة]
+        unverified: ربما وصلت الصفوف إلى الورقة في محاولة فاشلة، فيُتحقق منها قبل إرسالها
+    """
+    groups = _group_by_partition(rows)
+    for key, group in groups.items():
+        _mirror(key).add_pending(group)
+    try:
+        await append_buffer.append(rows, unverified)
+    except Exception:
+        for key, group in groups.items():
+            _mirror(key).discard_pending(group)
+        raise
+
+async def _write_rows(rows: List[list]) -> None:
+    """
+    حفظ صفوف جديدة عبر مخزن الكتابة أو إرسالها مباشرة
+    
+    إذا تعذر الإرسال المباشر (انقطاع أو قاطع مفتوح) تُحفظ الصفوف في سجل مخزن الكتابة
+    وتُرسل تلقائياً عند عودة الخدمة، بدلاً من حفظها في مخزن محلي منفصل.
+    
+    Args:
+        rows: الصفوف بالشكل [التاريخ، المنتج، السعر، الملاحظات، المعرف، المحادثة]
+    """
+    unverified = False
+    if not WRITE_BUFFER_ENABLED:
+        try:
+            await _flush_pending_rows(rows)
+            return
+        except (SheetsError, CircuitOpenError, APIError, OSError) as e:
+            logger.warning(f"تعذر الإرسال إلى Google Sheets، سيتم حفظ {len(rows)} صف وإرساله لاحقاً: {str(e)}")
+            # قاطع الدائرة يمنع الطلب قبل إرساله؛ غير ذلك ربما وصلت الصفوف وضاع الرد
+            unverified = not isinstance(e, CircuitOpenError)
+    
+    # حفظ الصفوف في السجل المحلي؛ سترسل مع غيرها في طلب واحد
+    await _buffer_rows(rows, unverified)
+
+async def _commit_rows(rows: List[list], uncertain: bool = False) -> None:
+    """
+    حفظ صفوف جديدة في محرك التخزين الحالي وتسجيلها في المجاميع
+    
+    Args:
+        rows: الصفوف بالشكل [التاريخ، المنتج، السعر، الملاحظات، المعرف، المحادثة]
+        uncertain: فشلت محاولة سابقة لكتابة الصفوف نفسها؛ تُستبعد الصفوف التي وصلت إلى الورقة
+    """
+    backend = get_backend()
+    pending = rows
+    if uncertain and backend is sheets_backend:
+        pending = await _drop_written_rows(rows)
+    if pending:
+        await backend.add_many(pending)
+    # المجاميع تتخطى المعرفات المسجلة من قبل
+    aggregate_store.add_rows(rows)
+
+def _remember_appended(rows: List[list]) -> None:
+    """تسجيل معرفات صفوف وصلت إلى الورقة (لتخطيها إذا أُعيد إرسال الدفعة نفسها)"""
+    for row in rows:
+        if len(row) > ID_INDEX and row[ID_INDEX]:
+            _appended_ids[row[ID_INDEX]] = None
+    while len(_appended_ids) > APPENDED_IDS_LIMIT:
+        _appended_ids.popitem(last=False)
+
+async def _check_headers(keys: List[str]) -> None:
+    """
+    التحقق من رؤوس أوراق الأشهر الموجودة قبل أول كتابة فيها، بطلب قراءة واحد لجميعها
+    
+    الأوراق التي رؤوسها كاملة تُعلّم كمفحوصة؛ الناقصة تُكمل رؤوسها عند فتحها للكتابة في
+    get_partition_worksheet. ورقة واحدة تُفحص هناك مباشرة دون طلب إضافي.
+    
+    Args:
+        keys: مفاتيح الأقسام التي ستُكتب فيها صفوف
+    """
+    targets = [
+        (key, _partition_worksheets[key]) for key in keys
+        if key in _partition_worksheets and key not in _headers_checked
+    ]
+    if len(targets) < 2:
+        return
+    
+    results = await _batch_read([(worksheet, f"A1:{CHAT_COLUMN}1") for _, worksheet in targets])
+    for (key, _), result in zip(targets, results):
+        # الصف يُعاد بدون الخانات الفارغة في نهايته، فامتلاء العمود الأخير يعني اكتمال الرؤوس
+        if result.rows and result.rows[0][-1]:
+            _headers_checked.add(key)
+
+async def _flush_pending_rows(rows: List[list]) -> None:
+    """
+    إرسال الصفوف المؤجلة إلى Google Sheets
+    
+    إضافات جميع أوراق الأشهر (مع رؤوس الأوراق الناقصة) تُرسل في طلب batchUpdate واحد يُنفذ
+    كاملاً أو لا يُنفذ؛ الصفوف التي وصلت في إرسال سابق للدفعة نفسها تُتخطى حتى لا تتكرر.
+    
+    Args:
+        rows: الصفوف بالشكل [التاريخ، المنتج، السعر، الملاحظات، المعرف، المحادثة]
+    """
+    await get_worksheet()
+    if DEMO_MODE:
+        # الصفوف كُتبت في الطابور أثناء الاتصال بـ Google Sheets (أو في تشغيل سابق)؛ تبقى فيه
+        # حتى تتوفر الاعتمادات بدلاً من تحويلها إلى المحرك المحلي فلا تصل إلى الورقة أبداً
+        raise SheetsError("الوضع التجريبي: تبقى الصفوف المؤجلة في السجل حتى يتوفر الاتصال بـ Google Sheets")
+    
+    groups = _group_by_partition(rows)
+    await _check_headers(list(groups))
+    async with _unit_of_work(join=False):
+        for key, group in groups.items():
+            group = [row for row in group if not (len(row) > ID_INDEX and row[ID_INDEX] in _appended_ids)]
+            if not group:
+                continue
+            worksheet = await get_partition_worksheet(key, True)
+            await _append_rows_to_sheet(worksheet, key, group)
+
+async def _drop_written_rows(rows: List[list]) -> List[list]:
+    """
+    استبعاد صفوف وصلت إلى الورقة من قبل
+    
+    إذا توقف البوت بعد إرسال دفعة وقبل تسجيل تأكيدها تُحمّل صفوفها من سجل الكتابة مرة أخرى
+    عند التشغيل التالي، وإذا فشلت كتابة بمفتاح تكرار ربما وصلت صفوفها قبل الخطأ. نقرأ عمود
+    المعرف في أوراق جميع الأقسام بطلب واحد ونتخطى الصفوف الموجودة فيه.
+    
+    Args:
+        rows: الصفوف بالشكل [التاريخ، المنتج، السعر، الملاحظات، المعرف، المحادثة]
+    
+    Returns:
+        List[list]: الصفوف التي لم تصل بعد بنفس ترتيبها
+    """
+    await get_worksheet()
+    if DEMO_MODE:
+        return rows
+    
+    targets = []
+    for key, group in _group_by_partition(rows).items():
+        worksheet = await get_partition_worksheet(key) or await _find_unconfirmed_partition(key)
+        if worksheet is not None:
+            targets.append((key, worksheet, group))
+    
+    # عمود المعرف لجميع الأوراق في طلب قراءة واحد
+    columns = await _batch_read([
+        (worksheet, f"{ID_COLUMN}{FIRST_DATA_ROW}:{ID_COLUMN}") for _, worksheet, _ in targets
+    ])
+    written: Set[str] = set()
+    for (key, _, group), column in zip(targets, columns):
+        present = {cell for cell, in column.rows if cell}
+        found = [row for row in group if len(row) > ID_INDEX and row[ID_INDEX] in present]
+        if found:
+            # الصفوف موجودة في الورقة؛ تظهر في المرآة مع المزامنة التالية بدلاً من المعلقة
+            cache = _mirror(key)
+            cache.discard_pending(found)
+            cache.expire()
+            _remember_appended(found)
+            written.update(row[ID_INDEX] for row in found)
+    
+    if written:
+        logger.info(f"تخطي {len(written)} صف وصل إلى Google Sheets من قبل")
+    return [row for row in rows if not (len(row) > ID_INDEX and row[ID_INDEX] in written)]
+
+async def _ensure_row_caches(keys: List[str]) -> bool:
+    """
+    مزامنة مرايا الأقسام التي حان وقت مزامنتها، في طلب قراءة واحد لجميع أوراقها
+    
+    إذا تعذرت المزامنة وكانت المرايا محملة من قبل، نكمل بآخر نسخة معروفة من الأوراق.
+    
+    Args:
+        keys: مفاتيح الأقسام
+    
+    Returns:
+        bool: False إذا تحول البوت إلى الوضع التجريبي
+    """
+    due = []
+    for key in dict.fromkeys(keys):
+        cache = _mirror(key)
+        if not cache.needs_sync():
+            continue
+        if cache.last_sync is not None and change_probe.active:
+            # التعديلات من خارج البوت يكتشفها فحص الإصدار، فلا حاجة للمزامنة الدورية
+            continue
+        due.append((key, cache))
+    if not due:
+        return True
+    
+    try:
+        targets = []
+        for key, cache in due:
+            worksheet = await get_partition_worksheet(key)
+            
+            # إذا تم تحويل الوضع إلى تجريبي في get_worksheet
+            if DEMO_MODE:
+                return False
+            
+            # لم تُنشأ ورقة الشهر بعد؛ المرآة تحمل صفوفه المعلقة فقط
+            if worksheet is not None:
+                targets.append((worksheet, cache))
+        
+        await _sync_row_caches(targets)
+    except (SheetsError, CircuitOpenError, APIError, OSError) as e:
+        if not all(cache.loaded for _, cache in due):
+            raise
+        # الخدمة غير متاحة: نعرض آخر نسخة معروفة من الأوراق
+        logger.warning(f"تعذرت المزامنة مع Google Sheets، عرض آخر نسخة محفوظة: {str(e)}")
+    return True
+
+async def _ensure_row_cache(key: str = LEGACY_PARTITION) -> bool:
+    """مزامنة مرآة قسم واحد إذا حان وقت المزامنة (انظر _ensure_row_caches)"""
+    return await _ensure_row_caches([key])
+
+def _mirror_loaded(key: str) -> bool:
+    """هل مرآة القسم محملة؟ (دون إنشاء مرآة فارغة له)"""
+    cache = row_caches.get(key)
+    return cache is not None and cache.loaded
+
+def _find_in_mirrors(product_id: str, keys: List[str]) -> Optional[Tuple[str, int]]:
+    """موقع المنتج (القسم، رقم الصف) في مرايا الأقسام المحددة حسب آخر نسخة معروفة"""
+    for key in keys:
+        row_number = row_caches[key].find(product_id)
+        if row_number is not None:
+            return key, row_number
+    return None
+
+def _chat_filter(chat_id: ChatId) -> Optional[str]:
+    """معرف المحادثة كما يستخدمه فهرس الأقسام (None = جميع المحادثات)"""
+    return None if chat_id is None else chat_key(chat_id)
+
+async def _fetch_revision() -> Dict[str, Any]:
+    """إصدار جدول البيانات في Google Drive (قاموس فارغ في الوضع التجريبي)"""
+    if await get_worksheet() is None:
+        return {}
+    return await _sheets_call(_spreadsheet.fetch_revision)
+
+async def _resync_changed_sheets() -> None:
+    """
+    مزامنة موجهة بعد تعديل جدول البيانات من خارج البوت
+    
+    تُقرأ قائمة الأوراق (بدون خلايا) لتحديث فهرس الأقسام إذا أضيفت أوراق أو حُذفت أو أعيدت
+    تسميتها، ثم تُقرأ الصفوف المعروفة لكل مرآة محملة في طلب batch_get واحد لجميع الأوراق
+    وتُحدّث الصفوف المختلفة فقط. الأقسام غير المحملة لا تُقرأ، والصفوف المضافة بعد آخر صف
+    معروف تُجلب عند القراءة التالية. معلومات نهايات الأوراق تُنسى لأنها ربما تغيرت. المجاميع تُعدّل
+    بالصفوف المختلفة فقط، ولا يُعاد حساب إلا الأوراق الجديدة أو التي تغيرت هويتها.
+    """
+    global _worksheet, _partition_worksheets
+    
+    if _spreadsheet is None:
+        return
+    
+    # الأقسام التي تغيرت أوراقها ولا تُعرف صفوفها، تُعاد قراءتها للمجاميع
+    refresh: Set[str] = set()
+    async with _get_worksheet_lock():
+        worksheets = await _sheets_call(_spreadsheet.worksheets)
+        if _worksheet is not None and worksheets[0].id != _worksheet.id:
+            # تغيرت الورقة الأولى (إعادة ترتيب الأوراق)، فمرآتها لم تعد صالحة
+            if LEGACY_PARTITION in row_caches:
+                row_caches[LEGACY_PARTITION].invalidate()
+            refresh.add(LEGACY_PARTITION)
+        _worksheet = worksheets[0]
+        titles = {ws.title: ws for ws in worksheets[1:]}
+        refresh.update(set(titles) - set(_partition_worksheets))
+        for key in set(_partition_worksheets) - set(titles):
+            cache = row_caches.get(key)
+            if cache is not None:
+                # الصفوف المعلقة تُرسل إلى ورقة جديدة بالاسم نفسه
+                cache.invalidate()
+            aggregate_store.replace_partition(key, [(None, row) for row in cache.pending] if cache is not None else [])
+            _headers_checked.discard(key)
+            logger.info(f"حُذفت ورقة الشهر {key} من خارج البوت")
+        _partition_worksheets = titles
+        partition_catalog.load(titles)
+        # صفوفها المعلقة تُرسل إلى ورقة جديدة بالاسم نفسه ولو بلغ عدد أوراق المحادثات الحد
+        partition_catalog.reserve(_pending_partitions())
+    
+    _known_used_rows.clear()
+    
+    # المرايا المحملة وأوراقها، مع نسخة من صفوفها قبل القراءة
+    targets = []
+    for key, cache in row_caches.items():
+        worksheet = _worksheet if key == LEGACY_PARTITION else _partition_worksheets.get(key)
+        if worksheet is not None and cache.loaded and cache.last_row >= FIRST_DATA_ROW:
+            targets.append((key, cache, worksheet, list(cache.rows)))
+    
+    changed_legacy = LEGACY_PARTITION not in row_caches or not row_caches[LEGACY_PARTITION].loaded
+    if targets:
+        results = await _sheets_call(_spreadsheet.values_batch_get, [
+            f"{quote_title(worksheet.title)}!A{FIRST_DATA_ROW}:{CHAT_COLUMN}{FIRST_DATA_ROW + len(snapshot) - 1}"
+            for _, _, worksheet, snapshot in targets
+        ])
+        for (key, cache, worksheet, snapshot), result in zip(targets, results):
+            changed = cache.reconcile(result.get('values', []), snapshot)
+            # الصفوف المضافة يدوياً بعد آخر صف معروف (وإعطاء معرفات للصفوف الجديدة)
+            cache.expire()
+            if changed:
+                logger.info(f"تم تحديث {len(changed)} صف عُدّل يدوياً في {worksheet.title}")
+                changed_legacy = changed_legacy or key == LEGACY_PARTITION
+                # التعديل اليدوي لا يمر بطبقة التخزين، فتُطبق الصفوف المختلفة على المجاميع
+                aggregate_store.apply_rows(key, [
+                    (row_number, old, _counted_row(cache, row_number)) for row_number, old, _ in changed
+                ])
+    
+    if changed_legacy:
+        # ربما تغير آخر تاريخ في الورقة القديمة
+        partition_catalog.legacy_last_key = None
+    
+    if ROW_CACHE_ENABLED:
+        aggregate_store.schedule_refresh(refresh)
+    elif aggregate_store.ready:
+        # بدون المرايا لا تُعرف الصفوف التي تغيرت؛ تُستخدم المجاميع الحالية حتى يكتمل البناء
+        aggregate_store.schedule_rebuild()
+
+class SheetsBackend(StorageBackend):
+    """
+    محرك التخزين Google Sheets
+    
+    معرف كل منتج (id) محفوظ في العمود E والمحادثة المالكة في العمود F، وموقعه (sheet_row) هو
+    رقم صفه الفعلي في ورقة قسمه. المشتريات موزعة على أوراق شهرية لكل محادثة
+    (database/partitions.py) والورقة الأولى هي أقدم قسم، فلا تمر عمليات محادثة إلا على أوراقها
+    والأوراق المشتركة.
+    إذا تحول البوت إلى الوضع التجريبي أثناء العملية تُكمل العملية على المحرك المحلي.
+    """
+    
+    name = "sheets"
+    
+    async def start(self) -> None:
+        # فتح ورقة العمل مرة واحدة والتحقق من رؤوس الأعمدة قبل استقبال الرسائل
+        try:
+            await get_worksheet()
+        except Exception as e:
+            logger.warning(f"تعذر فتح ورقة العمل عند بدء التشغيل: {str(e)}")
+        
+        if WRITE_BUFFER_ENABLED:
+            # إرسال أي صفوف بقيت في السجل من التشغيل السابق
+            append_buffer.start()
+        
+        if SHEETS_CHANGE_PROBE_ENABLED and not DEMO_MODE:
+            # كشف التعديلات اليدوية على الجدول بدلاً من المزامنة الدورية للمرايا
+            change_probe.start()
+    
+    async def close(self) -> None:
+        await change_probe.stop()
+        if WRITE_BUFFER_ENABLED:
+            await append_buffer.drain()
+    
+    async def add_many(self, rows: List[list]) -> None:
+        await _write_rows(ensure_row_ids(rows))
+    
+    async def _open(self) -> bool:
+        """
+        فتح جدول البيانات (وبناء فهرس الأقسام) قبل القراءة من المرايا
+        
+        إذا تعذر الفتح نكمل، فالمرايا المحملة تُعرض كما هي والمرايا غير المحملة ترفع الخطأ.
+        
+        Returns:
+            bool: False إذا تحول البوت إلى الوضع التجريبي
+        """
+        try:
+            await get_worksheet()
+        except (SheetsError, CircuitOpenError, APIError, OSError) as e:
+            logger.warning(f"تعذر فتح جدول البيانات: {str(e)}")
+        return not DEMO_MODE
+    
+    async def list_recent(self, limit: int, chat_id: ChatId = None) -> List[Dict]:
+        chat = _chat_filter(chat_id)
+        if ROW_CACHE_ENABLED:
+            if not await self._open():
+                return await memory_backend.list_recent(limit, chat_id)
+            
+            keys = partition_catalog.newest_first(chat, _pending_partitions())
+            
+            def reads_tail(key: str) -> bool:
+                # لا ننزل الورقة القديمة كاملة من أجل بضعة منتجات؛ نقرأ نهايتها فقط
+                cache = row_caches.get(key)
+                return (key == LEGACY_PARTITION and SHEETS_PARTITION_BY_MONTH
+                        and not _mirror_loaded(key) and not (cache is not None and cache.pending))
+            
+            # المزامنة تجلب فقط الصفوف الجديدة: المرايا المحملة وأحدث مرآة غير محملة معاً في
+            # طلب قراءة واحد، والمرايا الأقدم غير المحملة لا تُقرأ إلا إذا لم يكفِ ما قبلها
+            first_unloaded = next((key for key in keys if not _mirror_loaded(key)), None)
+            due = [key for key in keys if _mirror_loaded(key) or (key == first_unloaded and not reads_tail(key))]
+            if not await _ensure_row_caches(due):
+                return await memory_backend.list_recent(limit, chat_id)
+            
+            # نبدأ بأحدث شهر ولا ننتقل إلى الأقدم إلا إذا لم يكفِ
+            products = []
+            for key in keys:
+                if reads_tail(key):
+                    worksheet = await get_worksheet()
+                    if DEMO_MODE:
+                        return await memory_backend.list_recent(limit, chat_id)
+                    products.extend(await _read_tail_products(worksheet, key, limit - len(products), chat_id))
+                    return products
+                
+                if not await _ensure_row_cache(key):
+                    return await memory_backend.list_recent(limit, chat_id)
+                for row, sheet_row in _mirror(key).iter_latest():
+                    product = _row_to_product(row, sheet_row)
+                    if product is not None and is_visible(product['chat_id'], chat_id):
+                        products.append(product)
+                        if len(products) >= limit:
+                            return products
+            return products
+        
+        worksheet = await get_worksheet()
+        
+        # إذا تم تحويل الوضع إلى تجريبي في get_worksheet
+        if DEMO_MODE:
+            return await memory_backend.list_recent(limit, chat_id)
+        
+        # إرسال الصفوف المؤجلة أولاً حتى يرى المستخدم ما أضافه للتو
+        await self._flush_before_read()
+        
+        # قراءة نافذة صغيرة من نهاية كل ورقة فقط بدلاً من تنزيلها كاملة
+        products = []
+        for key in partition_catalog.newest_first(chat):
+            worksheet = await get_partition_worksheet(key)
+            if worksheet is None:
+                continue
+            products.extend(await _read_tail_products(worksheet, key, limit - len(products), chat_id))
+            if len(products) >= limit:
+                break
+        return products
+    
+    async def _partitions_for_range(self, start: date, end: date, chat_id: ChatId = None) -> List[str]:
+        """الأقسام التي يحتاجها استعلام بين تاريخين لمحادثة معينة، من الأحدث إلى الأقدم"""
+        try:
+            await _load_legacy_last_date()
+        except (SheetsError, CircuitOpenError, APIError, OSError) as e:
+            # نقرأ الورقة القديمة احتياطاً
+            logger.warning(f"تعذر تحديد آخر تاريخ في الورقة القديمة: {str(e)}")
+        return partition_catalog.for_range(start, end, _chat_filter(chat_id), _pending_partitions())
+    
+    async def query_by_date_range(self, start: date, end: date, chat_id: ChatId = None) -> List[Dict]:
+        start_key, end_key = date_key(start), date_key(end)
+        
+        if ROW_CACHE_ENABLED:
+            if not await self._open():
+                return await memory_backend.query_by_date_range(start, end, chat_id)
+            
+            # مزامنة مرايا جميع الأقسام المطلوبة في طلب قراءة واحد
+            keys = await self._partitions_for_range(start, end, chat_id)
+            if not await _ensure_row_caches(keys):
+                return await memory_backend.query_by_date_range(start, end, chat_id)
+            
+            products = []
+            for key in keys:
+                for row, sheet_row in _mirror(key).iter_latest():
+                    product = _row_to_product(row, sheet_row)
+                    if (product is not None and in_date_range(product, start_key, end_key)
+                            and is_visible(product['chat_id'], chat_id)):
+                        products.append(product)
+            return products
+        
+        worksheet = await get_worksheet()
+        
+        # إذا تم تحويل الوضع إلى تجريبي في get_worksheet
+        if DEMO_MODE:
+            return await memory_backend.query_by_date_range(start, end, chat_id)
+        
+        await self._flush_before_read()
+        
+        worksheets = []
+        for key in await self._partitions_for_range(start, end, chat_id):
+            worksheet = await get_partition_worksheet(key)
+            if worksheet is not None:
+                worksheets.append(worksheet)
+        return await _read_date_ranges(worksheets, start_key, end_key, chat_id)
+    
+    async def iter_pages(
+        self, start: Optional[date] = None, end: Optional[date] = None, chat_id: ChatId = None,
+        page_size: int = PAGE_ROWS
+    ) -> AsyncIterator[List[Dict]]:
+        # الأقسام من الأقدم إلى الأحدث؛ المرايا المحملة تُقرأ من الذاكرة وبقية الأوراق على نطاقات
+        page_size = max(1, page_size)
+        await get_worksheet()
+        if DEMO_MODE:
+            async for page in memory_backend.iter_pages(start, end, chat_id, page_size):
+                yield page
+            return
+        
+        await self._flush_before_read()
+        bounded = start is not None or end is not None
+        start_key, end_key = date_key(start or FIRST_DAY), date_key(end or LAST_DAY)
+        
+        def select(values: List[list], first_row: Optional[int]) -> List[Dict]:
+            products = []
+            for offset, row in enumerate(values):
+                product = _row_to_product(row, first_row + offset if first_row is not None else None)
+                if (product is not None and is_visible(product['chat_id'], chat_id)
+                        and (not bounded or in_date_range(product, start_key, end_key))):
+                    products.append(product)
+            return products
+        
+        keys = await self._partitions_for_range(start or FIRST_DAY, end or LAST_DAY, chat_id)
+        async for _, page in self._iter_partitions(reversed(keys), select, page_size):
+            yield page
+    
+    async def iter_partition_pages(
+        self, keys: Optional[Iterable[str]] = None, page_size: int = PAGE_ROWS
+    ) -> AsyncIterator[Tuple[str, List[Dict]]]:
+        """
+        المرور على منتجات أقسام معينة صفحة بعد صفحة مع مفتاح قسم كل صفحة
+        
+        تستخدمه المجاميع لإعادة حساب الأقسام التي تغيرت فقط.
+        
+        Args:
+            keys: مفاتيح الأقسام (None = جميع الأقسام من الأقدم إلى الأحدث)
+            page_size: أقصى عدد من المنتجات في كل صفحة
+        
+        Yields:
+            Tuple[str, List[Dict]]: (مفتاح القسم، صفحة من منتجاته)
+        """
+        await get_worksheet()
+        if DEMO_MODE:
+            raise SheetsError("تعذرت القراءة: البوت في الوضع التجريبي")
+        
+        await self._flush_before_read()
+        if keys is None:
+            keys = reversed(await self._partitions_for_range(FIRST_DAY, LAST_DAY))
+        
+        def select(values: List[list], first_row: Optional[int]) -> List[Dict]:
+            products = []
+            for offset, row in enumerate(values):
+                product = _row_to_product(row, first_row + offset if first_row is not None else None)
+                if product is not None:
+                    products.append(product)
+            return products
+        
+        async for key, page in self._iter_partitions(keys, select, max(1, page_size)):
+            yield key, page
+    
+    async def _iter_partitions(
+        self, keys: Iterable[str], select: Callable[[List[list], Optional[int]], List[Dict]], page_size: int
+    ) -> AsyncIterator[Tuple[str, List[Dict]]]:
+        """صفحات الأقسام بالترتيب المعطى؛ المرايا المحملة تُقرأ من الذاكرة وبقية الأوراق على نطاقات"""
+        for key in keys:
+            cache = row_caches.get(key)
+            if ROW_CACHE_ENABLED and cache is not None and cache.loaded:
+                if not await _ensure_row_cache(key):
+                    # الصفحات السابقة قُرئت من Google Sheets؛ لا نكمل من المحرك المحلي
+                    raise SheetsError("تعذر إكمال القراءة: تحول البوت إلى الوضع التجريبي")
+                for offset in range(0, len(cache.rows), page_size):
+                    page = select(cache.rows[offset:offset + page_size], FIRST_DATA_ROW + offset)
+                    if page:
+                        yield key, page
+                page = select(list(cache.pending), None)
+                if page:
+                    yield key, page
+                continue
+            
+            worksheet = await get_partition_worksheet(key)
+            if worksheet is None:
+                continue
+            async for first_row, values in _iter_sheet_pages(worksheet, key, page_size):
+                page = select(values, first_row)
+                if page:
+                    yield key, page
+    
+    async def read_ranges(self, ranges: List[Tuple[str, str]]) -> List[RangeRows]:
+        """
+        قراءة عدة نطاقات من أوراق الأقسام في طلب values_batch_get واحد
         
-    Returns:
-        نتيجة تنفيذ الدالة في حال النجاح
+        مثال: رؤوس الورقة القديمة مع صفين محددين من ورقة شهر:
+            [(LEGACY_PARTITION, "A1:F1"), ("2026-10", "A5:F5"), ("2026-10", "E9:F9")]
         
-    Raises:
-        SheetsError: في حال فشل جميع المحاولات
-    """
-    async def wrapper(*args, **kwargs):
-        last_error = None
-        for attempt in range(MAX_RETRIES):
+        Args:
+            ranges: (مفتاح القسم، نطاق A1 بدون اسم الورقة) لكل نطاق
+        
+        Returns:
+            List[RangeRows]: نتيجة كل نطاق بنفس الترتيب؛ نطاقات الأقسام التي لم تُنشأ أوراقها
+            بعد تعود بدون صفوف
+        
+        Raises:
+            SheetsError: في الوضع التجريبي (لا توجد أوراق)
+        """
+        if not await self._open():
+            raise SheetsError("الوضع التجريبي: لا توجد أوراق للقراءة منها")
+        
+        worksheets = [await get_partition_worksheet(key) for key, _ in ranges]
+        results = iter(await _batch_read([
+            (worksheet, a1_range) for worksheet, (_, a1_range) in zip(worksheets, ranges) if worksheet is not None
+        ]))
+        return [
+            next(results) if worksheet is not None else RangeRows(key, _range_shape(a1_range)[0], [])
+            for worksheet, (key, a1_range) in zip(worksheets, ranges)
+        ]
+    
+    async def _flush_before_read(self) -> None:
+        """إرسال الصفوف المؤجلة قبل القراءة المباشرة من الورقة"""
+        if WRITE_BUFFER_ENABLED and append_buffer.pending_count:
             try:
-                return await func(*args, **kwargs)
-            except (APIError, ConnectionError, TimeoutError) as e:
-                logger.warning(f"فشل الاتصال (محاولة {attempt+1}/{MAX_RETRIES}): {str(e)}")
-                last_error = e
-                # انتظار قبل إعادة المحاولة
-                time.sleep(RETRY_DELAY)
-                # إعادة تحميل العميل
-                get_google_sheets_client.cache_clear()
+                await append_buffer.flush()
             except Exception as e:
-                # الأخطاء الأخرى تُرفع مباشرة
-                logger.error(f"خطأ غير متوقع: {str(e)}")
-                raise
+                logger.warning(f"تعذر إرسال الصفوف المؤجلة قبل القراءة: {str(e)}")
+    
+    async def _locate_in_mirrors(self, ids: List[str], chat_id: ChatId = None) -> Dict[str, Tuple[str, int]]:
+        """
+        مواقع المنتجات حسب فهارس المرايا المحملة لأقسام المحادثة
         
-        # بعد فشل جميع المحاولات
-        error_msg = f"فشلت جميع محاولات الاتصال بـ Google Sheets ({MAX_RETRIES} محاولات)"
-        if last_error:
-            error_msg += f": {str(last_error)}"
-        logger.error(error_msg)
-        raise SheetsError(error_msg)
+        تُقرأ خانتا المعرف والمحادثة للصفوف المستهدفة فقط للتأكد من أن الصفوف لم تتحرك (حذف أو
+        ترتيب يدوي) وأنها تظهر لهذه المحادثة. إذا تحركت يُعاد تحميل مرايا الأوراق المتغيرة
+        ويُعاد البحث مرة واحدة.
         
-    return wrapper
-
-def get_worksheet() -> Optional[gspread.Worksheet]:
-    """
-    الحصول على ورقة العمل مع التعامل مع الأخطاء
+        Args:
+            ids: معرفات المنتجات
+            chat_id: المحادثة المالكة (None = الجميع)
+        
+        Returns:
+            Dict[str, Tuple[str, int]]: المعرف -> (القسم، رقم الصف)، للمنتجات الموجودة فقط
+        """
+        visible = set(partition_catalog.newest_first(_chat_filter(chat_id), _pending_partitions()))
+        keys = [key for key, cache in row_caches.items() if cache.loaded and key in visible]
+        located: Dict[str, Tuple[str, int]] = {}
+        stale: List[str] = []
+        for attempt in range(2):
+            if attempt:
+                # الصفوف تحركت منذ آخر مزامنة؛ نعيد تحميل مرايا هذه الأوراق بالكامل
+                for key in stale:
+                    row_caches[key].invalidate()
+            elif any(_find_in_mirrors(product_id, keys) is None for product_id in ids):
+                # ربما أضيف المنتج بعد آخر مزامنة
+                for key in keys:
+                    row_caches[key].expire()
+            if not await _ensure_row_caches(keys):
+                return {}
+            
+            located = {}
+            for product_id in ids:
+                found = _find_in_mirrors(product_id, keys)
+                if found is not None:
+                    located[product_id] = found
+            
+            # التحقق من خانات المعرف والمحادثة لجميع الأوراق في طلب values_batch_get واحد
+            checks = []
+            for key, items in self._group_located(located).items():
+                worksheet = await get_partition_worksheet(key)
+                checks.extend((key, worksheet, product_id, row_number) for product_id, row_number in items)
+            results = await _batch_read([
+                (worksheet, f"{ID_COLUMN}{row_number}:{CHAT_COLUMN}{row_number}")
+                for _, worksheet, _, row_number in checks
+            ])
+            moved: Dict[str, List[str]] = {}
+            for (key, _, product_id, _), result in zip(checks, results):
+                cell_id, owner = result.rows[0] if result.rows else ('', '')
+                if cell_id != product_id:
+                    moved.setdefault(key, []).append(product_id)
+                elif not is_visible(owner, chat_id):
+                    # المنتج موجود لكنه ملك محادثة أخرى
+                    del located[product_id]
+            titles = {key: worksheet.title for key, worksheet, _, _ in checks}
+            for key, moved_ids in moved.items():
+                logger.warning(f"تغير موقع {len(moved_ids)} منتج في {titles[key]} منذ آخر مزامنة")
+                for product_id in moved_ids:
+                    del located[product_id]
+            stale = list(moved)
+            if not stale:
+                return located
+        return located
     
-    Returns:
-        Optional[gspread.Worksheet]: ورقة العمل أو None في حالة الوضع التجريبي
-    """
-    global DEMO_MODE
+    @staticmethod
+    def _group_located(located: Dict[str, Tuple[str, int]]) -> Dict[str, List[Tuple[str, int]]]:
+        """توزيع المواقع على أقسامها: القسم -> [(المعرف، رقم الصف)]"""
+        groups: Dict[str, List[Tuple[str, int]]] = {}
+        for product_id, (key, row_number) in located.items():
+            groups.setdefault(key, []).append((product_id, row_number))
+        return groups
     
-    if DEMO_MODE:
-        logger.info("تشغيل في الوضع التجريبي - لن يتم الاتصال بـ Google Sheets")
-        return None
+    async def _locate_rows(self, ids: List[str], chat_id: ChatId = None) -> Dict[str, Tuple[str, int]]:
+        """
+        مواقع منتجات المحادثة في الأوراق حسب معرفاتها
         
-    try:
-        client, created_time = get_google_sheets_client()
+        مع المرآة يُستخدم فهرس المعرفات للأقسام المحملة. المنتجات التي لم توجد فيها (أو بدون
+        المرآة) يُبحث عنها بقراءة عمودي المعرف والمحادثة وحدهما في بقية أوراق المحادثة، جميعها
+        في طلب values_batch_get واحد؛ إذا تكرر المعرف يُعتمد الأحدث.
+        
+        Args:
+            ids: معرفات المنتجات
+            chat_id: المحادثة المالكة؛ منتجات المحادثات الأخرى تُعامل كغير موجودة (None = الجميع)
         
-        # إعادة إنشاء العميل إذا مر أكثر من 30 دقيقة
-        if datetime.now() - created_time > timedelta(minutes=30):
-            get_google_sheets_client.cache_clear()
-            client, _ = get_google_sheets_client()
+        Returns:
+            Dict[str, Tuple[str, int]]: المعرف -> (القسم، رقم الصف)، للمنتجات الموجودة فقط
+        """
+        located: Dict[str, Tuple[str, int]] = {}
+        if ROW_CACHE_ENABLED:
+            located = await self._locate_in_mirrors(ids, chat_id)
+        
+        missing = {product_id for product_id in ids if product_id not in located}
+        if not missing:
+            return located
+        
+        targets = []
+        for key in partition_catalog.newest_first(_chat_filter(chat_id)):
+            if ROW_CACHE_ENABLED and _mirror_loaded(key):
+                continue
+            worksheet = await get_partition_worksheet(key)
+            if worksheet is not None:
+                targets.append((key, worksheet))
+        results = await _batch_read([
+            (worksheet, f"{ID_COLUMN}{FIRST_DATA_ROW}:{CHAT_COLUMN}") for _, worksheet in targets
+        ])
+        for (key, _), result in zip(targets, results):
+            for offset, (product_id, owner) in enumerate(result.rows):
+                if product_id in missing and is_visible(owner, chat_id):
+                    located[product_id] = (key, result.first_row + offset)
+                    missing.discard(product_id)
+        return located
+    
+    async def delete_many(self, ids: List[str], chat_id: ChatId = None) -> Tuple[int, list]:
+        ids = list(dict.fromkeys(ids))
         
         try:
-            # محاولة فتح جدول البيانات بالاسم
-            try:
-                spreadsheet = client.open(SPREADSHEET_NAME)
-            except SpreadsheetNotFound:
-                # إذا لم يتم العثور على الجدول، محاولة البحث عن أي جدول
-                all_spreadsheets = client.openall()
-                if not all_spreadsheets:
-                    raise SheetsError("لا توجد جداول بيانات متاحة")
-                spreadsheet = all_spreadsheets[0]
-                logger.info(f"استخدام جدول بديل: {spreadsheet.title}")
+            # الحصول على ورقة العمل
+            await get_worksheet()
             
-            worksheet = spreadsheet.sheet1
+            # إذا تم تحويل الوضع إلى تجريبي في get_worksheet
+            if DEMO_MODE:
+                return await memory_backend.delete_many(ids, chat_id)
             
-            # التحقق من رؤوس الأعمدة
-            headers = worksheet.row_values(1)
-            # إذا كان الصف الأول فارغًا، سنضيف العناوين
-            if not headers or len(headers) < 4:
-                worksheet.update('A1:D1', [["التاريخ", "المنتج", "السعر", "ملاحظات"]])
-                worksheet.format('A1:D1', {
-                    "backgroundColor": {"red": 0.9, "green": 0.9, "blue": 0.9},
-                    "horizontalAlignment": "CENTER",
-                    "textFormat": {"bold": True}
-                })
+            # المنتجات المعلقة تُرسل أولاً حتى يصبح لها صف في الورقة
+            if any(cache.is_pending(product_id) for cache in row_caches.values() for product_id in ids):
+                await self._flush_before_read()
             
-            return worksheet
+            located = await self._locate_rows(ids, chat_id)
+            failed_ids = [product_id for product_id in ids if product_id not in located]
+            if failed_ids:
+                logger.error(f"لم يتم العثور على المنتجات بالمعرفات: {failed_ids}")
             
-        except Exception as e:
-            logger.error(f"خطأ في فتح ورقة العمل: {str(e)}")
-            DEMO_MODE = True
-            return None
+            if not located:
+                logger.warning("لا توجد صفوف صالحة للحذف")
+                return 0, failed_ids
             
-    except Exception as e:
-        logger.error(f"خطأ في الاتصال بـ Google Sheets: {str(e)}")
-        logger.error(traceback.format_exc())
-        DEMO_MODE = True
-        return None
+            # دمج الصفوف المتتالية في نطاق واحد، ثم مسح نطاقات جميع الأوراق في طلب batchUpdate واحد
+            cleared: Dict[str, List[int]] = {}
+            try:
+                async with _unit_of_work(join=False) as unit:
+                    for key, items in self._group_located(located).items():
+                        rows_to_clear = sorted(row_number for _, row_number in items)
+                        runs = _row_runs(rows_to_clear)
+                        worksheet = await get_partition_worksheet(key)
+                        logger.info(
+                            f"مسح {len(rows_to_clear)} صف من {worksheet.title}: {[f'{first}:{last}' for first, last in runs]}"
+                        )
+                        unit.add([worksheet.clear_rows_request(first, last) for first, last in runs])
+                        cleared[key] = rows_to_clear
+            except Exception as e:
+                # الطلب الواحد يُنفذ كاملاً أو لا يُنفذ، فلم يُحذف أي صف
+                logger.error(f"فشل في مسح الصفوف: {str(e)}")
+                return 0, failed_ids + list(located)
+            
+            deleted = 0
+            for key, rows_to_clear in cleared.items():
+                if key in row_caches:
+                    for row_index in rows_to_clear:
+                        row_caches[key].clear_row(row_index)
+                deleted += len(rows_to_clear)
+            return deleted, failed_ids
+        
+        except Exception as e:
+            logger.error(f"خطأ عام في عملية الحذف: {str(e)}")
+            logger.error(traceback.format_exc())
+            return 0, ids
+    
+    def get_stats(self) -> Dict[str, Any]:
+        return {
+            'backend': self.name,
+            'demo_mode': DEMO_MODE,
+            'rate_limiter': sheets_limiter.get_stats(),
+            'circuit_breaker': sheets_breaker.get_stats(),
+            'write_buffer': append_buffer.get_stats(),
+            'partitions': partition_catalog.get_stats(),
+            'change_probe': change_probe.get_stats(),
+            'unit_of_work': unit_stats.get_stats(),
+            'client': _client.get_stats() if _client is not None else None,
+        }
 
-def validate_product_data(product: str, price: float) -> None:
+# مخزن الكتابة المؤجلة المشترك بين جميع المحادثات
+append_buffer = AppendBuffer(_flush_pending_rows, PENDING_ROWS_FILE, verify_func=_drop_written_rows)
+
+# فحص إصدار الجدول لكشف التعديلات اليدوية
+change_probe = ChangeProbe(
+    _fetch_revision, _resync_changed_sheets, lambda: _client.writes if _client is not None else 0
+)
+
+# مفاتيح الكتابات المنفذة (لتخطي الإضافة المكررة لتحديث تيليجرام نفسه)
+write_index = IdempotencyIndex()
+
+# إحصاءات دمج تعديلات كل عملية في طلب batchUpdate واحد
+unit_stats = UnitOfWorkStats()
+
+async def _aggregate_pages(partitions: Optional[Set[Optional[str]]] = None) -> AsyncIterator[Tuple[Optional[str], List[Dict]]]:
     """
-    التحقق من صحة بيانات المنتج
+    مصدر المجاميع: صفحات المنتجات مع مفتاح قسم كل صفحة
     
     Args:
-        product (str): اسم المنتج
-        price (float): سعر المنتج
-        
-    Raises:
-        ValueError: إذا كانت البيانات غير صالحة
+        partitions: الأقسام المطلوبة (None = الكل)؛ المحركات غير المقسمة تُقرأ كاملة كقسم None
     """
-    if not product or not product.strip():
-        raise ValueError("اسم المنتج لا يمكن أن يكون فارغاً")
-        
-    if not isinstance(price, (int, float)):
-        raise ValueError("السعر يجب أن يكون رقماً")
-        
-    if price < MIN_PRICE or price > MAX_PRICE:
-        raise ValueError(f"السعر يجب أن يكون بين {MIN_PRICE} و {MAX_PRICE}")
+    backend = get_backend()
+    if backend is not sheets_backend:
+        async for page in backend.iter_pages():
+            yield None, page
+        return
+    keys = None if partitions is None else [key for key in partitions if key is not None]
+    async for key, page in sheets_backend.iter_partition_pages(keys):
+        yield key, page
 
-def format_date(dt: datetime) -> str:
+def _aggregate_partition(row: list) -> Optional[str]:
+    """القسم الذي كُتب فيه صف مضاف (None إذا لم يكن المحرك الحالي Google Sheets)"""
+    if get_backend() is not sheets_backend:
+        return None
+    return partition_catalog.route(partition_of(row[0], row_chat(row)))
+
+# مجاميع المشتريات المحدثة تدريجياً، تُبنى من السجل الكامل للمحرك الحالي وتُحفظ عند الإغلاق
+aggregate_store = AggregateStore(
+    _aggregate_pages, partition_of=_aggregate_partition,
+    journal=RecordJournal(AGGREGATES_JOURNAL_FILE, AGGREGATES_SNAPSHOT_FILE)
+)
+
+# مرايا صفوف الأوراق في الذاكرة حسب مفتاح القسم؛ الصفوف التي بقيت في سجل الكتابة تظهر
+# كصفوف معلقة في أقسامها
+row_caches: Dict[str, RowCache] = {}
+for _key, _rows in _group_by_partition(append_buffer.pending_rows()).items():
+    _mirror(_key).add_pending(_rows)
+
+# محركات التخزين المتاحة
+sheets_backend = SheetsBackend()
+# المحرك المحلي (يُستخدم أيضاً في الوضع التجريبي)
+memory_backend = MemoryBackend(RecordJournal(DEMO_JOURNAL_FILE, DEMO_SNAPSHOT_FILE), legacy_file=DEMO_DATA_FILE)
+sqlite_backend = SQLiteBackend()
+
+BACKENDS: Dict[str, StorageBackend] = {
+    sheets_backend.name: sheets_backend,
+    memory_backend.name: memory_backend,
+    sqlite_backend.name: sqlite_backend,
+}
+
+if STORAGE_BACKEND not in BACKENDS:
+    logger.error(f"محرك تخزين غير معروف: {STORAGE_BACKEND}، سيتم استخدام Google Sheets")
+
+def get_backend() -> StorageBackend:
     """
-    تنسيق التاريخ بالشكل المطلوب YYYY/MM/DD
-    
-    Args:
-        dt (datetime): كائن تاريخ
+    محرك التخزين الحالي حسب STORAGE_BACKEND
     
     Returns:
-        str: التاريخ بالتنسيق المطلوب
+        StorageBackend: المحرك المختار، أو المحرك المحلي إذا كان Google Sheets في الوضع التجريبي
     """
-    return dt.strftime("%Y/%m/%d")
+    backend = BACKENDS.get(STORAGE_BACKEND, sheets_backend)
+    if backend is sheets_backend and DEMO_MODE:
+        return memory_backend
+    return backend
 
 @with_retry
-async def add_to_sheets(product: str, price: float, notes: str = "") -> bool:
+async def add_to_sheets(product: str, price: float, notes: str = "", chat_id: ChatId = None,
+                        idempotency_key: Optional[str] = None) -> bool:
     """
-    إضافة منتج جديد إلى Google Sheets
+    إضافة منتج جديد إلى محرك التخزين
     
     Args:
         product (str): اسم المنتج
         price (float): سعر المنتج
         notes (str): ملاحظات إضافية (اختياري)
-        
+        chat_id: معرف المحادثة المالكة (None = بدون مالك، يظهر لجميع المحادثات)
+        idempotency_key: مفتاح الكتابة (update_write_key)؛ الإضافة بمفتاح منفذ من قبل تُتخطى
+    
     Returns:
         bool: True إذا تمت الإضافة بنجاح، False إذا فشلت
-        
+    
     Raises:
         SheetsError: في حال فشل الاتصال بعد عدة محاولات
         ValueError: في حال كانت البيانات غير صالحة
     """
-    global DEMO_MODE
-    
     try:
         # تنظيف المدخلات
         product = product.strip()
@@ -295,62 +1917,39 @@ async def add_to_sheets(product: str, price: float, notes: str = "") -> bool:
         # التحقق من صحة البيانات
         validate_product_data(product, price)
         
-        if DEMO_MODE:
-            # في وضع التجريبي، نضيف إلى القائمة المحلية
-            date = format_date(datetime.now())
-            # إضافة المنتج إلى القائمة المؤقتة
-            DEMO_PRODUCTS.append({
-                'date': date,
-                'name': product,
-                'price': price,
-                'notes': notes
-            })
-            logger.info(f"[وضع تجريبي] تمت إضافة المنتج: {product} بسعر {price} بتاريخ {date} مع ملاحظات: {notes}")
-            logger.info(f"[وضع تجريبي] عدد المنتجات في الذاكرة: {len(DEMO_PRODUCTS)}")
-            
-            # حفظ المنتجات إلى ملف
-            save_demo_products()
-            
-            return True
-        
-        # الحصول على ورقة العمل
-        worksheet = get_worksheet()
-        
-        # إذا تم تحويل الوضع إلى تجريبي في get_worksheet
-        if DEMO_MODE:
-            return await add_to_sheets(product, price, notes)
-            
-        # إضافة المنتج إلى الجدول
         date = format_date(datetime.now())
-        row = [date, product, price, notes]
-        worksheet.append_row(row)
+        
+        # إضافة المنتج إلى الجدول مع معرف ثابت (مشتق من مفتاح الكتابة إن وجد) والمحادثة المالكة
+        product_id = idempotent_product_id(idempotency_key, 0) if idempotency_key else new_product_id()
+        row = [date, product, price, notes, product_id, chat_key(chat_id)]
+        await write_index.run(idempotency_key, lambda uncertain: _commit_rows([row], uncertain))
         
         logger.info(f"تمت إضافة المنتج: {product} بسعر {price} بتاريخ {date} مع ملاحظات: {notes}")
         return True
-        
+    
     except ValueError as e:
         # أخطاء التحقق من صحة البيانات
         logger.error(f"بيانات غير صالحة: {str(e)}")
         raise
+    except BufferFullError as e:
+        logger.error(f"مخزن الكتابة ممتلئ: {str(e)}")
+        raise SheetsError(f"الخدمة مشغولة حالياً، الرجاء المحاولة بعد قليل: {str(e)}")
     except Exception as e:
         logger.error(f"خطأ في إضافة المنتج: {str(e)}")
         logger.error(traceback.format_exc())
-        if not DEMO_MODE:
-            logger.info("محاولة استخدام الوضع التجريبي...")
-            DEMO_MODE = True
-            return await add_to_sheets(product, price, notes)
-        else:
-            raise SheetsError(f"فشل في إضافة المنتج: {str(e)}")
+        raise SheetsError(f"فشل في إضافة المنتج: {str(e)}")
 
-async def add_product_to_sheet(chat_id, product: str, price, notes: str = "") -> bool:
+async def add_product_to_sheet(chat_id, product: str, price, notes: str = "",
+                               idempotency_key: Optional[str] = None) -> bool:
     """
     إضافة منتج جديد إلى Google Sheets مع دعم معرف المحادثة
     
     المعطيات:
-        chat_id: معرف المحادثة (للتسجيل)
+        chat_id: معرف المحادثة المالكة
         product (str): اسم المنتج
         price: سعر المنتج (يمكن أن يكون نص أو رقم)
         notes (str): ملاحظات إضافية (اختياري)
+        idempotency_key: مفتاح الكتابة (انظر add_to_sheets)
         
     تعيد:
         bool: True إذا تمت الإضافة بنجاح، False إذا فشلت
@@ -364,7 +1963,7 @@ async def add_product_to_sheet(chat_id, product: str, price, notes: str = "") ->
             return False
             
         # استدعاء الدالة الأساسية لإضافة المنتج
-        result = await add_to_sheets(product, price_float, notes)
+        result = await add_to_sheets(product, price_float, notes, chat_id, idempotency_key)
         
         # تسجيل معلومات إضافية
         if result:
@@ -377,188 +1976,167 @@ async def add_product_to_sheet(chat_id, product: str, price, notes: str = "") ->
         logger.error(traceback.format_exc())
         return False
 
-async def add_multiple_to_sheets(products: list) -> Tuple[int, list]:
+
+async def add_multiple_to_sheets(products: list, chat_id: ChatId = None,
+                                 idempotency_key: Optional[str] = None) -> Tuple[int, list]:
     """
     إضافة عدة منتجات دفعة واحدة
     
     المعطيات:
         products: قائمة من الأزواج (المنتج، السعر، الملاحظات)
+        chat_id: معرف المحادثة المالكة (None = بدون مالك)
+        idempotency_key: مفتاح الكتابة (update_write_key)؛ الدفعة بمفتاح منفذ من قبل لا تُضاف مرة أخرى
         
     تعيد:
         عدد المنتجات التي تمت إضافتها بنجاح وقائمة بالأخطاء
     """
-    global DEMO_MODE
-    
-    if DEMO_MODE:
-        success_count = 0
-        errors = []
-        date = format_date(datetime.now())
-        
-        for product, price, notes in products:
-            try:
-                product = product.strip()
-                notes = notes.strip() if notes else ""
-                validate_product_data(product, price)
-                # إضافة المنتج إلى القائمة المؤقتة
-                DEMO_PRODUCTS.append({
-                    'date': date,
-                    'name': product,
-                    'price': price,
-                    'notes': notes
-                })
-                logger.info(f"[وضع تجريبي] تمت إضافة المنتج: {product} بسعر {price} بتاريخ {date} مع ملاحظات: {notes}")
-                success_count += 1
-            except ValueError as e:
-                errors.append(f"خطأ في المنتج {product}: {str(e)}")
-        
-        # حفظ المنتجات إلى ملف
-        save_demo_products()
-            
-        return success_count, errors
-    
     try:
-        worksheet = get_worksheet()
-        
-        # إذا تم تحويل الوضع إلى تجريبي في get_worksheet
-        if DEMO_MODE:
-            return await add_multiple_to_sheets(products)
-        
         success_count = 0
         errors = []
         
         rows_to_add = []
         date = format_date(datetime.now())
+        chat = chat_key(chat_id)
         
-        for product, price, notes in products:
+        for index, (product, price, notes) in enumerate(products):
             try:
                 product = product.strip()
                 notes = notes.strip() if notes else ""
                 validate_product_data(product, price)
-                rows_to_add.append([date, product, price, notes])
+                product_id = idempotent_product_id(idempotency_key, index) if idempotency_key else new_product_id()
+                rows_to_add.append([date, product, price, notes, product_id, chat])
                 success_count += 1
             except ValueError as e:
                 errors.append(f"خطأ في المنتج {product}: {str(e)}")
         
         if rows_to_add:
-            worksheet.append_rows(rows_to_add)
+            await write_index.run(idempotency_key, lambda uncertain: _commit_rows(rows_to_add, uncertain))
         
         return success_count, errors
         
+    except BufferFullError as e:
+        logger.error(f"مخزن الكتابة ممتلئ: {str(e)}")
+        return 0, [f"الخدمة مشغولة حالياً، الرجاء المحاولة بعد قليل: {str(e)}"]
     except Exception as e:
-        logger.error(f"خطأ: {str(e)}")
-        DEMO_MODE = True
-        return await add_multiple_to_sheets(products)
+        logger.error(f"خطأ في إضافة المنتجات: {str(e)}")
+        logger.error(traceback.format_exc())
+        return 0, [f"فشل في إضافة المنتجات: {str(e)}"]
 
-async def get_products(limit: int = 10) -> list:
+def _demo_sample_products() -> list:
+    """منتجات تجريبية تُعرض في الوضع التجريبي إذا لم تكن هناك منتجات (غير محفوظة، لذلك بدون معرف)"""
+    return [
+        {
+            'date': format_date(datetime.now()),
+            'name': 'كولا',
+            'price': 23.0,
+            'notes': 'مثال تجريبي',
+            'sheet_row': None,
+            'id': None
+        },
+        {
+            'date': format_date(datetime.now()),
+            'name': 'شيبس',
+            'price': 15.0,
+            'notes': 'حار',
+            'sheet_row': None,
+            'id': None
+        }
+    ]
+
+async def get_products(limit: int = 10, chat_id: ChatId = None) -> list:
     """
     الحصول على آخر المنتجات المضافة
     
     المعطيات:
         limit (int): عدد المنتجات التي يجب إرجاعها (افتراضي: 10)
+        chat_id: المحادثة المالكة؛ تُعاد منتجاتها والمنتجات بدون مالك فقط (None = الجميع)
         
     تعيد:
-        قائمة بالمنتجات، كل منتج يحتوي على رقم الصف الفعلي (sheet_row)، مرتبة بحيث آخر المنتجات المضافة تكون أولاً
+        قائمة بالمنتجات، كل منتج يحتوي على معرفه (id) وموقعه (sheet_row)، مرتبة بحيث آخر المنتجات المضافة تكون أولاً
     """
-    global DEMO_MODE
+    try:
+        products = await get_backend().list_recent(limit, chat_id)
+    except Exception as e:
+        logger.error(f"خطأ في الحصول على المنتجات: {str(e)}")
+        raise SheetsError(f"فشل في الحصول على المنتجات: {str(e)}")
     
-    if DEMO_MODE:
-        # إرجاع المنتجات من القائمة المؤقتة
-        if DEMO_PRODUCTS:
-            # إرجاع آخر منتجات مضافة، بحد أقصى limit
-            # إضافة sheet_row وهمي (للوضع التجريبي)
-            demo = DEMO_PRODUCTS[-limit:]
-            for idx, p in enumerate(demo):
-                p['sheet_row'] = idx + 2  # الصفوف تبدأ من 2
-            # عكس الترتيب ليكون آخر المنتجات أولاً
-            return list(reversed(demo))
-        else:
-            # إذا لم تكن هناك منتجات، نعيد بيانات تجريبية
-            demo_products = [
-                {
-                    'date': format_date(datetime.now()),
-                    'name': 'كولا',
-                    'price': 23.0,
-                    'notes': 'مثال تجريبي',
-                    'sheet_row': 2
-                },
-                {
-                    'date': format_date(datetime.now()),
-                    'name': 'شيبس',
-                    'price': 15.0,
-                    'notes': 'حار',
-                    'sheet_row': 3
-                }
-            ]
-            return demo_products
+    if DEMO_MODE and not products:
+        products = _demo_sample_products()
+    return products
+
+async def get_products_by_date_range(start: date, end: date, chat_id: ChatId = None) -> list:
+    """
+    الحصول على جميع المنتجات المضافة بين تاريخين (شاملاً الطرفين)
     
-    try:
-        worksheet = get_worksheet()
-        
-        # إذا تم تحويل الوضع إلى تجريبي في get_worksheet
-        if DEMO_MODE:
-            return await get_products(limit)
-        
-        # الحصول على جميع القيم
-        values = worksheet.get_all_values()
-        
-        # تحويل القيم إلى قائمة من القواميس مع رقم الصف الفعلي
-        products = []
-        # تخطي الصف الأول (العناوين)
-        for idx, row in enumerate(values[1:], start=2):  # الصف 2 هو أول منتج فعلي
-            try:
-                if len(row) >= 3:
-                    products.append({
-                        'date': row[0],
-                        'name': row[1],
-                        'price': float(row[2]),
-                        'notes': row[3] if len(row) > 3 else '',
-                        'sheet_row': idx
-                    })
-            except (IndexError, ValueError) as e:
-                logger.warning(f"خطأ في تحويل الصف {row}: {str(e)}")
-                continue
-        # الحصول على آخر المنتجات فقط، مع عكس الترتيب ليكون آخر المنتجات أولاً
-        return list(reversed(products[-limit:])) if products else []
+    بخلاف get_products لا يوجد حد لعدد المنتجات، ولا يُقرأ إلا ما يقع في النطاق.
+    
+    المعطيات:
+        start (date): تاريخ البداية
+        end (date): تاريخ النهاية
+        chat_id: المحادثة المالكة (None = الجميع)
         
+    تعيد:
+        قائمة بالمنتجات، كل منتج يحتوي على معرفه (id) وموقعه (sheet_row)، مرتبة من الأحدث إلى الأقدم
+    """
+    try:
+        products = await get_backend().query_by_date_range(start, end, chat_id)
     except Exception as e:
-        logger.error(f"خطأ في الحصول على المنتجات: {str(e)}")
-        DEMO_MODE = True
-        return await get_products(limit)
+        logger.error(f"خطأ في الحصول على المنتجات بين {start} و {end}: {str(e)}")
+        raise SheetsError(f"فشل في الحصول على المنتجات: {str(e)}")
+    
+    if DEMO_MODE and not products and start <= datetime.now().date() <= end:
+        products = _demo_sample_products()
+    return products
+
+def get_day_total(day: date, chat_id: ChatId = None) -> Optional[Total]:
+    """
+    عدد مشتريات يوم معين ومجموعها من المجاميع المحدثة تدريجياً (بدون الرجوع إلى محرك التخزين)
+    
+    المعطيات:
+        day (date): اليوم
+        chat_id: المحادثة المالكة (None = الجميع)
+    
+    تعيد:
+        Optional[Total]: العدد والمجموع، أو None إذا لم تُبن المجاميع بعد
+    """
+    return aggregate_store.day_total(chat_id, day)
+
+def get_purchase_summary(group_by: str, chat_id: ChatId = None,
+                         start: Optional[date] = None, end: Optional[date] = None) -> Optional[List[Dict]]:
+    """
+    ملخص المشتريات مجمعاً حسب اليوم أو الشهر أو المنتج من المجاميع المحدثة تدريجياً
+    
+    المعطيات:
+        group_by (str): day أو month أو product
+        chat_id: المحادثة المالكة (None = الجميع)
+        start, end: حدود النطاق عند التجميع باليوم أو الشهر (None = السجل كاملاً)
+    
+    تعيد:
+        Optional[List[Dict]]: عناصر بالمفاتيح key, count, total، أو None إذا لم تُبن المجاميع بعد
+    """
+    return aggregate_store.summary(chat_id, group_by, start, end)
+
+async def rebuild_aggregates() -> None:
+    """إعادة بناء مجاميع المشتريات من السجل الكامل (للاستعادة إذا شُك في صحتها)"""
+    await aggregate_store.rebuild()
 
 @with_retry
-async def delete_product(index: int) -> bool:
+async def delete_product(product_id: str, chat_id: ChatId = None) -> bool:
     """
-    حذف منتج من قاعدة البيانات حسب الفهرس
+    حذف منتج من قاعدة البيانات
     
     Args:
-        index: فهرس المنتج في جدول البيانات (الصف بدءًا من 2)
+        product_id: معرف المنتج (id) كما أعادته get_products
+        chat_id: المحادثة المالكة؛ لا تُحذف منتجات المحادثات الأخرى (None = أي محادثة)
         
     Returns:
         bool: True في حالة النجاح، False في حالة الفشل
     """
-    global DEMO_MODE, DEMO_PRODUCTS
-    
-    logger.info(f"محاولة حذف المنتج بالفهرس {index}")
-    
-    if DEMO_MODE:
-        try:
-            # في الوضع التجريبي، نحذف من القائمة المحلية
-            if 0 <= index < len(DEMO_PRODUCTS):
-                deleted_product = DEMO_PRODUCTS.pop(index)
-                logger.info(f"تم حذف المنتج: {deleted_product.get('name', 'غير معروف')} من القائمة المحلية")
-                save_demo_products()
-                return True
-            else:
-                logger.error(f"فهرس غير صالح: {index}, العدد الكلي للمنتجات: {len(DEMO_PRODUCTS)}")
-                return False
-        except Exception as e:
-            logger.error(f"فشل في حذف المنتج: {str(e)}")
-            logger.error(traceback.format_exc())
-            return False
+    logger.info(f"محاولة حذف المنتج بالمعرف {product_id}")
     
     try:
         # استخدام دالة delete_products للحذف بشكل متسق
-        success_count, failed_indices = await delete_products([index])
+        success_count, failed_ids = await delete_products([product_id], chat_id)
         return success_count > 0
         
     except Exception as e:
@@ -567,178 +2145,123 @@ async def delete_product(index: int) -> bool:
         return False
 
 @with_retry
-async def delete_products(indices: list) -> Tuple[int, list]:
+async def delete_products(ids: list, chat_id: ChatId = None) -> Tuple[int, list]:
     """
     حذف عدة منتجات من قاعدة البيانات
     
+    المعرفات ثابتة، لذلك يبقى الحذف صحيحاً حتى لو تحركت الصفوف بعد عرض المنتجات للمستخدم.
+    
     Args:
-        indices: قائمة بأرقام الصفوف الفعلية للمنتجات المراد حذفها (sheet_row)
+        ids: قائمة بمعرفات المنتجات المراد حذفها (id)
+        chat_id: المحادثة المالكة؛ لا تُحذف منتجات المحادثات الأخرى (None = أي محادثة)
         
     Returns:
-        Tuple[int, list]: (عدد المنتجات التي تم حذفها بنجاح، قائمة بالفهارس التي فشل حذفها)
+        Tuple[int, list]: (عدد المنتجات التي تم حذفها بنجاح، قائمة بالمعرفات التي فشل حذفها)
     """
-    global DEMO_MODE, DEMO_PRODUCTS
+    logger.info(f"محاولة حذف {len(ids)} منتج بالمعرفات: {ids}")
     
-    logger.info(f"محاولة حذف {len(indices)} منتج بأرقام الصفوف: {indices}")
+    failed_ids = []
     
-    success_count = 0
-    failed_indices = []
+    # التحقق من المعرفات
+    valid_ids = []
+    for product_id in ids:
+        if isinstance(product_id, str) and product_id.strip():
+            valid_ids.append(product_id.strip())
+        else:
+            logger.warning(f"تخطي معرف غير صالح: {product_id} (النوع: {type(product_id)})")
+            failed_ids.append(product_id)
     
-    # تحقق من الفهارس وإصلاحها إذا لزم الأمر
-    valid_indices = []
-    for i in indices:
-        try:
-            if isinstance(i, str):
-                i = int(i.strip())
-            elif not isinstance(i, int):
-                logger.warning(f"تخطي فهرس غير صالح: {i} (النوع: {type(i)})")
-                failed_indices.append(i)
-                continue
-                
-            valid_indices.append(i)
-        except (ValueError, TypeError) as e:
-            logger.warning(f"فشل في تحويل الفهرس: {i}, خطأ: {str(e)}")
-            failed_indices.append(i)
+    if not valid_ids:
+        logger.warning("لا توجد معرفات صالحة للحذف")
+        return 0, failed_ids
     
-    if not valid_indices:
-        logger.warning("لا توجد فهارس صالحة للحذف")
-        return 0, failed_indices
+    success_count, backend_failed = await get_backend().delete_many(valid_ids, chat_id)
+    failed_ids.extend(backend_failed)
+    aggregate_store.remove_ids([product_id for product_id in valid_ids if product_id not in backend_failed])
     
-    # في الوضع التجريبي
-    if DEMO_MODE:
-        logger.info(f"محاولة حذف من القائمة المحلية، عدد المنتجات: {len(DEMO_PRODUCTS)}")
-        
-        # احتفاظ بالمنتجات الجديدة بعد الحذف
-        new_products = []
-        deleted_products = []
-        
-        for idx, product in enumerate(DEMO_PRODUCTS):
-            # تحديد ما إذا كان يجب الاحتفاظ بهذا المنتج
-            # المنتج له قيمة sheet_row مساوية للفهرس أو ليس له sheet_row وموضعه في القائمة مساوٍ للفهرس
-            sheet_row = product.get('sheet_row', idx + 2)  # بشكل افتراضي، استخدم الموقع + 2 (لتخطي صف العنوان)
-            
-            if sheet_row in valid_indices:
-                # هذا منتج مراد حذفه
-                logger.info(f"حذف المنتج: {product.get('name', 'غير معروف')} من الصف {sheet_row}")
-                deleted_products.append(product)
-                success_count += 1
-            else:
-                # احتفظ بهذا المنتج
-                new_products.append(product)
-        
-        # تحديث القائمة المحلية
-        if success_count > 0:
-            logger.info(f"تم حذف {success_count} منتج: {[p.get('name', 'غير معروف') for p in deleted_products]}")
-            DEMO_PRODUCTS = new_products
-            save_demo_products()
-            
-        logger.info(f"نتيجة عملية الحذف (وضع تجريبي): {success_count} نجاح، {len(failed_indices)} فشل")
-        return success_count, failed_indices
+    logger.info(f"نتيجة عملية الحذف: {success_count} نجاح، {len(failed_ids)} فشل")
+    return success_count, failed_ids
+
+async def init_storage(build_aggregates: bool = True) -> None:
+    """
+    تهيئة طبقة التخزين عند بدء البوت
+    
+    Args:
+        build_aggregates: بناء مجاميع المشتريات في الخلفية (لا تحتاجها أوامر سطر الأوامر)
+    """
+    backend = get_backend()
+    logger.info(f"محرك التخزين: {backend.name}")
+    # الإصدار قبل أي كتابة من هذا التشغيل، لمقارنته بإصدار المجاميع المحفوظة
+    version = await _source_version() if AGGREGATES_ENABLED and build_aggregates else None
+    if version is not None:
+        change_probe.baseline(version)
+    await backend.start()
+    if AGGREGATES_ENABLED and build_aggregates:
+        await aggregate_store.open(_source_id(), version)
+
+def _source_id() -> str:
+    """معرف مصدر المجاميع: جدول البيانات في Google Sheets، أو اسم المحرك المحلي"""
+    backend = get_backend()
+    if backend is sheets_backend and _spreadsheet is not None:
+        return f"sheets:{_spreadsheet.id}"
+    return backend.name
+
+async def _source_version() -> Optional[str]:
+    """
+    إصدار جدول البيانات الحالي (None للمحركات المحلية أو إذا تعذرت قراءته)
     
-    # للوضع العادي (Google Sheets)
+    المحركات المحلية لا إصدار لها، فتُبنى مجاميعها من جديد في كل تشغيل.
+    """
+    if get_backend() is not sheets_backend or not SHEETS_CHANGE_PROBE_ENABLED:
+        return None
     try:
-        # الحصول على ورقة العمل
-        worksheet = get_worksheet()
-        
-        # إذا تم تحويل الوضع إلى تجريبي في get_worksheet
-        if DEMO_MODE:
-            return await delete_products(indices)
-            
-        # الحصول على جميع الصفوف
-        all_rows = worksheet.get_all_values()
-        num_rows = len(all_rows)
-        
-        # التحقق من أن لدينا صفوف كافية
-        if num_rows <= 1:  # فقط عنوان
-            logger.warning("لا توجد صفوف للحذف")
-            return 0, valid_indices
-        
-        # ترتيب أرقام الصفوف تنازليًا (مهم للحذف!)
-        sorted_indices = sorted(valid_indices, reverse=True)
-        logger.info(f"أرقام الصفوف للحذف بعد الترتيب: {sorted_indices}")
-        
-        # تسجيل معلومات الصفوف
-        logger.info(f"إجمالي عدد الصفوف في الجدول: {num_rows}")
-        
-        # تحديد عدد الأعمدة في الورقة
-        num_cols = len(all_rows[0]) if all_rows else 5  # استخدام 5 أعمدة افتراضية
-        
-        # الحد الأقصى للأعمدة هو 26 (من A إلى Z)
-        if num_cols > 26:
-            num_cols = 26
-        
-        for row_index in sorted_indices:
-            try:
-                if row_index <= 1:
-                    # لا نريد حذف صف العنوان (الصف 1)
-                    logger.error(f"محاولة حذف صف العنوان أو صف غير صالح: {row_index}")
-                    failed_indices.append(row_index)
-                    continue
-                
-                if row_index > num_rows:
-                    logger.error(f"الصف {row_index} غير موجود. عدد الصفوف: {num_rows}")
-                    failed_indices.append(row_index)
-                    continue
-                
-                # طباعة محتوى الصف قبل الحذف للتحقق
-                try:
-                    if row_index <= len(all_rows):
-                        row_content = all_rows[row_index - 1]  # التعديل من 1-based إلى 0-based للوصول للقائمة
-                        logger.info(f"محتوى الصف {row_index} قبل الحذف: {row_content}")
-                except Exception as e:
-                    logger.warning(f"لا يمكن طباعة محتوى الصف {row_index}: {str(e)}")
-                
-                # إنشاء صف فارغ للاستبدال - نفس عدد الأعمدة الموجودة في الجدول
-                empty_row_values = [['' for _ in range(num_cols)]]
-                
-                # تحديد نطاق الصف بطريقة صحيحة
-                # نستخدم الأحرف من A إلى آخر عمود (على سبيل المثال A:E للخمسة أعمدة الأولى)
-                last_column_letter = chr(64 + num_cols)  # 65 = 'A', 66 = 'B', إلخ
-                cell_range = f'A{row_index}:{last_column_letter}{row_index}'
-                
-                logger.info(f"محاولة مسح النطاق: {cell_range} باستخدام batch_update")
-                
-                try:
-                    # تحديث الصف بقيم فارغة باستخدام batch_update
-                    worksheet.batch_update([{
-                        'range': cell_range,
-                        'values': empty_row_values
-                    }])
-                    
-                    logger.info(f"تم مسح محتويات الصف {row_index} بنجاح")
-                    success_count += 1
-                except Exception as batch_error:
-                    logger.error(f"فشل في استخدام batch_update لحذف الصف {row_index}: {str(batch_error)}")
-                    
-                    # محاولة بديلة باستخدام update_cell
-                    try:
-                        logger.info(f"محاولة حذف الصف {row_index} باستخدام update_cell لكل عمود...")
-                        
-                        # مسح كل خلية على حدة
-                        for col in range(1, num_cols + 1):
-                            worksheet.update_cell(row_index, col, '')
-                        
-                        logger.info(f"تم مسح محتويات الصف {row_index} باستخدام update_cell")
-                        success_count += 1
-                    except Exception as cell_error:
-                        logger.error(f"فشل في حذف الصف {row_index}: {str(cell_error)}")
-                        failed_indices.append(row_index)
-                        
-            except Exception as e:
-                logger.error(f"فشل في حذف الصف {row_index}: {str(e)}")
-                logger.error(traceback.format_exc())
-                failed_indices.append(row_index)
-        
-        logger.info(f"نتيجة عملية الحذف: {success_count} نجاح، {len(failed_indices)} فشل")
-        return success_count, failed_indices
-        
+        info = await _fetch_revision()
     except Exception as e:
-        logger.error(f"خطأ عام في عملية الحذف: {str(e)}")
-        logger.error(traceback.format_exc())
-        for idx in valid_indices:
-            if idx not in failed_indices:
-                failed_indices.append(idx)
-        return 0, failed_indices
+        logger.warning(f"تعذرت قراءة إصدار جدول البيانات: {str(e)}")
+        return None
+    return str(info.get('version') or '') or None
 
-load_dotenv()
-GOOGLE_SHEETS_KEY = os.getenv("GOOGLE_SHEETS_KEY")
+async def _matched_version() -> Optional[str]:
+    """
+    إصدار جدول البيانات الذي تطابقه المجاميع عند الإغلاق
+    
+    يُفحص الإصدار مرة أخيرة فتُطبق التعديلات اليدوية منذ آخر فحص؛ بدون فحص سابق لا يُعرف ما
+    تطابقه المجاميع (None).
+    """
+    if get_backend() is not sheets_backend or change_probe.version is None:
+        return None
+    try:
+        await change_probe.check()
+    except Exception as e:
+        logger.warning(f"تعذر فحص إصدار جدول البيانات عند الإغلاق: {str(e)}")
+        return None
+    return change_probe.version
+
+def get_storage_stats() -> Dict[str, Any]:
+    """
+    إحصاءات طبقة التخزين للمراقبة
+    
+    Returns:
+        Dict[str, Any]: إحصاءات المحرك الحالي ومنفذ التخزين
+    """
+    stats = get_backend().get_stats()
+    stats['demo_mode'] = DEMO_MODE
+    stats['executor'] = storage_executor.get_stats()
+    stats['aggregates'] = aggregate_store.get_stats()
+    stats['idempotency'] = write_index.get_stats()
+    return stats
+
+async def shutdown_storage() -> None:
+    """إيقاف طبقة التخزين بشكل آمن عند إغلاق البوت"""
+    await aggregate_store.stop()
+    # محرك Google Sheets قد يحمل صفوفاً مؤجلة حتى بعد التحول إلى الوضع التجريبي
+    backend = BACKENDS.get(STORAGE_BACKEND, sheets_backend)
+    await backend.close()
+    await aggregate_store.close(await _matched_version())
+    if backend is sheets_backend:
+        # الصفوف المؤجلة قد تُحفظ في المحرك المحلي إذا كان البوت في الوضع التجريبي
+        await memory_backend.close()
+    if _client is not None:
+        # إغلاق اتصالات Google Sheets المفتوحة ومهمة تجديد الرمز
+        await _client.close()
+    storage_executor.shutdown(wait=True)
@@ -0,0 +1,554 @@
+"""
+عميل Google Sheets API v4 غير متزامن
+
+بديل عن gspread و oauth2client: الطلبات تُرسل مباشرة من حلقة الأحداث عبر جلسة httpx
+واحدة تحتفظ باتصالاتها مفتوحة (keep-alive)، فلا يتكرر إنشاء اتصال TLS أو عميل جديد مع
+كل طلب ولا تنتقل العمليات إلى خيوط منفصلة.
+
+رمز الوصول لحساب الخدمة يُجدد في الخلفية قبل انتهائه بفترة. تبادل الرمز نفسه يتم عبر
+google-auth (متزامن) في منفذ التخزين، مرة كل ساعة تقريباً وخارج مسار الطلبات.
+
+الكائنات AsyncSpreadsheet و AsyncWorksheet توفر العمليات التي يحتاجها database/sheets.py
+بنفس أسماء gspread (get و batch_get و append_rows ...) لكنها دوال async.
+
+الإعدادات (عبر المتغيرات البيئية):
+    SHEETS_HTTP_TIMEOUT: مهلة كل طلب بالثواني (افتراضي: 30)
+    SHEETS_HTTP_CONNECTIONS: أقصى عدد من الاتصالات المفتوحة (افتراضي: 10)
+    SHEETS_TOKEN_REFRESH_MARGIN: تجديد الرمز قبل انتهائه بهذا العدد من الثواني (افتراضي: 300)
+"""
+import os
+import re
+import random
+import asyncio
+import logging
+from datetime import datetime
+from typing import Any, Dict, List, Optional, Tuple
+from urllib.parse import quote
+
+import httpx
+from google.auth.transport.requests import Request
+from google.oauth2.service_account import Credentials
+
+from database.executor import storage_executor
+
+# إعداد التسجيل
+logger = logging.getLogger(__name__)
+
+# مهلة كل طلب (بالثواني)
+SHEETS_HTTP_TIMEOUT = float(os.getenv("SHEETS_HTTP_TIMEOUT", "30"))
+# أقصى عدد من الاتصالات المفتوحة مع خوادم Google
+SHEETS_HTTP_CONNECTIONS = int(os.getenv("SHEETS_HTTP_CONNECTIONS", "10"))
+# تجديد الرمز قبل انتهائه بهذا العدد من الثواني
+SHEETS_TOKEN_REFRESH_MARGIN = float(os.getenv("SHEETS_TOKEN_REFRESH_MARGIN", "300"))
+
+SHEETS_API_URL = "https://sheets.googleapis.com/v4/spreadsheets"
+DRIVE_FILES_URL = "https://www.googleapis.com/drive/v3/files"
+
+# صلاحيات Google Sheets وقراءة بيانات الملفات من Google Drive (للبحث عن الجدول بالاسم ومعرفة إصداره)
+SHEETS_SCOPES = [
+    "https://www.googleapis.com/auth/spreadsheets",
+    "https://www.googleapis.com/auth/drive.readonly",
+]
+
+SPREADSHEET_MIME_TYPE = "application/vnd.google-apps.spreadsheet"
+
+class APIError(Exception):
+    """
+    خطأ أعادته Google API
+
+    response هو رد HTTP نفسه، ومنه يُقرأ رمز الحالة وترويسة Retry-After.
+    """
+
+    def __init__(self, response: httpx.Response):
+        self.response = response
+        try:
+            message = response.json().get('error', {}).get('message', '')
+        except ValueError:
+            message = response.text
+        super().__init__(f"{response.status_code}: {message}")
+
+class SpreadsheetNotFound(Exception):
+    """لم يُعثر على جدول البيانات"""
+
+class WorksheetNotFound(Exception):
+    """لم يُعثر على ورقة العمل"""
+
+def quote_title(title: str) -> str:
+    """اسم الورقة بالشكل المستخدم في نطاقات A1 ('اسم الورقة')"""
+    return "'" + title.replace("'", "''") + "'"
+
+def _column_index(letters: str) -> int:
+    """رقم العمود (من 0) لحروفه: A -> 0"""
+    index = 0
+    for letter in letters:
+        index = index * 26 + ord(letter) - ord('A') + 1
+    return index - 1
+
+def grid_range(sheet_id: int, a1: str) -> Dict[str, int]:
+    """
+    تحويل نطاق A1 محدود (مثل A1:E1) إلى GridRange كما تتطلبه طلبات batchUpdate
+
+    Raises:
+        ValueError: إذا لم يكن النطاق بالشكل A1 أو A1:E1
+    """
+    match = re.fullmatch(r'([A-Z]+)(\d+)(?::([A-Z]+)(\d+))?', a1)
+    if not match:
+        raise ValueError(f"نطاق غير مدعوم: {a1}")
+    first_col, first_row, last_col, last_row = match.groups()
+    last_col, last_row = last_col or first_col, last_row or first_row
+    return {
+        'sheetId': sheet_id,
+        'startRowIndex': int(first_row) - 1,
+        'endRowIndex': int(last_row),
+        'startColumnIndex': _column_index(first_col),
+        'endColumnIndex': _column_index(last_col) + 1,
+    }
+
+def cell_data(value: Any) -> Dict[str, Any]:
+    """
+    قيمة خانة بالشكل الذي تتطلبه طلبات batchUpdate (CellData)، كما تخزنها valueInputOption=RAW:
+    الأرقام أرقام والنصوص نصوص دون تحليل
+    """
+    if value is None or value == '':
+        return {}
+    if isinstance(value, bool):
+        return {'userEnteredValue': {'boolValue': value}}
+    if isinstance(value, (int, float)):
+        return {'userEnteredValue': {'numberValue': value}}
+    return {'userEnteredValue': {'stringValue': str(value)}}
+
+def rows_data(rows: List[list]) -> List[Dict[str, Any]]:
+    """صفوف القيم بالشكل الذي تتطلبه طلبات batchUpdate (RowData)"""
+    return [{'values': [cell_data(value) for value in row]} for row in rows]
+
+class ServiceAccountToken:
+    """
+    رمز الوصول لحساب الخدمة
+
+    يُجدد الرمز في مهمة خلفية قبل انتهائه بـ SHEETS_TOKEN_REFRESH_MARGIN ثانية، فلا ينتظر
+    أي طلب تجديد الرمز إلا في أول استخدام أو إذا رفضت Google الرمز (401).
+    """
+
+    def __init__(self, credentials: Credentials, refresh_margin: float = SHEETS_TOKEN_REFRESH_MARGIN):
+        self._credentials = credentials
+        self.refresh_margin = refresh_margin
+        self._lock: Optional[asyncio.Lock] = None
+        self._task: Optional[asyncio.Task] = None
+        self.refreshes = 0
+
+    @classmethod
+    def from_file(cls, path: str, scopes: List[str] = SHEETS_SCOPES) -> 'ServiceAccountToken':
+        """إنشاء الرمز من ملف مفتاح حساب الخدمة (JSON)"""
+        return cls(Credentials.from_service_account_file(path, scopes=scopes))
+
+    @property
+    def lock(self) -> asyncio.Lock:
+        """قفل التجديد (يُنشأ داخل حلقة الأحداث عند أول استخدام)"""
+        if self._lock is None:
+            self._lock = asyncio.Lock()
+        return self._lock
+
+    def _seconds_left(self) -> float:
+        """الثواني المتبقية حتى انتهاء الرمز (0 إذا لم يوجد رمز بعد)"""
+        expiry = self._credentials.expiry
+        if not self._credentials.token or expiry is None:
+            return 0.0
+        # google-auth تخزن وقت الانتهاء بتوقيت UTC بدون منطقة زمنية
+        return (expiry - datetime.utcnow()).total_seconds()
+
+    async def get(self) -> str:
+        """رمز صالح للاستخدام (يُجدد أولاً إذا لم يكن صالحاً)"""
+        if not self._credentials.valid:
+            await self.refresh()
+        if self._task is None or self._task.done():
+            self._task = asyncio.create_task(self._refresh_loop())
+        return self._credentials.token
+
+    async def refresh(self, force: bool = False) -> None:
+        """
+        تجديد الرمز
+
+        Args:
+            force: التجديد حتى لو كان الرمز الحالي صالحاً (بعد رفضه أو قرب انتهائه)
+        """
+        async with self.lock:
+            # ربما جدده طلب آخر أثناء انتظار القفل
+            if not force and self._credentials.valid:
+                return
+            await storage_executor.run(self._credentials.refresh, Request())
+            self.refreshes += 1
+            logger.debug(f"تم تجديد رمز الوصول، ينتهي بعد {self._seconds_left():.0f} ثانية")
+
+    async def _refresh_loop(self) -> None:
+        """تجديد الرمز في الخلفية قبل انتهائه"""
+        while True:
+            await asyncio.sleep(max(1.0, self._seconds_left() - self.refresh_margin))
+            try:
+                await self.refresh(force=True)
+            except Exception as e:
+                # الرمز الحالي ما زال صالحاً لبعض الوقت؛ نعيد المحاولة بعد قليل
+                logger.warning(f"تعذر تجديد رمز الوصول في الخلفية: {str(e)}")
+                await asyncio.sleep(min(30.0, self.refresh_margin / 2))
+
+    async def close(self) -> None:
+        """إيقاف مهمة التجديد"""
+        if self._task is not None and not self._task.done():
+            self._task.cancel()
+            try:
+                await self._task
+            except asyncio.CancelledError:
+                pass
+        self._task = None
+
+class AsyncSheetsClient:
+    """
+    عميل Google Sheets غير متزامن بجلسة HTTP مشتركة
+
+    أخطاء HTTP تُرفع كـ APIError، وأخطاء الشبكة كـ ConnectionError والمهلة كـ TimeoutError
+    (مثل أخطاء gspread سابقاً) حتى يتعامل معها محدد المعدل وقاطع الدائرة بالطريقة نفسها.
+    """
+
+    def __init__(self, token: ServiceAccountToken, http: Optional[httpx.AsyncClient] = None):
+        self.token = token
+        self._http = http
+        self.requests = 0
+        # طلبات الكتابة (كل ما ليس GET)، لتمييز تعديلات البوت عن التعديلات اليدوية
+        self.writes = 0
+
+    @property
+    def http(self) -> httpx.AsyncClient:
+        """جلسة HTTP (تُنشأ داخل حلقة الأحداث عند أول استخدام)"""
+        if self._http is None:
+            self._http = httpx.AsyncClient(
+                timeout=SHEETS_HTTP_TIMEOUT,
+                limits=httpx.Limits(
+                    max_connections=SHEETS_HTTP_CONNECTIONS,
+                    max_keepalive_connections=SHEETS_HTTP_CONNECTIONS
+                )
+            )
+        return self._http
+
+    async def request(self, method: str, url: str, **kwargs) -> Dict[str, Any]:
+        """
+        إرسال طلب إلى Google API مع رمز الوصول
+
+        Returns:
+            Dict[str, Any]: جسم الرد (JSON)
+
+        Raises:
+            APIError: إذا ردت الخدمة برمز خطأ
+            ConnectionError: عند تعذر الاتصال
+            TimeoutError: عند انتهاء المهلة
+        """
+        for attempt in range(2):
+            headers = {'Authorization': f"Bearer {await self.token.get()}"}
+            self.requests += 1
+            if method != 'GET':
+                self.writes += 1
+            try:
+                response = await self.http.request(method, url, headers=headers, **kwargs)
+            except httpx.TimeoutException as e:
+                raise TimeoutError(f"انتهت مهلة الطلب إلى Google API: {str(e)}") from e
+            except httpx.TransportError as e:
+                raise ConnectionError(f"تعذر الاتصال بـ Google API: {str(e)}") from e
+
+            if response.status_code == 401 and not attempt:
+                # الرمز أُلغي قبل موعد انتهائه
+                await self.token.refresh(force=True)
+                continue
+            if response.status_code >= 400:
+                raise APIError(response)
+            return response.json() if response.content else {}
+
+    async def open_by_key(self, key: str) -> 'AsyncSpreadsheet':
+        """فتح جدول بيانات بمعرفه"""
+        spreadsheet = AsyncSpreadsheet(self, key)
+        await spreadsheet.fetch_metadata()
+        return spreadsheet
+
+    async def list_spreadsheets(self, title: Optional[str] = None) -> List[Dict[str, str]]:
+        """
+        جداول البيانات المتاحة لحساب الخدمة في Google Drive
+
+        Args:
+            title: الاسم المطلوب (None = جميع الجداول)
+
+        Returns:
+            List[Dict[str, str]]: عناصر بالمفاتيح id و name
+        """
+        query = f"mimeType='{SPREADSHEET_MIME_TYPE}' and trashed=false"
+        if title is not None:
+            escaped = title.replace('\\', '\\\\').replace("'", "\\'")
+            query += f" and name='{escaped}'"
+
+        files: List[Dict[str, str]] = []
+        page_token = None
+        while True:
+            params = {'q': query, 'fields': 'nextPageToken,files(id,name)', 'pageSize': 100}
+            if page_token:
+                params['pageToken'] = page_token
+            data = await self.request('GET', DRIVE_FILES_URL, params=params)
+            files.extend(data.get('files', []))
+            page_token = data.get('nextPageToken')
+            if not page_token:
+                return files
+
+    async def open(self, title: str) -> 'AsyncSpreadsheet':
+        """
+        فتح جدول بيانات باسمه
+
+        Raises:
+            SpreadsheetNotFound: إذا لم يوجد جدول بهذا الاسم
+        """
+        files = await self.list_spreadsheets(title)
+        if not files:
+            raise SpreadsheetNotFound(title)
+        return await self.open_by_key(files[0]['id'])
+
+    async def openall(self) -> List['AsyncSpreadsheet']:
+        """فتح جميع جداول البيانات المتاحة لحساب الخدمة"""
+        return [await self.open_by_key(item['id']) for item in await self.list_spreadsheets()]
+
+    async def close(self) -> None:
+        """إغلاق الجلسة ومهمة تجديد الرمز"""
+        await self.token.close()
+        if self._http is not None:
+            await self._http.aclose()
+            self._http = None
+
+    def get_stats(self) -> Dict[str, Any]:
+        """إحصاءات العميل للمراقبة"""
+        return {'requests': self.requests, 'writes': self.writes, 'token_refreshes': self.token.refreshes}
+
+class AsyncSpreadsheet:
+    """جدول بيانات مفتوح"""
+
+    def __init__(self, client: AsyncSheetsClient, spreadsheet_id: str):
+        self.client = client
+        self.id = spreadsheet_id
+        self.title = ''
+        self._worksheets: List['AsyncWorksheet'] = []
+
+    @property
+    def url(self) -> str:
+        return f"{SHEETS_API_URL}/{self.id}"
+
+    async def fetch_metadata(self) -> None:
+        """قراءة اسم الجدول وخصائص أوراقه (بدون أي خلايا)"""
+        data = await self.client.request(
+            'GET', self.url, params={'fields': 'properties.title,sheets.properties'}
+        )
+        self.title = data.get('properties', {}).get('title', '')
+        self._worksheets = [AsyncWorksheet(self, sheet['properties']) for sheet in data.get('sheets', [])]
+
+    async def fetch_revision(self) -> Dict[str, Any]:
+        """
+        رقم إصدار الملف في Google Drive ووقت آخر تعديل ومن أجراه (بدون أي خلايا)
+
+        Returns:
+            Dict[str, Any]: بالمفاتيح version و modifiedTime و lastModifyingUser.me
+        """
+        return await self.client.request(
+            'GET', f"{DRIVE_FILES_URL}/{self.id}",
+            params={'fields': 'version,modifiedTime,lastModifyingUser(me)'}
+        )
+
+    async def worksheets(self) -> List['AsyncWorksheet']:
+        """جميع أوراق العمل بترتيبها في الجدول"""
+        await self.fetch_metadata()
+        return list(self._worksheets)
+
+    async def worksheet(self, title: str) -> 'AsyncWorksheet':
+        """
+        ورقة العمل بهذا الاسم
+
+        Raises:
+            WorksheetNotFound: إذا لم توجد ورقة بهذا الاسم
+        """
+        for worksheet in await self.worksheets():
+            if worksheet.title == title:
+                return worksheet
+        raise WorksheetNotFound(title)
+
+    async def add_worksheet(self, title: str, rows: int, cols: int) -> 'AsyncWorksheet':
+        """إنشاء ورقة عمل جديدة"""
+        worksheet, request = self.add_worksheet_request(title, rows, cols)
+        await self.batch_update([request])
+        self.register_worksheet(worksheet)
+        return worksheet
+
+    def add_worksheet_request(self, title: str, rows: int, cols: int) -> Tuple['AsyncWorksheet', Dict[str, Any]]:
+        """
+        طلب إنشاء ورقة عمل يُرسل مع طلبات أخرى في batchUpdate واحد
+
+        معرّف الورقة يُختار هنا بدلاً من انتظاره في الرد، فتُبنى طلبات الورقة الجديدة (الرؤوس
+        والإضافة) في الطلب نفسه. تُسجل الورقة بـ register_worksheet بعد نجاح الإرسال.
+
+        Returns:
+            Tuple[AsyncWorksheet, Dict[str, Any]]: (الورقة، طلب addSheet)
+        """
+        used = {worksheet.id for worksheet in self._worksheets}
+        sheet_id = random.randrange(1, 2 ** 31 - 1)
+        while sheet_id in used:
+            sheet_id = random.randrange(1, 2 ** 31 - 1)
+        properties = {
+            'sheetId': sheet_id,
+            'title': title,
+            'gridProperties': {'rowCount': rows, 'columnCount': cols}
+        }
+        return AsyncWorksheet(self, properties), {'addSheet': {'properties': properties}}
+
+    def register_worksheet(self, worksheet: 'AsyncWorksheet') -> None:
+        """إضافة ورقة أُنشئت بـ add_worksheet_request إلى قائمة الأوراق المعروفة"""
+        if all(known.id != worksheet.id for known in self._worksheets):
+            self._worksheets.append(worksheet)
+
+    async def batch_update(self, requests: List[Dict[str, Any]]) -> Dict[str, Any]:
+        """تنفيذ طلبات spreadsheets.batchUpdate (تنسيق، إنشاء أوراق ...) في طلب واحد"""
+        return await self.client.request('POST', f"{self.url}:batchUpdate", json={'requests': requests})
+
+    async def values_get(self, range_name: str) -> Dict[str, Any]:
+        """قراءة نطاق واحد (ValueRange)"""
+        return await self.client.request('GET', f"{self.url}/values/{quote(range_name, safe='')}")
+
+    async def values_batch_get(self, ranges: List[str]) -> List[Dict[str, Any]]:
+        """قراءة عدة نطاقات (من أوراق مختلفة أيضاً) في طلب واحد"""
+        data = await self.client.request(
+            'GET', f"{self.url}/values:batchGet", params=[('ranges', range_name) for range_name in ranges]
+        )
+        return data.get('valueRanges', [])
+
+    async def values_batch_update(self, data: List[Dict[str, Any]], value_input_option: str = 'RAW') -> Dict[str, Any]:
+        """كتابة عدة نطاقات في طلب واحد"""
+        return await self.client.request(
+            'POST', f"{self.url}/values:batchUpdate",
+            json={'valueInputOption': value_input_option, 'data': data}
+        )
+
+    async def values_batch_clear(self, ranges: List[str]) -> Dict[str, Any]:
+        """مسح عدة نطاقات في طلب واحد"""
+        return await self.client.request('POST', f"{self.url}/values:batchClear", json={'ranges': ranges})
+
+class AsyncWorksheet:
+    """
+    ورقة عمل داخل جدول البيانات
+
+    النطاقات تُمرر بدون اسم الورقة (مثل A2:E10) ويُضاف اسمها تلقائياً.
+    """
+
+    def __init__(self, spreadsheet: AsyncSpreadsheet, properties: Dict[str, Any]):
+        self.spreadsheet = spreadsheet
+        self.id = properties.get('sheetId', 0)
+        self.title = properties.get('title', '')
+        grid = properties.get('gridProperties', {})
+        self.row_count = grid.get('rowCount', 0)
+        self.col_count = grid.get('columnCount', 0)
+
+    def _range(self, a1: str) -> str:
+        """النطاق مع اسم الورقة"""
+        return f"{quote_title(self.title)}!{a1}"
+
+    async def get(self, range_name: str) -> List[list]:
+        """قيم نطاق واحد (الصفوف الفارغة في نهايته لا تُعاد)"""
+        data = await self.spreadsheet.values_get(self._range(range_name))
+        return data.get('values', [])
+
+    async def batch_get(self, ranges: List[str]) -> List[List[list]]:
+        """قيم عدة نطاقات في طلب واحد، بنفس ترتيبها"""
+        value_ranges = await self.spreadsheet.values_batch_get([self._range(r) for r in ranges])
+        return [value_range.get('values', []) for value_range in value_ranges]
+
+    async def batch_update(self, data: List[Dict[str, Any]], value_input_option: str = 'RAW') -> Dict[str, Any]:
+        """
+        كتابة عدة نطاقات في طلب واحد
+
+        Args:
+            data: عناصر بالمفاتيح range و values
+        """
+        return await self.spreadsheet.values_batch_update(
+            [{'range': self._range(item['range']), 'values': item['values']} for item in data],
+            value_input_option
+        )
+
+    async def batch_clear(self, ranges: List[str]) -> Dict[str, Any]:
+        """مسح عدة نطاقات في طلب واحد"""
+        return await self.spreadsheet.values_batch_clear([self._range(r) for r in ranges])
+
+    async def append_rows(self, rows: List[list], value_input_option: str = 'RAW') -> Dict[str, Any]:
+        """
+        إضافة صفوف بعد آخر صف مستخدم
+
+        Returns:
+            Dict[str, Any]: رد values.append (النطاق المكتوب في updates.updatedRange)
+        """
+        return await self.spreadsheet.client.request(
+            'POST', f"{self.spreadsheet.url}/values/{quote(quote_title(self.title), safe='')}:append",
+            params={'valueInputOption': value_input_option},
+            json={'values': rows}
+        )
+
+    async def row_values(self, row: int) -> list:
+        """قيم صف واحد"""
+        values = await self.get(f"{row}:{row}")
+        return values[0] if values else []
+
+    async def update(self, range_name: str, values: List[list], value_input_option: str = 'RAW') -> Dict[str, Any]:
+        """كتابة قيم نطاق واحد"""
+        return await self.spreadsheet.client.request(
+            'PUT', f"{self.spreadsheet.url}/values/{quote(self._range(range_name), safe='')}",
+            params={'valueInputOption': value_input_option},
+            json={'values': values}
+        )
+
+    async def add_cols(self, cols: int) -> Dict[str, Any]:
+        """إضافة أعمدة في نهاية الورقة"""
+        data = await self.spreadsheet.batch_update([self.add_cols_request(cols)])
+        self.col_count += cols
+        return data
+
+    async def format(self, range_name: str, cell_format: Dict[str, Any]) -> Dict[str, Any]:
+        """تنسيق خلايا نطاق (userEnteredFormat)"""
+        return await self.spreadsheet.batch_update([self.format_request(range_name, cell_format)])
+
+    # طلبات batchUpdate لهذه الورقة، لتجميع عدة تعديلات في طلب واحد (spreadsheet.batch_update)
+
+    def add_cols_request(self, cols: int) -> Dict[str, Any]:
+        """طلب إضافة أعمدة في نهاية الورقة"""
+        return {'appendDimension': {'sheetId': self.id, 'dimension': 'COLUMNS', 'length': cols}}
+
+    def format_request(self, range_name: str, cell_format: Dict[str, Any]) -> Dict[str, Any]:
+        """طلب تنسيق خلايا نطاق (userEnteredFormat)"""
+        return {
+            'repeatCell': {
+                'range': grid_range(self.id, range_name),
+                'cell': {'userEnteredFormat': cell_format},
+                'fields': f"userEnteredFormat({','.join(cell_format)})"
+            }
+        }
+
+    def update_cells_request(self, range_name: str, rows: List[list]) -> Dict[str, Any]:
+        """طلب كتابة قيم نطاق محدود (مثل A1:F1)"""
+        return {
+            'updateCells': {
+                'range': grid_range(self.id, range_name),
+                'rows': rows_data(rows),
+                'fields': 'userEnteredValue'
+            }
+        }
+
+    def append_cells_request(self, rows: List[list]) -> Dict[str, Any]:
+        """
+        طلب إضافة صفوف بعد آخر صف مستخدم (مثل append_rows)
+
+        ردّه فارغ: لا يحمل أرقام الصفوف المكتوبة كما يحملها رد values.append.
+        """
+        return {'appendCells': {'sheetId': self.id, 'rows': rows_data(rows), 'fields': 'userEnteredValue'}}
+
+    def clear_rows_request(self, first_row: int, last_row: int) -> Dict[str, Any]:
+        """طلب مسح قيم صفوف كاملة (مثل batch_clear للنطاق first:last)"""
+        return {
+            'updateCells': {
+                'range': {'sheetId': self.id, 'startRowIndex': first_row - 1, 'endRowIndex': last_row},
+                'fields': 'userEnteredValue'
+            }
+        }
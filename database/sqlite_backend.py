@@ -0,0 +1,239 @@
+"""
+محرك التخزين SQLite
+
+قاعدة بيانات محلية في ملف واحد لا تحتاج إلى أي خدمة خارجية. تعمل بوضع WAL حتى لا تمنع
+القراءة أثناء الكتابة، ولها فهارس على التاريخ واسم المنتج لتسريع أوامر اليوم والتجميع،
+وفهارس تبدأ بالمحادثة المالكة حتى لا تمر استعلامات محادثة على صفوف غيرها.
+جميع الاستعلامات تُنفَّذ في منفذ التخزين بعيداً عن حلقة الأحداث.
+
+الإعدادات (عبر المتغيرات البيئية):
+    SQLITE_PATH: مسار ملف قاعدة البيانات (افتراضي: data/purchases.db)
+"""
+import os
+import logging
+import sqlite3
+import threading
+from datetime import date
+from typing import Any, AsyncIterator, Dict, List, Optional, Tuple
+
+from database.backend import (
+    StorageBackend, ChatId, GROUP_BY_PRODUCT, GROUP_BY_DAY, PAGE_ROWS, chat_key, date_key, ensure_row_ids, row_chat
+)
+from database.executor import storage_executor
+
+# إعداد التسجيل
+logger = logging.getLogger(__name__)
+
+# مسار ملف قاعدة البيانات
+SQLITE_PATH = os.getenv(
+    "SQLITE_PATH",
+    os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), "data", "purchases.db")
+)
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS products (
+    id INTEGER PRIMARY KEY AUTOINCREMENT,
+    date TEXT NOT NULL,
+    name TEXT NOT NULL,
+    price REAL NOT NULL,
+    notes TEXT NOT NULL DEFAULT '',
+    uid TEXT,
+    chat TEXT NOT NULL DEFAULT ''
+);
+CREATE INDEX IF NOT EXISTS idx_products_date ON products(date);
+CREATE INDEX IF NOT EXISTS idx_products_name ON products(name);
+"""
+
+# فهارس المعرفات والمحادثات (تُنشأ بعد إضافة الأعمدة في قواعد البيانات القديمة)
+UID_INDEX = "CREATE UNIQUE INDEX IF NOT EXISTS idx_products_uid ON products(uid)"
+CHAT_INDEXES = """
+CREATE INDEX IF NOT EXISTS idx_products_chat ON products(chat, id);
+CREATE INDEX IF NOT EXISTS idx_products_chat_date ON products(chat, date);
+"""
+
+# أعمدة المنتج في استعلامات القراءة
+PRODUCT_COLUMNS = "id, date, name, price, notes, uid, chat"
+
+# شرط المحادثة: صفوفها والصفوف التي ليس لها مالك
+CHAT_FILTER = "chat IN (?, '')"
+
+def _to_product(row: tuple) -> Dict:
+    """تحويل صف من الاستعلام (id, date, name, price, notes, uid, chat) إلى قاموس منتج"""
+    return {
+        'date': row[1],
+        'name': row[2],
+        'price': row[3],
+        'notes': row[4],
+        'sheet_row': row[0],
+        'id': row[5],
+        'chat_id': row[6]
+    }
+
+def _chat_clause(chat_id: ChatId) -> Tuple[str, tuple]:
+    """شرط المحادثة ومعامله لإضافته إلى الاستعلام (فارغ لجميع المحادثات)"""
+    if chat_id is None:
+        return "", ()
+    return f" AND {CHAT_FILTER}", (chat_key(chat_id),)
+
+class SQLiteBackend(StorageBackend):
+    """
+    محرك تخزين SQLite
+
+    موقع كل منتج (sheet_row) هو رقم السجل id في الجدول، ومعرفه (id) في العمود uid.
+    """
+
+    name = "sqlite"
+
+    def __init__(self, path: str = SQLITE_PATH):
+        self.path = path
+        self._conn = None
+        # اتصال واحد مشترك بين خيوط المنفذ، لذلك نحمي استخدامه بقفل
+        self._lock = threading.Lock()
+
+    def _connect(self) -> sqlite3.Connection:
+        """فتح الاتصال وإنشاء الجدول والفهارس عند أول استخدام (يجب حجز القفل)"""
+        if self._conn is None:
+            directory = os.path.dirname(self.path)
+            if directory:
+                os.makedirs(directory, exist_ok=True)
+            conn = sqlite3.connect(self.path, check_same_thread=False)
+            conn.execute("PRAGMA journal_mode=WAL")
+            conn.execute("PRAGMA synchronous=NORMAL")
+            conn.executescript(SCHEMA)
+            self._migrate(conn)
+            conn.execute(UID_INDEX)
+            conn.executescript(CHAT_INDEXES)
+            conn.commit()
+            self._conn = conn
+            logger.info(f"تم فتح قاعدة بيانات SQLite: {self.path}")
+        return self._conn
+
+    def _migrate(self, conn: sqlite3.Connection) -> None:
+        """إضافة أعمدة المعرف والمحادثة لقواعد البيانات المنشأة قبلها وإعطاء السجلات الموجودة معرفات"""
+        columns = [row[1] for row in conn.execute("PRAGMA table_info(products)")]
+        if 'uid' not in columns:
+            conn.execute("ALTER TABLE products ADD COLUMN uid TEXT")
+        if 'chat' not in columns:
+            # السجلات الموجودة ليس لها مالك وتظهر لجميع المحادثات
+            conn.execute("ALTER TABLE products ADD COLUMN chat TEXT NOT NULL DEFAULT ''")
+        updated = conn.execute(
+            "UPDATE products SET uid = lower(hex(randomblob(6))) WHERE uid IS NULL OR uid = ''"
+        ).rowcount
+        if updated:
+            logger.info(f"تم إنشاء معرفات لـ {updated} سجل في SQLite")
+
+    def _execute(self, sql: str, params: tuple = ()) -> List[tuple]:
+        """تنفيذ استعلام قراءة وإرجاع جميع الصفوف"""
+        with self._lock:
+            return self._connect().execute(sql, params).fetchall()
+
+    def _insert(self, rows: List[list]) -> None:
+        """إضافة الصفوف في معاملة واحدة (الصف الذي يصل مرة ثانية بنفس المعرف يُتجاهل)"""
+        with self._lock:
+            conn = self._connect()
+            with conn:
+                conn.executemany(
+                    "INSERT OR IGNORE INTO products (date, name, price, notes, uid, chat) VALUES (?, ?, ?, ?, ?, ?)",
+                    [(row[0], row[1], float(row[2]), row[3] or '', row[4], row_chat(row)) for row in rows]
+                )
+
+    def _delete(self, ids: List[str], chat_id: ChatId = None) -> List[str]:
+        """حذف السجلات وإرجاع المعرفات التي كانت موجودة فعلاً (وتملكها المحادثة)"""
+        placeholders = ",".join("?" * len(ids))
+        clause, params = _chat_clause(chat_id)
+        params = tuple(ids) + params
+        with self._lock:
+            conn = self._connect()
+            with conn:
+                found = [row[0] for row in conn.execute(
+                    f"SELECT uid FROM products WHERE uid IN ({placeholders}){clause}", params
+                )]
+                if found:
+                    conn.execute(f"DELETE FROM products WHERE uid IN ({placeholders}){clause}", params)
+        return found
+
+    async def start(self) -> None:
+        await storage_executor.run(self._execute, "SELECT 1")
+
+    def _close(self) -> None:
+        with self._lock:
+            if self._conn is not None:
+                self._conn.close()
+                self._conn = None
+                logger.info("تم إغلاق قاعدة بيانات SQLite")
+
+    async def close(self) -> None:
+        await storage_executor.run(self._close)
+
+    async def add_many(self, rows: List[list]) -> None:
+        if rows:
+            await storage_executor.run(self._insert, ensure_row_ids(rows))
+
+    async def list_recent(self, limit: int, chat_id: ChatId = None) -> List[Dict]:
+        if limit <= 0:
+            return []
+        if chat_id is None:
+            sql, params = f"SELECT {PRODUCT_COLUMNS} FROM products ORDER BY id DESC LIMIT ?", (limit,)
+        else:
+            sql = f"SELECT {PRODUCT_COLUMNS} FROM products WHERE {CHAT_FILTER} ORDER BY id DESC LIMIT ?"
+            params = (chat_key(chat_id), limit)
+        rows = await storage_executor.run(self._execute, sql, params)
+        return [_to_product(row) for row in rows]
+
+    async def query_by_date_range(self, start: date, end: date, chat_id: ChatId = None) -> List[Dict]:
+        clause, params = _chat_clause(chat_id)
+        rows = await storage_executor.run(
+            self._execute,
+            f"SELECT {PRODUCT_COLUMNS} FROM products WHERE date BETWEEN ? AND ?{clause} ORDER BY id DESC",
+            (date_key(start), date_key(end)) + params
+        )
+        return [_to_product(row) for row in rows]
+
+    async def iter_pages(
+        self, start: Optional[date] = None, end: Optional[date] = None, chat_id: ChatId = None,
+        page_size: int = PAGE_ROWS
+    ) -> AsyncIterator[List[Dict]]:
+        # تقسيم حسب المفتاح (id > آخر مفتاح) بدلاً من OFFSET حتى لا تعيد كل صفحة مسح ما قبلها
+        clause, params = _chat_clause(chat_id)
+        if start is not None:
+            clause, params = f"{clause} AND date >= ?", params + (date_key(start),)
+        if end is not None:
+            clause, params = f"{clause} AND date <= ?", params + (date_key(end),)
+        page_size = max(1, page_size)
+        last_id = 0
+        while True:
+            rows = await storage_executor.run(
+                self._execute,
+                f"SELECT {PRODUCT_COLUMNS} FROM products WHERE id > ?{clause} ORDER BY id LIMIT ?",
+                (last_id,) + params + (page_size,)
+            )
+            if not rows:
+                return
+            last_id = rows[-1][0]
+            yield [_to_product(row) for row in rows]
+
+    async def delete_many(self, ids: List[str], chat_id: ChatId = None) -> Tuple[int, list]:
+        valid = list(dict.fromkeys(product_id for product_id in ids if isinstance(product_id, str)))
+        found = set(await storage_executor.run(self._delete, valid, chat_id)) if valid else set()
+        failed = [product_id for product_id in ids if product_id not in found]
+        if found:
+            logger.info(f"[{self.name}] تم حذف {len(found)} منتج")
+        return len(found), failed
+
+    async def aggregate(
+        self, start: date, end: date, group_by: str = GROUP_BY_PRODUCT, chat_id: ChatId = None
+    ) -> List[Dict]:
+        clause, params = _chat_clause(chat_id)
+        if group_by == GROUP_BY_PRODUCT:
+            sql = (f"SELECT name, COUNT(*), SUM(price) FROM products WHERE date BETWEEN ? AND ?{clause} "
+                   "GROUP BY name ORDER BY SUM(price) DESC")
+        elif group_by == GROUP_BY_DAY:
+            sql = (f"SELECT date, COUNT(*), SUM(price) FROM products WHERE date BETWEEN ? AND ?{clause} "
+                   "GROUP BY date ORDER BY date")
+        else:
+            raise ValueError(f"نوع تجميع غير مدعوم: {group_by}")
+        rows = await storage_executor.run(self._execute, sql, (date_key(start), date_key(end)) + params)
+        return [{'key': key, 'count': count, 'total': total} for key, count, total in rows]
+
+    def get_stats(self) -> Dict[str, Any]:
+        return {'backend': self.name, 'path': self.path}
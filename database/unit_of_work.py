@@ -0,0 +1,159 @@
+"""
+دمج تعديلات العملية الواحدة في طلب batchUpdate واحد
+
+كل عملية كتابة يطلبها تحديث من تيليجرام (إضافة منتجات، حذف، إرسال دفعة مؤجلة) قد تحتاج عدة
+تعديلات على الجدول: إكمال رؤوس الأعمدة وتنسيقها، ثم إضافة الصفوف إلى ورقة شهر أو أكثر، أو
+مسح صفوف من عدة أوراق. داخل وحدة العمل لا تُرسل هذه التعديلات فور طلبها، بل تُجمع بالترتيب
+وتُرسل عند إغلاق الوحدة في طلب spreadsheets.batchUpdate واحد. Google تنفذ طلبات batchUpdate
+كلها أو لا شيء منها، فلا تصل عملية إلى الجدول نصف مكتملة.
+
+الوحدة تنتقل عبر contextvars إلى الدوال التي تستدعيها العملية (مثل فتح ورقة الشهر والتحقق من
+رؤوسها) دون تمريرها كمعطى. وحدة تُفتح داخل وحدة مفتوحة تنضم إليها، فترسل الوحدة الخارجية
+تعديلاتهما معاً.
+
+التعديل الذي يحتاج رده (مثل أرقام الصفوف المضافة لتحديث المرآة) يسجل دالة تُستدعى بعد الإرسال
+بردود طلباته. إذا كانت الوحدة تحمل تعديلاً واحداً له طريقة إرسال مباشرة (مثل values.append
+الذي يعيد النطاق المكتوب) يُرسل بها بدلاً من batchUpdate.
+"""
+import asyncio
+import logging
+import contextlib
+from contextvars import ContextVar
+from dataclasses import dataclass, field
+from typing import Any, Awaitable, Callable, Dict, List, Optional
+
+# إعداد التسجيل
+logger = logging.getLogger(__name__)
+
+# دالة تستقبل ردود طلبات التعديل بنفس ترتيبها
+ReplyHandler = Callable[[List[Dict[str, Any]]], Awaitable[None]]
+
+@dataclass
+class _Mutation:
+    """تعديل واحد: طلبات batchUpdate الخاصة به، ومعالج ردودها، وطريقة إرساله منفرداً"""
+    requests: List[Dict[str, Any]]
+    on_reply: Optional[ReplyHandler] = None
+    direct: Optional[Callable[[], Awaitable[Dict[str, Any]]]] = None
+
+@dataclass
+class UnitOfWork:
+    """
+    التعديلات المجمعة للعملية الحالية
+
+    الأقفال المسجلة بـ hold تُحجز أثناء الإرسال ومعالجة الردود (بترتيب أسمائها حتى لا تنتظر
+    وحدتان بعضهما)، مثل قفل المرآة الذي يمنع المزامنة من جلب صفوف ما زالت معلقة.
+    """
+    mutations: List[_Mutation] = field(default_factory=list)
+    locks: Dict[str, asyncio.Lock] = field(default_factory=dict)
+
+    def add(self, requests: List[Dict[str, Any]], on_reply: Optional[ReplyHandler] = None,
+            direct: Optional[Callable[[], Awaitable[Dict[str, Any]]]] = None) -> None:
+        """
+        إضافة تعديل إلى الوحدة
+
+        Args:
+            requests: طلبات batchUpdate للتعديل
+            on_reply: دالة async تُستدعى بعد الإرسال بردود هذه الطلبات
+            direct: دالة async ترسل التعديل منفرداً (تُستخدم إذا كان التعديل الوحيد في الوحدة)؛
+                ردها يُمرر إلى on_reply كقائمة من عنصر واحد
+        """
+        self.mutations.append(_Mutation(list(requests), on_reply, direct))
+
+    def hold(self, name: str, lock: asyncio.Lock) -> None:
+        """حجز قفل أثناء إرسال الوحدة"""
+        self.locks[name] = lock
+
+    @property
+    def request_count(self) -> int:
+        """عدد طلبات batchUpdate في الوحدة"""
+        return sum(len(mutation.requests) for mutation in self.mutations)
+
+# الوحدة المفتوحة في السياق الحالي
+_current_unit: ContextVar[Optional[UnitOfWork]] = ContextVar('sheets_unit_of_work', default=None)
+
+class UnitOfWorkStats:
+    """إحصاءات إرسال الوحدات للمراقبة"""
+
+    def __init__(self):
+        self.commits = 0
+        self.mutations = 0
+        self.requests = 0
+        self.failures = 0
+
+    def get_stats(self) -> dict:
+        return {
+            'commits': self.commits,
+            'mutations': self.mutations,
+            'requests': self.requests,
+            # الطلبات التي كانت سترسل منفردة لولا الدمج
+            'saved_round_trips': max(0, self.mutations - self.commits),
+            'failures': self.failures,
+        }
+
+@contextlib.asynccontextmanager
+async def unit_of_work(send: Callable[[List[Dict[str, Any]]], Awaitable[Dict[str, Any]]],
+                       stats: Optional[UnitOfWorkStats] = None, join: bool = True):
+    """
+    فتح وحدة عمل (أو الانضمام إلى الوحدة المفتوحة) وإرسالها عند الإغلاق
+
+    إذا رُفع استثناء داخل الوحدة لا يُرسل شيء منها. إذا فشل الإرسال يُرفع خطأ الإرسال ولا
+    تُستدعى معالجات الردود.
+
+    Args:
+        send: دالة async ترسل طلبات batchUpdate وتعيد ردها (بالمفتاح replies)
+        stats: إحصاءات الإرسال
+        join: الانضمام إلى الوحدة المفتوحة إن وجدت؛ العملية التي تحتاج نتيجة الإرسال قبل
+            أن تعود (مثل عدد الصفوف المحذوفة) تفتح وحدة مستقلة بـ join=False
+
+    Yields:
+        UnitOfWork: الوحدة
+    """
+    unit = _current_unit.get()
+    if join and unit is not None:
+        yield unit
+        return
+
+    unit = UnitOfWork()
+    token = _current_unit.set(unit)
+    try:
+        yield unit
+    finally:
+        _current_unit.reset(token)
+
+    if not unit.mutations:
+        return
+    try:
+        await _commit(unit, send)
+    except BaseException:
+        if stats is not None:
+            stats.failures += 1
+        raise
+    if stats is not None:
+        stats.commits += 1
+        stats.mutations += len(unit.mutations)
+        stats.requests += unit.request_count
+
+async def _commit(unit: UnitOfWork, send: Callable[[List[Dict[str, Any]]], Awaitable[Dict[str, Any]]]) -> None:
+    """إرسال تعديلات الوحدة في طلب واحد ثم تمرير الردود إلى معالجاتها"""
+    async with contextlib.AsyncExitStack() as stack:
+        for _, lock in sorted(unit.locks.items(), key=lambda item: item[0]):
+            await stack.enter_async_context(lock)
+
+        if len(unit.mutations) == 1 and unit.mutations[0].direct is not None:
+            mutation = unit.mutations[0]
+            replies = [[await mutation.direct()]]
+        else:
+            response = await send([request for mutation in unit.mutations for request in mutation.requests])
+            flat = response.get('replies', []) if isinstance(response, dict) else []
+            replies = []
+            offset = 0
+            for mutation in unit.mutations:
+                count = len(mutation.requests)
+                chunk = flat[offset:offset + count]
+                replies.append(chunk + [{}] * (count - len(chunk)))
+                offset += count
+            logger.debug(f"تم إرسال {len(unit.mutations)} تعديل في طلب batchUpdate واحد ({offset} طلب)")
+
+        for mutation, mutation_replies in zip(unit.mutations, replies):
+            if mutation.on_reply is not None:
+                await mutation.on_reply(mutation_replies)
@@ -0,0 +1,431 @@
+"""
+مخزن الكتابة المؤجلة (write-behind)
+
+كل إضافة منفردة كانت تكلف طلب append_row مستقلاً، مما يستهلك حصة الكتابة في Google Sheets
+بسرعة وقت الذروة. هذا الملف يجمع الصفوف من جميع المحادثات ويرسلها دفعة واحدة عبر
+append_rows عند بلوغ عدد معين من الصفوف أو عمر معين لأقدم صف.
+
+قبل تأكيد الإضافة للمستخدم يُكتب الصف في سجل محلي (JSONL) مع fsync، لذلك لا تضيع الصفوف
+المعلقة إذا توقف البوت قبل إرسالها؛ يُعاد تحميلها من السجل عند التشغيل التالي.
+
+السجل طابور دائم يُكتب في نهايته فقط: كل صف يُسجل مع وقت إضافته، وبعد نجاح إرسال دفعة يُضاف
+سطر تأكيد بعدد صفوفها بدلاً من إعادة كتابة الملف. يُعاد بناء الملف بالصفوف المتبقية فقط عند
+فراغ الطابور أو بعد تأكيد WRITE_BUFFER_COMPACT_ROWS صف.
+
+أثناء انقطاع Google Sheets تبقى الصفوف في الطابور (لا يُرفض الإدخال بسبب امتلائه) وتُعاد
+المحاولة بفترات متزايدة حتى WRITE_BUFFER_RETRY_MAX_DELAY، ثم تُرسل بالترتيب على دفعات بحجم
+WRITE_BUFFER_REPLAY_BATCH عند عودة الخدمة. الصفوف المحملة من السجل عند التشغيل ربما وصلت
+إلى الورقة قبل التوقف دون تسجيل تأكيدها، وكذلك دفعة فشل إرسالها (ربما وصل الطلب وضاع الرد)،
+لذلك تمر بدالة التحقق (verify_func) قبل إرسالها مرة أخرى حتى لا تتكرر. عمر أقدم صف معلق
+(oldest_age) هو تأخر الإرسال الحالي.
+
+الإعدادات (عبر المتغيرات البيئية):
+    WRITE_BUFFER_ENABLED: تفعيل الكتابة المؤجلة (افتراضي: 1)
+    WRITE_BUFFER_MAX_ROWS: عدد الصفوف الذي يفرض الإرسال فوراً (افتراضي: 20)
+    WRITE_BUFFER_MAX_AGE: أقصى عمر لصف معلق بالثواني قبل الإرسال (افتراضي: 2)
+    WRITE_BUFFER_MAX_PENDING: أقصى عدد صفوف معلقة قبل إبطاء الإضافات (افتراضي: 1000)
+    WRITE_BUFFER_BACKPRESSURE_TIMEOUT: مدة انتظار الإضافة عند امتلاء المخزن (افتراضي: 10)
+    WRITE_BUFFER_DRAIN_TIMEOUT: مهلة تفريغ المخزن عند الإغلاق (افتراضي: 15)
+    WRITE_BUFFER_REPLAY_BATCH: أقصى عدد صفوف في كل طلب إرسال (افتراضي: 500)
+    WRITE_BUFFER_RETRY_MAX_DELAY: أقصى فترة بين محاولات الإرسال أثناء الانقطاع (افتراضي: 60)
+"""
+import os
+import json
+import asyncio
+import logging
+import threading
+import time
+from typing import Awaitable, Callable, List, Optional
+
+from database.executor import storage_executor
+
+# إعداد التسجيل
+logger = logging.getLogger(__name__)
+
+# تفعيل الكتابة المؤجلة
+WRITE_BUFFER_ENABLED = os.getenv("WRITE_BUFFER_ENABLED", "1") not in ("0", "false", "False", "")
+# عدد الصفوف الذي يفرض الإرسال فوراً
+WRITE_BUFFER_MAX_ROWS = int(os.getenv("WRITE_BUFFER_MAX_ROWS", "20"))
+# أقصى عمر لصف معلق قبل الإرسال (بالثواني)
+WRITE_BUFFER_MAX_AGE = float(os.getenv("WRITE_BUFFER_MAX_AGE", "2"))
+# أقصى عدد صفوف معلقة قبل إبطاء الإضافات الجديدة
+WRITE_BUFFER_MAX_PENDING = int(os.getenv("WRITE_BUFFER_MAX_PENDING", "1000"))
+# مدة انتظار الإضافة عند امتلاء المخزن (بالثواني)
+WRITE_BUFFER_BACKPRESSURE_TIMEOUT = float(os.getenv("WRITE_BUFFER_BACKPRESSURE_TIMEOUT", "10"))
+# مهلة تفريغ المخزن عند الإغلاق (بالثواني)
+WRITE_BUFFER_DRAIN_TIMEOUT = float(os.getenv("WRITE_BUFFER_DRAIN_TIMEOUT", "15"))
+# أقصى عدد صفوف في كل طلب إرسال (الطابور الطويل بعد انقطاع يُرسل على عدة دفعات)
+WRITE_BUFFER_REPLAY_BATCH = int(os.getenv("WRITE_BUFFER_REPLAY_BATCH", "500"))
+# فترة الانتظار بعد أول فشل في الإرسال (تتضاعف مع كل فشل متتالٍ)
+WRITE_BUFFER_RETRY_DELAY = 5.0
+# أقصى فترة بين محاولات الإرسال أثناء الانقطاع (بالثواني)
+WRITE_BUFFER_RETRY_MAX_DELAY = float(os.getenv("WRITE_BUFFER_RETRY_MAX_DELAY", "60"))
+# عدد الصفوف المؤكدة الذي يُعاد بعده بناء ملف السجل بالصفوف المتبقية فقط
+WRITE_BUFFER_COMPACT_ROWS = 1000
+
+class BufferFullError(Exception):
+    """يُرفع عندما يبقى المخزن ممتلئاً بعد انتهاء مهلة الانتظار"""
+    pass
+
+class AppendBuffer:
+    """
+    مخزن مؤقت للصفوف المعلقة مع سجل محلي دائم
+
+    Args:
+        flush_func: دالة async تستقبل قائمة صفوف وترسلها في طلب واحد (ترفع استثناء عند الفشل)
+        journal_path: مسار ملف السجل المحلي
+        verify_func: دالة async تستقبل صفوفاً ربما وصلت من قبل (محملة من السجل أو فشل
+            إرسالها) وتعيد منها ما لم يصل بعد (None = إرسالها كما هي)
+    """
+
+    def __init__(
+        self,
+        flush_func: Callable[[List[list]], Awaitable[None]],
+        journal_path: str,
+        max_rows: int = WRITE_BUFFER_MAX_ROWS,
+        max_age: float = WRITE_BUFFER_MAX_AGE,
+        max_pending: int = WRITE_BUFFER_MAX_PENDING,
+        backpressure_timeout: float = WRITE_BUFFER_BACKPRESSURE_TIMEOUT,
+        verify_func: Optional[Callable[[List[list]], Awaitable[List[list]]]] = None,
+        replay_batch: int = WRITE_BUFFER_REPLAY_BATCH,
+    ):
+        self.flush_func = flush_func
+        self.journal_path = journal_path
+        self.verify_func = verify_func
+        self.max_rows = max(1, max_rows)
+        self.max_age = max_age
+        self.max_pending = max(self.max_rows, max_pending)
+        self.backpressure_timeout = backpressure_timeout
+        self.replay_batch = max(1, replay_batch)
+
+        # الصفوف المعلقة وأوقات إضافتها (time.time، تُحفظ في السجل) محمية بقفل لأن السجل يُكتب
+        # من خيوط المنفذ
+        self._pending: List[list] = []
+        self._pending_times: List[float] = []
+        self._lock = threading.Lock()
+        # عدد الصفوف في أول الطابور التي يجب التحقق منها قبل إرسالها (المحملة من السجل أو
+        # التي ربما وصلت في محاولة فاشلة)
+        self._recovered = 0
+        # الصفوف المؤكدة في السجل منذ آخر إعادة بناء له
+        self._acked_since_compact = 0
+        # عدد محاولات الإرسال الفاشلة المتتالية (0 = الخدمة تعمل)
+        self._consecutive_failures = 0
+        self._last_error: Optional[str] = None
+
+        self._flush_lock: Optional[asyncio.Lock] = None
+        self._wakeup: Optional[asyncio.Event] = None
+        self._space: Optional[asyncio.Event] = None
+        self._task: Optional[asyncio.Task] = None
+        self._closed = False
+
+        # الإحصاءات
+        self._flushes = 0
+        self._flushed_rows = 0
+        self._failed_flushes = 0
+        self._skipped_rows = 0
+        self._last_flush: Optional[float] = None
+
+        self._load_journal()
+
+    # ------------------------------------------------------------------
+    # السجل المحلي
+    # ------------------------------------------------------------------
+    def _load_journal(self) -> None:
+        """تحميل الصفوف التي لم تُرسل من السجل عند التشغيل"""
+        if not os.path.exists(self.journal_path):
+            return
+        try:
+            with open(self.journal_path, 'r', encoding='utf-8') as f:
+                for line in f:
+                    line = line.strip()
+                    if not line:
+                        continue
+                    try:
+                        entry = json.loads(line)
+                    except json.JSONDecodeError:
+                        # سطر مقطوع بسبب توقف مفاجئ أثناء الكتابة
+                        logger.warning(f"تجاهل سطر تالف في سجل الكتابة المؤجلة: {line[:50]}")
+                        continue
+                    if isinstance(entry, list):
+                        # صيغة السجل القديمة: الصف وحده بدون وقت الإضافة
+                        self._pending.append(entry)
+                        self._pending_times.append(time.time())
+                    elif 'ack' in entry:
+                        del self._pending[:entry['ack']]
+                        del self._pending_times[:entry['ack']]
+                    else:
+                        self._pending.append(entry['row'])
+                        self._pending_times.append(entry.get('t', time.time()))
+            self._recovered = len(self._pending)
+            if self._pending:
+                logger.info(f"تم تحميل {len(self._pending)} صف معلق من سجل الكتابة المؤجلة")
+        except Exception as e:
+            logger.error(f"فشل في قراءة سجل الكتابة المؤجلة: {str(e)}")
+
+    def _write_lines(self, mode: str, lines: List[str]) -> None:
+        """كتابة أسطر في ملف السجل مع fsync"""
+        with open(self.journal_path, mode, encoding='utf-8') as f:
+            f.writelines(lines)
+            f.flush()
+            os.fsync(f.fileno())
+
+    def _journal_append(self, rows: List[list], unverified: bool = False) -> None:
+        """كتابة الصفوف في السجل مع fsync ثم إضافتها للطابور (يعمل في خيط المنفذ)"""
+        with self._lock:
+            now = time.time()
+            self._write_lines('a', [
+                json.dumps({'t': now, 'row': row}, ensure_ascii=False) + "\n" for row in rows
+            ])
+            self._pending.extend(rows)
+            self._pending_times.extend([now] * len(rows))
+            if unverified:
+                # التحقق يقرأ عمود المعرف مرة واحدة لكل قسم مهما كان عدد الصفوف
+                self._recovered = len(self._pending)
+
+    def _journal_commit(self, count: int) -> None:
+        """
+        إزالة الصفوف المرسلة من أول الطابور وتسجيل تأكيدها (يعمل في خيط المنفذ)
+
+        يُضاف سطر تأكيد في نهاية السجل، ويُعاد بناء الملف بالصفوف المتبقية فقط إذا فرغ الطابور
+        أو تراكمت التأكيدات.
+        """
+        with self._lock:
+            del self._pending[:count]
+            del self._pending_times[:count]
+            self._acked_since_compact += count
+            if self._pending and self._acked_since_compact < WRITE_BUFFER_COMPACT_ROWS:
+                self._write_lines('a', [json.dumps({'ack': count}) + "\n"])
+                return
+            tmp_path = self.journal_path + ".tmp"
+            with open(tmp_path, 'w', encoding='utf-8') as f:
+                for row, added in zip(self._pending, self._pending_times):
+                    f.write(json.dumps({'t': added, 'row': row}, ensure_ascii=False) + "\n")
+                f.flush()
+                os.fsync(f.fileno())
+            os.replace(tmp_path, self.journal_path)
+            self._acked_since_compact = 0
+
+    # ------------------------------------------------------------------
+    # الواجهة العامة
+    # ------------------------------------------------------------------
+    @property
+    def pending_count(self) -> int:
+        """عدد الصفوف المعلقة"""
+        with self._lock:
+            return len(self._pending)
+
+    def pending_rows(self) -> List[list]:
+        """نسخة من الصفوف المعلقة بترتيب إرسالها (للقراءة فقط)"""
+        with self._lock:
+            return [list(row) for row in self._pending]
+
+    @property
+    def failing(self) -> bool:
+        """هل فشلت آخر محاولة إرسال (انقطاع ما زال مستمراً)؟"""
+        return self._consecutive_failures > 0
+
+    def _oldest_age(self) -> float:
+        """عمر أقدم صف معلق بالثواني (تأخر الإرسال الحالي)"""
+        with self._lock:
+            if not self._pending_times:
+                return 0.0
+            return max(0.0, time.time() - self._pending_times[0])
+
+    def _ensure_primitives(self) -> None:
+        """إنشاء أدوات التزامن داخل حلقة الأحداث الحالية"""
+        if self._flush_lock is None:
+            self._flush_lock = asyncio.Lock()
+            self._wakeup = asyncio.Event()
+            self._space = asyncio.Event()
+            self._space.set()
+
+    def _ensure_started(self) -> None:
+        """تشغيل مهمة الإرسال في الخلفية داخل حلقة الأحداث الحالية"""
+        self._ensure_primitives()
+        if self._task is None or self._task.done():
+            self._closed = False
+            self._task = asyncio.get_running_loop().create_task(self._flush_loop())
+
+    def start(self) -> None:
+        """بدء مهمة الإرسال (لإرسال الصفوف المحملة من السجل دون انتظار إضافة جديدة)"""
+        self._ensure_started()
+        if self.pending_count:
+            self._wakeup.set()
+
+    async def append(self, rows: List[list], unverified: bool = False) -> None:
+        """
+        إضافة صفوف إلى المخزن بعد كتابتها في السجل المحلي
+
+        عند عودة هذه الدالة تكون الصفوف محفوظة محلياً ويمكن تأكيد الإضافة للمستخدم.
+
+        Args:
+            rows: الصفوف
+            unverified: ربما وصلت الصفوف بالفعل (فشل إرسالها مباشرة بعد بدء الطلب)، فتمر
+                بدالة التحقق قبل إرسالها
+
+        Raises:
+            BufferFullError: إذا بقي المخزن ممتلئاً طوال مهلة الانتظار
+        """
+        if not rows:
+            return
+        self._ensure_started()
+
+        # إبطاء الإضافات عند امتلاء المخزن حتى يتم الإرسال (الدفعة الأكبر من الحد تُقبل في
+        # مخزن فارغ). أثناء الانقطاع لا فائدة من الانتظار، فتُحفظ الصفوف في الطابور مباشرة
+        deadline = time.monotonic() + self.backpressure_timeout
+        while not self.failing and self.pending_count and self.pending_count + len(rows) > self.max_pending:
+            self._space.clear()
+            self._wakeup.set()
+            remaining = deadline - time.monotonic()
+            if remaining <= 0:
+                raise BufferFullError(f"مخزن الكتابة ممتلئ ({self.pending_count} صف معلق)")
+            try:
+                await asyncio.wait_for(self._space.wait(), remaining)
+            except asyncio.TimeoutError:
+                pass
+
+        was_empty = self.pending_count == 0
+        await storage_executor.run(self._journal_append, rows, unverified)
+
+        # إيقاظ المهمة عند بلوغ حد العدد، أو عند أول صف حتى تبدأ حساب عمر الدفعة
+        if was_empty or self.pending_count >= self.max_rows:
+            self._wakeup.set()
+
+    async def flush(self) -> int:
+        """
+        إرسال جميع الصفوف المعلقة الآن بالترتيب، على دفعات بحجم replay_batch
+
+        Returns:
+            int: عدد الصفوف المرسلة
+
+        Raises:
+            أي استثناء ترفعه دالة الإرسال أو التحقق (تبقى الصفوف في الطابور)
+        """
+        self._ensure_primitives()
+        sent = 0
+        async with self._flush_lock:
+            while True:
+                with self._lock:
+                    batch = self._pending[:self.replay_batch]
+                    recovered = min(self._recovered, len(batch))
+                if not batch:
+                    break
+                try:
+                    rows = batch
+                    if recovered and self.verify_func is not None:
+                        # صفوف من التشغيل السابق ربما وصلت قبل تسجيل تأكيدها
+                        rows = await self.verify_func(batch[:recovered]) + batch[recovered:]
+                        self._skipped_rows += len(batch) - len(rows)
+                    if rows:
+                        await self.flush_func(rows)
+                except Exception as e:
+                    # ربما وصل الطلب وضاع الرد؛ تُتحقق الدفعة قبل إعادة إرسالها
+                    self._recovered = max(self._recovered, len(batch))
+                    self._failed_flushes += 1
+                    self._consecutive_failures += 1
+                    self._last_error = str(e)
+                    raise
+                await storage_executor.run(self._journal_commit, len(batch))
+                self._recovered -= recovered
+                self._consecutive_failures = 0
+                self._last_error = None
+                self._last_flush = time.time()
+                self._flushes += 1
+                self._flushed_rows += len(rows)
+                sent += len(rows)
+                logger.info(f"تم إرسال {len(rows)} صف مؤجل دفعة واحدة (بقي {self.pending_count})")
+                self._space.set()
+        return sent
+
+    async def _flush_loop(self) -> None:
+        """مهمة الخلفية: الإرسال عند بلوغ حد العدد أو العمر"""
+        while not self._closed:
+            pending = self.pending_count
+            if pending:
+                timeout = max(0.05, self.max_age - self._oldest_age())
+            else:
+                timeout = None
+            try:
+                await asyncio.wait_for(self._wakeup.wait(), timeout)
+            except asyncio.TimeoutError:
+                pass
+            self._wakeup.clear()
+            if self._closed:
+                break
+
+            pending = self.pending_count
+            if not pending:
+                continue
+            if pending < self.max_rows and self._oldest_age() < self.max_age and self._space.is_set():
+                continue
+
+            try:
+                await self.flush()
+            except Exception as e:
+                delay = min(
+                    WRITE_BUFFER_RETRY_MAX_DELAY,
+                    WRITE_BUFFER_RETRY_DELAY * 2 ** min(self._consecutive_failures - 1, 16)
+                )
+                logger.error(
+                    f"فشل إرسال الصفوف المؤجلة ({self.pending_count} صف معلق منذ {self._oldest_age():.0f} ثانية)، "
+                    f"المحاولة التالية بعد {delay:.0f} ثانية: {str(e)}"
+                )
+                # الانتظار قبل المحاولة التالية؛ الإضافات الجديدة لا تقطعه (تنتظر في الطابور)
+                # بخلاف الإغلاق
+                deadline = time.monotonic() + delay
+                while not self._closed:
+                    remaining = deadline - time.monotonic()
+                    if remaining <= 0:
+                        break
+                    try:
+                        await asyncio.wait_for(self._wakeup.wait(), remaining)
+                    except asyncio.TimeoutError:
+                        pass
+                    self._wakeup.clear()
+
+    async def drain(self, timeout: float = WRITE_BUFFER_DRAIN_TIMEOUT) -> int:
+        """
+        تفريغ المخزن عند الإغلاق
+
+        الصفوف التي لم يمكن إرسالها خلال المهلة تبقى في السجل وتُرسل عند التشغيل التالي.
+
+        Returns:
+            int: عدد الصفوف المتبقية في السجل
+        """
+        self._closed = True
+        if self._task is not None and not self._task.done():
+            # ننتظر انتهاء أي إرسال جارٍ بدلاً من قطعه في منتصف الطلب
+            self._wakeup.set()
+            try:
+                await asyncio.wait_for(asyncio.shield(self._task), timeout)
+            except (asyncio.TimeoutError, Exception):
+                self._task.cancel()
+        self._task = None
+
+        if self.pending_count:
+            self._ensure_primitives()
+            try:
+                await asyncio.wait_for(self.flush(), timeout)
+            except Exception as e:
+                logger.error(f"تعذر تفريغ مخزن الكتابة عند الإغلاق: {str(e)}")
+
+        remaining = self.pending_count
+        if remaining:
+            logger.warning(f"بقي {remaining} صف في سجل الكتابة المؤجلة وسيتم إرسالها عند التشغيل التالي")
+        return remaining
+
+    def get_stats(self) -> dict:
+        """إحصاءات المخزن للمراقبة"""
+        return {
+            'pending': self.pending_count,
+            'oldest_age': round(self._oldest_age(), 3),
+            'recovered': self._recovered,
+            'failing': self.failing,
+            'consecutive_failures': self._consecutive_failures,
+            'last_error': self._last_error,
+            'last_flush_age': round(time.time() - self._last_flush, 3) if self._last_flush is not None else None,
+            'flushes': self._flushes,
+            'flushed_rows': self._flushed_rows,
+            'skipped_rows': self._skipped_rows,
+            'failed_flushes': self._failed_flushes,
+        }
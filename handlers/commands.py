@@ -1,11 +1,16 @@
 """
 معالجات الأوامر
 """
+import os
 import logging
+import tempfile
+from typing import Optional
 from telegram import Update, ReplyKeyboardMarkup, InlineKeyboardButton, InlineKeyboardMarkup
 from telegram.ext import ContextTypes, ConversationHandler
 from src.config import WELCOME_MESSAGE as welcome_message
-from database.sheets import add_to_sheets, get_products
+from database.sheets import add_to_sheets, get_products, get_products_by_date_range, get_day_total
+from database.idempotency import update_write_key
+from database.export import export_products, parse_export_date, ExportError, EXPORT_FORMATS, FORMAT_CSV
 from datetime import datetime
 import traceback
 
@@ -24,6 +29,9 @@ NOTES = 2
 DELETE_SELECTION = 3
 DELETE_CONFIRM = 4
 
+# أقصى حجم للملفات التي يرسلها البوت (حد Telegram Bot API)
+MAX_DOCUMENT_SIZE = 50 * 1024 * 1024
+
 # لوحة المفاتيح الرئيسية
 MAIN_KEYBOARD = [
     ["❌ إلغاء العملية"]
@@ -56,6 +64,7 @@ async def help_command(update: Update, context: ContextTypes.DEFAULT_TYPE) -> No
 /cancel - إلغاء العملية الحالية
 /help - عرض هذه المساعدة
 /last - عرض آخر المنتجات المضافة
+/export - تصدير المشتريات إلى ملف (مثال: <code>/export 2024-01-01 2024-12-31 قهوة</code>)
 
 <b>طرق إضافة المنتجات:</b>
 - <code>كولا 23</code> (منتج ثم سعر)
@@ -82,7 +91,7 @@ async def last_products_command(update: Update, context: ContextTypes.DEFAULT_TY
     """معالج أمر عرض آخر المنتجات المضافة"""
     try:
         # الحصول على آخر 10 منتجات
-        products = await get_products(10)
+        products = await get_products(10, chat_id=update.effective_chat.id)
         
         if not products:
             await update.message.reply_text("لا توجد منتجات مضافة حتى الآن.")
@@ -119,7 +128,7 @@ async def skip_command(update: Update, context: ContextTypes.DEFAULT_TYPE) -> in
             
             logger.debug(f"تخطي الملاحظات للمنتج: {product} بسعر {price}")
             
-            await add_to_sheets(product, price, '')
+            await add_to_sheets(product, price, '', chat_id=update.effective_chat.id, idempotency_key=update_write_key(update))
             
             # إنشاء لوحة المفاتيح
             reply_markup = ReplyKeyboardMarkup(
@@ -256,7 +265,7 @@ async def handle_notes(update: Update, context: ContextTypes.DEFAULT_TYPE) -> in
     price = context.user_data['price']
     
     try:
-        await add_to_sheets(product, price, notes)
+        await add_to_sheets(product, price, notes, chat_id=update.effective_chat.id, idempotency_key=update_write_key(update))
         
         # إنشاء لوحة المفاتيح
         reply_markup = ReplyKeyboardMarkup(
@@ -284,6 +293,32 @@ async def handle_notes(update: Update, context: ContextTypes.DEFAULT_TYPE) -> in
         await update.message.reply_text(f"❌ حدث خطأ: {str(e)}")
         return ConversationHandler.END
 
+def _sum_prices(products: list) -> float:
+    """مجموع أسعار قائمة منتجات (الأسعار غير الصالحة تُتجاهل)"""
+    total = 0
+    for product in products:
+        price = product.get('price', 0)
+        try:
+            total += float(price)
+        except (ValueError, TypeError):
+            logger.warning(f"قيمة سعر غير صالحة: {price}")
+    return total
+
+def _today_total(chat_id, products: Optional[list] = None) -> Optional[float]:
+    """
+    مجموع مشتريات اليوم للمحادثة
+    
+    يُقرأ من المجاميع المحدثة تدريجياً دون الرجوع إلى قاعدة البيانات. إذا لم تُبن المجاميع بعد
+    (أو كانت المنتجات المعروضة أمثلة الوضع التجريبي غير المحفوظة) تُجمع أسعار المنتجات المعروضة.
+    
+    Returns:
+        float: المجموع، أو None إذا لم تتوفر المجاميع ولا المنتجات
+    """
+    summary = get_day_total(datetime.now().date(), chat_id)
+    if summary is not None and (summary.count or not products):
+        return summary.total
+    return _sum_prices(products) if products is not None else None
+
 async def today_products_command(update: Update, context: ContextTypes.DEFAULT_TYPE) -> None:
     """عرض المنتجات المسجلة اليوم"""
     try:
@@ -299,15 +334,9 @@ async def today_products_command(update: Update, context: ContextTypes.DEFAULT_T
         # تسجيل هذا الطلب
         context.bot_data[request_key] = True
         
-        # الحصول على المنتجات من قاعدة البيانات
-        products = await get_products()
-        
-        # تصفية المنتجات المسجلة اليوم
-        today = datetime.now().strftime("%Y/%m/%d")
-        today_products = [
-            p for p in products 
-            if p.get('date', '').startswith(today)
-        ]
+        # الحصول على منتجات اليوم فقط من قاعدة البيانات (بدون حد لعددها)
+        today = datetime.now().date()
+        today_products = await get_products_by_date_range(today, today, chat_id=update.effective_chat.id)
         
         if not today_products:
             await update.message.reply_text("لا توجد منتجات مسجلة اليوم.")
@@ -318,7 +347,6 @@ async def today_products_command(update: Update, context: ContextTypes.DEFAULT_T
             
         # تنسيق الرسالة
         message = "📊 المنتجات المسجلة اليوم:\n\n"
-        total = 0
         
         for i, product in enumerate(today_products, 1):
             product_name = product.get('name') or product.get('product', 'غير معروف')
@@ -329,9 +357,8 @@ async def today_products_command(update: Update, context: ContextTypes.DEFAULT_T
             if notes:
                 message += f" ({notes})"
             message += "\n"
-            total += float(price)
             
-        message += f"\n💰 المجموع: {total}"
+        message += f"\n💰 المجموع: {_today_total(update.effective_chat.id, today_products)}"
         
         # إنشاء أزرار التحكم بشكل أبسط
         keyboard = [
@@ -371,7 +398,7 @@ async def last_ten_command(update: Update, context: ContextTypes.DEFAULT_TYPE) -
     # استدعاء الدالة الفعلية مباشرة دون إعادة استدعاء last_ten_operations_command
     try:
         # الحصول على المنتجات من قاعدة البيانات
-        products = await get_products(10)
+        products = await get_products(10, chat_id=update.effective_chat.id)
         
         if not products:
             await update.message.reply_text("لا توجد عمليات مسجلة.")
@@ -450,7 +477,7 @@ async def handle_callback_query(update: Update, context: ContextTypes.DEFAULT_TY
             price = context.user_data['price']
             
             try:
-                await add_to_sheets(product, price, '')
+                await add_to_sheets(product, price, '', chat_id=update.effective_chat.id, idempotency_key=update_write_key(update))
                 
                 # إنشاء لوحة المفاتيح
                 reply_markup = ReplyKeyboardMarkup(
@@ -475,14 +502,9 @@ async def handle_callback_query(update: Update, context: ContextTypes.DEFAULT_TY
     elif query.data == "delete_today":
         logger.info("تنفيذ إجراء delete_today")
         try:
-            # إعادة جلب المنتجات للتأكد من أحدث البيانات
-            products = await get_products()
-            # تصفية منتجات اليوم
-            today = datetime.now().strftime("%Y/%m/%d")
-            today_products = [
-                p for p in products 
-                if p.get('date', '').startswith(today)
-            ]
+            # إعادة جلب منتجات اليوم للتأكد من أحدث البيانات
+            today = datetime.now().date()
+            today_products = await get_products_by_date_range(today, today, chat_id=update.effective_chat.id)
             
             # تحديث القائمة المخزنة
             context.user_data['today_products'] = today_products
@@ -516,7 +538,7 @@ async def handle_callback_query(update: Update, context: ContextTypes.DEFAULT_TY
         logger.info("تنفيذ إجراء delete_last10")
         try:
             # إعادة جلب آخر المنتجات للتأكد من أحدث البيانات
-            products = await get_products(10)
+            products = await get_products(10, chat_id=update.effective_chat.id)
             
             # ترتيب المنتجات حسب التاريخ
             try:
@@ -559,10 +581,9 @@ async def handle_callback_query(update: Update, context: ContextTypes.DEFAULT_TY
     # التعامل مع أزرار عرض المجموع
     elif query.data == "total_today":
         logger.info("تنفيذ إجراء total_today")
-        # عرض مجموع منتجات اليوم
-        if 'today_products' in context.user_data:
-            products = context.user_data['today_products']
-            total = sum(float(p.get('price', 0)) for p in products)
+        # عرض مجموع منتجات اليوم من المجاميع المحدثة تدريجياً (بدون جلب المنتجات)
+        total = _today_total(update.effective_chat.id, context.user_data.get('today_products'))
+        if total is not None:
             await query.message.reply_text(f"💰 مجموع منتجات اليوم: {total}")
         else:
             await query.message.reply_text("⚠️ لا توجد منتجات معروضة. الرجاء عرض المنتجات أولاً.")
@@ -572,7 +593,7 @@ async def handle_callback_query(update: Update, context: ContextTypes.DEFAULT_TY
         # عرض مجموع آخر 10 منتجات
         if 'last10_products' in context.user_data:
             products = context.user_data['last10_products']
-            total = sum(float(p.get('price', 0)) for p in products)
+            total = _sum_prices(products)
             await query.message.reply_text(f"💰 مجموع آخر 10 منتجات: {total}")
         else:
             await query.message.reply_text("⚠️ لا توجد منتجات معروضة. الرجاء عرض المنتجات أولاً.")
@@ -672,19 +693,15 @@ async def handle_delete_selection(update: Update, context: ContextTypes.DEFAULT_
         # تحديث قائمة المنتجات قبل عملية الحذف
         if delete_type == 'today':
             # إعادة جلب منتجات اليوم
-            all_products = await get_products()
-            today = datetime.now().strftime("%Y/%m/%d")
-            logger.debug(f"تصفية المنتجات لليوم: {today}")
-            today_products = [
-                p for p in all_products 
-                if p.get('date', '').startswith(today)
-            ]
+            today = datetime.now().date()
+            logger.debug(f"جلب منتجات اليوم: {today}")
+            today_products = await get_products_by_date_range(today, today, chat_id=update.effective_chat.id)
             context.user_data['today_products'] = today_products
             products = today_products
             logger.debug(f"تم تحديث منتجات اليوم، العدد: {len(products)}")
         elif delete_type == 'last10':
             # إعادة جلب آخر 10 منتجات
-            products = await get_products(10)
+            products = await get_products(10, chat_id=update.effective_chat.id)
             context.user_data['last10_products'] = products
             logger.debug(f"تم تحديث آخر 10 منتجات، العدد: {len(products)}")
         else:
@@ -695,7 +712,7 @@ async def handle_delete_selection(update: Update, context: ContextTypes.DEFAULT_
         # المخرجات التفصيلية للمساعدة في تشخيص المشكلة
         logger.info(f"عدد المنتجات المتاحة: {len(products)}")
         for i, p in enumerate(products):
-            logger.debug(f"المنتج {i+1}: {p.get('name')} - {p.get('price')} - sheet_row={p.get('sheet_row')}")
+            logger.debug(f"المنتج {i+1}: {p.get('name')} - {p.get('price')} - id={p.get('id')} - sheet_row={p.get('sheet_row')}")
         
         # التحقق من صحة الفهارس
         valid_indices = []
@@ -705,12 +722,12 @@ async def handle_delete_selection(update: Update, context: ContextTypes.DEFAULT_
         for i in indices:
             if 0 <= i < len(products):
                 product = products[i]
-                # التأكد من وجود رقم الصف الفعلي للمنتج
-                if 'sheet_row' in product and product['sheet_row'] is not None:
+                # التأكد من وجود معرف المنتج (المنتجات التجريبية ليس لها معرف)
+                if product.get('id'):
                     valid_indices.append(i)
                     selected_products.append(product)
                 else:
-                    logger.warning(f"منتج بدون رقم صف معروف في الفهرس {i}: {product}")
+                    logger.warning(f"منتج بدون معرف في الفهرس {i}: {product}")
                     invalid_indices.append(i + 1)  # تحويل إلى 1-based للعرض
             else:
                 logger.warning(f"فهرس خارج النطاق: {i}, الحد الأقصى: {len(products)-1}")
@@ -735,8 +752,8 @@ async def handle_delete_selection(update: Update, context: ContextTypes.DEFAULT_
         for product in selected_products:
             name = product.get('name') or product.get('product', 'غير معروف')
             price = product.get('price', 'غير معروف')
-            sheet_row = product.get('sheet_row', 'غير معروف')
-            message += f"- {name} - {price} (صف {sheet_row})\n"
+            sheet_row = product.get('sheet_row')
+            message += f"- {name} - {price}" + (f" (صف {sheet_row})" if sheet_row else "") + "\n"
             products_to_delete.append(product)
         
         # تخزين المنتجات المراد حذفها
@@ -803,33 +820,33 @@ async def handle_delete_confirm(update: Update, context: ContextTypes.DEFAULT_TY
                         del context.user_data[key]
                 return ConversationHandler.END
                 
-            # استخراج أرقام الصفوف الفعلية من المنتجات
-            rows_to_delete = []
+            # استخراج معرفات المنتجات (ثابتة حتى لو تحركت الصفوف بعد عرضها)
+            ids_to_delete = []
             products_info = []
             
             # تسجيل محتوى الـمنتجات المراد حذفها للتحقق
             logger.debug(f"المنتجات المراد حذفها: {products_to_delete}")
             
             for product in products_to_delete:
-                if 'sheet_row' in product and product['sheet_row'] is not None:
-                    sheet_row = product['sheet_row']
-                    rows_to_delete.append(sheet_row)
-                    products_info.append(f"{product.get('name', 'غير معروف')} (صف {sheet_row})")
-                    logger.info(f"إضافة المنتج للحذف: {product.get('name')} - صف {sheet_row}")
+                product_id = product.get('id')
+                if product_id:
+                    ids_to_delete.append(product_id)
+                    products_info.append(f"{product.get('name', 'غير معروف')} ({product_id})")
+                    logger.info(f"إضافة المنتج للحذف: {product.get('name')} - معرف {product_id}")
                 else:
-                    logger.warning(f"منتج بدون sheet_row أو قيمة sheet_row فارغة: {product}")
+                    logger.warning(f"منتج بدون معرف: {product}")
             
-            if not rows_to_delete:
-                logger.error("لا توجد أرقام صفوف صالحة للحذف")
-                await query.message.reply_text("⚠️ لم يتم تحديد أي أرقام صفوف صالحة للحذف.")
+            if not ids_to_delete:
+                logger.error("لا توجد معرفات صالحة للحذف")
+                await query.message.reply_text("⚠️ لم يتم تحديد أي منتجات صالحة للحذف.")
                 return ConversationHandler.END
                 
             # تنفيذ عملية الحذف
-            logger.info(f"جاري إرسال أمر حذف الصفوف: {rows_to_delete}")
+            logger.info(f"جاري إرسال أمر حذف المنتجات: {ids_to_delete}")
             await query.message.reply_text("⏳ جاري حذف المنتجات...")
             
             # استدعاء دالة الحذف من sheets.py
-            success_count, failed_indices = await delete_products(rows_to_delete)
+            success_count, failed_indices = await delete_products(ids_to_delete, chat_id=update.effective_chat.id)
             
             logger.info(f"نتيجة الحذف: {success_count} منتج تم حذفه بنجاح، {len(failed_indices)} منتج فشل")
             
@@ -889,15 +906,9 @@ async def today_command(update: Update, context: ContextTypes.DEFAULT_TYPE) -> N
     
     # تنفيذ الدالة مباشرة بدلاً من استدعاء today_products_command
     try:
-        # الحصول على المنتجات من قاعدة البيانات
-        products = await get_products()
-        
-        # تصفية المنتجات المسجلة اليوم
-        today = datetime.now().strftime("%Y/%m/%d")
-        today_products = [
-            p for p in products 
-            if p.get('date', '').startswith(today)
-        ]
+        # الحصول على منتجات اليوم فقط من قاعدة البيانات (بدون حد لعددها)
+        today = datetime.now().date()
+        today_products = await get_products_by_date_range(today, today, chat_id=update.effective_chat.id)
         
         if not today_products:
             await update.message.reply_text("لا توجد منتجات مسجلة اليوم.")
@@ -908,7 +919,6 @@ async def today_command(update: Update, context: ContextTypes.DEFAULT_TYPE) -> N
             
         # تنسيق الرسالة
         message = "📊 المنتجات المسجلة اليوم:\n\n"
-        total = 0
         
         for i, product in enumerate(today_products, 1):
             product_name = product.get('name') or product.get('product', 'غير معروف')
@@ -919,12 +929,8 @@ async def today_command(update: Update, context: ContextTypes.DEFAULT_TYPE) -> N
             if notes:
                 message += f" ({notes})"
             message += "\n"
-            try:
-                total += float(price)
-            except (ValueError, TypeError):
-                logger.warning(f"قيمة سعر غير صالحة: {price}")
             
-        message += f"\n💰 المجموع: {total}"
+        message += f"\n💰 المجموع: {_today_total(update.effective_chat.id, today_products)}"
         
         # إنشاء أزرار التحكم بشكل أبسط
         keyboard = [
@@ -943,3 +949,77 @@ async def today_command(update: Update, context: ContextTypes.DEFAULT_TYPE) -> N
         logger.error(f"خطأ في عرض منتجات اليوم: {str(e)}")
         logger.error(traceback.format_exc())
         await update.message.reply_text("حدث خطأ أثناء جلب المنتجات. الرجاء المحاولة مرة أخرى.")
+
+def _parse_export_args(args: list):
+    """
+    تحليل معطيات أمر /export: الصيغة (csv أو parquet)، تاريخ البداية ثم النهاية، واسم المنتج
+    
+    Returns:
+        Tuple[str, Optional[date], Optional[date], str]: (الصيغة، البداية، النهاية، نص تصفية المنتج)
+    
+    Raises:
+        ValueError: إذا ذُكرت أكثر من تاريخين
+    """
+    file_format = FORMAT_CSV
+    dates = []
+    words = []
+    for arg in args:
+        if arg.lower() in EXPORT_FORMATS:
+            file_format = arg.lower()
+            continue
+        try:
+            dates.append(parse_export_date(arg))
+        except ValueError:
+            words.append(arg)
+    if len(dates) > 2:
+        raise ValueError("يمكن تحديد تاريخين على الأكثر (البداية ثم النهاية)")
+    start = dates[0] if dates else None
+    end = dates[1] if len(dates) > 1 else None
+    return file_format, start, end, " ".join(words)
+
+async def export_command(update: Update, context: ContextTypes.DEFAULT_TYPE) -> None:
+    """
+    معالج أمر /export لإرسال مشتريات المحادثة كملف
+
+    أمثلة:
+        /export                          جميع المشتريات بصيغة CSV
+        /export 2024-01-01               من تاريخ معين حتى اليوم
+        /export 2024-01-01 2024-03-31 قهوة parquet
+    """
+    chat_id = update.effective_chat.id
+    try:
+        file_format, start, end, product = _parse_export_args(context.args or [])
+    except ValueError as e:
+        await update.message.reply_text(f"⚠️ {str(e)}")
+        return
+    
+    logger.info(f"تصدير المشتريات للمحادثة {chat_id}: {file_format} من {start} إلى {end} منتج: {product}")
+    await update.message.reply_text("⏳ جاري تجهيز ملف المشتريات...")
+    
+    fd, path = tempfile.mkstemp(suffix=f".{file_format}")
+    os.close(fd)
+    try:
+        result = await export_products(path, file_format, start, end, product, chat_id=chat_id)
+        if not result.rows:
+            await update.message.reply_text("لا توجد مشتريات مطابقة للتصدير.")
+            return
+        if os.path.getsize(path) > MAX_DOCUMENT_SIZE:
+            await update.message.reply_text("⚠️ الملف أكبر من الحد المسموح في تيليجرام، حدد فترة أقصر.")
+            return
+        
+        filename = f"purchases_{datetime.now().strftime('%Y%m%d')}.{file_format}"
+        with open(path, 'rb') as document:
+            await update.message.reply_document(
+                document=document,
+                filename=filename,
+                caption=f"📦 {result.rows} منتج"
+            )
+    except ExportError as e:
+        await update.message.reply_text(f"⚠️ {str(e)}")
+    except Exception as e:
+        logger.error(f"خطأ في تصدير المشتريات: {str(e)}")
+        logger.error(traceback.format_exc())
+        await update.message.reply_text("حدث خطأ أثناء تصدير المشتريات. الرجاء المحاولة مرة أخرى.")
+    finally:
+        if os.path.exists(path):
+            os.remove(path)
@@ -7,6 +7,7 @@ from telegram.ext import ContextTypes, ConversationHandler
 from src.config import WELCOME_MESSAGE as welcome_message, PRICE, NOTES
 from utils.number_converter import convert_to_english_numbers, extract_price_from_text
 from database.sheets import add_to_sheets, add_multiple_to_sheets, SheetsError
+from database.idempotency import update_write_key
 import traceback
 import re
 from handlers.gemini_integration import handle_unstructured_message, GEMINI_CONFIRM, GEMINI_SELECT
@@ -211,7 +212,7 @@ async def handle_any_message(update: Update, context: ContextTypes.DEFAULT_TYPE)
         # فقط إذا نجحنا في تحليل جميع الأسطر وليس هناك أخطاء، أضف المنتجات
         if products_to_add and len(errors) == 0:
             try:
-                success_count, add_errors = await add_multiple_to_sheets(products_to_add)
+                success_count, add_errors = await add_multiple_to_sheets(products_to_add, chat_id=update.effective_chat.id, idempotency_key=update_write_key(update))
                 
                 # تجهيز رسالة الرد
                 if success_count > 0:
@@ -262,7 +263,7 @@ async def handle_any_message(update: Update, context: ContextTypes.DEFAULT_TYPE)
         if result and result[1] is not None:  # إذا وجدنا منتج وسعر
             product, price, notes = result
             try:
-                await add_to_sheets(product, price, notes)
+                await add_to_sheets(product, price, notes, chat_id=update.effective_chat.id, idempotency_key=update_write_key(update))
                 if notes:
                     await update.message.reply_text(f"تم إضافة {product} بسعر {price} مع ملاحظة: {notes}")
                 else:
@@ -352,7 +353,7 @@ async def notes(update: Update, context: ContextTypes.DEFAULT_TYPE) -> int:
     price = context.user_data['price']
     
     try:
-        await add_to_sheets(product, price, notes)
+        await add_to_sheets(product, price, notes, chat_id=update.effective_chat.id, idempotency_key=update_write_key(update))
         if notes:
             await update.message.reply_text(f"تم إضافة {product} بسعر {price} مع ملاحظة: {notes}")
         else:
@@ -8,6 +8,7 @@ from telegram import Update, InlineKeyboardButton, InlineKeyboardMarkup
 from telegram.ext import ContextTypes, ConversationHandler, CallbackQueryHandler
 from utils.gemini import analyze_products_with_gemini, GeminiAPIError, DEFAULT_NOTES_KEYWORDS
 from database.sheets import add_product_to_sheet, add_multiple_to_sheets
+from database.idempotency import update_write_key
 from src.config import GEMINI_API_KEY, WELCOME_MESSAGE
 import json
 import re
@@ -221,7 +222,7 @@ async def gemini_callback_handler(update: Update, context: ContextTypes.DEFAULT_
             
             # إضافة المنتجات دفعة واحدة
             if products_list:
-                success_count, errors = await add_multiple_to_sheets(products_list)
+                success_count, errors = await add_multiple_to_sheets(products_list, chat_id=update.effective_chat.id, idempotency_key=update_write_key(update))
                 
                 # تحديث الرسالة مع تأكيد الإضافة
                 if errors:
@@ -382,7 +383,7 @@ async def handle_selected_products_confirmation(update: Update, context: Context
         
         # إضافة المنتجات دفعة واحدة
         if products_list:
-            success_count, errors = await add_multiple_to_sheets(products_list)
+            success_count, errors = await add_multiple_to_sheets(products_list, chat_id=update.effective_chat.id, idempotency_key=update_write_key(update))
             
             # تحديث الرسالة مع تأكيد الإضافة
             if errors:
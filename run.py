@@ -41,7 +41,7 @@ try:
     from handlers.commands import (
         start, cancel, skip_command, help_command, 
         last_products_command, handle_button_clicks,
-        handle_callback_query, last_ten_command, today_command,
+        handle_callback_query, last_ten_command, today_command, export_command,
         handle_delete_selection, handle_delete_confirm, DELETE_SELECTION, DELETE_CONFIRM
     )
     from handlers.gemini_integration import gemini_callback_handler, GEMINI_CONFIRM, GEMINI_SELECT
@@ -146,7 +146,8 @@ def is_bot_running():
 
 async def post_init(application: Application) -> None:
     """يتم تنفيذ هذه الدالة بعد بدء البوت"""
-    from database.sheets import DEMO_MODE
+    from database.sheets import DEMO_MODE, init_storage
+    await init_storage()
     logger.info("تم بدء تشغيل البوت!")
     if DEMO_MODE:
         mode_msg = "⚠️ البوت يعمل في الوضع التجريبي - لن يتم إضافة المنتجات إلى Google Sheets الفعلي"
@@ -170,6 +171,12 @@ async def post_init(application: Application) -> None:
     except Exception:
         pass
 
+async def post_shutdown(application: Application) -> None:
+    """يتم تنفيذ هذه الدالة عند إيقاف البوت"""
+    from database.sheets import shutdown_storage
+    await shutdown_storage()
+    logger.info("تم إيقاف طبقة التخزين")
+
 # تعريف المتغيرات العالمية
 PRODUCT = 0
 
@@ -204,7 +211,13 @@ def main() -> None:
             sys.exit(1)
             
         # إنشاء التطبيق
-        application = Application.builder().token(TELEGRAM_TOKEN).post_init(post_init).build()
+        application = (
+            Application.builder()
+            .token(TELEGRAM_TOKEN)
+            .post_init(post_init)
+            .post_shutdown(post_shutdown)
+            .build()
+        )
         
         # تأكد من وجود معرفات Gemini
         GEMINI_CONFIRM_STATE = GEMINI_CONFIRM
@@ -215,6 +228,7 @@ def main() -> None:
         application.add_handler(CommandHandler('last', last_products_command))
         application.add_handler(CommandHandler('last10', last_ten_command, filters.Regex(r'^/last10$')))
         application.add_handler(CommandHandler('today', today_command, filters.Regex(r'^/today$')))
+        application.add_handler(CommandHandler('export', export_command))
         application.add_handler(CommandHandler('cancel', cancel))
         application.add_handler(CommandHandler('start', start))
         application.add_handler(CommandHandler('s', skip_command))
@@ -176,9 +176,10 @@ async def test_delete_specific_product():
         
         selected_product = products[product_index]
         sheet_row = selected_product.get('sheet_row')
+        product_id = selected_product.get('id')
         
-        if not sheet_row:
-            error_msg = f"المنتج المحدد ليس له رقم صف معروف: {selected_product}"
+        if not product_id:
+            error_msg = f"المنتج المحدد ليس له معرف: {selected_product}"
             logger.warning(error_msg)
             print(error_msg)
             return
@@ -195,7 +196,7 @@ async def test_delete_specific_product():
         # 5. تنفيذ الحذف
         logger.info(f"جاري حذف المنتج من الصف {sheet_row}...")
         print(f"\nجاري حذف المنتج من الصف {sheet_row}...")
-        success_count, failed_indices = await delete_products([sheet_row])
+        success_count, failed_indices = await delete_products([product_id])
         
         # 6. عرض النتيجة
         if success_count > 0:
@@ -49,6 +49,7 @@ async def test_add_then_verify_delete():
         
         found = False
         sheet_row = None
+        product_id = None
         
         for idx, product in enumerate(products):
             name = product.get('name', '')
@@ -56,18 +57,19 @@ async def test_add_then_verify_delete():
                 row = product.get('sheet_row', 'غير معروف')
                 print(f"✅ تم العثور على المنتج في القائمة: #{idx+1}, الصف: {row}")
                 sheet_row = row
+                product_id = product.get('id')
                 found = True
                 break
         
-        if not found or sheet_row is None:
-            print("❌ لم يتم العثور على المنتج الاختباري في القائمة أو لم يكن له رقم صف!")
+        if not found or product_id is None:
+            print("❌ لم يتم العثور على المنتج الاختباري في القائمة أو لم يكن له معرف!")
             return
             
         # 3. محاولة حذف المنتج
         print(f"\n3. حذف المنتج الاختباري من الصف {sheet_row}...")
         
-        # استخدام رقم الصف الفعلي للحذف
-        success_count, failed_indices = await delete_products([sheet_row])
+        # استخدام معرف المنتج للحذف
+        success_count, failed_indices = await delete_products([product_id])
         
         if success_count > 0:
             print(f"✅ تم حذف المنتج بنجاح! نجاح: {success_count}")
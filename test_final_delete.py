@@ -3,6 +3,7 @@ import sys
 import os
 import logging
 import time
+from datetime import datetime
 
 # إعداد التسجيل
 logging.basicConfig(
@@ -14,7 +15,8 @@ logging.basicConfig(
 sys.path.append(os.path.dirname(os.path.abspath(__file__)))
 
 # استيراد الوظائف المطلوبة
-from database.sheets import get_worksheet, delete_products
+from database.sheets import get_worksheet, get_partition_worksheet, delete_products, format_date
+from database.partitions import partition_of, LEGACY_PARTITION
 
 async def final_test_delete():
     print("=== اختبار نهائي لحذف منتجات الاختبار ===")
@@ -22,19 +24,26 @@ async def final_test_delete():
     # 1. البحث عن منتجات الاختبار
     print("\n1. البحث عن منتجات الاختبار...")
     
-    worksheet = get_worksheet()
-    
-    if worksheet is None:
+    if await get_worksheet() is None:
         print("تعذر الاتصال بجدول البيانات!")
         return
     
-    # الحصول على جميع القيم في الجدول
-    all_values = worksheet.get_all_values()
+    # منتجات الاختبار تُضاف إلى ورقة الشهر الحالي، والمنتجات القديمة في الورقة الأولى
+    worksheets = []
+    for key in dict.fromkeys([partition_of(format_date(datetime.now())), LEGACY_PARTITION]):
+        worksheet = await get_partition_worksheet(key)
+        if worksheet is not None:
+            worksheets.append(worksheet)
+    
+    # الحصول على جميع القيم في الأوراق
+    all_values = []
+    for worksheet in worksheets:
+        all_values.extend((worksheet.title, i, row) for i, row in enumerate(await worksheet.get("A1:E")))
     
     # البحث عن منتجات الاختبار وحفظ أرقام صفوفها
     test_products = []
     
-    for i, row in enumerate(all_values):
+    for title, i, row in all_values:
         # تخطي صف العناوين
         if i == 0:
             continue
@@ -44,6 +53,8 @@ async def final_test_delete():
             row_number = i + 1  # رقم الصف الفعلي (+1 لأن الفهرسة تبدأ من 0)
             test_products.append({
                 "row": row_number,
+                "sheet": title,
+                "id": row[4] if len(row) > 4 else "",
                 "name": row[1],
                 "price": row[2] if len(row) > 2 else "-"
             })
@@ -54,7 +65,7 @@ async def final_test_delete():
     
     print(f"تم العثور على {len(test_products)} منتج اختبار:")
     for prod in test_products:
-        print(f"  المنتج {prod['name']} (السعر: {prod['price']}) - الصف {prod['row']}")
+        print(f"  المنتج {prod['name']} (السعر: {prod['price']}) - {prod['sheet']} الصف {prod['row']}")
     
     # 2. حذف منتجات الاختبار واحدًا تلو الآخر
     print("\n2. جاري حذف منتجات الاختبار واحدًا تلو الآخر...")
@@ -67,11 +78,9 @@ async def final_test_delete():
             # نحذف منتج واحد في كل مرة
             print(f"  جاري حذف المنتج {prod['name']} (صف رقم {prod['row']})...")
             
-            # استخدام رقم الصف الفعلي للحذف وليس الفهرس
-            row_number = prod['row']
-            
+            # استخدام معرف المنتج للحذف وليس رقم الصف
             # محاولة الحذف
-            success_count, failed_indices = await delete_products([row_number])
+            success_count, failed_indices = await delete_products([prod['id']])
             
             # عرض النتيجة
             if success_count > 0:
@@ -102,10 +111,12 @@ async def final_test_delete():
     print("\nالتحقق النهائي من وجود منتجات الاختبار:")
     
     # إعادة تحميل القيم
-    all_values = worksheet.get_all_values()
+    all_values = []
+    for worksheet in worksheets:
+        all_values.extend((worksheet.title, i, row) for i, row in enumerate(await worksheet.get("A1:E")))
     remaining_test_products = []
     
-    for i, row in enumerate(all_values):
+    for title, i, row in all_values:
         # تخطي صف العناوين
         if i == 0:
             continue
@@ -113,6 +124,7 @@ async def final_test_delete():
         # البحث عن منتجات الاختبار المتبقية
         if len(row) > 1 and row[1].strip().startswith("اختبار الحذف"):
             remaining_test_products.append({
+                "sheet": title,
                 "row": i + 1,
                 "name": row[1]
             })
@@ -120,7 +132,7 @@ async def final_test_delete():
     if remaining_test_products:
         print(f"تم العثور على {len(remaining_test_products)} منتج اختبار متبقي:")
         for prod in remaining_test_products:
-            print(f"  الصف {prod['row']}: {prod['name']}")
+            print(f"  {prod['sheet']} الصف {prod['row']}: {prod['name']}")
     else:
         print("تم حذف جميع منتجات الاختبار بنجاح!")
 
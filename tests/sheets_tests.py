@@ -12,9 +12,8 @@ from datetime import datetime
 # إضافة المجلد الرئيسي إلى مسار البحث
 sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
 
-import gspread
-from oauth2client.service_account import ServiceAccountCredentials
 from database.sheets import add_to_sheets, add_multiple_to_sheets
+from database.sheets_client import AsyncSheetsClient, ServiceAccountToken
 
 # إعداد التسجيل
 logging.basicConfig(level=logging.INFO, 
@@ -85,29 +84,21 @@ async def test_add_products_direct():
         logger.error("لا يمكن إكمال الاختبار بدون ملف اعتماد")
         return False
     
+    # إنشاء العميل
+    client = AsyncSheetsClient(ServiceAccountToken.from_file(credentials_file))
+    
     try:
-        # صلاحيات Google Sheets و Google Drive
-        scope = ['https://spreadsheets.google.com/feeds',
-                'https://www.googleapis.com/auth/drive']
-        
-        # تهيئة الاعتمادات
-        credentials = ServiceAccountCredentials.from_json_keyfile_name(
-            credentials_file, scope)
-        
-        # إنشاء عميل gspread
-        client = gspread.authorize(credentials)
-        
         try:
             # محاولة فتح جدول البيانات بالاسم
-            spreadsheet = client.open(SPREADSHEET_NAME)
-            worksheet = spreadsheet.sheet1
+            spreadsheet = await client.open(SPREADSHEET_NAME)
+            worksheet = (await spreadsheet.worksheets())[0]
             
             # التحقق من رؤوس الأعمدة
-            headers = worksheet.row_values(1)
+            headers = await worksheet.row_values(1)
             # إذا كان الصف الأول فارغًا، سنضيف العناوين
             if not headers or len(headers) < 4:
-                worksheet.update('A1:D1', [["التاريخ", "المنتج", "السعر", "ملاحظات"]])
-                worksheet.format('A1:D1', {
+                await worksheet.update('A1:D1', [["التاريخ", "المنتج", "السعر", "ملاحظات"]])
+                await worksheet.format('A1:D1', {
                     "backgroundColor": {"red": 0.9, "green": 0.9, "blue": 0.9},
                     "horizontalAlignment": "CENTER",
                     "textFormat": {"bold": True}
@@ -123,7 +114,7 @@ async def test_add_products_direct():
                 logger.info(f"✅ تجهيز {product} بسعر {price}" + (f" مع ملاحظة: {notes}" if notes else ""))
             
             if rows_to_add:
-                worksheet.append_rows(rows_to_add)
+                await worksheet.append_rows(rows_to_add)
                 logger.info(f"✅ تمت إضافة {len(rows_to_add)} منتج إلى جدول البيانات")
                 return True
             
@@ -135,6 +126,9 @@ async def test_add_products_direct():
         logger.error(f"خطأ في الاتصال بـ Google Sheets: {str(e)}")
         return False
     
+    finally:
+        await client.close()
+    
     return False
 
 async def test_add_multiple_products():
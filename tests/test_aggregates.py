@@ -0,0 +1,222 @@
+"""
+اختبارات مجاميع المشتريات (database/aggregates.py) بمصدر في الذاكرة
+
+التشغيل من المجلد الرئيسي للمشروع:
+    python -m pytest -q tests
+"""
+import os
+import sys
+import asyncio
+from datetime import date
+
+# إضافة المسار الجذري للمشروع إلى sys.path
+sys.path.append(os.path.abspath(os.path.join(os.path.dirname(__file__), '..')))
+from database.aggregates import AggregateStore, ALL_CHATS
+from database.journal import RecordJournal
+
+MONTH = "2026-09"
+
+def product(day, name, price, product_id=None, sheet_row=None, chat_id='111'):
+    return {'date': f"2026/09/{day:02d}", 'name': name, 'price': price, 'notes': '',
+            'sheet_row': sheet_row, 'id': product_id, 'chat_id': chat_id}
+
+class FakeSource:
+    """مصدر بناء بأقسام في الذاكرة يسجل الأقسام التي طُلبت"""
+
+    def __init__(self, partitions):
+        self.partitions = partitions
+        self.requests = []
+
+    async def __call__(self, partitions=None):
+        self.requests.append(partitions)
+        for key, products in list(self.partitions.items()):
+            if partitions is None or key in partitions:
+                yield key, list(products)
+
+def make_store(partitions):
+    source = FakeSource(partitions)
+    return AggregateStore(source, retry_delay=0, partition_of=lambda row: MONTH), source
+
+async def settle(store):
+    """انتظار انتهاء طلبات البناء المنتظرة"""
+    while store._task is not None and not store._task.done():
+        await asyncio.sleep(0)
+
+def test_add_and_remove():
+    async def run():
+        store, _ = make_store({MONTH: [product(1, "شاي", 2.5, "a1"), product(1, "قهوة", 1.5, "a2")]})
+        await store.rebuild()
+        assert store.day_total('111', date(2026, 9, 1)).count == 2
+        assert store.month_total(ALL_CHATS, 2026, 9).total == 4.0
+
+        store.add_rows([["2026/09/02", "شاي", 0.1, "", "a3", "222"]])
+        assert store.product_total('222', "شاي").total == 0.1
+        assert store.product_total(ALL_CHATS, "شاي").count == 2
+
+        store.remove_ids(["a1", "a3"])
+        assert store.product_total(ALL_CHATS, "شاي").count == 0
+        assert store.month_total('111', 2026, 9).total == 1.5
+        # المعرف المحذوف مرتين لا يُطرح مرة ثانية
+        store.remove_ids(["a1"])
+        await settle(store)
+        assert store.month_total('111', 2026, 9).total == 1.5
+        await store.stop()
+
+    asyncio.run(run())
+
+def test_add_during_rebuild_is_counted_once():
+    async def run():
+        store, source = make_store({MONTH: [product(1, "شاي", 2.0, "a1")]})
+        original = source.__call__
+
+        async def slow(partitions=None):
+            async for page in original(partitions):
+                # إضافة منتج قرأه البناء، وحذف منتج قبل اكتمال البناء
+                store.add_rows([["2026/09/01", "شاي", 2.0, "", "a1", "111"],
+                                ["2026/09/01", "خبز", 1.0, "", "b1", "111"]])
+                store.remove_ids(["b1"])
+                yield page
+
+        store.source = slow
+        await store.rebuild()
+        total = store.day_total('111', date(2026, 9, 1))
+        assert (total.count, total.total) == (1, 2.0)
+        await store.stop()
+
+    asyncio.run(run())
+
+def test_rows_added_during_rebuild_are_replayed_each():
+    async def run():
+        store, source = make_store({MONTH: [product(1, "شاي", 2.0, "a1")]})
+        original = source.__call__
+
+        async def slow(partitions=None):
+            async for page in original(partitions):
+                # كل صف في الدفعة يُطبق بقيمه على نتيجة البناء
+                store.add_rows([["2026/09/02", "خبز", 1.0, "", "b1", "111"],
+                                ["2026/09/02", "رز", 4.0, "", "b2", "111"]])
+                yield page
+
+        store.source = slow
+        await store.rebuild()
+        day = store.day_total('111', date(2026, 9, 2))
+        assert (day.count, day.total) == (2, 5.0)
+        month = store.month_total('111', 2026, 9)
+        assert (month.count, month.total) == (3, 7.0)
+        await store.stop()
+
+    asyncio.run(run())
+
+def test_delete_after_lazy_id():
+    async def run():
+        # صف أضيف يدوياً بدون معرف: يُحسب بموقعه حتى يُكتب معرفه
+        rows = [product(1, "شاي", 2.0, "a1", 2), product(3, "خبز", 5.0, None, 3)]
+        store, _ = make_store({MONTH: rows})
+        await store.rebuild()
+        assert store.month_total('111', 2026, 9).total == 7.0
+
+        store.assign_ids(MONTH, {3: "lazy"})
+        store.remove_ids(["lazy"])
+        total = store.month_total('111', 2026, 9)
+        assert (total.count, total.total) == (1, 2.0)
+        await store.stop()
+
+    asyncio.run(run())
+
+def test_delete_miss_recomputes_located_partitions():
+    async def run():
+        # لم يُسجل المعرف الجديد (مثلاً كُتب قبل اكتمال البناء)، فيُعاد حساب القسم عند الحذف
+        rows = [product(1, "شاي", 2.0, "a1", 2), product(3, "خبز", 5.0, None, 3)]
+        other = [product(4, "قهوة", 1.0, "c1", 2)]
+        store, source = make_store({MONTH: rows, "2026-08": other})
+        await store.rebuild()
+
+        source.partitions[MONTH] = [rows[0]]
+        store.remove_ids(["lazy"])
+        await settle(store)
+        assert source.requests[-1] == {MONTH}
+        assert store.product_total('111', "خبز").count == 0
+        assert store.product_total('111', "قهوة").total == 1.0
+        assert store.get_stats()['refreshes'] == 1
+        await store.stop()
+
+    asyncio.run(run())
+
+def test_failed_rebuild_keeps_previous_totals():
+    async def run():
+        store, source = make_store({MONTH: [product(1, "شاي", 2.0, "a1")]})
+        await store.rebuild()
+
+        async def broken(partitions=None):
+            raise OSError("network")
+            yield
+
+        store.source = broken
+        store.schedule_rebuild()
+        for _ in range(5):
+            await asyncio.sleep(0)
+        assert store.ready and store.month_total('111', 2026, 9).total == 2.0
+        assert store.get_stats()['failures'] >= 1
+        await store.stop()
+
+    asyncio.run(run())
+
+def test_hand_edits_apply_incrementally():
+    async def run():
+        rows = [["2026/09/01", "شاي", "2", "", "a1", "111"], ["2026/09/02", "خبز", "5", "", "a2", "111"],
+                ["2026/09/03", "قهوة", "1", "", "", "111"]]
+        store, source = make_store({MONTH: [
+            product(1, "شاي", 2.0, "a1", 2), product(2, "خبز", 5.0, "a2", 3), product(3, "قهوة", 1.0, None, 4),
+        ]})
+        await store.rebuild()
+
+        # حذف الصف الأول يدوياً ينقل ما بعده صفاً إلى الأعلى، وتعديل سعر الخبز
+        store.apply_rows(MONTH, [
+            (2, rows[0], ["2026/09/02", "خبز", "6", "", "a2", "111"]),
+            (3, rows[1], rows[2]),
+            (4, rows[2], None),
+        ])
+        assert store.product_total('111', "شاي").count == 0
+        assert store.product_total('111', "خبز").total == 6.0
+        assert store.product_total('111', "قهوة").count == 1
+        # صف جديد أضيف يدوياً بعد آخر صف معروف
+        store.apply_rows(MONTH, [(4, None, ["2026/09/04", "رز", "3", "", "", "111"])])
+        assert store.month_total('111', 2026, 9).total == 10.0
+        assert source.requests == [None]
+        await store.stop()
+
+    asyncio.run(run())
+
+def test_persisted_totals_round_trip(tmp_path):
+    async def run():
+        def journal():
+            return RecordJournal(str(tmp_path / "aggregates.jsonl"), str(tmp_path / "aggregates.snapshot.json"))
+
+        store, source = make_store({MONTH: [product(1, "شاي", 2.0, "a1"), product(2, "خبز", 5.0, None, 3)]})
+        store.journal = journal()
+        assert not await store.open("sheets:SS1", "7")
+        await settle(store)
+        store.add_rows([["2026/09/05", "رز", 3.0, "", "a3", "222"]])
+        await store.close("8")
+
+        # الإصدار نفسه: تُحمّل المجاميع دون قراءة المصدر
+        restored, source = make_store({})
+        restored.journal = journal()
+        assert await restored.open("sheets:SS1", "8")
+        assert source.requests == []
+        assert restored.month_total(ALL_CHATS, 2026, 9).total == 10.0
+        restored.assign_ids(MONTH, {3: "a2"})
+        restored.remove_ids(["a2"])
+        assert restored.month_total(ALL_CHATS, 2026, 9).total == 5.0
+        # إغلاق دون إصدار معروف لا يحفظ شيئاً، فيُبنى التشغيل التالي من المصدر
+        await restored.close(None)
+
+        rebuilt, source = make_store({MONTH: [product(1, "شاي", 2.0, "a1")]})
+        rebuilt.journal = journal()
+        assert not await rebuilt.open("sheets:SS1", "8")
+        await settle(rebuilt)
+        assert source.requests == [None]
+        assert rebuilt.month_total(ALL_CHATS, 2026, 9).total == 2.0
+        await rebuilt.close("9")
+
+    asyncio.run(run())
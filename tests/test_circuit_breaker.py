@@ -0,0 +1,96 @@
+"""
+اختبارات قاطع الدائرة (database/circuit_breaker.py): الانتقال بين الحالات
+
+التشغيل من المجلد الرئيسي للمشروع:
+    python -m pytest -q tests
+"""
+import os
+import sys
+
+import pytest
+
+# إضافة المسار الجذري للمشروع إلى sys.path
+sys.path.append(os.path.abspath(os.path.join(os.path.dirname(__file__), '..')))
+from database import circuit_breaker
+from database.circuit_breaker import CircuitBreaker, CircuitOpenError, CLOSED, OPEN, HALF_OPEN
+
+class FakeClock:
+    """ساعة يتحكم بها الاختبار بدلاً من time.monotonic"""
+
+    def __init__(self):
+        self.now = 1000.0
+
+    def monotonic(self):
+        return self.now
+
+@pytest.fixture
+def clock(monkeypatch):
+    fake = FakeClock()
+    monkeypatch.setattr(circuit_breaker, 'time', fake)
+    return fake
+
+def make_breaker():
+    return CircuitBreaker("test", failure_threshold=3, recovery_timeout=30, half_open_probes=1)
+
+def test_opens_after_consecutive_failures(clock):
+    breaker = make_breaker()
+    breaker.record_failure()
+    breaker.record_failure()
+    # النجاح يصفر العداد
+    breaker.record_success()
+    breaker.record_failure()
+    breaker.record_failure()
+    assert breaker.state == CLOSED
+
+    breaker.record_failure(OSError("timeout"))
+    assert breaker.state == OPEN
+    with pytest.raises(CircuitOpenError):
+        breaker.check()
+    stats = breaker.get_stats()
+    assert stats['opened'] == 1 and stats['rejected'] == 1 and stats['last_error'] == "timeout"
+
+def test_half_open_probe_success_closes(clock):
+    breaker = make_breaker()
+    for _ in range(3):
+        breaker.record_failure()
+
+    clock.now += 29
+    assert not breaker.allow_request()
+    clock.now += 1
+    assert breaker.state == HALF_OPEN
+    # طلب تجريبي واحد فقط
+    assert breaker.allow_request()
+    assert not breaker.allow_request()
+
+    breaker.record_success()
+    assert breaker.state == CLOSED
+    assert breaker.allow_request()
+    assert breaker.get_stats()['closed'] == 1
+
+def test_half_open_probe_failure_reopens(clock):
+    breaker = make_breaker()
+    for _ in range(3):
+        breaker.record_failure()
+    clock.now += 30
+    assert breaker.allow_request()
+
+    breaker.record_failure()
+    assert breaker.state == OPEN
+    # فترة استعادة جديدة تبدأ من لحظة فشل الطلب التجريبي
+    clock.now += 29
+    assert breaker.state == OPEN
+    clock.now += 1
+    assert breaker.state == HALF_OPEN
+
+def test_released_probe_can_be_retried(clock):
+    breaker = make_breaker()
+    for _ in range(3):
+        breaker.record_failure()
+    clock.now += 30
+    assert breaker.allow_request()
+    assert not breaker.allow_request()
+
+    # الطلب لم يصل إلى الخدمة (خطأ في البيانات)، فتعود خانته
+    breaker.release_probe()
+    assert breaker.allow_request()
+    assert breaker.state == HALF_OPEN
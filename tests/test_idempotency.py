@@ -0,0 +1,126 @@
+"""
+اختبارات الكتابة مرة واحدة لكل تحديث (database/idempotency.py)
+
+التشغيل من المجلد الرئيسي للمشروع:
+    python -m pytest -q tests
+"""
+import os
+import sys
+import asyncio
+from types import SimpleNamespace
+
+import pytest
+
+# إضافة المسار الجذري للمشروع إلى sys.path
+sys.path.append(os.path.abspath(os.path.join(os.path.dirname(__file__), '..')))
+from database import idempotency
+from database.idempotency import IdempotencyIndex, idempotent_product_id, update_write_key
+
+class FakeSheet:
+    """ورقة بمعرفات منتجات؛ يمكن أن يضيع رد الكتابة بعد وصولها"""
+
+    def __init__(self):
+        self.ids = []
+        self.lose_reply = False
+        self.attempts = []
+
+    def writer(self, key, count):
+        async def write(uncertain):
+            self.attempts.append(uncertain)
+            ids = [idempotent_product_id(key, index) for index in range(count)]
+            if uncertain:
+                # ربما وصلت الصفوف في المحاولة السابقة: لا تُكتب إلا الناقصة
+                ids = [product_id for product_id in ids if product_id not in self.ids]
+            self.ids.extend(ids)
+            if self.lose_reply:
+                self.lose_reply = False
+                raise TimeoutError("reply lost")
+            return count
+        return write
+
+def test_duplicate_returns_first_result():
+    async def run():
+        index, sheet = IdempotencyIndex(), FakeSheet()
+        assert await index.run("msg:1:10", sheet.writer("msg:1:10", 2)) == 2
+        assert await index.run("msg:1:10", sheet.writer("msg:1:10", 2)) == 2
+        assert sheet.attempts == [False] and len(sheet.ids) == 2
+        assert index.get_stats()['duplicates'] == 1
+
+    asyncio.run(run())
+
+def test_concurrent_duplicate_waits_for_inflight_write():
+    async def run():
+        index = IdempotencyIndex()
+        started, release = asyncio.Event(), asyncio.Event()
+        calls = []
+
+        async def write(uncertain):
+            calls.append(uncertain)
+            started.set()
+            await release.wait()
+            return "done"
+
+        first = asyncio.ensure_future(index.run("cb:1:5:confirm", write))
+        await started.wait()
+        second = asyncio.ensure_future(index.run("cb:1:5:confirm", write))
+        await asyncio.sleep(0)
+        release.set()
+        assert await first == "done" and await second == "done"
+        assert calls == [False]
+
+    asyncio.run(run())
+
+def test_retry_after_uncertain_write_does_not_duplicate():
+    async def run():
+        index, sheet = IdempotencyIndex(), FakeSheet()
+        sheet.lose_reply = True
+        with pytest.raises(TimeoutError):
+            await index.run("msg:1:11", sheet.writer("msg:1:11", 3))
+
+        # إعادة المحاولة تعرف أن الكتابة السابقة ربما وصلت
+        assert await index.run("msg:1:11", sheet.writer("msg:1:11", 3)) == 3
+        assert sheet.attempts == [False, True]
+        assert len(sheet.ids) == len(set(sheet.ids)) == 3
+        assert index.get_stats()['uncertain_retries'] == 1
+        # بعد نجاحها يُعامل المفتاح كمنفذ
+        assert await index.run("msg:1:11", sheet.writer("msg:1:11", 3)) == 3
+        assert sheet.attempts == [False, True]
+
+    asyncio.run(run())
+
+def test_keys_expire_and_are_evicted(monkeypatch):
+    clock = SimpleNamespace(now=100.0)
+    monkeypatch.setattr(idempotency, 'time', SimpleNamespace(monotonic=lambda: clock.now))
+
+    async def run():
+        index, calls = IdempotencyIndex(ttl=60, max_keys=2), []
+
+        async def write(uncertain):
+            calls.append(uncertain)
+
+        for key in ("a", "b", "c"):
+            await index.run(key, write)
+        # أقدم مفتاح حُذف عند امتلاء الفهرس فيُكتب من جديد
+        await index.run("a", write)
+        assert len(calls) == 4 and index.get_stats()['evictions'] >= 1
+
+        clock.now += 61
+        await index.run("c", write)
+        assert len(calls) == 5
+        # بدون مفتاح لا حماية من التكرار
+        await index.run(None, write)
+        await index.run(None, write)
+        assert len(calls) == 7
+
+    asyncio.run(run())
+
+def test_update_write_key():
+    chat = SimpleNamespace(id=42)
+    message = SimpleNamespace(chat=chat, message_id=7)
+    assert update_write_key(SimpleNamespace(callback_query=None, message=message)) == "msg:42:7"
+    query = SimpleNamespace(message=message, data="confirm_all")
+    # الضغط مرتين على الزر نفسه ينتج المفتاح نفسه
+    assert update_write_key(SimpleNamespace(callback_query=query, message=None)) == "cb:42:7:confirm_all"
+    assert update_write_key(SimpleNamespace(callback_query=None, message=None)) is None
+    assert idempotent_product_id("msg:42:7", 0) == idempotent_product_id("msg:42:7", 0)
+    assert len(idempotent_product_id("msg:42:7", 1)) == 12
@@ -0,0 +1,141 @@
+"""
+اختبارات دمج تعديلات العملية في طلب batchUpdate واحد (database/unit_of_work.py)
+
+التشغيل من المجلد الرئيسي للمشروع:
+    python -m pytest -q tests
+"""
+import os
+import sys
+import asyncio
+
+import pytest
+
+# إضافة المسار الجذري للمشروع إلى sys.path
+sys.path.append(os.path.abspath(os.path.join(os.path.dirname(__file__), '..')))
+from database.unit_of_work import UnitOfWorkStats, unit_of_work
+
+class FakeSpreadsheet:
+    """دالة batchUpdate تسجل الطلبات وتعيد رداً لكل طلب (أو تفشل)"""
+
+    def __init__(self, fail=False, short=False):
+        self.calls = []
+        self.fail = fail
+        self.short = short
+
+    async def __call__(self, requests):
+        self.calls.append(list(requests))
+        if self.fail:
+            raise OSError("503")
+        replies = [{'reply': request['name']} for request in requests]
+        # Google لا تعيد رداً للطلبات التي ليس لها نتيجة في نهاية القائمة
+        return {'replies': replies[:1] if self.short else replies}
+
+def request(name):
+    return {'name': name}
+
+def collector(received, name):
+    async def on_reply(replies):
+        received.append((name, replies))
+    return on_reply
+
+def test_nested_units_send_once_and_fan_out_replies():
+    async def run():
+        sheet, stats, received = FakeSpreadsheet(), UnitOfWorkStats(), []
+        async with unit_of_work(sheet, stats) as unit:
+            unit.add([request("header"), request("format")], collector(received, "headers"))
+            async with unit_of_work(sheet, stats) as inner:
+                # الوحدة الداخلية تنضم إلى الخارجية
+                assert inner is unit
+                inner.add([request("append")], collector(received, "append"))
+            unit.add([request("clear")])
+            assert sheet.calls == []
+
+        assert sheet.calls == [[request("header"), request("format"), request("append"), request("clear")]]
+        assert received == [
+            ("headers", [{'reply': "header"}, {'reply': "format"}]),
+            ("append", [{'reply': "append"}]),
+        ]
+        assert stats.get_stats()['saved_round_trips'] == 2
+
+    asyncio.run(run())
+
+def test_missing_replies_are_padded():
+    async def run():
+        sheet, received = FakeSpreadsheet(short=True), []
+        async with unit_of_work(sheet) as unit:
+            unit.add([request("a")], collector(received, "a"))
+            unit.add([request("b"), request("c")], collector(received, "b"))
+        assert received == [("a", [{'reply': "a"}]), ("b", [{}, {}])]
+
+    asyncio.run(run())
+
+def test_single_mutation_uses_direct_send():
+    async def run():
+        sheet, received = FakeSpreadsheet(), []
+
+        async def direct():
+            return {'updates': {'updatedRange': "'2026-09'!A5:F6"}}
+
+        async with unit_of_work(sheet) as unit:
+            unit.add([request("append")], collector(received, "append"), direct=direct)
+        assert sheet.calls == []
+        assert received == [("append", [{'updates': {'updatedRange': "'2026-09'!A5:F6"}}])]
+
+        # مع تعديل آخر في الوحدة يُرسل الكل في batchUpdate
+        async with unit_of_work(sheet) as unit:
+            unit.add([request("append")], collector(received, "append"), direct=direct)
+            unit.add([request("clear")])
+        assert sheet.calls == [[request("append"), request("clear")]]
+
+    asyncio.run(run())
+
+def test_independent_unit_sends_separately():
+    async def run():
+        sheet = FakeSpreadsheet()
+        async with unit_of_work(sheet) as outer:
+            outer.add([request("append")])
+            async with unit_of_work(sheet, join=False) as delete:
+                assert delete is not outer
+                delete.add([request("delete")])
+            # الحذف أُرسل قبل إغلاق الوحدة الخارجية
+            assert sheet.calls == [[request("delete")]]
+        assert sheet.calls == [[request("delete")], [request("append")]]
+
+    asyncio.run(run())
+
+def test_failures_send_nothing_or_skip_handlers():
+    async def run():
+        sheet, stats, received = FakeSpreadsheet(), UnitOfWorkStats(), []
+        with pytest.raises(ValueError):
+            async with unit_of_work(sheet, stats) as unit:
+                unit.add([request("append")], collector(received, "append"))
+                raise ValueError("bad row")
+        assert sheet.calls == []
+
+        sheet.fail = True
+        with pytest.raises(OSError):
+            async with unit_of_work(sheet, stats) as unit:
+                unit.add([request("append")], collector(received, "append"))
+        assert received == [] and stats.get_stats()['failures'] == 1
+
+    asyncio.run(run())
+
+def test_held_locks_cover_send_and_replies():
+    async def run():
+        lock = asyncio.Lock()
+        seen = []
+
+        async def send(requests):
+            seen.append(lock.locked())
+            return {'replies': [{}]}
+
+        async def on_reply(replies):
+            seen.append(lock.locked())
+
+        async with unit_of_work(send) as unit:
+            unit.hold("2026-09", lock)
+            unit.add([request("append")], on_reply)
+            unit.add([request("format")])
+        assert seen == [True, True] and not lock.locked()
+
+    asyncio.run(run())
@@ -0,0 +1,141 @@
+"""
+اختبارات مخزن الكتابة المؤجلة (database/write_buffer.py): إعادة تحميل السجل وضغطه
+
+التشغيل من المجلد الرئيسي للمشروع:
+    python -m pytest -q tests
+"""
+import os
+import sys
+import json
+import asyncio
+
+# إضافة المسار الجذري للمشروع إلى sys.path
+sys.path.append(os.path.abspath(os.path.join(os.path.dirname(__file__), '..')))
+from database.write_buffer import AppendBuffer
+
+def rows(*names):
+    return [["2026/09/01", name, 1.0, "", f"id-{name}", "111"] for name in names]
+
+class FakeSheet:
+    """
+    دالة إرسال تسجل الصفوف المكتوبة
+
+    failures: رقم المحاولة -> 'lost' (وصل الطلب وضاع الرد) أو 'down' (لم يصل)
+    """
+
+    def __init__(self, failures=None):
+        self.written = []
+        self.calls = 0
+        self.failures = failures or {}
+
+    async def __call__(self, batch):
+        self.calls += 1
+        failure = self.failures.get(self.calls)
+        if failure != 'down':
+            self.written.extend(list(row) for row in batch)
+        if failure:
+            raise OSError("connection reset")
+
+def make_buffer(path, sheet, **kwargs):
+    # الإرسال يدوي فقط (flush) حتى لا تتدخل مهمة الخلفية
+    return AppendBuffer(sheet, str(path), max_rows=1000, max_age=3600, **kwargs)
+
+async def close(buffer):
+    buffer._closed = True
+    if buffer._task is not None:
+        buffer._task.cancel()
+        try:
+            await buffer._task
+        except asyncio.CancelledError:
+            pass
+
+def test_journal_replay_after_restart(tmp_path):
+    path = tmp_path / "pending_rows.jsonl"
+
+    async def first_run():
+        buffer = make_buffer(path, FakeSheet())
+        await buffer.append(rows("a", "b"))
+        await buffer.append(rows("c"))
+        # توقف قبل الإرسال
+        await close(buffer)
+
+    asyncio.run(first_run())
+
+    sheet = FakeSheet()
+    verified = []
+
+    async def verify(batch):
+        verified.append(list(batch))
+        return batch
+
+    async def second_run():
+        buffer = make_buffer(path, sheet, verify_func=verify)
+        assert buffer.pending_rows() == rows("a", "b", "c")
+        assert await buffer.flush() == 3
+        await close(buffer)
+
+    asyncio.run(second_run())
+    # الصفوف المحملة من السجل تمر بالتحقق قبل إرسالها
+    assert verified == [rows("a", "b", "c")]
+    assert sheet.written == rows("a", "b", "c")
+    assert make_buffer(path, FakeSheet()).pending_count == 0
+
+def test_acks_and_compaction(tmp_path):
+    path = tmp_path / "pending_rows.jsonl"
+    sheet = FakeSheet({2: 'down'})
+
+    async def run():
+        buffer = make_buffer(path, sheet, replay_batch=2)
+        await buffer.append(rows("a", "b", "c"))
+        try:
+            await buffer.flush()
+        except OSError:
+            pass
+        # الدفعة الأولى أُكدت بسطر في نهاية السجل بدلاً من إعادة كتابته
+        with open(path, encoding='utf-8') as f:
+            lines = [json.loads(line) for line in f]
+        assert len(lines) == 4 and lines[-1] == {'ack': 2}
+        assert make_buffer(path, FakeSheet()).pending_rows() == rows("c")
+
+        # فراغ الطابور يعيد بناء السجل فارغاً
+        assert await buffer.flush() == 1
+        assert os.path.getsize(path) == 0
+        await close(buffer)
+
+    asyncio.run(run())
+    assert sheet.written == rows("a", "b", "c")
+
+def test_truncated_line_is_skipped(tmp_path):
+    path = tmp_path / "pending_rows.jsonl"
+    with open(path, 'w', encoding='utf-8') as f:
+        f.write(json.dumps({'t': 1.0, 'row': rows("a")[0]}, ensure_ascii=False) + "\n")
+        f.write('{"t": 2.0, "row": ["2026/09')
+    buffer = make_buffer(path, FakeSheet())
+    assert buffer.pending_rows() == rows("a")
+
+def test_failed_flush_is_verified_before_retry(tmp_path):
+    path = tmp_path / "pending_rows.jsonl"
+    sheet = FakeSheet({1: 'lost'})
+
+    async def verify(batch):
+        # يعيد ما لم يصل إلى الورقة بعد
+        return [row for row in batch if row not in sheet.written]
+
+    async def run():
+        buffer = make_buffer(path, sheet, verify_func=verify)
+        await buffer.append(rows("a", "b"))
+        try:
+            await buffer.flush()
+        except OSError:
+            pass
+        assert buffer.failing and buffer.pending_count == 2
+
+        await buffer.append(rows("c"))
+        assert await buffer.flush() == 1
+        assert not buffer.failing and buffer.pending_count == 0
+        assert buffer.get_stats()['skipped_rows'] == 2
+        await close(buffer)
+
+    asyncio.run(run())
+    # لا يتكرر أي صف في الورقة
+    assert sheet.written == rows("a", "b", "c")
@@ -39,10 +39,48 @@ CURRENCY_WORDS = {
     'درهم': '', 'دراهم': '', 'AED': '', 'د.إ': '',
 }
 
+# محرك التحويل: يُبنى مرة واحدة عند الاستيراد بدلاً من بناء الأنماط في كل استدعاء
+
+# جدول تحويل الأرقام (str.translate يمر على النص مرة واحدة)
+_DIGITS_TABLE = str.maketrans(ARABIC_TO_ENGLISH)
+# النص الخالي من العملات يحوّل أرقامه وفواصله العشرية في المرور نفسه
+_DIGITS_AND_COMMA_TABLE = str.maketrans({**ARABIC_TO_ENGLISH, ',': '.'})
+
+# نمط واحد يكشف وجود أي كلمة عملة في أي موضع
+_CURRENCY_ALTERNATION = '|'.join(re.escape(currency) for currency in CURRENCY_WORDS if currency)
+_CURRENCY_SEARCH = re.compile(_CURRENCY_ALTERNATION, re.IGNORECASE)
+
+# أنماط إزالة العملات بترتيب القاموس: إزالة كلمة قد تكشف كلمة أخرى (مثل US$D)، فالترتيب
+# جزء من النتيجة ولا تُدمج في نمط واحد
+_CURRENCY_WORD_PATTERNS = [
+    (re.compile(r'\b' + re.escape(currency) + r'\b', re.IGNORECASE), replacement)
+    for currency, replacement in CURRENCY_WORDS.items()
+]
+# رقم متبوع بكلمة عملة بدون مسافة: 100ريال
+_NUMBER_BEFORE_CURRENCY = re.compile(r'(\d+)(' + _CURRENCY_ALTERNATION + r')', re.IGNORECASE)
+# كلمة عملة متبوعة برقم بدون مسافة: ريال100
+_CURRENCY_BEFORE_NUMBER = re.compile(r'(' + _CURRENCY_ALTERNATION + r')(\d+)', re.IGNORECASE)
+
+# كلمات الأرقام كلها حروف، فكل مطابقة بحدود الكلمة هي كلمة كاملة تساوي مفتاحاً واحداً
+# فقط؛ لذلك يكفي نمط واحد (الأطول أولاً) مع البحث في القاموس
+_NUMBER_WORDS_PATTERN = re.compile(
+    r'\b(?:' + '|'.join(re.escape(word) for word in sorted(ARABIC_WORDS_TO_NUMBERS, key=len, reverse=True)) + r')\b',
+    re.IGNORECASE
+)
+
+# رقم (مع دعم الأرقام العشرية)
+_PRICE_PATTERN = re.compile(r'\b\d+(?:\.\d+)?\b')
+
+def _replace_number_word(match: re.Match) -> str:
+    return ARABIC_WORDS_TO_NUMBERS[match.group()]
+
 def convert_to_english_numbers(text: str) -> str:
     """
     تحويل الأرقام العربية والهندية في النص إلى أرقام إنجليزية
     
+    معظم الأسطر بلا عملات، فتمر على النص ثلاث مرات فقط: كشف العملات، ثم جدول الأرقام
+    والفواصل، ثم نمط كلمات الأرقام.
+    
     Args:
         text (str): النص المحتوي على أرقام عربية/هندية
         
@@ -52,42 +90,28 @@ def convert_to_english_numbers(text: str) -> str:
     if not text:
         return text
         
-    # تحويل الأرقام العربية والهندية
-    for arabic, english in ARABIC_TO_ENGLISH.items():
-        if arabic in text:
-            text = text.replace(arabic, english)
-    
-    # تحويل كلمات العملات إلى مساحة (لتسهيل تحليل النص)
-    for currency, replacement in CURRENCY_WORDS.items():
-        # نضيف حدود الكلمة لنتأكد من أنها كلمة مستقلة
-        pattern = r'\b' + re.escape(currency) + r'\b'
-        text = re.sub(pattern, replacement, text, flags=re.IGNORECASE)
-    
-    # التعامل مع التنسيقات المختلفة للعملات
-    # مثال: 100ريال، 200 درهم، ر.س 150
-    
-    # 1. نمط رقم متبوع بكلمة عملة بدون مسافة: 100ريال
-    currency_patterns = [re.escape(currency) for currency in CURRENCY_WORDS.keys() if currency]
-    if currency_patterns:
-        currency_pattern = '|'.join(currency_patterns)
-        pattern = r'(\d+)(' + currency_pattern + r')'
-        text = re.sub(pattern, r'\1', text, flags=re.IGNORECASE)
-    
-    # 2. نمط كلمة عملة متبوعة برقم بدون مسافة: ريال100
-    pattern = r'(' + currency_pattern + r')(\d+)'
-    text = re.sub(pattern, r'\2', text, flags=re.IGNORECASE)
-    
-    # استخراج الأجزاء العشرية والتعامل معها
-    # مثال: 10.5 أو 10,5
-    text = text.replace(',', '.')
+    if _CURRENCY_SEARCH.search(text) is None:
+        # لا عملات: تحويل الأرقام والفواصل العشرية (مثال: 10,5) في مرور واحد
+        text = text.translate(_DIGITS_AND_COMMA_TABLE)
+    else:
+        # تحويل الأرقام العربية والهندية
+        text = text.translate(_DIGITS_TABLE)
+        
+        # تحويل كلمات العملات إلى مساحة (لتسهيل تحليل النص)
+        for pattern, replacement in _CURRENCY_WORD_PATTERNS:
+            text = pattern.sub(replacement, text)
+        
+        # التعامل مع التنسيقات المختلفة للعملات
+        # مثال: 100ريال، 200 درهم، ر.س 150
+        text = _NUMBER_BEFORE_CURRENCY.sub(r'\1', text)
+        text = _CURRENCY_BEFORE_NUMBER.sub(r'\2', text)
+        
+        # استخراج الأجزاء العشرية والتعامل معها
+        # مثال: 10.5 أو 10,5
+        text = text.replace(',', '.')
     
     # تحويل الكلمات العربية للأرقام
-    # هذا تحسين إضافي للتعامل مع كلمات الأرقام
-    for word, number in ARABIC_WORDS_TO_NUMBERS.items():
-        pattern = r'\b' + re.escape(word) + r'\b'
-        text = re.sub(pattern, number, text, flags=re.IGNORECASE)
-    
-    return text
+    return _NUMBER_WORDS_PATTERN.sub(_replace_number_word, text)
 
 def extract_price_from_text(text: str) -> float:
     """
@@ -105,14 +129,11 @@ def extract_price_from_text(text: str) -> float:
     # تحويل الأرقام العربية والهندية
     text = convert_to_english_numbers(text)
     
-    # نمط للعثور على رقم (مع دعم الأرقام العشرية)
-    pattern = r'\b\d+(?:\.\d+)?\b'
-    
-    matches = re.findall(pattern, text)
-    if matches:
+    # نأخذ أول رقم في النص
+    match = _PRICE_PATTERN.search(text)
+    if match:
         try:
-            # نأخذ أول مطابقة
-            return float(matches[0])
+            return float(match.group())
         except ValueError:
             return None
     
@@ -3,4 +3,5 @@
 تحتوي على دوال لمعالجة إدخالات المستخدم بأشكال مختلفة
 """
 
-from utils.parsers.product_parser import parse_product_input, InputFormat, ProductData 
\ No newline at end of file
+from utils.parsers.product_parser import parse_product_input, InputFormat, ProductData
+from utils.parsers.file_parser import ProductFileReader, FileFormat, FileRecord, detect_format
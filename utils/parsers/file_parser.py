@@ -0,0 +1,226 @@
+"""
+قارئ ملفات المنتجات
+يقرأ ملفات CSV و TSV و JSONL والنص الحر (منتج في كل سطر كما في docs/products.txt)
+سجلاً بعد سجل دون تحميل الملف في الذاكرة، فيمكن استيراد ملفات بمئات الآلاف من الصفوف
+"""
+import io
+import os
+import csv
+import json
+from enum import Enum
+from dataclasses import dataclass
+from datetime import datetime
+from typing import Dict, Iterator, List, Optional
+
+from utils.number_converter import extract_price_from_text
+from utils.parsers.product_parser import parse_product_input, InputFormat, ProductData
+
+class FileFormat(Enum):
+    """صيغ ملفات المنتجات المدعومة"""
+    CSV = "csv"  # منتج,سعر,ملاحظات[,تاريخ] مع صف عناوين اختياري
+    TSV = "tsv"  # مثل CSV مع الفاصل Tab
+    JSONL = "jsonl"  # كائن JSON في كل سطر: {"product": "تفاح", "price": 10} أو نص حر
+    TEXT = "text"  # نص حر في كل سطر يحلله parse_product_input (مثال: تفاح ١٠ أحمر)
+
+# الصيغة حسب امتداد الملف
+FORMAT_EXTENSIONS = {
+    '.csv': FileFormat.CSV,
+    '.tsv': FileFormat.TSV,
+    '.tab': FileFormat.TSV,
+    '.jsonl': FileFormat.JSONL,
+    '.ndjson': FileFormat.JSONL,
+}
+
+# أسماء الأعمدة المقبولة في صف العناوين وفي مفاتيح JSON
+COLUMN_NAMES = {
+    'product': {'product', 'name', 'المنتج', 'منتج'},
+    'price': {'price', 'السعر', 'سعر'},
+    'notes': {'notes', 'note', 'ملاحظات', 'ملاحظة'},
+    'date': {'date', 'التاريخ', 'تاريخ'},
+}
+
+# ترتيب الأعمدة إذا لم يوجد صف عناوين
+DEFAULT_COLUMNS = ['product', 'price', 'notes', 'date']
+
+@dataclass
+class FileRecord:
+    """سجل منتج مقروء من الملف"""
+    index: int  # ترتيب السجل في الملف بدءاً من 0 (يُستخدم لاستئناف الاستيراد)
+    line: int  # رقم السطر في الملف (لرسائل الأخطاء)
+    product: ProductData
+    date: str = ""  # التاريخ بالشكل YYYY/MM/DD إذا حدده الملف
+    error: str = ""  # سبب رفض السجل (فارغ للسجلات الصالحة)
+    
+    @property
+    def is_valid(self) -> bool:
+        """هل السجل صالح للإضافة؟"""
+        return not self.error
+
+def detect_format(path: str) -> FileFormat:
+    """
+    تحديد صيغة الملف من امتداده
+    الامتدادات غير المعروفة (مثل .txt) تُقرأ كنص حر
+    """
+    return FORMAT_EXTENSIONS.get(os.path.splitext(path)[1].lower(), FileFormat.TEXT)
+
+def _normalize_date(value) -> Optional[str]:
+    """
+    تحويل التاريخ إلى الشكل المخزن YYYY/MM/DD
+    يقبل YYYY/MM/DD و YYYY-MM-DD (مع وقت اختياري بعدهما)
+    """
+    text = str(value).strip()[:10].replace('-', '/')
+    try:
+        return datetime.strptime(text, "%Y/%m/%d").strftime("%Y/%m/%d")
+    except ValueError:
+        return None
+
+def _parse_price(value) -> Optional[float]:
+    """السعر من خانة CSV أو قيمة JSON (يدعم الأرقام العربية والعملات)"""
+    if isinstance(value, bool):
+        return None
+    if isinstance(value, (int, float)):
+        return float(value)
+    return extract_price_from_text(str(value)) if value is not None else None
+
+def _field_of(name) -> Optional[str]:
+    """اسم الحقل (product, price, notes, date) لعنوان عمود أو مفتاح JSON"""
+    name = str(name).strip().lower()
+    return next((field for field, names in COLUMN_NAMES.items() if name in names), None)
+
+def _header_columns(cells: List[str]) -> Optional[List[Optional[str]]]:
+    """
+    أسماء الحقول حسب صف العناوين
+    يعيد None إذا لم يكن الصف صف عناوين (أول صف بيانات)
+    """
+    columns = [_field_of(cell) for cell in cells]
+    return columns if 'product' in columns and 'price' in columns else None
+
+class ProductFileReader:
+    """
+    قراءة سجلات المنتجات من ملف بشكل متدفق
+    
+    الاستخدام:
+        with ProductFileReader("products.csv") as reader:
+            for record in reader:
+                ...
+    
+    bytes_read و size يسمحان بعرض نسبة التقدم أثناء القراءة.
+    """
+    
+    def __init__(self, path: str, file_format: Optional[FileFormat] = None, encoding: str = 'utf-8-sig'):
+        self.path = path
+        self.format = file_format or detect_format(path)
+        self.encoding = encoding
+        self.size = os.path.getsize(path)
+        self._raw = None
+    
+    def __enter__(self) -> 'ProductFileReader':
+        self._raw = open(self.path, 'rb')
+        return self
+    
+    def __exit__(self, *exc) -> None:
+        self.close()
+    
+    def close(self) -> None:
+        """إغلاق الملف"""
+        if self._raw is not None:
+            self._raw.close()
+            self._raw = None
+    
+    @property
+    def bytes_read(self) -> int:
+        """عدد البايتات المقروءة حتى الآن (تقريبي بسبب التخزين المؤقت)"""
+        if self._raw is None or self._raw.closed:
+            return self.size
+        return self._raw.tell()
+    
+    def __iter__(self) -> Iterator[FileRecord]:
+        if self._raw is None:
+            self.__enter__()
+        text = io.TextIOWrapper(self._raw, encoding=self.encoding, newline='')
+        if self.format in (FileFormat.CSV, FileFormat.TSV):
+            return self._iter_delimited(text, ',' if self.format == FileFormat.CSV else '\t')
+        if self.format == FileFormat.JSONL:
+            return self._iter_jsonl(text)
+        return self._iter_text(text)
+    
+    def _iter_delimited(self, text: io.TextIOWrapper, delimiter: str) -> Iterator[FileRecord]:
+        """سجلات CSV/TSV"""
+        reader = csv.reader(text, delimiter=delimiter)
+        columns = None
+        index = 0
+        for cells in reader:
+            if not any(cell.strip() for cell in cells):
+                continue
+            if columns is None:
+                columns = _header_columns(cells)
+                if columns is not None:
+                    continue
+                columns = DEFAULT_COLUMNS
+            fields = {field: cell for field, cell in zip(columns, cells) if field}
+            yield self._record(index, reader.line_num, fields, InputFormat.COMMA)
+            index += 1
+    
+    def _iter_jsonl(self, text: io.TextIOWrapper) -> Iterator[FileRecord]:
+        """سجلات JSONL: كائن بحقول المنتج، أو نص حر"""
+        index = 0
+        for line_number, line in enumerate(text, 1):
+            line = line.strip()
+            if not line:
+                continue
+            try:
+                value = json.loads(line)
+            except json.JSONDecodeError as e:
+                yield FileRecord(index, line_number, ProductData(line[:50], None, "", InputFormat.STANDARD, False),
+                                 error=f"JSON غير صالح: {str(e)}")
+            else:
+                if isinstance(value, dict):
+                    fields = {_field_of(key): item for key, item in value.items() if _field_of(key)}
+                    yield self._record(index, line_number, fields, InputFormat.STANDARD)
+                else:
+                    yield self._text_record(index, line_number, str(value))
+            index += 1
+    
+    def _iter_text(self, text: io.TextIOWrapper) -> Iterator[FileRecord]:
+        """سجلات النص الحر (سطر لكل منتج)"""
+        index = 0
+        for line_number, line in enumerate(text, 1):
+            line = line.strip()
+            if not line:
+                continue
+            yield self._text_record(index, line_number, line)
+            index += 1
+    
+    @staticmethod
+    def _text_record(index: int, line_number: int, line: str) -> FileRecord:
+        """سجل من نص حر عبر محلل إدخال المنتجات"""
+        product = parse_product_input(line)
+        product.format_used = InputFormat.MULTILINE
+        error = ""
+        if not product.is_valid or not product.product:
+            error = "تعذر تحليل السطر"
+        elif product.price is None:
+            error = "لم يتم العثور على سعر"
+        return FileRecord(index, line_number, product, error=error)
+    
+    @staticmethod
+    def _record(index: int, line_number: int, fields: Dict, format_used: InputFormat) -> FileRecord:
+        """سجل من حقول مسماة (CSV/TSV/JSONL)"""
+        name = str(fields.get('product') or '').strip()
+        price = _parse_price(fields.get('price'))
+        notes = fields.get('notes')
+        product = ProductData(name, price, str(notes).strip() if notes is not None else "", format_used, True)
+        
+        error = ""
+        date = ""
+        if not name:
+            error = "اسم المنتج فارغ"
+        elif price is None:
+            error = f"سعر غير صالح: {fields.get('price')}"
+        elif fields.get('date'):
+            date = _normalize_date(fields['date']) or ""
+            if not date:
+                error = f"تاريخ غير صالح: {fields['date']}"
+        if error:
+            product.is_valid = False
+        return FileRecord(index, line_number, product, date, error)